@@ -0,0 +1,14 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : __init__.py.py
+@time    : 2026/10/18 09:30
+@desc    : 
+-----------------------------------------------------------------------
+"""
+
+if __name__ == '__main__':
+    print("__init__.py...")
@@ -0,0 +1,87 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : async_bench.py
+@time    : 2026/10/18 10:20
+@desc    : 异步执行路径并发压测：假大模型注入延迟，统计并发1~512时的吞吐
+           运行：python -m src.app.benchmark.async_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.benchmark.fake_llm import FakeChatModel
+
+os.environ.setdefault("TAVILY_API_KEY", "bench")  # 构造TavilySearch需要，压测中不会真正调用
+from src.app.chatbot import chatbot_demo3 as demo
+
+
+def build_graph(latency: float):
+    """
+    用chatbot_demo3的图，大模型替换为假模型
+    """
+    model = FakeChatModel(latency=latency)
+    demo.get_llm_with_tools = lambda: model
+    return demo.build_graph(checkpointer=MemorySaver())
+
+
+def bench_sync(graph, total: int) -> dict:
+    """
+    优化前：同步invoke，一个进程一次只处理一个会话
+    """
+    latencies = []
+    start = time.perf_counter()
+    for i in range(total):
+        config = {"configurable": {"thread_id": f"sync_{i}"}}
+        t0 = time.perf_counter()
+        graph.invoke({"messages": [{"role": "user", "content": "你好"}]}, config)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - start
+    return {"concurrency": 1, "throughput": round(total / elapsed, 2), **summarize(latencies)}
+
+
+async def bench_async(graph, concurrency: int, total: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            config = {"configurable": {"thread_id": f"async_{concurrency}_{i}"}}
+            t0 = time.perf_counter()
+            await graph.ainvoke({"messages": [{"role": "user", "content": "你好"}]}, config)
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(i) for i in range(total)])
+    elapsed = time.perf_counter() - start
+    return {"concurrency": concurrency, "throughput": round(total / elapsed, 2), **summarize(latencies)}
+
+
+async def run(latency: float, levels, per_level: int) -> dict:
+    graph = build_graph(latency)
+    report = {"latency_ms": latency * 1000, "sync": bench_sync(graph, 16), "async": []}
+    for concurrency in levels:
+        total = max(per_level, concurrency * 2)
+        report["async"].append(await bench_async(graph, concurrency, total))
+    return report
+
+
+if __name__ == '__main__':
+    print("async_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.1, help="假大模型每次调用的延迟(秒)")
+    parser.add_argument("--levels", default="1,8,32,128,512", help="逗号分隔的并发数")
+    parser.add_argument("--per-level", type=int, default=64, help="每个并发级别至少执行的会话数")
+    args = parser.parse_args()
+
+    levels = [int(x) for x in args.levels.split(",")]
+    print(json.dumps(asyncio.run(run(args.latency, levels, args.per_level)), indent=2))
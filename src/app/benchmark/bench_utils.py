@@ -0,0 +1,123 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : bench_utils.py
+@time    : 2026/10/18 09:30
+@desc    : 压测公共工具(统计、本地桩服务)
+-----------------------------------------------------------------------
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+def percentile(values, p: float) -> float:
+    """
+    计算百分位数(最近秩)
+    :param values:
+    :param p: 0~100
+    :return:
+    """
+    if not values:
+        return 0.0
+    data = sorted(values)
+    k = max(0, min(len(data) - 1, int(round(p / 100 * len(data) + 0.5)) - 1))
+    return data[k]
+
+
+def summarize(latencies, unit: float = 1000.0) -> dict:
+    """
+    汇总延迟(秒)，默认换算为毫秒
+    :param latencies:
+    :param unit:
+    :return:
+    """
+    return {
+        "count": len(latencies),
+        "p50": round(percentile(latencies, 50) * unit, 3),
+        "p99": round(percentile(latencies, 99) * unit, 3),
+        "max": round(max(latencies) * unit, 3) if latencies else 0.0,
+    }
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # 高并发压测时避免连接被拒绝
+
+
+class StubServer:
+    """
+    本地HTTP桩服务：模拟上游延迟并统计调用次数
+
+    handler(path, query) 返回 (status_code, dict)
+    """
+
+    def __init__(self, handler, delay: float = 0.02, host: str = "127.0.0.1", port: int = 0):
+        self.handler = handler
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+        stub = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持keep-alive
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.calls += 1
+                if stub.delay:
+                    time.sleep(stub.delay)
+                parsed = urlparse(self.path)
+                query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                status, body = stub.handler(parsed.path, query)
+                payload = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = _Server((host, port), _Handler)
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def weather_handler(path, query):
+    """
+    模拟openweathermap接口返回
+    """
+    return 200, {
+        "weather": [{"description": "晴"}],
+        "main": {"temp": 20.5},
+        "name": query.get("q", ""),
+    }
+
+
+if __name__ == '__main__':
+    print("bench_utils...")
+    print(summarize([0.001 * i for i in range(1, 101)]))
@@ -0,0 +1,126 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : checkpoint_bench.py
+@time    : 2026/10/18 11:05
+@desc    : SQLite检查点写入压测：N个检查点分布在M个thread_id上，统计写入/秒和p99提交延迟
+           运行：python -m src.app.benchmark.checkpoint_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import closing
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.checkpoint.sqlite_saver import BatchedAsyncSqliteSaver, BatchedSqliteSaver, connect
+
+
+def make_checkpoint(step: int):
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {
+        "messages": [HumanMessage(f"第{step}轮提问"), AIMessage(f"第{step}轮回复")]
+    }
+    return checkpoint
+
+
+def thread_plan(total: int, threads: int):
+    """
+    每个thread_id要写入的检查点数
+    """
+    return {f"thread_{i}": total // threads + (1 if i < total % threads else 0) for i in range(threads)}
+
+
+def run_sync(saver, total: int, threads: int, workers: int) -> dict:
+    plan = list(thread_plan(total, threads).items())
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        local = []
+        for thread_id, count in plan[index::workers]:
+            config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+            for step in range(count):
+                t0 = time.perf_counter()
+                config = saver.put(config, make_checkpoint(step), {"source": "loop", "step": step}, {})
+                local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(workers)]
+    start = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return {"writes_per_sec": round(total / elapsed, 1), **summarize(latencies)}
+
+
+async def run_async(saver, total: int, threads: int) -> dict:
+    latencies = []
+
+    async def one_thread(thread_id, count):
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        for step in range(count):
+            t0 = time.perf_counter()
+            config = await saver.aput(config, make_checkpoint(step), {"source": "loop", "step": step}, {})
+            latencies.append(time.perf_counter() - t0)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one_thread(t, c) for t, c in thread_plan(total, threads).items()])
+    elapsed = time.perf_counter() - start
+    return {"writes_per_sec": round(total / elapsed, 1), **summarize(latencies)}
+
+
+async def bench_async(directory: str, total: int, threads: int) -> dict:
+    results = {}
+    async with AsyncSqliteSaver.from_conn_string(os.path.join(directory, "async_baseline.sqlite")) as saver:
+        results["async_baseline"] = await run_async(saver, total, threads)
+    async with BatchedAsyncSqliteSaver.from_conn_string(os.path.join(directory, "async_batched.sqlite")) as saver:
+        results["async_batched"] = await run_async(saver, total, threads)
+        results["async_batched"]["transactions"] = saver.batches
+    return results
+
+
+def bench(total: int, threads: int, workers: int) -> dict:
+    results = {"checkpoints": total, "thread_ids": threads, "workers": workers}
+    with tempfile.TemporaryDirectory() as directory:
+        # 优化前：SqliteSaver默认连接，每次写入单独提交，synchronous=FULL
+        with SqliteSaver.from_conn_string(os.path.join(directory, "baseline.sqlite")) as saver:
+            results["baseline"] = run_sync(saver, total, threads, workers)
+
+        # 只调pragma
+        with closing(connect(os.path.join(directory, "tuned.sqlite"))) as conn:
+            results["tuned"] = run_sync(SqliteSaver(conn), total, threads, workers)
+
+        # pragma + 组提交
+        with BatchedSqliteSaver.from_conn_string(os.path.join(directory, "batched.sqlite")) as saver:
+            results["batched"] = run_sync(saver, total, threads, workers)
+            results["batched"]["transactions"] = saver.batches
+
+        results.update(asyncio.run(bench_async(directory, total, threads)))
+    return results
+
+
+if __name__ == '__main__':
+    print("checkpoint_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoints", type=int, default=5000, help="写入的检查点总数N")
+    parser.add_argument("--threads", type=int, default=100, help="thread_id数M")
+    parser.add_argument("--workers", type=int, default=32, help="同步压测的写线程数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.checkpoints, args.threads, args.workers), indent=2))
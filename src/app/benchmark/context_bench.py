@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : context_bench.py
+@time    : 2026/10/18 13:20
+@desc    : 长对话压测：全量历史 vs token预算窗口+增量摘要，统计每轮prompt token数和延迟
+           运行：python -m src.app.benchmark.context_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import time
+from typing import Annotated
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END, add_messages
+from typing_extensions import TypedDict
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.benchmark.fake_llm import FakeChatModel
+from src.app.messages.message_window import LLMSummarizer, MessageWindow
+
+REPLY = "好的，关于这个问题我的建议如下：" + "先确认需求，再逐步排查。" * 8
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+    summary: str
+    summarized_count: int
+
+
+def build_graph(node):
+    graph_builder = StateGraph(State)
+    graph_builder.add_node("chatbot", node)
+    graph_builder.add_edge(START, "chatbot")
+    graph_builder.add_edge("chatbot", END)
+    return graph_builder.compile(checkpointer=MemorySaver())
+
+
+def run(node, llm, turns: int) -> dict:
+    graph = build_graph(node)
+    config = {"configurable": {"thread_id": "bench"}}
+    tokens, latencies = [], []
+    for turn in range(turns):
+        t0 = time.perf_counter()
+        graph.invoke({"messages": [{"role": "user", "content": f"第{turn}个问题：" + "请帮我看看订单。" * 5}]}, config)
+        latencies.append(time.perf_counter() - t0)
+        tokens.append(llm.last_prompt_tokens)
+    checkpoints = {f"turn_{n}": tokens[n - 1] for n in (1, 10, 50, 100, 200, turns) if n <= turns}
+    return {
+        "prompt_tokens_total": sum(tokens),
+        "prompt_tokens_at": checkpoints,
+        "latency_ms": summarize(latencies),
+        "last_turn_ms": round(latencies[-1] * 1000, 3),
+    }
+
+
+def bench(turns: int, max_tokens: int, latency: float, latency_per_token: float) -> dict:
+    # 优化前：每轮发送全部历史
+    llm = FakeChatModel(responses=[REPLY], latency=latency, latency_per_token=latency_per_token)
+
+    def full_history(state: State):
+        return {"messages": [llm.invoke(state["messages"])]}
+
+    baseline = run(full_history, llm, turns)
+
+    # 优化后：token预算窗口 + 增量摘要(摘要模型同样有延迟)
+    llm = FakeChatModel(responses=[REPLY], latency=latency, latency_per_token=latency_per_token)
+    summarizer = LLMSummarizer(FakeChatModel(responses=["摘要：" + "用户咨询订单。" * 20],
+                                             latency=latency, latency_per_token=latency_per_token))
+    window = MessageWindow(max_tokens=max_tokens, summarizer=summarizer, min_summarize=6)
+
+    def windowed(state: State):
+        prompt, updates = window.prepare(state)
+        return {"messages": [llm.invoke(prompt)], **updates}
+
+    optimized = run(windowed, llm, turns)
+    optimized["summarizer_calls"] = summarizer.calls
+    return {"turns": turns, "max_tokens": max_tokens, "full_history": baseline, "windowed": optimized}
+
+
+if __name__ == '__main__':
+    print("context_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--max-tokens", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.005, help="假大模型固定延迟(秒)")
+    parser.add_argument("--latency-per-token", type=float, default=0.000002, help="每个prompt token增加的延迟(秒)")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.turns, args.max_tokens, args.latency, args.latency_per_token),
+                     ensure_ascii=False, indent=2))
@@ -0,0 +1,159 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : fake_llm.py
+@time    : 2026/10/18 10:20
+@desc    : 压测用的假大模型(可注入延迟，不依赖API Key)
+-----------------------------------------------------------------------
+"""
+import asyncio
+import hashlib
+import itertools
+import json
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.messages.utils import convert_to_messages, count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    按顺序循环返回responses中的文本，每次调用等待 latency + prompt token数 * latency_per_token 秒
+    """
+
+    responses: List[str] = ["这是一个模拟回复"]
+    latency: float = 0.05
+    latency_per_token: float = 0.0
+    last_prompt_tokens: int = 0
+
+    _counter: Any = PrivateAttr(default_factory=itertools.count)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def _next_message(self) -> AIMessage:
+        index = next(self._counter)
+        return AIMessage(content=self.responses[index % len(self.responses)])
+
+    def _delay(self, messages: List[BaseMessage]) -> float:
+        self.last_prompt_tokens = count_tokens_approximately(messages)
+        return self.latency + self.last_prompt_tokens * self.latency_per_token
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        delay = self._delay(messages)
+        if delay:
+            time.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message())])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        delay = self._delay(messages)
+        if delay:
+            await asyncio.sleep(delay)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message())])
+
+    def bind_tools(self, tools, **kwargs):
+        # 假模型不会产生工具调用，直接返回自身
+        return self
+
+
+class FakeCachingChatModel(FakeChatModel):
+    """
+    模拟Anthropic提示词缓存的假模型：按工具定义、消息内容块上的cache_control断点计算前缀哈希，
+    在返回消息的usage_metadata中给出cache_read / cache_creation，行为与真实接口一致：
+    命中已缓存的最长前缀，最后一个断点之前未命中的部分写入缓存
+    """
+
+    min_cache_tokens: int = 0
+
+    _cache: Any = PrivateAttr(default_factory=set)
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=tools, **kwargs)
+
+    @staticmethod
+    def _tokens(block) -> int:
+        return max(1, len(json.dumps(block, ensure_ascii=False)) // 3)
+
+    def _blocks(self, messages, tools):
+        """
+        把请求展开成(内容块, 是否断点)列表，哈希时去掉cache_control本身
+        """
+        blocks = []
+        for tool in tools or []:
+            tool = dict(tool)
+            marked = tool.pop("cache_control", None) is not None
+            blocks.append((tool, marked))
+        for message in messages:
+            content = message.content
+            if isinstance(content, str):
+                content = [{"type": "text", "text": content}] if content else []
+            for block in content:
+                block = dict(block) if isinstance(block, dict) else {"type": "text", "text": block}
+                marked = block.pop("cache_control", None) is not None
+                blocks.append(({"role": message.type, **block}, marked))
+            for call in getattr(message, "tool_calls", None) or []:
+                blocks.append(({"role": message.type, "tool_use": call["name"], "input": call["args"]}, False))
+        return blocks
+
+    def _usage(self, messages, tools) -> dict:
+        digest = hashlib.sha1()
+        total = read = last_breakpoint = 0
+        prefixes = []  # (前缀哈希, 累计token)
+        breakpoints = []
+        for block, marked in self._blocks(messages, tools):
+            digest.update(json.dumps(block, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+            total += self._tokens(block)
+            prefixes.append((digest.hexdigest(), total))
+            if marked and total >= self.min_cache_tokens:
+                breakpoints.append(prefixes[-1][0])
+                last_breakpoint = total
+        # 与真实接口一样，在断点之前回看已缓存的最长前缀
+        for key, tokens in prefixes:
+            if tokens > last_breakpoint:
+                break
+            if key in self._cache:
+                read = tokens
+        self._cache.update(breakpoints)
+        creation = max(last_breakpoint - read, 0)
+        return {
+            "input_tokens": total,
+            "output_tokens": 20,
+            "total_tokens": total + 20,
+            "input_token_details": {"cache_read": read, "cache_creation": creation},
+        }
+
+    def _respond(self, messages, kwargs) -> ChatResult:
+        message = self._next_message()
+        message.usage_metadata = self._usage(convert_to_messages(messages), kwargs.get("tools"))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        delay = self._delay(messages)
+        if delay:
+            time.sleep(delay)
+        return self._respond(messages, kwargs)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        delay = self._delay(messages)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._respond(messages, kwargs)
+
+
+if __name__ == '__main__':
+    print("fake_llm...")
+    llm = FakeChatModel(latency=0.01)
+    print(llm.invoke("hi").content)
+    print(asyncio.run(llm.ainvoke("hi")).content)
@@ -0,0 +1,95 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : graph_bench.py
+@time    : 2026/10/18 18:30
+@desc    : 编译图注册表压测：每个请求重新编译图 vs 从注册表取已编译的图，多线程共享同一个图
+           大模型和工具替换为零延迟的假模型/替身，测到的差值就是每个请求的编译开销
+           运行：python -m src.app.benchmark.graph_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.graphs.registry import registry
+from src.app.loadtest.targets import build_target
+
+
+def compile_cost(name: str, factory, rounds: int) -> dict:
+    """
+    单独测编译一次图的耗时
+    """
+    factory()  # 预热：首次编译包含导入langgraph.prebuilt等一次性开销
+    latencies = []
+    for _ in range(rounds):
+        t0 = time.perf_counter()
+        factory()
+        latencies.append(time.perf_counter() - t0)
+    return {"graph": name, **summarize(latencies)}
+
+
+def serve(get_graph, target, requests: int, workers: int, offset: int = 0) -> dict:
+    """
+    模拟服务：每个请求先拿到图再执行一轮对话，offset让不同轮次使用不同的会话
+    """
+    def one(i):
+        t0 = time.perf_counter()
+        graph = get_graph()
+        graph.invoke(target.make_input(i, 0), target.make_config(offset + i))
+        return time.perf_counter() - t0
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        latencies = list(pool.map(one, range(requests)))
+    elapsed = time.perf_counter() - start
+    return {"workers": workers, "throughput": round(requests / elapsed, 2), **summarize(latencies)}
+
+
+def bench(names, requests: int, workers: int, rounds: int) -> dict:
+    report = {"requests": requests, "workers": workers, "targets": []}
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for name in names:
+            checkpointer = MemorySaver()
+            target = build_target(name, checkpointer, latency="fixed:0.0", tool_latency="fixed:0.0")
+            package = "chatbot2" if name.startswith("chatbot2") else "chatbot"
+            module = importlib.import_module(f"src.app.{package}.{name}")
+            factory = module.builder.compile if hasattr(module, "builder") else module.build_graph
+            options = {"checkpointer": checkpointer}
+            if hasattr(module, "builder"):
+                options["store"] = module.get_store()
+
+            registry.clear(name)
+            warmup_ms = registry.warmup([(name, options)])[name]
+            report["targets"].append({
+                "target": name,
+                "compile_ms": compile_cost(name, lambda: factory(**options), rounds),
+                "warmup_ms": warmup_ms,
+                "rebuild_per_request": serve(lambda: factory(**options), target, requests, workers),
+                "registry": serve(lambda: registry.get(name, **options), target, requests, workers, offset=requests),
+            })
+    report["registry_stats"] = registry.stats()
+    return report
+
+
+if __name__ == '__main__':
+    print("graph_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--targets", default="chatbot_demo3,chatbot2_demo2", help="逗号分隔的压测目标")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=50, help="单独测编译耗时的次数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.targets.split(","), args.requests, args.workers, args.rounds), indent=2,
+                     ensure_ascii=False))
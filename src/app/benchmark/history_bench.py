@@ -0,0 +1,155 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : history_bench.py
+@time    : 2026/10/18 21:50
+@desc    : 状态历史查询压测：构造1k/10k步的会话(SQLite检查点)，对比
+           list(get_state_history)[:3]                  优化前：反序列化全部快照
+           get_state_history(limit=3)                   LangGraph自带的limit：只取3个，但每个都完整加载
+           StateHistory.page(limit=3)                   只读metadata，values按需加载
+           以及翻页(before游标)、步数范围过滤、计数，并检查步数过滤走了索引；
+           TieredSqliteSaver(热会话读内存、冷会话查磁盘)的翻页/计数不反序列化任何检查点
+           运行：python -m src.app.benchmark.history_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import TypedDict
+
+from langgraph.graph import StateGraph, START, END
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.checkpoint.history import StateHistory
+from src.app.checkpoint.sqlite_saver import STEP_EXPR, BatchedAsyncSqliteSaver, BatchedSqliteSaver
+from src.app.checkpoint.tiered_saver import TieredSqliteSaver
+
+
+class Session(TypedDict):
+    count: int
+    notes: list
+
+
+def build_graph(checkpointer, steps: int):
+    """
+    一次invoke循环steps步，每步写一个检查点；notes保持固定长度，模拟带消息窗口的状态
+    """
+    def step(state: Session):
+        return {"count": state["count"] + 1, "notes": (state["notes"] + [f"第{state['count']}步：" + "x" * 200])[-20:]}
+
+    builder = StateGraph(Session)
+    builder.add_node("step", step)
+    builder.add_edge(START, "step")
+    builder.add_conditional_edges("step", lambda state: END if state["count"] >= steps else "step")
+    return builder.compile(checkpointer=checkpointer)
+
+
+def timed(fn, repeat: int) -> dict:
+    latencies = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies)
+
+
+def query_plan(saver) -> str:
+    with saver.cursor(transaction=False) as cur:
+        rows = cur.execute(f"EXPLAIN QUERY PLAN SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND "
+                           f"checkpoint_ns = ? AND {STEP_EXPR} >= ? AND {STEP_EXPR} <= ?", ("t", "", 1, 2)).fetchall()
+    return " | ".join(row[-1] for row in rows)
+
+
+def bench_steps(directory: str, steps: int, repeat: int) -> dict:
+    path = os.path.join(directory, f"history_{steps}.sqlite")
+    config = {"configurable": {"thread_id": "t"}}
+    report = {"steps": steps}
+    with BatchedSqliteSaver.from_conn_string(path) as saver:
+        graph = build_graph(saver, steps)
+        t0 = time.perf_counter()
+        graph.invoke({"count": 0, "notes": []}, {**config, "recursion_limit": steps + 10})
+        report["build_s"] = round(time.perf_counter() - t0, 2)
+
+        history = StateHistory(graph)
+        latest = history.page(config, limit=3)
+        assert [e.step for e in latest] == [steps, steps - 1, steps - 2], latest.entries
+        assert latest.entries[1].values["count"] == steps - 1
+        middle = steps // 2
+        assert [e.step for e in history.page(config, limit=5, min_step=middle, max_step=middle + 4)] == \
+               list(range(middle + 4, middle - 1, -1))
+
+        report["full_history_ms"] = timed(lambda: list(graph.get_state_history(config))[:3], 1)
+        report["builtin_limit_ms"] = timed(lambda: list(graph.get_state_history(config, limit=3)), repeat)
+        report["page_ms"] = timed(lambda: history.page(config, limit=3), repeat)
+        report["page_values_ms"] = timed(lambda: [e.values for e in history.page(config, limit=3)], repeat)
+        report["next_page_ms"] = timed(lambda: history.page(config, limit=3, before=latest.cursor), repeat)
+        report["step_range_ms"] = timed(lambda: history.page(config, limit=5, min_step=middle, max_step=middle + 4),
+                                        repeat)
+        report["count_ms"] = timed(lambda: history.count(config), repeat)
+        report["step_range_plan"] = query_plan(saver)
+    report["async_page_ms"] = asyncio.run(abench(path, steps, config, repeat))
+    report["tiered"] = bench_tiered(os.path.join(directory, f"tiered_{steps}.sqlite"), steps, config, repeat)
+    return report
+
+
+def bench_tiered(path: str, steps: int, config: dict, repeat: int) -> dict:
+    """
+    热会话和被挤出内存的冷会话各测一遍，同时统计loads_typed调用次数，必须为0
+    """
+    report = {}
+    with TieredSqliteSaver.from_conn_string(path, max_threads=1) as saver:
+        graph = build_graph(saver, steps)
+        graph.invoke({"count": 0, "notes": []}, {**config, "recursion_limit": steps + 10})
+        history = StateHistory(graph)
+        loads, loads_typed = [0], saver.serde.loads_typed
+
+        def counted(data):
+            loads[0] += 1
+            return loads_typed(data)
+
+        saver.serde.loads_typed = counted
+        try:
+            for tier in ("hot", "cold"):
+                if tier == "cold":  # 另一个会话把它挤出内存
+                    graph.invoke({"count": steps - 1, "notes": []}, {"configurable": {"thread_id": "other"}})
+                    saver.flush()
+                assert [e.step for e in history.page(config, limit=3)] == [steps, steps - 1, steps - 2]
+                assert history.count(config) == steps + 2
+                report[f"{tier}_page_ms"] = timed(lambda: history.page(config, limit=3), repeat)
+                report[f"{tier}_count_ms"] = timed(lambda: history.count(config), repeat)
+        finally:
+            saver.serde.loads_typed = loads_typed
+        assert loads[0] == 0, f"分页/计数反序列化了{loads[0]}次"
+    return report
+
+
+async def abench(path: str, steps: int, config: dict, repeat: int) -> dict:
+    async with BatchedAsyncSqliteSaver.from_conn_string(path) as saver:
+        history = StateHistory(build_graph(saver, steps))
+        page = await history.apage(config, limit=3)
+        assert [e.step for e in page] == [steps, steps - 1, steps - 2]
+        assert (await page.entries[0].aload()).values["count"] == steps
+        latencies = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            await history.apage(config, limit=3)
+            latencies.append(time.perf_counter() - t0)
+        return summarize(latencies)
+
+
+if __name__ == '__main__':
+    print("history_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--steps", default="1000,10000", help="逗号分隔的会话步数")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [bench_steps(directory, int(steps), args.repeat) for steps in args.steps.split(",")]
+    print(json.dumps(results, indent=2, ensure_ascii=False))
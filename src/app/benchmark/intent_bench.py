@@ -0,0 +1,108 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : intent_bench.py
+@time    : 2026/10/18 16:50
+@desc    : 意图识别压测：原来的if/in判断链 vs 字典树关键词分类器(单条/批量)，关键词数10/100/1000
+           classify_batch：消息各不相同时与逐条classify对比；repeated_*：消息从1/10数量的文本池中抽取
+           运行：python -m src.app.benchmark.intent_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import random
+import time
+
+from src.app.tools.IntentTools import IntentClassifier
+
+CHARS = "订单快递退款退货物流发票会员积分优惠价格商品地址支付账户密码售后维修换货客服投诉评价尺码颜色库存预约"
+FILLER = "我你他的了是在有不这要想请问一下帮能吗呢吧好谢，。？！ 0123456789今天昨天明天什么怎么为什么已经还没"
+
+
+def make_rules(keywords: int, intents: int, rng: random.Random) -> dict:
+    rules = {f"意图{i}": {} for i in range(intents)}
+    words = set()
+    while len(words) < keywords:
+        words.add("".join(rng.choice(CHARS) for _ in range(rng.randint(2, 4))))
+    for i, word in enumerate(sorted(words)):
+        rules[f"意图{i % intents}"][word] = 1.0
+    return rules
+
+
+def make_messages(rules: dict, count: int, rng: random.Random) -> list:
+    words = [w for keywords in rules.values() for w in keywords]
+    messages = []
+    for _ in range(count):
+        filler = "".join(rng.choice(FILLER) for _ in range(rng.randint(10, 40)))
+        if rng.random() < 0.7:
+            pos = rng.randint(0, len(filler))
+            filler = filler[:pos] + rng.choice(words) + filler[pos:]
+        messages.append(filler)
+    return messages
+
+
+def chain_classifier(rules: dict, default: str = "一般咨询"):
+    """
+    优化前：按意图顺序逐个关键词做子串判断(与原analyze_intent的写法一致)
+    """
+    items = [(intent, list(keywords)) for intent, keywords in rules.items()]
+
+    def classify(text: str) -> str:
+        for intent, keywords in items:
+            for keyword in keywords:
+                if keyword in text:
+                    return intent
+        return default
+
+    return classify
+
+
+def timed(func, *args):
+    t0 = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - t0, result
+
+
+def bench(sizes, intents: int, count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    report = []
+    for keywords in sizes:
+        rules = make_rules(keywords, intents, rng)
+        messages = make_messages(rules, count, rng)
+        chain = chain_classifier(rules)
+        build, classifier = timed(IntentClassifier, rules)
+        chain_s, _ = timed(lambda: [chain(m) for m in messages])
+        single_s, _ = timed(lambda: [classifier.classify(m) for m in messages])
+        batch_s, batched = timed(classifier.classify_batch, messages)
+        assert batched == [classifier.classify(m) for m in messages]
+        repeated = [rng.choice(messages[:max(count // 10, 1)]) for _ in range(count)]
+        repeated_single_s, _ = timed(lambda: [classifier.classify(m) for m in repeated])
+        repeated_batch_s, _ = timed(classifier.classify_batch, repeated)
+        report.append({
+            "keywords": keywords,
+            "messages": count,
+            "build_ms": round(build * 1000, 3),
+            "chain_us_per_msg": round(chain_s / count * 1e6, 3),
+            "matcher_us_per_msg": round(single_s / count * 1e6, 3),
+            "classify_batch_us_per_msg": round(batch_s / count * 1e6, 3),
+            "repeated_matcher_us_per_msg": round(repeated_single_s / count * 1e6, 3),
+            "repeated_classify_batch_us_per_msg": round(repeated_batch_s / count * 1e6, 3),
+            "speedup": round(chain_s / single_s, 2),
+        })
+    return report
+
+
+if __name__ == '__main__':
+    print("intent_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10,100,1000", help="逗号分隔的关键词数")
+    parser.add_argument("--intents", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    sizes = [int(x) for x in args.sizes.split(",")]
+    print(json.dumps(bench(sizes, args.intents, args.messages, args.seed), ensure_ascii=False, indent=2))
@@ -0,0 +1,189 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : kb_bench.py
+@time    : 2026/10/18 23:50
+@desc    : 知识库检索压测：模板生成N篇文章(默认5万)，测BM25Index的构建耗时、索引文件大小、打开耗时和查询延迟
+           numpy：bincount累加得分        python：没有numpy时逐条累加
+           scan：不建索引、逐篇文档计算BM25(同样的公式)，用来核对索引结果的得分一致
+           exact_key：原来按标题精确匹配的dict能回答的查询占比
+           worker：新进程打开已有索引并完成一次查询的耗时(不需要重新建索引)
+           运行：python -m src.app.benchmark.kb_bench [--docs 50000]
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.tools import KnowledgeTools
+from src.app.tools.KnowledgeTools import BM25Index, tokenize
+
+TOPICS = ["退货", "换货", "运费", "发票", "会员积分", "优惠券", "售后维修", "价格保护", "预售定金", "分期付款",
+          "地址修改", "订单取消", "礼品卡", "生鲜配送", "空调安装", "以旧换新", "保修", "延保服务", "跨境购", "自提点"]
+PRODUCTS = ["iPhone 15", "MacBook Pro", "蓝牙耳机", "洗衣机", "冰箱", "电视", "扫地机器人", "咖啡机", "跑步机", "显示器",
+            "平板电脑", "机械键盘", "空气净化器", "电动牙刷", "智能手表"]
+SENTENCES = ["{topic}需要在签收后{n}天内通过订单详情页提交申请", "{product}的{topic}由品牌官方售后负责",
+             "VIP用户办理{topic}可享受优先处理", "满{n}元的订单{topic}不收取额外费用",
+             "{topic}审核通常在{n}个工作日内完成，结果会短信通知", "如果{product}存在质量问题，{topic}不影响保修",
+             "部分偏远地区的{topic}时效会延长{n}天", "{topic}的退款将原路返回支付账户",
+             "使用优惠券购买的{product}在{topic}时按实付金额计算", "{product}拆封后仍可{topic}，但需保持配件齐全"]
+
+
+def make_docs(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    docs = []
+    for i in range(count):
+        topic, product = rng.choice(TOPICS), rng.choice(PRODUCTS)
+        body = "。".join(rng.choice(SENTENCES).format(topic=rng.choice((topic, topic, rng.choice(TOPICS))),
+                                                      product=product, n=rng.randint(1, 99))
+                         for _ in range(rng.randint(4, 10)))
+        docs.append({"id": f"KB-{i:06d}", "title": f"{product}{topic}说明({i})", "content": body})
+    return docs
+
+
+def make_queries(count: int, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    templates = ["{topic}", "{product}{topic}", "{product}怎么{topic}", "买的{product}坏了可以{topic}吗",
+                 "{topic}多久到账", "VIP{topic}有什么优惠"]
+    return [rng.choice(templates).format(topic=rng.choice(TOPICS), product=rng.choice(PRODUCTS))
+            for _ in range(count)]
+
+
+class ScanBM25:
+    """
+    不建倒排索引：每次查询逐篇文档计算BM25，公式与BM25Index相同
+    """
+
+    def __init__(self, docs: list, k1: float = 1.2, b: float = 0.75):
+        self.counts = [Counter(tokenize(f"{doc['title']} {doc['content']}")) for doc in docs]
+        self.lengths = [sum(counts.values()) for counts in self.counts]
+        self.avgdl = sum(self.lengths) / len(self.lengths)
+        df = Counter(term for counts in self.counts for term in counts)
+        self.idf = {term: math.log(1 + (len(docs) - n + 0.5) / (n + 0.5)) for term, n in df.items()}
+        self.k1, self.b = k1, b
+
+    def search_ids(self, query: str, k: int) -> list:
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores = []
+        for doc_id, (counts, length) in enumerate(zip(self.counts, self.lengths)):
+            norm = self.k1 * (1 - self.b + self.b * length / self.avgdl)
+            score = sum(self.idf[t] * counts[t] * (self.k1 + 1) / (counts[t] + norm) for t in terms if t in counts)
+            if score > 0:
+                scores.append((score, doc_id))
+        return sorted(scores, key=lambda item: (-item[0], item[1]))[:k]
+
+
+@contextmanager
+def without_numpy():
+    """
+    模拟没有安装numpy：构建和查询都走纯Python路径
+    """
+    saved, KnowledgeTools.np = KnowledgeTools.np, None
+    try:
+        yield
+    finally:
+        KnowledgeTools.np = saved
+
+
+def measure(index: BM25Index, queries: list, k: int) -> dict:
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        index.search(query, k)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies)
+
+
+def check(index: BM25Index, scan: ScanBM25, queries: list, k: int) -> int:
+    for query in queries:
+        expected, actual = scan.search_ids(query, k), index.search_ids(query, k)
+        assert len(expected) == len(actual), query
+        for (want, _), (got, _) in zip(expected, actual):
+            assert abs(want - got) <= 1e-3 * max(1.0, want), (query, want, got)  # 同分文档的先后可能不同，只比得分
+    return len(queries)
+
+
+def worker_startup(path: str) -> float:
+    """
+    新进程打开索引并查询一次的耗时(含解释器启动)
+    """
+    code = ("import time; t0 = time.perf_counter(); from src.app.tools.KnowledgeTools import BM25Index; "
+            f"index = BM25Index({path!r}); index.search('退货运费', 3); print(time.perf_counter() - t0)")
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}).stdout
+    return round(float(output) * 1000, 1)
+
+
+def bench(n_docs: int, n_queries: int, k: int, python_queries: int, check_queries: int) -> dict:
+    docs, queries = make_docs(n_docs), make_queries(n_queries)
+    titles = {doc["title"] for doc in docs}
+    report = {"docs": n_docs, "queries": n_queries, "k": k,
+              "raw_json_mb": round(sum(len(json.dumps(doc, ensure_ascii=False).encode()) for doc in docs) / 2 ** 20, 1),
+              "exact_key_hit_rate": round(sum(query in titles for query in queries) / len(queries), 4)}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "kb.bm25")
+        t0 = time.perf_counter()
+        BM25Index.build(docs, path).close()
+        report["build_s"] = round(time.perf_counter() - t0, 2)
+        report["index_mb"] = round(os.path.getsize(path) / 2 ** 20, 1)
+
+        opens = []
+        for _ in range(50):
+            t0 = time.perf_counter()
+            BM25Index(path).close()
+            opens.append(time.perf_counter() - t0)
+        report["open_ms"] = summarize(opens)
+        report["worker_startup_ms"] = worker_startup(path)
+
+        with BM25Index(path) as index:
+            report["stats"] = index.stats()
+            report["numpy_ms"] = measure(index, queries, k)
+            scan = ScanBM25(docs)
+            report["checked_queries"] = check(index, scan, queries[:check_queries], k)
+            report["scan_ms"] = measure_scan(scan, queries[:check_queries], k)
+        with without_numpy():
+            with BM25Index(path) as index:
+                report["python_ms"] = measure(index, queries[:python_queries], k)
+                check(index, scan, queries[:check_queries], k)
+            python_path = os.path.join(directory, "kb_python.bm25")
+            t0 = time.perf_counter()
+            BM25Index.build(docs, python_path).close()
+            report["python_build_s"] = round(time.perf_counter() - t0, 2)
+        with open(path, "rb") as a, open(python_path, "rb") as b:
+            report["python_build_identical"] = a.read() == b.read()
+    return report
+
+
+def measure_scan(scan: ScanBM25, queries: list, k: int) -> dict:
+    latencies = []
+    for query in queries:
+        t0 = time.perf_counter()
+        scan.search_ids(query, k)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies)
+
+
+if __name__ == '__main__':
+    print("kb_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=50000, help="文章数")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--python-queries", type=int, default=200, help="纯Python路径测试的查询数")
+    parser.add_argument("--check-queries", type=int, default=20, help="与逐篇扫描核对得分的查询数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.docs, args.queries, args.k, args.python_queries, args.check_queries), indent=2,
+                     ensure_ascii=False))
@@ -0,0 +1,86 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : log_bench.py
+@time    : 2026/10/18 19:20
+@desc    : 会话日志写入压测：每轮同步store.put vs BatchedLogWriter，多个会话线程并发，统计条/秒和单次调用延迟
+           运行：python -m src.app.benchmark.log_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.store.log_writer import BatchedLogWriter
+from src.app.store.sqlite_store import IndexedSqliteStore
+
+
+def run(log, sessions: int, entries: int, finish=None) -> dict:
+    latencies = []
+    lock = threading.Lock()
+
+    def session(s):
+        local = []
+        for i in range(entries):
+            t0 = time.perf_counter()
+            log(f"user_{s % 100}", f"conv_{s}", i)
+            local.append(time.perf_counter() - t0)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=session, args=(s,)) for s in range(sessions)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    if finish:
+        finish()
+    elapsed = time.perf_counter() - start
+    total = sessions * entries
+    return {"entries": total, "entries_per_sec": round(total / elapsed, 1), "call_ms": summarize(latencies)}
+
+
+def bench(sessions: int, entries: int) -> dict:
+    report = {"sessions": sessions}
+    with tempfile.TemporaryDirectory() as directory:
+        with IndexedSqliteStore.from_conn_string(os.path.join(directory, "sync.sqlite"),
+                                                 indexed_fields=("session_id",)) as store:
+            store.setup()
+
+            def sync_put(user, session_id, i):
+                # 优化前的save_log：每轮一次同步写入
+                store.put((user, "logs"), f"log_{session_id}_{i}",
+                          {"session_id": session_id, "message_count": i, "timestamp": time.time()})
+
+            report["sync_put"] = run(sync_put, sessions, entries)
+
+        with IndexedSqliteStore.from_conn_string(os.path.join(directory, "batched.sqlite"),
+                                                 indexed_fields=("session_id",)) as store:
+            store.setup()
+            writer = BatchedLogWriter(store)
+
+            def append(user, session_id, i):
+                writer.append((user, "logs"), session_id, {"message_count": i})
+
+            report["batched_writer"] = {**run(append, sessions, entries, finish=writer.flush), **writer.stats()}
+            writer.close()
+            report["batched_writer"]["rows"] = len(store.search(("user_0", "logs"), limit=100000))
+    return report
+
+
+if __name__ == '__main__':
+    print("log_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=64, help="并发会话(线程)数")
+    parser.add_argument("--entries", type=int, default=500, help="每个会话写入的日志条数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.sessions, args.entries), ensure_ascii=False, indent=2))
@@ -0,0 +1,102 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : memory_bench.py
+@time    : 2026/10/18 17:30
+@desc    : 偏好提取压测：每轮拼接全部历史 vs 高水位增量扫描+脏检查写入，对话长度逐步增加
+           运行：python -m src.app.benchmark.memory_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langgraph.store.memory import InMemoryStore
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.chatbot2 import chatbot2_demo2 as demo
+
+
+class CountingStore(InMemoryStore):
+    def __init__(self):
+        super().__init__()
+        self.puts = 0
+
+    def put(self, *args, **kwargs):
+        self.puts += 1
+        return super().put(*args, **kwargs)
+
+
+def legacy_extract_memory(state, config):
+    """
+    优化前的extract_memory：每轮拼接整段对话，命中就无条件写入
+    """
+    user_id = config.get("configurable", {}).get("user_id", "anonymous")
+    all_content = " ".join([m.content for m in state["messages"]])
+    preferences = {}
+    if "喜欢" in all_content:
+        preferences["likes"] = "从对话中提取的兴趣点"
+    if preferences:
+        demo.get_store().put((user_id, "profile"), "preferences", preferences)
+    return {}
+
+
+def turn_messages(turn: int) -> list:
+    text = "我喜欢苹果产品，" if turn == 0 else ""
+    return [
+        SystemMessage("已加载用户档案：新用户"),
+        HumanMessage(text + f"第{turn}个问题：我想查订单 ORD-001，顺便问一下运费规则。"),
+        AIMessage("[意图识别] 用户意图：订单查询"),
+        AIMessage('订单状态：{"status": "已发货", "product": "iPhone 15", "amount": 5999}'),
+    ]
+
+
+def run(node, turns: int, window: int) -> dict:
+    """
+    模拟一个会话逐轮增长，统计最后window轮的提取耗时和写入次数
+    """
+    store = CountingStore()
+    demo.get_store = lambda: store  # 节点每次调用get_store()，替换后写入计数store
+    config = {"configurable": {"user_id": "bench_user", "thread_id": "bench"}}
+    state = {"messages": []}
+    latencies = []
+    for turn in range(turns):
+        state["messages"].extend(turn_messages(turn))
+        t0 = time.perf_counter()
+        update = node(state, config)
+        elapsed = time.perf_counter() - t0
+        state.update({k: v for k, v in update.items() if k != "messages"})
+        if turn >= turns - window:
+            latencies.append(elapsed)
+    return {"store_puts": store.puts, "last_turns_us": summarize(latencies, unit=1e6)}
+
+
+def bench(lengths, window: int) -> list:
+    original = demo.get_store
+    report = []
+    try:
+        for turns in lengths:
+            report.append({
+                "turns": turns,
+                "messages": turns * 4,
+                "full_rescan": run(legacy_extract_memory, turns, window),
+                "incremental": run(demo.extract_memory, turns, window),
+            })
+    finally:
+        demo.get_store = original
+    return report
+
+
+if __name__ == '__main__':
+    print("memory_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", default="10,100,1000,5000", help="逗号分隔的会话轮数")
+    parser.add_argument("--window", type=int, default=10, help="统计最后多少轮的耗时")
+    args = parser.parse_args()
+
+    lengths = [int(x) for x in args.lengths.split(",")]
+    print(json.dumps(bench(lengths, args.window), ensure_ascii=False, indent=2))
@@ -0,0 +1,177 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : messages_bench.py
+@time    : 2026/10/18 22:50
+@desc    : 消息合并微基准：已有1k/100k条消息时，对比add_messages与IndexedMessages通道的单次合并耗时
+           append：追加1条新消息        replace：按id替换1条已有消息        remove：RemoveMessage删除1条
+           indexed_step：每次合并前先get()一次(模拟每个超级步节点读取状态、写检查点)，包含写时复制的列表复制
+           session：从0条增长到N条的整段会话总耗时(add_messages是平方级)
+           另外随机生成追加/替换/删除序列(穿插通道副本的合并)，检查合并结果与add_messages一致
+           运行：python -m src.app.benchmark.messages_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import random
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage, RemoveMessage
+from langgraph.graph import add_messages
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.messages.indexed_messages import IndexedMessages
+
+
+def make_message(i: int, text: str = "消息"):
+    cls = HumanMessage if i % 2 == 0 else AIMessage
+    return cls(f"{text}{i}", id=f"m{i}")
+
+
+def channel_with(messages: list) -> IndexedMessages:
+    """
+    与从检查点恢复的通道相同：列表来自外部，索引在第一次合并时建立
+    """
+    channel = IndexedMessages().from_checkpoint(list(messages))
+    channel.update([[]])
+    return channel
+
+
+def _update(n: int, i: int, op: str) -> list:
+    if op == "append":
+        return [make_message(n + i)]
+    if op == "replace":
+        return [make_message(i % n, "改写")]
+    return [RemoveMessage(id=f"m{i}"), make_message(i)]  # 删除后再写回，保持消息数不变
+
+
+def bench_baseline(messages: list, op: str, repeat: int) -> dict:
+    n, latencies, left = len(messages), [], list(messages)
+    for i in range(repeat):
+        update = _update(n, i, op)
+        t0 = time.perf_counter()
+        merged = add_messages(left, update)
+        latencies.append(time.perf_counter() - t0)
+        if op != "remove":
+            left = merged
+    return summarize(latencies)
+
+
+def bench_indexed(messages: list, op: str, repeat: int, read_between: bool) -> dict:
+    n, latencies = len(messages), []
+    channel = channel_with(messages)
+    for i in range(repeat):
+        update = _update(n, i, op)
+        if op == "remove":
+            update = update[:1]
+        if read_between:
+            channel.get()
+        t0 = time.perf_counter()
+        channel.update([update])
+        latencies.append(time.perf_counter() - t0)
+        if op == "remove":
+            channel.update([[make_message(i)]])  # 不计时：写回被删除的消息
+    return summarize(latencies)
+
+
+def session(length: int, indexed: bool) -> float:
+    t0 = time.perf_counter()
+    if indexed:
+        channel = IndexedMessages()
+        for i in range(length):
+            channel.update([[make_message(i)]])
+            channel.get()
+    else:
+        messages = []
+        for i in range(length):
+            messages = add_messages(messages, [make_message(i)])
+    return round((time.perf_counter() - t0) * 1000, 1)
+
+
+def check_equivalence(steps: int, seed: int = 7) -> int:
+    """
+    随机的追加/替换/删除/无id消息序列，逐步对比两种合并的结果
+    """
+    rng = random.Random(seed)
+    expected, channel, next_id = [], IndexedMessages(), 0
+    for _ in range(steps):
+        update, ids = [], [m.id for m in expected]
+        for _ in range(rng.randint(1, 4)):
+            roll = rng.random()
+            if roll < 0.02:  # 清空后追加无id的消息，本次合并的其余部分都被丢弃
+                update.extend([RemoveMessage(id=REMOVE_ALL_MESSAGES), HumanMessage("清空后a", id=None),
+                               HumanMessage("清空后b", id=None)])
+                break
+            if roll < 0.5 or not ids:
+                update.append(make_message(next_id))
+                next_id += 1
+            elif roll < 0.7:
+                update.append(AIMessage(f"改写{next_id}", id=rng.choice(ids)))
+            elif roll < 0.9:
+                update.append(RemoveMessage(id=rng.choice(ids)))
+            else:
+                update.append(HumanMessage("无id", id=None))
+        before, fork = list(expected), channel.copy()  # 条件边式的副本：与原通道共享列表和索引
+        expected = add_messages(expected, update)
+        channel.update([update])
+        assert _pairs(channel.get()) == _pairs(expected)
+        if ids and rng.random() < 0.2:  # 原通道改过之后，副本的合并仍然基于复制时的状态
+            fork_update = [RemoveMessage(id=ids[0]), make_message(-1, "副本")]
+            fork.update([fork_update])
+            assert _pairs(fork.get()) == _pairs(add_messages(before, fork_update))
+            assert _pairs(channel.get()) == _pairs(expected)
+    return len(expected)
+
+
+def check_remove_all() -> int:
+    """
+    REMOVE_ALL_MESSAGES之后无id的消息(dict形式)都要分配各自的id，与add_messages一样全部保留
+    """
+    update = [RemoveMessage(id=REMOVE_ALL_MESSAGES), {"role": "user", "content": "a"},
+              {"role": "user", "content": "b"}]
+    channel = channel_with([make_message(i) for i in range(3)])
+    channel.update([update])
+    merged, expected = channel.get(), add_messages([make_message(i) for i in range(3)], update)
+    assert [m.content for m in merged] == [m.content for m in expected] == ["a", "b"]
+    assert all(m.id is not None for m in merged) and len({m.id for m in merged}) == 2
+    channel.update([[make_message(3)]])  # 清空后的列表仍然可以按id继续合并
+    assert [m.content for m in channel.get()] == ["a", "b", "消息3"]
+    return len(merged)
+
+
+def _pairs(messages: list) -> list:
+    return [(m.id, m.content) for m in messages]
+
+
+def bench(lengths, repeat: int, session_lengths) -> dict:
+    report = {"equivalence_messages": check_equivalence(2000), "remove_all_messages": check_remove_all(),
+              "merge": [], "session_ms": []}
+    for n in lengths:
+        messages = [make_message(i) for i in range(n)]
+        for op in ("append", "replace", "remove"):
+            result = {"messages": n, "op": op,
+                      "add_messages_ms": bench_baseline(messages, op, repeat),
+                      "indexed_ms": bench_indexed(messages, op, repeat, read_between=False),
+                      "indexed_step_ms": bench_indexed(messages, op, repeat, read_between=True)}
+            result["speedup_p50"] = round(result["add_messages_ms"]["p50"] / max(result["indexed_ms"]["p50"], 1e-6),
+                                          1)
+            report["merge"].append(result)
+    for n in session_lengths:
+        report["session_ms"].append({"messages": n, "add_messages": session(n, False), "indexed": session(n, True)})
+    return report
+
+
+if __name__ == '__main__':
+    print("messages_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", default="1000,100000", help="逗号分隔的已有消息数")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--session", default="1000,5000", help="逗号分隔的整段会话消息数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench([int(n) for n in args.lengths.split(",")], args.repeat,
+                           [int(n) for n in args.session.split(",")]), indent=2, ensure_ascii=False))
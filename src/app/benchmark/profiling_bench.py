@@ -0,0 +1,78 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : profiling_bench.py
+@time    : 2026/10/18 16:10
+@desc    : 节点埋点开销压测：chatbot2_demo2在关闭埋点、默认埋点、内存采样三种配置下的单轮延迟
+           运行：python -m src.app.benchmark.profiling_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+from contextlib import redirect_stdout
+
+from langchain_core.messages import HumanMessage
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.store.memory import InMemoryStore
+
+from src.app.benchmark.bench_utils import summarize
+
+VARIANTS = {
+    "off": {"NODE_PROFILING": "0"},
+    "default": {"NODE_PROFILING": "1", "NODE_PROFILING_MEMORY_EVERY": "0"},
+    "memory_every_100": {"NODE_PROFILING": "1", "NODE_PROFILING_MEMORY_EVERY": "100"},
+}
+
+
+def load(env: dict):
+    """
+    按环境变量重新加载chatbot2_demo2，得到对应埋点配置的图
+    """
+    os.environ.update(env)
+    from src.app.chatbot2 import chatbot2_demo2
+    module = importlib.reload(chatbot2_demo2)
+    store = module.new_store(InMemoryStore())  # 不写demo共用的chatbot2_store.sqlite
+    module.get_store = lambda: store
+    return module, module.builder.compile(checkpointer=MemorySaver(), store=store)
+
+
+def run(graph, turns: int) -> list:
+    latencies = []
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        for i in range(turns):
+            config = {"configurable": {"thread_id": f"bench_{i % 50}", "user_id": f"user_{i % 10}"}}
+            t0 = time.perf_counter()
+            graph.invoke({"messages": [HumanMessage("我想查订单 ORD-001")]}, config)
+            latencies.append(time.perf_counter() - t0)
+    return latencies
+
+
+def bench(turns: int) -> dict:
+    report = {"turns": turns}
+    for name, env in VARIANTS.items():
+        module, graph = load(env)
+        run(graph, 50)  # 预热
+        latencies = run(graph, turns)
+        report[name] = {**summarize(latencies), "mean": round(sum(latencies) / len(latencies) * 1000, 4)}
+        if module.profiler.enabled:
+            report[name]["nodes"] = module.profiler.report()
+            module.profiler.registry.clear()
+    base = report["off"]["mean"]
+    for name in VARIANTS:
+        report[name]["overhead_pct"] = round((report[name]["mean"] - base) / base * 100, 2)
+    return report
+
+
+if __name__ == '__main__':
+    print("profiling_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.turns), ensure_ascii=False, indent=2))
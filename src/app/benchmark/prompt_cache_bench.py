@@ -0,0 +1,66 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : prompt_cache_bench.py
+@time    : 2026/10/18 14:05
+@desc    : 提示词缓存验证：用模拟Anthropic缓存的假模型跑多轮对话，统计每轮缓存命中/未缓存token
+           运行：python -m src.app.benchmark.prompt_cache_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+from typing import Annotated
+
+from langchain_anthropic import convert_to_anthropic_tool
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END, add_messages
+from typing_extensions import TypedDict
+
+from src.app.benchmark.fake_llm import FakeCachingChatModel
+from src.app.messages.prompt_cache import PromptCache, cache_tools
+from src.app.tools.CommonTools import get_weather
+
+REPLY = "好的，我来帮你查询。" + "根据目前的信息，建议您关注天气变化。" * 10
+
+
+class State(TypedDict):
+    messages: Annotated[list, add_messages]
+
+
+def run(turns: int, cached: bool) -> dict:
+    prompt_cache = PromptCache(max_breakpoints=2 if cached else 0)
+    llm = FakeCachingChatModel(responses=[REPLY], latency=0)
+    tools = cache_tools([get_weather]) if cached else [convert_to_anthropic_tool(get_weather)]
+    llm_with_tools = llm.bind_tools(tools)
+
+    def chatbot(state: State):
+        response = llm_with_tools.invoke(prompt_cache.prepare(state["messages"]))
+        prompt_cache.record(response)
+        return {"messages": [response]}
+
+    graph_builder = StateGraph(State)
+    graph_builder.add_node("chatbot", chatbot)
+    graph_builder.add_edge(START, "chatbot")
+    graph_builder.add_edge("chatbot", END)
+    graph = graph_builder.compile(checkpointer=MemorySaver())
+
+    config = {"configurable": {"thread_id": "bench"}}
+    for turn in range(turns):
+        graph.invoke({"messages": [{"role": "user", "content": f"第{turn}个问题：北京明天天气怎么样？"}]}, config)
+    return {
+        "per_turn": [{k: u[k] for k in ("cache_read", "cache_creation", "uncached")} for u in prompt_cache.turns],
+        "totals": prompt_cache.totals(),
+    }
+
+
+if __name__ == '__main__':
+    print("prompt_cache_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=10)
+    args = parser.parse_args()
+
+    report = {"without_breakpoints": run(args.turns, False), "with_breakpoints": run(args.turns, True)}
+    print(json.dumps(report, ensure_ascii=False, indent=1))
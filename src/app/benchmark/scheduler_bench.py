@@ -0,0 +1,164 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : scheduler_bench.py
+@time    : 2026/10/18 21:10
+@desc    : 同一会话并发请求的调度验证与压测：chatbot_demo3换成假模型，每个会话同时发出T条消息
+           raw：直接并发调用图，多个请求读到同一个父检查点，会话历史分叉、用户消息丢失
+           scheduler：ThreadScheduler按thread_id排队，消息一条不丢，不同会话之间仍然并行
+           coalesce：排队中的消息合并成一轮执行，执行次数和总耗时下降
+           cross_process：两个进程用同一个锁目录(ThreadLocks)，同一会话的turn不会交叠
+           cancelled_head：合并执行的发起者被取消，其余合并进来的请求仍然拿到结果
+           运行：python -m src.app.benchmark.scheduler_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import redirect_stdout
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.app.graphs.scheduler import ThreadScheduler
+from src.app.server.thread_lock import ThreadLocks, fcntl
+from src.app.loadtest.targets import build_target
+
+
+def lost_messages(graph, threads: int, turns: int) -> int:
+    """
+    统计各会话最终状态中缺少的用户消息数
+    """
+    lost = 0
+    for t in range(threads):
+        state = graph.get_state({"configurable": {"thread_id": f"t{t}"}})
+        contents = {m.content for m in state.values.get("messages", []) if m.type == "human"}
+        lost += sum(1 for i in range(turns) if f"t{t}-消息{i}" not in contents)
+    return lost
+
+
+def _inputs(t: int, i: int) -> dict:
+    return {"messages": [{"role": "user", "content": f"t{t}-消息{i}"}]}
+
+
+def run_threads(threads: int, turns: int, latency: str, scheduler: ThreadScheduler = None) -> dict:
+    graph = build_target("chatbot_demo3", MemorySaver(), latency=latency, tool_latency="fixed:0.0").graph
+
+    def call(job):
+        t, i = job
+        config = {"configurable": {"thread_id": f"t{t}"}}
+        return scheduler.invoke(graph, _inputs(t, i), config) if scheduler else graph.invoke(_inputs(t, i), config)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads * turns) as pool:
+        list(pool.map(call, [(t, i) for t in range(threads) for i in range(turns)]))
+    return _report(graph, threads, turns, time.perf_counter() - start, scheduler)
+
+
+async def run_async(threads: int, turns: int, latency: str, scheduler: ThreadScheduler = None) -> dict:
+    graph = build_target("chatbot_demo3", MemorySaver(), latency=latency, tool_latency="fixed:0.0").graph
+
+    async def call(t, i):
+        config = {"configurable": {"thread_id": f"t{t}"}}
+        if scheduler:
+            return await scheduler.ainvoke(graph, _inputs(t, i), config)
+        return await graph.ainvoke(_inputs(t, i), config)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[call(t, i) for t in range(threads) for i in range(turns)])
+    return _report(graph, threads, turns, time.perf_counter() - start, scheduler)
+
+
+def _report(graph, threads: int, turns: int, elapsed: float, scheduler: ThreadScheduler = None) -> dict:
+    report = {"elapsed_ms": round(elapsed * 1000, 1), "lost_messages": lost_messages(graph, threads, turns)}
+    if scheduler:
+        report["stats"] = scheduler.stats()
+        wait = scheduler.metrics.snapshot()["scheduler_queue_wait_seconds"][f"scheduler={scheduler.name}"]
+        report["queue_wait_ms"] = {k: round(wait[k] * 1000, 1) for k in ("p50", "p99", "max")}
+    return report
+
+
+def _hold_turn(lock_dir: str, log_path: str, hold: float):
+    async def main():
+        scheduler = ThreadScheduler(name="cross", locks=ThreadLocks(lock_dir))
+        async with scheduler.turn("t"):
+            with open(log_path, "a") as log:
+                log.write("in\n")
+            await asyncio.sleep(hold)
+            with open(log_path, "a") as log:
+                log.write("out\n")
+    asyncio.run(main())
+
+
+def cross_process(workers: int = 2, hold: float = 0.2) -> list:
+    """
+    多个进程同时进入同一会话的turn，返回进出顺序；正确时为 in,out,in,out...
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        log_path = os.path.join(directory, "order.log")
+        processes = [multiprocessing.Process(target=_hold_turn, args=(directory, log_path, hold))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        with open(log_path) as log:
+            return log.read().split()
+
+
+async def cancelled_head(latency: str) -> list:
+    """
+    第一轮执行期间排队3条消息，第二轮合并执行开始后取消发起者，返回每个请求的结果类型
+    """
+    graph = build_target("chatbot_demo3", MemorySaver(), latency=latency, tool_latency="fixed:0.0").graph
+    scheduler = ThreadScheduler(name="cancel", coalesce=True)
+    config = {"configurable": {"thread_id": "cancel"}}
+    first = asyncio.ensure_future(scheduler.ainvoke(graph, _inputs(0, 0), config))
+    await asyncio.sleep(0)
+    queued = [asyncio.ensure_future(scheduler.ainvoke(graph, _inputs(0, i), config)) for i in (1, 2, 3)]
+    await first
+    await asyncio.sleep(0)
+    queued[0].cancel()
+    results = await asyncio.gather(*queued, return_exceptions=True)
+    return [type(result).__name__ for result in results]
+
+
+def bench(threads: int, turns: int, latency: float) -> dict:
+    dist = f"fixed:{latency}"
+    report = {"threads": threads, "turns": turns, "latency_ms": latency * 1000,
+              "expected_serial_ms": round(turns * 2 * latency * 1000, 1)}  # 每轮调用两次大模型
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        report["raw"] = run_threads(threads, turns, dist)
+        report["scheduler"] = run_threads(threads, turns, dist, ThreadScheduler(name="thread"))
+        report["coalesce"] = run_threads(threads, turns, dist, ThreadScheduler(name="coalesce", coalesce=True))
+        report["raw_async"] = asyncio.run(run_async(threads, turns, dist))
+        report["scheduler_async"] = asyncio.run(run_async(threads, turns, dist, ThreadScheduler(name="async")))
+        report["coalesce_async"] = asyncio.run(
+            run_async(threads, turns, dist, ThreadScheduler(name="coalesce_async", coalesce=True)))
+    assert report["raw"]["lost_messages"] > 0 or report["raw_async"]["lost_messages"] > 0, "没有复现会话历史分叉"
+    for name in ("scheduler", "coalesce", "scheduler_async", "coalesce_async"):
+        assert report[name]["lost_messages"] == 0, f"{name} 丢失了用户消息"
+    report["cancelled_head"] = asyncio.run(cancelled_head(dist))
+    assert report["cancelled_head"] == ["CancelledError", "dict", "dict"], "发起者取消导致合并的请求失败"
+    if fcntl is not None:
+        report["cross_process"] = cross_process()
+        assert report["cross_process"] == ["in", "out"] * 2, "两个进程同时进入了同一会话"
+    return report
+
+
+if __name__ == '__main__':
+    print("scheduler_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8, help="会话数")
+    parser.add_argument("--turns", type=int, default=5, help="每个会话同时发出的消息数")
+    parser.add_argument("--latency", type=float, default=0.05, help="假模型每次调用的延迟(秒)")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.threads, args.turns, args.latency), indent=2, ensure_ascii=False))
@@ -0,0 +1,195 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : semantic_bench.py
+@time    : 2026/10/18 23:30
+@desc    : 语义检索压测：单个命名空间中有1万/10万/100万条记忆时的查询延迟
+           brute：一次矩阵乘对全部向量打分(精确)        ivf：只对最近的nprobe个簇打分，recall@k为与brute结果的重合率
+           python：没有numpy时的纯Python打分(只测较小的规模)
+           另测增量put(单条写入索引)、IVF训练耗时，以及SemanticStore + IndexedSqliteStore的端到端查询
+           记忆文本由模板组合生成，用HashingEmbedder编码一个文本池，每条记忆 = 池中某条的向量 + 随机扰动
+           运行：python -m src.app.benchmark.semantic_bench [--sizes 10000,100000,1000000]
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.store import semantic_store
+from src.app.store.semantic_store import HashingEmbedder, SemanticStore, VectorIndex
+from src.app.store.sqlite_store import IndexedSqliteStore
+
+SUBJECTS = ["退货", "换货", "运费", "快递", "发票", "会员积分", "优惠券", "售后维修", "价格保护", "预售定金",
+            "iPhone 15", "MacBook Pro", "蓝牙耳机", "洗衣机", "空调安装", "生鲜配送", "礼品卡", "分期付款",
+            "地址修改", "订单取消"]
+ACTIONS = ["咨询了", "投诉了", "询问", "申请", "希望尽快处理", "对结果不满意的", "确认了", "多次催促"]
+DETAILS = ["周末不方便收货", "希望用顺丰", "金额超过五千元", "商品有划痕", "物流三天没有更新", "需要开公司抬头",
+           "已经等了一周", "客服答复前后不一致", "想改成分期", "要求上门取件"]
+
+
+def make_texts(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    return [f"用户{rng.choice(ACTIONS)}{rng.choice(SUBJECTS)}的问题，{rng.choice(DETAILS)}，"
+            f"{rng.choice(DETAILS)}" for _ in range(count)]
+
+
+def make_queries(count: int, seed: int = 11) -> list:
+    rng = random.Random(seed)
+    return [f"{rng.choice(SUBJECTS)}{rng.choice(DETAILS)}" for _ in range(count)]
+
+
+def generate(pool, size: int, chunk: int = 100000, noise: float = 0.05, seed: int = 3):
+    """
+    分块生成size条记忆向量，控制临时内存
+    """
+    rng = np.random.default_rng(seed)
+    for start in range(0, size, chunk):
+        n = min(chunk, size - start)
+        matrix = pool[rng.integers(0, len(pool), n)]
+        matrix += rng.standard_normal(matrix.shape, dtype=np.float32) * noise
+        yield [f"m{i}" for i in range(start, start + n)], matrix
+
+
+def measure(index: VectorIndex, queries, k: int, **kwargs):
+    latencies, results = [], []
+    for query in queries:
+        t0 = time.perf_counter()
+        results.append(index.search(query, k, **kwargs))
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies), results
+
+
+def recall(expected: list, actual: list) -> float:
+    hits = sum(len({key for _, key in e} & {key for _, key in a}) for e, a in zip(expected, actual))
+    return round(hits / max(sum(len(e) for e in expected), 1), 4)
+
+
+def measure_puts(index: VectorIndex, pool, count: int) -> dict:
+    latencies = []
+    for i in range(count):
+        t0 = time.perf_counter()
+        index.add(f"new{i}", pool[i % len(pool)])
+        latencies.append(time.perf_counter() - t0)
+    for i in range(count):
+        index.remove(f"new{i}")
+    return summarize(latencies)
+
+
+@contextmanager
+def without_numpy():
+    """
+    模拟没有安装numpy：索引用纯Python列表和逐条打分
+    """
+    saved, semantic_store.np = semantic_store.np, None
+    try:
+        yield
+    finally:
+        semantic_store.np = saved
+
+
+def bench_size(pool, queries, size: int, k: int, nprobes, python_limit: int) -> dict:
+    report = {"memories": size}
+    index = VectorIndex(pool.shape[1], ivf_threshold=None)
+    t0 = time.perf_counter()
+    for keys, matrix in generate(pool, size):
+        index.add_many(keys, matrix)
+    report["build_s"] = round(time.perf_counter() - t0, 2)
+    report["brute_ms"], expected = measure(index, queries, k)
+    report["brute_put_ms"] = measure_puts(index, pool, 200)
+
+    if size <= python_limit:
+        with without_numpy():
+            fallback = VectorIndex(pool.shape[1])
+            for keys, matrix in generate(pool, size):
+                for key, vector in zip(keys, matrix.tolist()):
+                    fallback.add(key, vector)
+            report["python_ms"], actual = measure(fallback, queries[:20], k)
+            report["python_recall"] = recall(expected[:20], actual)
+        del fallback
+
+    t0 = time.perf_counter()
+    index.rebuild(nlist=max(16, int(size ** 0.5)))
+    report["ivf_train_s"] = round(time.perf_counter() - t0, 2)
+    report["nlist"] = len(index.buckets)
+    for nprobe in nprobes:
+        latency, actual = measure(index, queries, k, nprobe=nprobe)
+        report[f"ivf_nprobe{nprobe}_ms"] = latency
+        report[f"ivf_nprobe{nprobe}_recall"] = recall(expected, actual)
+    report["ivf_put_ms"] = measure_puts(index, pool, 200)
+    return report
+
+
+def bench_store(size: int, k: int) -> dict:
+    """
+    端到端：IndexedSqliteStore中一个用户有size条记忆，第一次查询时加载索引，之后的查询包含从SQLite读出记录
+    """
+    texts, queries = make_texts(size), make_queries(100)
+    report = {"memories": size}
+    with tempfile.TemporaryDirectory() as directory, \
+            IndexedSqliteStore.from_conn_string(os.path.join(directory, "store.sqlite")) as inner:
+        inner.setup()
+        inner.put_many((("user_001", "memories"), f"m{i}", {"text": text}) for i, text in enumerate(texts))
+        store = SemanticStore(inner)
+        t0 = time.perf_counter()
+        store.search(("user_001",), query=queries[0], limit=k)
+        report["first_query_load_s"] = round(time.perf_counter() - t0, 2)
+        latencies = []
+        for query in queries:
+            t0 = time.perf_counter()
+            store.search(("user_001",), query=query, limit=k)
+            latencies.append(time.perf_counter() - t0)
+        report["query_ms"] = summarize(latencies)
+        latencies = []
+        for i, query in enumerate(queries):
+            t0 = time.perf_counter()
+            store.put(("user_001", "memories"), f"new{i}", {"text": query})
+            latencies.append(time.perf_counter() - t0)
+        report["put_ms"] = summarize(latencies)
+        found = store.search(("user_001",), query=queries[5], limit=1)[0]
+        assert found.key.startswith("new") and found.score > 0.99  # 刚写入的记忆立即可以检索到
+        store.put(("user_001", "memories"), found.key, None)
+        assert all(item.key != found.key for item in store.search(("user_001",), query=queries[5], limit=k))
+        report["stats"] = store.stats()
+    return report
+
+
+def bench(sizes, k: int, nprobes, pool_size: int, queries: int, python_limit: int, store_size: int) -> dict:
+    embedder = HashingEmbedder()
+    texts = make_texts(pool_size)
+    t0 = time.perf_counter()
+    pool = embedder(texts)
+    report = {"dims": embedder.dims, "k": k,
+              "embed_us_per_text": round((time.perf_counter() - t0) / len(texts) * 1e6, 1),
+              "store": bench_store(store_size, k), "sizes": []}
+    query_vectors = embedder(make_queries(queries))
+    for size in sizes:
+        report["sizes"].append(bench_size(pool, query_vectors, size, k, nprobes, python_limit))
+        print(json.dumps(report["sizes"][-1], ensure_ascii=False))
+    return report
+
+
+if __name__ == '__main__':
+    print("semantic_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="逗号分隔的记忆条数")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", default="8,32", help="逗号分隔的IVF探测簇数")
+    parser.add_argument("--pool", type=int, default=5000, help="文本池大小")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--python-limit", type=int, default=10000, help="纯Python打分只测不超过该规模")
+    parser.add_argument("--store-size", type=int, default=10000, help="端到端测试的记忆条数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench([int(n) for n in args.sizes.split(",")], args.k,
+                           [int(n) for n in args.nprobe.split(",")], args.pool, args.queries, args.python_limit,
+                           args.store_size), indent=2, ensure_ascii=False))
@@ -0,0 +1,163 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : serde_bench.py
+@time    : 2026/10/18 22:30
+@desc    : 增量检查点序列化压测：会话每步追加一条消息，50/500/5000条消息时对比
+           baseline：JsonPlusSerializer整份序列化(SqliteSaver默认)，每步的大小和耗时随会话长度线性增长
+           delta：DeltaSerde + BatchedSqliteSaver，只写新增消息，每full_every步一次全量，再压缩
+           指标：每个会话的检查点总字节数、最后一步的序列化耗时、冷/热读取最新检查点的耗时
+           baseline在长会话下全部写一遍需要GB级空间，按均匀采样的步数积分估算总字节数(字节数随长度线性增长)
+           另外用真实的图(MessagesState，同步/异步检查点)验证冷启动后读取的状态与写入一致
+           运行：python -m src.app.benchmark.serde_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import create_checkpoint, empty_checkpoint
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from langgraph.graph import StateGraph, START, END, MessagesState
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.checkpoint.delta_serde import DeltaSerde
+from src.app.checkpoint.sqlite_saver import BatchedAsyncSqliteSaver, BatchedSqliteSaver
+
+TEXT = "关于订单配送时间的问题，客服已经查询物流信息并给出了预计送达日期和后续处理建议。"
+
+
+def make_message(i: int):
+    cls = HumanMessage if i % 2 == 0 else AIMessage
+    return cls(f"第{i}条：{TEXT}", id=f"msg-{i}")
+
+
+def _checkpoint(messages, step: int) -> dict:
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {"messages": messages}
+    checkpoint["channel_versions"] = {"messages": step}
+    return checkpoint
+
+
+def baseline(length: int, samples: int) -> dict:
+    """
+    全量序列化：在均匀采样的会话长度上测大小和耗时，总字节数按采样点积分
+    """
+    serde = JsonPlusSerializer()
+    messages = [make_message(i) for i in range(length)]
+    points = sorted({max(1, round(length * k / samples)) for k in range(1, samples + 1)})
+    sizes = {}
+    for n in points:
+        sizes[n] = len(serde.dumps_typed(_checkpoint(messages[:n], n))[1])
+    total, previous = 0.0, (0, 0)
+    for n in points:
+        total += (sizes[n] + previous[1]) / 2 * (n - previous[0])
+        previous = (n, sizes[n])
+    checkpoint = _checkpoint(messages, length)
+    t0 = time.perf_counter()
+    data = serde.dumps_typed(checkpoint)
+    t1 = time.perf_counter()
+    serde.loads_typed(data)
+    t2 = time.perf_counter()
+    return {"bytes_per_thread": int(total), "last_checkpoint_bytes": sizes[length],
+            "serialize_last_ms": round((t1 - t0) * 1000, 3), "deserialize_last_ms": round((t2 - t1) * 1000, 3)}
+
+
+def delta(directory: str, length: int, full_every: int, compression: str) -> dict:
+    """
+    每条消息一个检查点，真实写入SQLite
+    """
+    path = os.path.join(directory, f"delta_{length}_{compression}.sqlite")
+    serde = DeltaSerde(full_every=full_every, compression=compression)
+    serialize = []
+    with BatchedSqliteSaver.from_conn_string(path, serde=serde) as saver:
+        config = {"configurable": {"thread_id": "t", "checkpoint_ns": ""}}
+        messages = []
+        for i in range(length):
+            messages = messages + [make_message(i)]
+            checkpoint = _checkpoint(messages, i + 1)
+            t0 = time.perf_counter()
+            config = saver.put(config, checkpoint, {"step": i, "source": "loop"}, {})
+            serialize.append(time.perf_counter() - t0)  # 包括组提交写入
+        with saver.cursor(transaction=False) as cur:
+            total = cur.execute("SELECT SUM(LENGTH(checkpoint)) FROM checkpoints").fetchone()[0]
+
+        t0 = time.perf_counter()
+        warm = saver.get_tuple(config)
+        warm_ms = (time.perf_counter() - t0) * 1000
+        serde.clear_cache()  # 模拟重启后第一次读取，需要沿父链解码
+        t0 = time.perf_counter()
+        cold = saver.get_tuple(config)
+        cold_ms = (time.perf_counter() - t0) * 1000
+        assert cold.checkpoint["channel_values"]["messages"] == messages
+        assert warm.checkpoint["channel_values"]["messages"] == messages
+    return {"bytes_per_thread": total, "serialize_ms": summarize(serialize),
+            "get_latest_warm_ms": round(warm_ms, 3), "get_latest_cold_ms": round(cold_ms, 3), "stats": serde.stats}
+
+
+def _chat_graph(checkpointer):
+    builder = StateGraph(MessagesState)
+    builder.add_node("reply", lambda state: {"messages": [AIMessage(f"收到：{state['messages'][-1].content}")]})
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def verify_graph(directory: str, turns: int) -> dict:
+    path = os.path.join(directory, "graph.sqlite")
+    config = {"configurable": {"thread_id": "chat"}}
+    with BatchedSqliteSaver.from_conn_string(path, serde=DeltaSerde(full_every=8)) as saver:
+        graph = _chat_graph(saver)
+        for i in range(turns):
+            graph.invoke({"messages": [HumanMessage(f"第{i}个问题")]}, config)
+        expected = graph.get_state(config).values["messages"]
+        types = dict(saver.conn.execute("SELECT type, COUNT(*) FROM checkpoints GROUP BY type").fetchall())
+    with BatchedSqliteSaver.from_conn_string(path, serde=DeltaSerde(full_every=8)) as saver:  # 冷启动
+        graph = _chat_graph(saver)
+        assert graph.get_state(config).values["messages"] == expected
+        graph.invoke({"messages": [HumanMessage("重启后的问题")]}, config)
+        assert len(graph.get_state(config).values["messages"]) == len(expected) + 2
+    asyncio.run(_averify(path, config, len(expected) + 2))
+    return {"messages": len(expected) + 4, "checkpoint_types": types}
+
+
+async def _averify(path: str, config: dict, expected: int):
+    async with BatchedAsyncSqliteSaver.from_conn_string(path, serde=DeltaSerde(full_every=8)) as saver:
+        graph = _chat_graph(saver)
+        assert len((await graph.aget_state(config)).values["messages"]) == expected
+        await graph.ainvoke({"messages": [HumanMessage("异步的问题")]}, config)
+        assert len((await graph.aget_state(config)).values["messages"]) == expected + 2
+
+
+def bench(lengths, full_every: int, samples: int) -> dict:
+    compressions = ["zstd", "zlib"] if DeltaSerde().compression == "zstd" else ["zlib"]
+    report = {"full_every": full_every, "compressions": compressions, "results": []}
+    with tempfile.TemporaryDirectory() as directory:
+        report["graph_check"] = verify_graph(directory, 20)
+        for length in lengths:
+            result = {"messages": length, "baseline": baseline(length, samples)}
+            for compression in compressions + ["none"]:
+                result[f"delta_{compression}"] = delta(directory, length, full_every, compression)
+            best = min(result[f"delta_{c}"]["bytes_per_thread"] for c in compressions)
+            result["bytes_ratio"] = round(result["baseline"]["bytes_per_thread"] / best, 1)
+            report["results"].append(result)
+    return report
+
+
+if __name__ == '__main__':
+    print("serde_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--lengths", default="50,500,5000", help="逗号分隔的会话消息数")
+    parser.add_argument("--full-every", type=int, default=32)
+    parser.add_argument("--samples", type=int, default=50, help="baseline估算总字节数的采样点数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench([int(n) for n in args.lengths.split(",")], args.full_every, args.samples),
+                     indent=2, ensure_ascii=False))
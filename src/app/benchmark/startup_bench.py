@@ -0,0 +1,124 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : startup_bench.py
+@time    : 2026/10/18 17:40
+@desc    : 冷启动压测：python -X importtime 按顶层包拆分导入耗时，以及新进程从启动到流式输出第一个token的时间
+           lazy：模型、工具、检查点都在第一次用到时才创建(假模型注入后真实对象不会被创建)
+           eager：启动时就导入并创建真实的ChatAnthropic/工具/检查点，相当于改造前导入模块时的开销
+           运行：python -m src.app.benchmark.startup_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from src.app.benchmark.bench_utils import summarize
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", ".."))
+
+# 子进程中执行：导入demo，注入假模型，编译图，流式输出到第一个token为止
+CHILD = """
+import sys, time
+t0 = time.perf_counter()
+import importlib
+module = importlib.import_module("src.app.chatbot.{target}")
+t_import = time.perf_counter()
+if {eager}:
+    module.get_llm_with_tools()
+    for name in ("get_window", "get_memory"):
+        if hasattr(module, name):
+            getattr(module, name)()
+t_eager = time.perf_counter()
+from langgraph.checkpoint.memory import MemorySaver
+from src.app.loadtest.fake_model import ScriptedChatModel
+model = ScriptedChatModel(script=["你好，我是你的助手，有什么可以帮你？"], latency="fixed:0.0")
+module.get_llm_with_tools = lambda: model
+module.get_llm = lambda: model
+if hasattr(module, "get_window"):
+    module.get_window.cache_clear()
+graph = module.get_graph(MemorySaver())
+t_compile = time.perf_counter()
+config = {{"configurable": {{"thread_id": "startup"}}}}
+for chunk, metadata in graph.stream({{"messages": [{{"role": "user", "content": "你好"}}]}}, config,
+                                    stream_mode="messages"):
+    if chunk.content:
+        break
+t_token = time.perf_counter()
+sys.stdout.write("FIRST_TOKEN %.6f %.6f %.6f %.6f\\n" % (t_import - t0, t_eager - t_import,
+                                                    t_compile - t_eager, t_token - t_compile))
+sys.stdout.flush()
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("TAVILY_API_KEY", "bench")  # eager模式下构造TavilySearch需要，不会真正调用
+    env.setdefault("ANTHROPIC_API_KEY", "bench")
+    return env
+
+
+def import_breakdown(module: str, top: int = 10) -> dict:
+    """
+    python -X importtime 的输出按顶层包汇总，用每个模块自身的耗时(self)相加，嵌套导入不会重复计算
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=ROOT, env=_env(),
+                          capture_output=True, text=True, check=True)
+    packages = defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us)
+    ranked = sorted(packages.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return {"total_ms": round(sum(packages.values()) / 1000, 1), "top_ms": {k: round(v / 1000, 1) for k, v in ranked}}
+
+
+def cold_start(target: str, eager: bool) -> dict:
+    """
+    新进程从启动到第一个token的耗时，wall_ms包含解释器本身的启动
+    """
+    code = CHILD.format(target=target, eager=eager)
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=ROOT, env=_env(), stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL, text=True)
+    phases = None
+    for line in proc.stdout:
+        if line.startswith("FIRST_TOKEN"):
+            wall = time.perf_counter() - start
+            phases = [float(x) for x in line.split()[1:]]
+            break
+    proc.stdout.close()
+    proc.wait()
+    if phases is None:
+        raise RuntimeError(f"{target} 子进程没有输出第一个token，退出码 {proc.returncode}")
+    return {"wall": wall, "import": phases[0], "eager": phases[1], "compile": phases[2], "first_token": phases[3]}
+
+
+def bench(target: str, runs: int) -> dict:
+    report = {"target": target, "runs": runs,
+              "importtime": import_breakdown(f"src.app.chatbot.{target}"),
+              "importtime_eager_deps": import_breakdown("langchain_anthropic, langchain_tavily, langgraph.prebuilt")}
+    for mode in ("lazy", "eager"):
+        samples = [cold_start(target, mode == "eager") for _ in range(runs)]
+        report[mode] = {phase: summarize([s[phase] for s in samples]) for phase in samples[0]}
+    return report
+
+
+if __name__ == '__main__':
+    print("startup_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", default="chatbot_demo3",
+                        choices=["chatbot_demo1", "chatbot_demo2", "chatbot_demo3", "chatbot_demo4"])
+    parser.add_argument("--runs", type=int, default=5, help="每种模式启动的进程数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.target, args.runs), indent=2, ensure_ascii=False))
@@ -0,0 +1,129 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : store_bench.py
+@time    : 2026/10/18 18:00
+@desc    : 长期记忆存储压测：InMemoryStore / SqliteStore / IndexedSqliteStore 的 get、put、search
+           默认100万条记录、10万用户，另有一个5万条日志的热点用户用于测试深分页
+           运行：python -m src.app.benchmark.store_bench [--items 1000000 --users 100000]
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+from contextlib import closing
+
+from langgraph.store.base import PutOp
+from langgraph.store.memory import InMemoryStore
+from langgraph.store.sqlite import SqliteStore
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.store.sqlite_store import IndexedSqliteStore
+
+HOT_USER = "hot_user"
+
+
+def records(items: int, users: int, hot: int):
+    """
+    每个用户一条profile，其余为logs(session_id取值在用户内重复)
+    """
+    per_user = max(items // users - 1, 0)
+    for u in range(users):
+        user = f"user_{u}"
+        yield (user, "profile"), "basic_info", {"name": f"用户{u}", "level": "VIP" if u % 10 == 0 else "normal"}
+        for i in range(per_user):
+            yield (user, "logs"), f"log_{i}", {"session_id": f"{user}_s{i % 5}", "message_count": i,
+                                               "last_message": "我想查订单 ORD-001"}
+    for i in range(hot):
+        yield (HOT_USER, "logs"), f"log_{i:06d}", {"session_id": f"hot_s{i % 50}", "message_count": i}
+
+
+def load(store, items, users, hot, chunk: int = 2000) -> float:
+    t0 = time.perf_counter()
+    if isinstance(store, IndexedSqliteStore):
+        store.put_many(records(items, users, hot), chunk_size=chunk)
+    else:
+        ops = []
+        for namespace, key, value in records(items, users, hot):
+            ops.append(PutOp(namespace, key, value))
+            if len(ops) >= chunk:
+                store.batch(ops)
+                ops = []
+        if ops:
+            store.batch(ops)
+    return time.perf_counter() - t0
+
+
+def measure(func, count: int) -> dict:
+    latencies = []
+    for i in range(count):
+        t0 = time.perf_counter()
+        func(i)
+        latencies.append(time.perf_counter() - t0)
+    return summarize(latencies)
+
+
+def run(name, store, args) -> dict:
+    rng = random.Random(args.seed)
+    user = lambda: f"user_{rng.randrange(args.users)}"
+    report = {"store": name, "load_s": round(load(store, args.items, args.users, args.hot), 2)}
+    report["get_ms"] = measure(lambda i: store.get((user(), "profile"), "basic_info"), args.ops)
+    report["put_ms"] = measure(lambda i: store.put((user(), "logs"), f"new_{i}", {"session_id": "new"}), args.ops)
+    report["search_ns_ms"] = measure(lambda i: store.search((user(), "logs"), limit=10), args.ops)
+
+    def filtered(i):
+        u = user()
+        return store.search((u, "logs"), filter={"session_id": f"{u}_s{i % 5}"}, limit=10)
+
+    report["search_ns_filter_ms"] = measure(filtered, args.ops)
+    report["search_global_filter_ms"] = measure(
+        lambda i: store.search((), filter={"session_id": f"user_{rng.randrange(args.users)}_s1"}, limit=10),
+        max(args.ops // 20, 5))
+    report["deep_page_offset_ms"] = measure(
+        lambda i: store.search((HOT_USER, "logs"), limit=20, offset=args.hot // 2), max(args.ops // 20, 5))
+    if isinstance(store, IndexedSqliteStore):
+        # 键集分页：先翻到中间位置，再测下一页的耗时
+        _, cursor = store.search_page((HOT_USER, "logs"), limit=args.hot // 2)
+        report["deep_page_keyset_ms"] = measure(
+            lambda i: store.search_page((HOT_USER, "logs"), limit=20, cursor=cursor), max(args.ops // 20, 5))
+    return report
+
+
+def bench(args) -> list:
+    report = []
+    with tempfile.TemporaryDirectory() as directory:
+        if not args.skip_memory:
+            report.append(run("InMemoryStore", InMemoryStore(), args))
+
+        import sqlite3
+        with closing(sqlite3.connect(os.path.join(directory, "stock.sqlite"), check_same_thread=False,
+                                     isolation_level=None)) as conn:
+            store = SqliteStore(conn)
+            store.setup()
+            report.append(run("SqliteStore", store, args))
+
+        with IndexedSqliteStore.from_conn_string(os.path.join(directory, "indexed.sqlite"),
+                                                 indexed_fields=("session_id",)) as store:
+            store.setup()
+            report.append(run("IndexedSqliteStore", store, args))
+    return report
+
+
+if __name__ == '__main__':
+    print("store_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--hot", type=int, default=50000, help="热点用户的日志条数")
+    parser.add_argument("--ops", type=int, default=2000, help="每种操作的次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--skip-memory", action="store_true", help="跳过InMemoryStore(100万条约占数GB内存)")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args), ensure_ascii=False, indent=2))
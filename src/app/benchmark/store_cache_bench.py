@@ -0,0 +1,83 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : store_cache_bench.py
+@time    : 2026/10/18 18:40
+@desc    : 档案读缓存压测：模拟远程store(每次往返有延迟)，对比每轮读档案时直连与CachedStore的往返次数和耗时
+           运行：python -m src.app.benchmark.store_cache_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import json
+import random
+import time
+
+from langgraph.store.base import BaseStore
+from langgraph.store.memory import InMemoryStore
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.store.cached_store import CachedStore, profile_only
+
+
+class RemoteStore(BaseStore):
+    """
+    模拟远程store：每次batch往返等待latency秒
+    """
+
+    def __init__(self, latency: float):
+        self.store = InMemoryStore()
+        self.latency = latency
+        self.round_trips = 0
+
+    def batch(self, ops):
+        self.round_trips += 1
+        time.sleep(self.latency)
+        return self.store.batch(ops)
+
+    async def abatch(self, ops):
+        return self.batch(ops)
+
+
+def run(store, remote: RemoteStore, args) -> dict:
+    rng = random.Random(args.seed)
+    users = [f"user_{i}" for i in range(args.users)]
+    for user in users:
+        if rng.random() < args.unknown:
+            continue
+        remote.store.put((user, "profile"), "basic_info", {"name": user})
+    remote.round_trips = 0
+    latencies = []
+    for turn in range(args.turns):
+        user = users[min(int(rng.paretovariate(1.2)) - 1, args.users - 1)]  # 少数活跃用户占大部分请求
+        t0 = time.perf_counter()
+        item = store.get((user, "profile"), "basic_info")
+        latencies.append(time.perf_counter() - t0)
+        if rng.random() < args.update_rate:
+            store.put((user, "profile"), "basic_info", {"name": user, "updated": turn, "seen": item is not None})
+    return {"round_trips": remote.round_trips, "get_ms": summarize(latencies), "total_s": round(sum(latencies), 3)}
+
+
+def bench(args) -> dict:
+    remote = RemoteStore(args.latency)
+    report = {"direct": run(remote, remote, args)}
+    remote = RemoteStore(args.latency)
+    cached = CachedStore(remote, cacheable=profile_only)
+    report["cached"] = {**run(cached, remote, args), **cached.stats()}
+    return report
+
+
+if __name__ == '__main__':
+    print("store_cache_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--unknown", type=float, default=0.1, help="没有档案的用户占比")
+    parser.add_argument("--update-rate", type=float, default=0.01, help="每轮更新档案的概率")
+    parser.add_argument("--latency", type=float, default=0.002, help="远程store单次往返延迟(秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args), ensure_ascii=False, indent=2))
@@ -0,0 +1,135 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : stream_bench.py
+@time    : 2026/10/18 19:10
+@desc    : 逐token流式输出验证与压测：chatbot_demo3换成按固定间隔吐chunk的假模型，
+           检查文本片段是逐个到达的(而不是模型结束后一次性到达)、摘要调用不会混进输出，
+           并对比messages模式的首token延迟和values模式看到第一条回复的时间
+           运行：python -m src.app.benchmark.stream_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+from contextlib import redirect_stdout
+
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.loadtest.fake_model import ScriptedChatModel
+from src.app.loadtest.stubs import search_stub
+from src.app.messages.message_window import LLMSummarizer, MessageWindow
+from src.app.messages.token_stream import StreamStats, TokenStreamer
+from src.app.chatbot import chatbot_demo3 as demo
+
+ANSWER = "根据搜索结果，LangGraph是一个用于构建有状态、多参与者应用的框架，支持检查点、人工干预和流式输出。"
+SUMMARY = "【摘要】这段文字不应该出现在流式输出里"
+
+
+def build_graph(latency: float, token_latency: float):
+    model = ScriptedChatModel(
+        script=[{"content": "", "tool_calls": [{"name": "tavily_search", "args": {"query": "LangGraph"}}]}, ANSWER],
+        latency=f"fixed:{latency}", token_latency=f"fixed:{token_latency}", chunk_chars=2,
+    )
+    summarizer = ScriptedChatModel(script=[SUMMARY], latency="fixed:0.0")
+    window = MessageWindow(max_tokens=60, summarizer=LLMSummarizer(summarizer))  # 预算很小，几乎每轮都会触发摘要
+    demo.get_window = lambda: window
+    demo.get_llm_with_tools = lambda: model
+    return demo.build_graph(checkpointer=MemorySaver(), tools=[search_stub("fixed:0.0")]), window
+
+
+def check_incremental(arrivals, latency: float, token_latency: float) -> dict:
+    """
+    片段到达时间应该大致按token_latency均匀分布，最后一个片段比第一个晚(片段数-1)*token_latency
+    """
+    chunks = len(arrivals)
+    spread = arrivals[-1] - arrivals[0]
+    expected = (chunks - 1) * token_latency
+    assert chunks > 1, "只收到一个片段，没有逐token输出"
+    assert spread >= expected * 0.8, f"片段集中到达：间隔 {spread:.3f}s，预期约 {expected:.3f}s"
+    return {"chunks": chunks, "spread_ms": round(spread * 1000, 1), "expected_spread_ms": round(expected * 1000, 1)}
+
+
+def run_messages(graph, turns: int, latency: float, token_latency: float) -> dict:
+    streamer = TokenStreamer(graph_name="chatbot_demo3")
+    checks, ttft = [], []
+    for i in range(turns):
+        config = {"configurable": {"thread_id": "stream"}}
+        stats = StreamStats()
+        arrivals, text = [], ""
+        for node, piece in streamer.stream(graph, {"messages": [("user", f"第{i}个问题：LangGraph是什么？")]},
+                                           config, stats):
+            if node == "chatbot":
+                arrivals.append(time.perf_counter())
+                text += piece
+        assert SUMMARY not in text, "摘要调用的输出混进了流式输出"
+        assert text == ANSWER, f"拼接后的文本与模型回复不一致：{text}"
+        checks.append(check_incremental(arrivals, latency, token_latency))
+        ttft.append(stats.first_token)
+    return {"first_token": summarize(ttft), "check": checks[-1],
+            "metrics": streamer.metrics.snapshot()["llm_time_to_first_token_seconds"]}
+
+
+def run_values(graph, turns: int) -> dict:
+    """
+    优化前：stream_mode="values"，模型全部生成完才能看到回复
+    """
+    latencies = []
+    for i in range(turns):
+        config = {"configurable": {"thread_id": "values"}}
+        t0 = time.perf_counter()
+        for event in graph.stream({"messages": [("user", f"第{i}个问题：LangGraph是什么？")]}, config,
+                                  stream_mode="values"):
+            message = event["messages"][-1]
+            if message.type == "ai" and message.content:
+                latencies.append(time.perf_counter() - t0)
+                break
+    return {"first_reply": summarize(latencies)}
+
+
+async def run_async(graph, turns: int, latency: float, token_latency: float) -> dict:
+    streamer = TokenStreamer(graph_name="chatbot_demo3")
+    ttft = []
+    for i in range(turns):
+        config = {"configurable": {"thread_id": "astream"}}
+        stats = StreamStats()
+        arrivals = []
+        async for node, _ in streamer.astream(graph, {"messages": [("user", f"第{i}个问题")]}, config, stats):
+            if node == "chatbot":
+                arrivals.append(time.perf_counter())
+        check_incremental(arrivals, latency, token_latency)
+        ttft.append(stats.first_token)
+    return {"first_token": summarize(ttft)}
+
+
+def bench(turns: int, latency: float, token_latency: float) -> dict:
+    graph, window = build_graph(latency, token_latency)
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        report = {
+            "latency_ms": latency * 1000,
+            "token_latency_ms": token_latency * 1000,
+            "answer_chunks": (len(ANSWER) + 1) // 2,
+            "messages": run_messages(graph, turns, latency, token_latency),
+            "messages_async": asyncio.run(run_async(graph, turns, latency, token_latency)),
+            "values": run_values(graph, turns),
+        }
+    report["summarizer_calls"] = window.summarizer.calls
+    assert report["summarizer_calls"] > 0, "没有触发摘要，无法验证摘要调用不进入流式输出"
+    return report
+
+
+if __name__ == '__main__':
+    print("stream_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="假模型首token延迟(秒)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="假模型chunk间隔(秒)")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.turns, args.latency, args.token_latency), indent=2, ensure_ascii=False))
@@ -0,0 +1,147 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : tiered_bench.py
+@time    : 2026/10/18 23:10
+@desc    : 两级检查点压测：N个会话各有一个带若干条消息的检查点，然后按“少数活跃、大多数空闲”的分布访问
+           (hot_share的请求落在hot_ratio的会话上)，每次访问读最新检查点再写一个新检查点，对比
+           MemorySaver：全部常驻内存        BatchedSqliteSaver：每次读都查库
+           TieredSqliteSaver：内存LRU只保留max_threads个会话，其余在磁盘
+           指标：读写延迟、进程内存增长(tracemalloc)、命中率和写盘次数，并用真实的图验证淘汰、重新加载和异步接口
+           运行：python -m src.app.benchmark.tiered_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import StateGraph, START, END, MessagesState
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.checkpoint.sqlite_saver import BatchedSqliteSaver
+from src.app.checkpoint.tiered_saver import TieredSqliteSaver
+
+TEXT = "您好，我想查询一下上周下的订单什么时候能送到，物流信息一直没有更新。"
+
+
+def make_checkpoint(thread: int, turn: int, messages: int) -> dict:
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {
+        "messages": [(HumanMessage if i % 2 == 0 else AIMessage)(f"{TEXT}{thread}-{i}", id=f"{thread}-{turn}-{i}")
+                     for i in range(messages)]}
+    checkpoint["channel_versions"] = {"messages": turn + 1}
+    return checkpoint
+
+
+def _config(thread: int) -> dict:
+    return {"configurable": {"thread_id": f"user-{thread}", "checkpoint_ns": ""}}
+
+
+def workload(threads: int, requests: int, hot_ratio: float, hot_share: float, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    hot = max(1, int(threads * hot_ratio))
+    return [rng.randrange(hot) if rng.random() < hot_share else rng.randrange(hot, threads) for _ in range(requests)]
+
+
+def run(saver, threads: int, accesses: list, messages: int) -> dict:
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    t0 = time.perf_counter()
+    for thread in range(threads):
+        checkpoint = make_checkpoint(thread, 0, messages)
+        saver.put(_config(thread), checkpoint, {"step": 0, "source": "input"}, checkpoint["channel_versions"])
+    populate_s = time.perf_counter() - t0
+    populated = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    reads, writes = [], []
+    for turn, thread in enumerate(accesses, start=1):
+        t0 = time.perf_counter()
+        saved = saver.get_tuple(_config(thread))
+        t1 = time.perf_counter()
+        checkpoint = make_checkpoint(thread, turn, messages)
+        saver.put(saved.config, checkpoint, {"step": turn, "source": "loop"}, checkpoint["channel_versions"])
+        writes.append(time.perf_counter() - t1)
+        reads.append(t1 - t0)
+    report = {"populate_s": round(populate_s, 2), "memory_mb": round(populated / 1024 / 1024, 1),
+              "read_ms": summarize(reads), "write_ms": summarize(writes)}
+    if isinstance(saver, TieredSqliteSaver):
+        report["stats"] = saver.stats()
+    return report
+
+
+def verify_graph(directory: str) -> dict:
+    """
+    max_threads=2时轮流访问5个会话，每次访问都要从磁盘加载；重新打开后(冷启动)状态一致；异步接口同样可用
+    """
+    builder = StateGraph(MessagesState)
+    builder.add_node("reply", lambda state: {"messages": [AIMessage(f"收到：{state['messages'][-1].content}")]})
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    path = os.path.join(directory, "graph.sqlite")
+    users = [{"configurable": {"thread_id": f"u{i}"}} for i in range(5)]
+    with TieredSqliteSaver.from_conn_string(path, max_threads=2) as saver:
+        graph = builder.compile(checkpointer=saver)
+        for turn in range(3):
+            for config in users:
+                graph.invoke({"messages": [HumanMessage(f"第{turn}轮")]}, config)
+        history = len(list(graph.get_state_history(users[0])))
+        stats = saver.stats()
+    with TieredSqliteSaver.from_conn_string(path, max_threads=2) as saver:
+        graph = builder.compile(checkpointer=saver)
+        assert all(len(graph.get_state(config).values["messages"]) == 6 for config in users)
+        assert len(list(graph.get_state_history(users[0]))) == history
+
+        async def async_turns():
+            for config in users:
+                await graph.ainvoke({"messages": [HumanMessage("异步")]}, config)
+            return [len((await graph.aget_state(config)).values["messages"]) for config in users]
+
+        assert asyncio.run(async_turns()) == [8] * len(users)
+    return {"threads": len(users), "history_per_thread": history, "stats": stats}
+
+
+def bench(threads: int, requests: int, messages: int, max_threads: int, hot_ratio: float, hot_share: float) -> dict:
+    accesses = workload(threads, requests, hot_ratio, hot_share)
+    report = {"threads": threads, "requests": requests, "messages_per_checkpoint": messages,
+              "max_threads": max_threads, "hot_ratio": hot_ratio, "hot_share": hot_share}
+    with tempfile.TemporaryDirectory() as directory, ExitStack() as stack:
+        report["graph_check"] = verify_graph(directory)
+        report["memory_saver"] = run(MemorySaver(), threads, accesses, messages)
+        sqlite = stack.enter_context(BatchedSqliteSaver.from_conn_string(os.path.join(directory, "sqlite.sqlite")))
+        report["sqlite_saver"] = run(sqlite, threads, accesses, messages)
+        tiered = stack.enter_context(TieredSqliteSaver.from_conn_string(os.path.join(directory, "tiered.sqlite"),
+                                                                        max_threads=max_threads))
+        report["tiered_saver"] = run(tiered, threads, accesses, messages)
+        t0 = time.perf_counter()
+        tiered.flush()
+        report["tiered_saver"]["flush_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        report["tiered_saver"]["metrics"] = tiered.metrics.snapshot()
+    return report
+
+
+if __name__ == '__main__':
+    print("tiered_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=20000, help="会话总数")
+    parser.add_argument("--requests", type=int, default=20000, help="访问次数(每次读一次、写一次)")
+    parser.add_argument("--messages", type=int, default=20, help="每个检查点的消息数")
+    parser.add_argument("--max-threads", type=int, default=1000, help="TieredSqliteSaver内存中最多保留的会话数")
+    parser.add_argument("--hot-ratio", type=float, default=0.02, help="活跃会话占比")
+    parser.add_argument("--hot-share", type=float, default=0.9, help="落在活跃会话上的请求占比")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.threads, args.requests, args.messages, args.max_threads, args.hot_ratio,
+                           args.hot_share), indent=2, ensure_ascii=False))
@@ -0,0 +1,131 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : tool_bench.py
+@time    : 2026/10/18 19:50
+@desc    : 并行工具调用压测：chatbot_demo4的模型一轮发出N个get_weather调用，工具换成本地慢速替身
+           serial：max_concurrency=1，工具逐个执行(优化前的效果)
+           parallel：ToolNode并行执行 + ToolGuard按工具限流，同步/异步两条路径
+                     (同步路径的线程数受config的max_concurrency限制，默认是min(32, CPU数+4))
+           hang：其中一个城市的请求挂起，超时后重试一次仍失败，本轮返回错误消息而不是卡住
+           flaky：每个城市第一次请求失败，靠重试恢复
+           运行：python -m src.app.benchmark.tool_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from contextlib import redirect_stdout
+
+from langchain_core.tools import StructuredTool
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.app.chatbot import chatbot_demo4 as demo
+from src.app.loadtest.fake_model import ScriptedChatModel
+from src.app.tools.CommonTools import WeatherInput
+from src.app.tools.ConcurrencyTools import ToolGuard, ToolPolicy
+
+CITIES = ["Beijing", "Shanghai", "Guangzhou", "Shenzhen", "Hangzhou", "Chengdu", "Wuhan", "Xian",
+          "Nanjing", "Tianjin", "Chongqing", "Suzhou", "Qingdao", "Dalian", "Xiamen", "Kunming"]
+
+
+def slow_weather(latency: float, hang: dict = None, fail_first: bool = False) -> StructuredTool:
+    """
+    get_weather的慢速替身：hang中的城市按给定秒数挂起，fail_first时每个城市第一次调用抛ConnectionError
+    """
+    hang = hang or {}
+    attempts = {}
+    lock = threading.Lock()
+
+    def check(location: str) -> float:
+        with lock:
+            attempts[location] = attempts.get(location, 0) + 1
+            first = attempts[location] == 1
+        if fail_first and first:
+            raise ConnectionError(f"{location} 连接被重置")
+        return hang.get(location, latency)
+
+    def get_weather(location: str) -> str:
+        time.sleep(check(location))
+        return f"{location}当前天气：晴，温度：20°C"
+
+    async def aget_weather(location: str) -> str:
+        await asyncio.sleep(check(location))
+        return f"{location}当前天气：晴，温度：20°C"
+
+    return StructuredTool.from_function(func=get_weather, coroutine=aget_weather, name="get_weather",
+                                        description="查询指定城市的当前天气", args_schema=WeatherInput)
+
+
+def build_graph(calls: int, tool: StructuredTool, policy: ToolPolicy):
+    model = ScriptedChatModel(script=[
+        {"content": "", "tool_calls": [{"name": "get_weather", "args": {"location": CITIES[i % len(CITIES)]}}
+                                       for i in range(calls)]},
+        "各城市天气已查询完毕。",
+    ], latency="fixed:0.0")
+    demo.get_llm_with_tools = lambda: model
+    demo.tool_guard = ToolGuard({"get_weather": policy})
+    return demo.build_graph(checkpointer=MemorySaver(), tools=[tool]), demo.tool_guard
+
+
+def turn(graph, name: str, config_extra: dict = None) -> dict:
+    config = {"configurable": {"thread_id": name}, **(config_extra or {})}
+    start = time.perf_counter()
+    result = graph.invoke({"messages": [("user", "查询这些城市的天气")]}, config)
+    return _report(result, time.perf_counter() - start)
+
+
+async def aturn(graph, name: str) -> dict:
+    config = {"configurable": {"thread_id": name}}
+    start = time.perf_counter()
+    result = await graph.ainvoke({"messages": [("user", "查询这些城市的天气")]}, config)
+    return _report(result, time.perf_counter() - start)
+
+
+def _report(result, elapsed: float) -> dict:
+    tools = [m for m in result["messages"] if m.type == "tool"]
+    return {"elapsed_ms": round(elapsed * 1000, 1), "tool_results": len(tools),
+            "errors": sum(1 for m in tools if m.status == "error")}
+
+
+def bench(calls: int, latency: float, limit: int, hang_seconds: float) -> dict:
+    policy = ToolPolicy(max_concurrency=limit, timeout=latency * 4, retries=1, backoff=0.05)
+    report = {"calls": calls, "tool_latency_ms": latency * 1000, "max_concurrency": limit,
+              "expected_serial_ms": round(calls * latency * 1000, 1),
+              "expected_parallel_ms": round(-(-calls // limit) * latency * 1000, 1)}
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        wide = {"max_concurrency": calls}
+        graph, _ = build_graph(calls, slow_weather(latency), ToolPolicy())
+        turn(graph, "warmup", wide)  # 预热：首次执行有一次性开销
+        report["serial"] = turn(graph, "serial", {"max_concurrency": 1})
+
+        graph, guard = build_graph(calls, slow_weather(latency), policy)
+        report["parallel"] = turn(graph, "parallel", wide)
+        report["parallel_async"] = asyncio.run(aturn(graph, "parallel_async"))
+
+        graph, guard = build_graph(calls, slow_weather(latency, hang={CITIES[0]: hang_seconds}), policy)
+        report["hang"] = {**turn(graph, "hang", wide), "guard": guard.stats()["get_weather"]}
+        graph, guard = build_graph(calls, slow_weather(latency, hang={CITIES[0]: hang_seconds}), policy)
+        report["hang_async"] = {**asyncio.run(aturn(graph, "hang_async")), "guard": guard.stats()["get_weather"]}
+
+        graph, guard = build_graph(calls, slow_weather(latency, fail_first=True), policy)
+        report["flaky"] = {**turn(graph, "flaky", wide), "guard": guard.stats()["get_weather"]}
+    return report
+
+
+if __name__ == '__main__':
+    print("tool_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=16, help="一轮中的工具调用数")
+    parser.add_argument("--latency", type=float, default=0.2, help="替身工具每次调用的延迟(秒)")
+    parser.add_argument("--limit", type=int, default=8, help="get_weather的并发上限")
+    parser.add_argument("--hang", type=float, default=5.0, help="挂起的请求持续的秒数")
+    args = parser.parse_args()
+
+    print(json.dumps(bench(args.calls, args.latency, args.limit, args.hang), indent=2, ensure_ascii=False))
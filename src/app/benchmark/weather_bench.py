@@ -0,0 +1,114 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : weather_bench.py
+@time    : 2026/10/18 09:30
+@desc    : get_weather压测：每次新建连接 vs 连接池+TTL缓存+请求合并
+           运行：python -m src.app.benchmark.weather_bench
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+import requests
+
+from src.app.benchmark.bench_utils import StubServer, summarize, weather_handler
+from src.app.tools.CommonTools import WeatherClient
+
+
+def legacy_get_weather(url: str, location: str) -> str:
+    """
+    优化前的实现：每次调用新建连接，无超时、无缓存
+    """
+    params = {"q": location, "appid": "stub", "units": "metric", "lang": "zh_cn"}
+    try:
+        response = requests.get(url, params=params)
+        data = response.json()
+        if response.status_code == 200:
+            return f"{location}当前天气：{data['weather'][0]['description']}，温度：{data['main']['temp']}°C"
+        return f"查询失败：{data.get('message', '未知错误')}"
+    except Exception as e:
+        return f"查询出错：{str(e)}"
+
+
+def run_threads(fn, locations, threads: int) -> list:
+    """
+    threads个线程同时起跑，每个线程查询一次，返回各次调用延迟
+    """
+    latencies = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(i):
+        barrier.wait()
+        start = time.perf_counter()
+        fn(locations[i % len(locations)])
+        cost = time.perf_counter() - start
+        with lock:
+            latencies.append(cost)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return latencies
+
+
+async def run_tasks(client: WeatherClient, locations, tasks: int) -> list:
+    async def one(i):
+        start = time.perf_counter()
+        await client.aget_weather(locations[i % len(locations)])
+        return time.perf_counter() - start
+
+    latencies = await asyncio.gather(*[one(i) for i in range(tasks)])
+    await client.aclose()
+    return list(latencies)
+
+
+def bench(threads: int, delay: float, locations) -> dict:
+    results = {}
+    with StubServer(weather_handler, delay=delay) as stub:
+        url = stub.url + "/data/2.5/weather"
+
+        # 优化前
+        stub.reset()
+        latencies = run_threads(lambda loc: legacy_get_weather(url, loc), locations, threads)
+        results["before"] = {**summarize(latencies), "upstream_calls": stub.calls}
+
+        # 优化后(同步，冷缓存)
+        stub.reset()
+        client = WeatherClient(url=url)
+        latencies = run_threads(client.get_weather, locations, threads)
+        results["after_sync_cold"] = {**summarize(latencies), "upstream_calls": stub.calls}
+
+        # 优化后(同步，热缓存)
+        stub.reset()
+        latencies = run_threads(client.get_weather, locations, threads)
+        results["after_sync_warm"] = {**summarize(latencies), "upstream_calls": stub.calls}
+        client.close()
+
+        # 优化后(异步，冷缓存)
+        stub.reset()
+        client = WeatherClient(url=url)
+        latencies = asyncio.run(run_tasks(client, locations, threads))
+        results["after_async_cold"] = {**summarize(latencies), "upstream_calls": stub.calls}
+    return results
+
+
+if __name__ == '__main__':
+    print("weather_bench...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.05, help="桩服务模拟的上游延迟(秒)")
+    parser.add_argument("--locations", default="Beijing", help="逗号分隔的城市列表")
+    args = parser.parse_args()
+
+    report = bench(args.threads, args.delay, args.locations.split(","))
+    print(json.dumps(report, ensure_ascii=False, indent=2))
@@ -10,63 +10,164 @@
 -----------------------------------------------------------------------
 """
 
+import asyncio
+import sys
+from functools import lru_cache, partial
+
 from dotenv import load_dotenv
 import os
 from typing import Annotated
+from langchain_core.runnables import RunnableLambda
 from typing_extensions import TypedDict
-from langgraph.graph import StateGraph, START, END, add_messages
-from langchain_anthropic import ChatAnthropic
+from langgraph.graph import StateGraph, START, END
+from src.app.graphs.registry import registry
+from src.app.messages.indexed_messages import IndexedMessages
+from src.app.messages.prompt_cache import PromptCache, format_usage
+from src.app.messages.token_stream import TokenStreamer
 
 load_dotenv(dotenv_path="../../env/.env")
 api_key = os.getenv("ANTHROPIC_API_KEY")
 base_url = os.getenv("ANTHROPIC_BASE_URL")
 model_name = "claude-opus-4-5-20251101"
 
-llm = ChatAnthropic(model=model_name)
+@lru_cache(maxsize=None)
+def get_llm():
+    """
+    首次调用时才导入langchain_anthropic并创建模型，导入本模块不产生这部分开销
+    :return:
+    """
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(model=model_name)
+
+prompt_cache = PromptCache() # 提示词前缀缓存
+token_streamer = TokenStreamer(graph_name="chatbot_demo1") # --stream模式下逐token输出，统计首token延迟
 
 class State(TypedDict):
     """
     定义状态
     """
-    messages: Annotated[list, add_messages]
+    messages: Annotated[list, IndexedMessages()]
 
-def chatbot(state: State):
+def chatbot(state: State, llm=None):
     """
     定义大模型调用节点
     :param state:
+    :param llm: 不传时使用get_llm()
+    :return:
+    """
+    llm = llm or get_llm()
+    response = llm.invoke(prompt_cache.prepare(state["messages"]))
+    prompt_cache.record(response)
+    return {"messages": [response]}
+
+async def achatbot(state: State, llm=None):
+    """
+    定义大模型调用节点(异步)
+    :param state:
+    :param llm: 不传时使用get_llm()
     :return:
     """
-    return {"messages": [llm.invoke(state["messages"])]}
+    llm = llm or get_llm()
+    response = await llm.ainvoke(prompt_cache.prepare(state["messages"]))
+    prompt_cache.record(response)
+    return {"messages": [response]}
 
 def stream_graph_updates(user_input: str):
     for event in graph.stream({"messages": [{"role": "user", "content": user_input}]}):
         for value in event.values():
             print("Assistant:", value["messages"][-1].content)
 
-if __name__ == '__main__':
-    print("chatbot_demo1...")
-    #print(f"api_key: {api_key},base_url: {base_url},model_name: {model_name}")
+async def astream_graph_updates(user_input: str):
+    async for event in graph.astream({"messages": [{"role": "user", "content": user_input}]}):
+        for value in event.values():
+            print("Assistant:", value["messages"][-1].content)
 
-    graph_builder = StateGraph(State)
+def stream_graph_tokens(user_input: str):
+    """
+    逐token输出，结束后打印首token延迟
+    :param user_input:
+    :return:
+    """
+    token_streamer.print(graph, {"messages": [{"role": "user", "content": user_input}]})
 
-    graph_builder.add_node("chatbot", chatbot)
-    graph_builder.add_edge(START, "chatbot")
-    graph_builder.add_edge("chatbot", END)
-    graph = graph_builder.compile()
+async def astream_graph_tokens(user_input: str):
+    await token_streamer.aprint(graph, {"messages": [{"role": "user", "content": user_input}]})
 
+def print_usage():
+    """
+    打印本轮模型调用的缓存用量，在交互循环中调用，不在节点中打印
+    :return:
+    """
+    for usage in prompt_cache.drain():
+        print(format_usage(usage))
+
+async def amain():
+    """
+    异步交互循环：input放到线程中执行，不阻塞事件循环
+    """
     while True:
         try:
-            user_input = input("User: ")
-            if user_input.lower() in ["quit", "exit", "q"]:
-                print("Goodbye!")
-                break
-            stream_graph_updates(user_input)
-        except:
-            # fallback if input() is not available
-            user_input = "What do you know about LangGraph?"
-            print("User: " + user_input)
-            stream_graph_updates(user_input)
+            user_input = await asyncio.to_thread(input, "User: ")
+        except EOFError:
+            break
+        if user_input.lower() in ["quit", "exit", "q"]:
+            print("Goodbye!")
             break
+        await astream_graph_updates(user_input)
+        print_usage()
+
+def build_graph(checkpointer=None, llm=None):
+    """
+    构建并编译图
+    :param checkpointer:
+    :param llm: 替换默认模型，用于在同一进程中提供不同模型的图
+    :return:
+    """
+    graph_builder = StateGraph(State)
 
+    graph_builder.add_node("chatbot", RunnableLambda(partial(chatbot, llm=llm), afunc=partial(achatbot, llm=llm),
+                                                     name="chatbot"))
+    graph_builder.add_edge(START, "chatbot")
+    graph_builder.add_edge("chatbot", END)
+    return graph_builder.compile(checkpointer=checkpointer)
 
+registry.register("chatbot_demo1", build_graph, replace=True)
 
+def get_graph(checkpointer=None, **options):
+    """
+    从注册表获取编译好的图，同一配置(检查点、模型、工具)只编译一次
+    :param checkpointer:
+    :param options: build_graph的其他参数
+    :return:
+    """
+    return registry.get("chatbot_demo1", checkpointer=checkpointer, **options)
+
+if __name__ == '__main__':
+    print("chatbot_demo1...")
+    #print(f"api_key: {api_key},base_url: {base_url},model_name: {model_name}")
+
+    graph = get_graph()
+
+    if "--stream" in sys.argv:
+        # 逐token输出：python chatbot_demo1.py --stream，可以和--async一起使用
+        stream_graph_updates, astream_graph_updates = stream_graph_tokens, astream_graph_tokens
+
+    if "--async" in sys.argv:
+        # 异步模式：python chatbot_demo1.py --async
+        asyncio.run(amain())
+    else:
+        while True:
+            try:
+                user_input = input("User: ")
+                if user_input.lower() in ["quit", "exit", "q"]:
+                    print("Goodbye!")
+                    break
+                stream_graph_updates(user_input)
+                print_usage()
+            except:
+                # fallback if input() is not available
+                user_input = "What do you know about LangGraph?"
+                print("User: " + user_input)
+                stream_graph_updates(user_input)
+                print_usage()
+                break
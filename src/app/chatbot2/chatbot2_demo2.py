@@ -10,16 +10,29 @@
 -----------------------------------------------------------------------
 """
 
+import atexit
+import os
+import threading
+from contextlib import ExitStack
+from functools import lru_cache
 from typing import TypedDict, Annotated, Optional, List
 from langchain_core.tools import tool
-from langgraph.graph.message import add_messages
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.store.memory import InMemoryStore
 from langchain_core.runnables import RunnableConfig
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
 from langgraph.graph import StateGraph, START, END
 import json
 
+from src.app.checkpoint.history import StateHistory
+from src.app.checkpoint.tiered_saver import TieredSqliteSaver
+from src.app.graphs.registry import registry
+from src.app.messages.indexed_messages import IndexedMessages
+from src.app.profiling.node_profiler import NodeProfiler, format_report
+from src.app.store.cached_store import CachedStore, profile_only
+from src.app.store.semantic_store import SemanticStore
+from src.app.store.sqlite_store import IndexedSqliteStore
+from src.app.tools.IntentTools import IntentClassifier
+from src.app.tools.KnowledgeTools import BM25Index
+
 
 # ======================= 1. 定义工具（模拟真实业务） =======================
 @tool
@@ -41,26 +54,91 @@ def apply_refund(order_id: str, reason: str) -> dict:
         "message": f"退款申请已提交，原因：{reason}"
     }
 
+# 知识库：设置KB_INDEX_PATH时直接打开离线构建好的BM25索引(mmap，不需要重新建索引)，否则用内置条目构建
+KNOWLEDGE_BASE = [
+    {"title": "退货政策", "content": "支持7天无理由退货，15天质量问题换货"},
+    {"title": "运费规则", "content": "满99元免运费，VIP用户全年包邮"},
+]
+_kb_index = None
+_kb_lock = threading.Lock()
+
+def knowledge_index() -> BM25Index:
+    global _kb_index
+    if _kb_index is None:
+        with _kb_lock:
+            if _kb_index is None:
+                path = os.environ.get("KB_INDEX_PATH")
+                _kb_index = BM25Index(path) if path else BM25Index.build(KNOWLEDGE_BASE, "chatbot2_kb.bm25")
+    return _kb_index
+
 @tool
 def get_knowledge_base(query: str) -> str:
     """查询知识库"""
-    kb = {
-        "退货政策": "支持7天无理由退货，15天质量问题换货",
-        "运费规则": "满99元免运费，VIP用户全年包邮",
-    }
-    return kb.get(query, "暂无相关信息")
+    # 按BM25相关度取最匹配的一篇，不再要求query与标题完全一致
+    hits = knowledge_index().search(query, k=1)
+    return hits[0][1]["content"] if hits else "暂无相关信息"
 
 # ======================= 2. 定义状态 =======================
 class State(TypedDict):
-    messages: Annotated[List, add_messages]
+    messages: Annotated[List, IndexedMessages()]
     user_name: Optional[str]
     user_profile: Optional[dict]  # 完整的用户画像
     requires_approval: bool  # 是否需要人工审批
     refund_request: Optional[dict]  # 退款申请详情
+    memory_cursor: int  # 已提取过偏好的消息数(高水位)
+    preferences: Optional[dict]  # 已写入长期记忆的偏好
 
 # ======================= 3. 初始化记忆组件 =======================
-checkpointer = MemorySaver()
-store = InMemoryStore()
+# 长期记忆持久化到SQLite，重启后用户档案和日志仍然保留
+# 检查点和store在第一次使用时才创建，导入模块不会打开数据库文件
+@lru_cache(maxsize=None)
+def get_stack():
+    stack = ExitStack()
+    atexit.register(stack.close)  # 退出时把内存中的检查点写盘
+    return stack
+
+@lru_cache(maxsize=None)
+def get_checkpointer():
+    """
+    短期记忆：活跃会话留在内存，空闲会话淘汰到SQLite
+    """
+    return get_stack().enter_context(
+        TieredSqliteSaver.from_conn_string("chatbot2_checkpoints.sqlite", max_threads=1000)
+    )
+
+def new_store(backend):
+    """
+    在backend外面套上语义检索和缓存层；压测等场景传入自己的backend，不写共用的chatbot2_store.sqlite。
+    语义索引在进程内存中：多worker服务时，每个worker的索引只有首次检索时已有的记忆和本worker之后写入的，搜不到其他worker新写的记忆
+    """
+    return CachedStore(
+        SemanticStore(backend, min_score=0.1),  # 相似度太低的记忆不返回
+        cacheable=profile_only,  # 用户档案几乎不变，每轮的读取走缓存
+    )
+
+@lru_cache(maxsize=None)
+def get_store():
+    """
+    长期记忆：search(query=...)按语义相似度检索记忆
+    """
+    return new_store(get_stack().enter_context(
+        IndexedSqliteStore.from_conn_string("chatbot2_store.sqlite", indexed_fields=("session_id",))
+    ))
+
+# 意图关键词及权重，同分时按意图的先后顺序
+INTENT_RULES = {
+    "订单查询": {"订单": 1.0, "快递": 1.0},
+    "退款申请": {"退款": 1.0, "退货": 1.0},
+}
+intent_classifier = IntentClassifier(INTENT_RULES, default="一般咨询")
+
+# 偏好关键词 -> (偏好字段, 值)
+PREFERENCE_RULES = {
+    "喜欢": ("likes", "从对话中提取的兴趣点"),
+}
+
+# 节点性能埋点，NODE_PROFILING=1 时开启，默认不包装节点
+profiler = NodeProfiler.from_env()
 
 # ======================= 4. 定义业务节点 =======================
 def load_profile(state: State, config: RunnableConfig):
@@ -71,6 +149,7 @@ def load_profile(state: State, config: RunnableConfig):
     print(f"user_id:{user_id}")
 
     # 从长期记忆加载用户画像
+    store = get_store()
     memory = store.get((user_id, "profile"), "basic_info")
     if memory:
         profile = memory.value
@@ -88,13 +167,7 @@ def load_profile(state: State, config: RunnableConfig):
 def analyze_intent(state: State, config: RunnableConfig):
     """分析用户意图"""
     last_message = state["messages"][-1].content
-
-    if "订单" in last_message or "快递" in last_message:
-        intent = "订单查询"
-    elif "退款" in last_message or "退货" in last_message:
-        intent = "退款申请"
-    else:
-        intent = "一般咨询"
+    intent = intent_classifier.classify(last_message)
 
     return {
         "messages": [AIMessage(f"[意图识别] 用户意图：{intent}")]
@@ -122,26 +195,40 @@ def call_tools(state: State):
 
     return {"messages": [AIMessage("请提供订单号格式：ORD-001")]}
 
+def extract_preferences(messages) -> dict:
+    """从消息中提取用户偏好"""
+    preferences = {}
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else ""
+        for keyword, (key, value) in PREFERENCE_RULES.items():
+            if keyword in content:
+                preferences[key] = value
+    return preferences
+
 def extract_memory(state: State, config: RunnableConfig):
     """自动提取用户偏好并保存到长期记忆"""
     cfg = config.get("configurable", {})
     user_id = cfg.get("user_id", "anonymous")
 
-    # 分析对话内容提取偏好
-    all_content = " ".join([m.content for m in state["messages"]])
-    preferences = {}
+    # 只分析上次提取之后的新消息，每轮的开销与对话总长度无关
+    messages = state["messages"]
+    cursor = state.get("memory_cursor") or 0
+    if cursor > len(messages):  # 历史消息被裁剪过，重新扫描
+        cursor = 0
+    found = extract_preferences(messages[cursor:])
 
-    if "喜欢" in all_content:
-        preferences["likes"] = "从对话中提取的兴趣点"
+    # 偏好没有变化时不写长期记忆
+    known = state.get("preferences") or {}
+    changed = {k: v for k, v in found.items() if known.get(k) != v}
+    if not changed:
+        return {"memory_cursor": len(messages)}
 
-    if preferences:
-        store.put(
-            (user_id, "profile"),
-            "preferences",
-            preferences
-        )
+    namespace, store = (user_id, "profile"), get_store()
+    existing = store.get(namespace, "preferences")
+    preferences = {**(existing.value if existing else {}), **known, **changed}
+    store.put(namespace, "preferences", preferences)
 
-    return {}
+    return {"memory_cursor": len(messages), "preferences": preferences}
 
 def human_approval(state: State):
     """检查是否需要人工审批"""
@@ -170,12 +257,12 @@ def handle_approval(state: State):
 # ======================= 5. 构建智能工作流 =======================
 builder = StateGraph(State)
 # 添加节点
-builder.add_node("load_profile", load_profile)
-builder.add_node("analyze_intent", analyze_intent)
-builder.add_node("tools", call_tools)
-builder.add_node("extract_memory", extract_memory)
-builder.add_node("human_approval", human_approval)
-builder.add_node("handle_approval", handle_approval)
+builder.add_node("load_profile", profiler.wrap(load_profile, "load_profile"))
+builder.add_node("analyze_intent", profiler.wrap(analyze_intent, "analyze_intent"))
+builder.add_node("tools", profiler.wrap(call_tools, "tools"))
+builder.add_node("extract_memory", profiler.wrap(extract_memory, "extract_memory"))
+builder.add_node("human_approval", profiler.wrap(human_approval, "human_approval"))
+builder.add_node("handle_approval", profiler.wrap(handle_approval, "handle_approval"))
 # 添加边
 builder.add_edge(START, "load_profile")
 builder.add_edge("load_profile", "analyze_intent")
@@ -197,11 +284,23 @@ builder.add_conditional_edges(
 builder.add_edge("handle_approval", "extract_memory")
 builder.add_edge("extract_memory", END)
 
-# 编译图
-graph = builder.compile(checkpointer=checkpointer, store=store)
+registry.register("chatbot2_demo2", builder.compile, replace=True)
+
+def get_graph(**options):
+    """
+    从注册表获取编译好的图，同一配置只编译一次，默认使用get_checkpointer()和get_store()
+    :param options: compile的参数
+    :return:
+    """
+    if "checkpointer" not in options:
+        options["checkpointer"] = get_checkpointer()
+    if "store" not in options:
+        options["store"] = get_store()
+    return registry.get("chatbot2_demo2", **options)
 
 def run_customer_service_scenario():
     """运行完整客服场景模拟"""
+    graph, store = get_graph(), get_store()
 
     print("🎯 智能客服 Agent 启动")
     print("=" * 60)
@@ -245,9 +344,10 @@ def run_customer_service_scenario():
 
     # 场景3：时间旅行 - 查看历史状态
     print("\n【场景3】时间旅行 - 查看对话历史")
-    history = list(graph.get_state_history(config_vip))
-    print(f"该对话共有 {len(history)} 个状态快照")
-    for i, snapshot in enumerate(history[:3]):
+    # 只读取最近3个快照的metadata，不反序列化整个历史
+    history = StateHistory(graph)
+    print(f"该对话共有 {history.count(config_vip)} 个状态快照")
+    for i, snapshot in enumerate(history.page(config_vip, limit=3)):
         print(f"  步骤 {i}: {snapshot.metadata.get('step', 0)} 步")
 
     # 场景4：状态分叉 - 模拟如果审批拒绝会怎样
@@ -268,6 +368,20 @@ def run_customer_service_scenario():
     for log in all_logs:
         print(f"  - {log.value}")
 
+    print("\n【长期记忆】与“退款”最相关的记忆:")
+    memories = store.search(("vip_user_001",), query="申请退款", limit=3)  # 低于min_score的不返回
+    for item in memories:
+        print(f"  - {item.score:.3f} {'/'.join(item.namespace)}/{item.key}: {item.value}")
+    if not memories:
+        print("  (没有足够相关的记忆)")
+
+    print("\n【知识库】VIP用户的运费怎么算:")
+    print(f"  {get_knowledge_base.invoke('VIP用户的运费怎么算')}")
+
+    if profiler.enabled:
+        print("\n【性能】各节点耗时:")
+        print(format_report(profiler.report()))
+
 if __name__ == '__main__':
     print("chatbot2_demo2...")
     run_customer_service_scenario()
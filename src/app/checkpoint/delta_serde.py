@@ -0,0 +1,218 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : delta_serde.py
+@time    : 2026/10/18 22:30
+@desc    : 增量检查点序列化：只追加的消息通道(messages)只保存相对父检查点新增的消息，每隔full_every步保存一次全量，
+           整个检查点用msgpack编码后再压缩(有zstandard用zstd，否则zlib)
+           SqliteSaver每一步都把完整的messages列表重新序列化一遍，会话越长每步越慢、占用越大(总量是平方级)
+-----------------------------------------------------------------------
+"""
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Callable, Optional, Tuple
+
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # 没有安装zstandard时用zlib
+    zstandard = None
+
+DELTA_PREFIX = "delta/"
+_BASE = "__base__"  # 增量通道值的标记键
+_OWNER = "__delta__"  # 检查点所属的(thread_id, checkpoint_ns)，解码时据此读取父检查点
+
+
+def _is_prefix(base: tuple, messages: list) -> bool:
+    """
+    父检查点的消息是否原样保留在开头(消息按不可变对象处理，先比较身份再比较内容)
+    """
+    if len(base) > len(messages):
+        return False
+    return all(a is b or a == b for a, b in zip(base, messages))
+
+
+class DeltaSerde:
+    """
+    用法：
+        BatchedSqliteSaver.from_conn_string("weather_agent.sqlite", serde=DeltaSerde())
+
+    - 编码发生在saver的put里(需要知道父检查点)，通过dumps_checkpoint(config, checkpoint)调用；
+      其他值(中间写入等)的dumps_typed/loads_typed直接交给inner，旧格式的检查点也能正常读取
+    - 父检查点的消息在本进程的LRU缓存里时才写增量，否则(重启后第一步、时间旅行到很早的检查点)写全量
+    - 解码增量时沿父链向上找到全量为止(最多full_every层)，解码结果同样进缓存，连续读取最新检查点只需解码一层
+    - bind(fetch)：fetch(thread_id, checkpoint_ns, checkpoint_id) -> (type, blob)，由saver提供
+    """
+
+    def __init__(self, inner=None, channels: Tuple[str, ...] = ("messages",), full_every: int = 32,
+                 compression: str = "auto", level: Optional[int] = None, cache_size: int = 4096):
+        if compression == "auto":
+            compression = "zstd" if zstandard is not None else "zlib"
+        if compression == "zstd" and zstandard is None:
+            raise ImportError("需要安装zstandard：pip install zstandard，或使用compression='zlib'")
+        if compression not in ("zstd", "zlib", "none"):
+            raise ValueError(f"不支持的压缩方式：{compression}")
+        self.inner = inner or JsonPlusSerializer()
+        self.channels = tuple(channels)
+        self.full_every = full_every
+        self.compression = compression
+        self.level = level
+        self.cache_size = cache_size
+        self._fetch: Optional[Callable] = None
+        self._cache = OrderedDict()  # (thread_id, checkpoint_ns, checkpoint_id) -> {通道: (消息元组, 增量层数)}
+        self._lock = threading.Lock()
+        self._local = threading.local()  # zstd的压缩/解压对象不是线程安全的，每个线程一份
+        self.stats = {"full": 0, "delta": 0, "fetches": 0}
+
+    def bind(self, fetch: Callable[[str, str, str], Optional[tuple]]):
+        self._fetch = fetch
+
+    # ======================= 普通值 =======================
+    def dumps_typed(self, obj) -> Tuple[str, bytes]:
+        return self.inner.dumps_typed(obj)
+
+    def loads_typed(self, data: Tuple[str, bytes]):
+        if data[0].startswith(DELTA_PREFIX):
+            return self._decode(*data)
+        return self.inner.loads_typed(data)
+
+    @staticmethod
+    def is_delta(type_: str) -> bool:
+        return type_.startswith(DELTA_PREFIX)
+
+    # ======================= 编码 =======================
+    def dumps_checkpoint(self, config: dict, checkpoint: dict) -> Tuple[str, bytes]:
+        configurable = config["configurable"]
+        thread_id, checkpoint_ns = str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+        parent = configurable.get("checkpoint_id")
+        values = dict(checkpoint["channel_values"])
+        entry = {}
+        for channel in self.channels:
+            messages = values.get(channel)
+            if not isinstance(messages, list):
+                continue
+            base = self._cached((thread_id, checkpoint_ns, parent), channel) if parent else None
+            if base is not None and base[1] + 1 < self.full_every and _is_prefix(base[0], messages):
+                depth = base[1] + 1
+                values[channel] = {_BASE: parent, "len": len(base[0]), "append": messages[len(base[0]):],
+                                   "depth": depth}
+                self.stats["delta"] += 1
+            else:
+                depth = 0
+                self.stats["full"] += 1
+            entry[channel] = (tuple(messages), depth)
+        self._remember((thread_id, checkpoint_ns, checkpoint["id"]), entry)
+        payload = {**checkpoint, "channel_values": values, _OWNER: [thread_id, checkpoint_ns]}
+        type_, raw = self.inner.dumps_typed(payload)
+        return f"{DELTA_PREFIX}{self.compression}/{type_}", self._compress(raw)
+
+    def dumps_full(self, thread_id: str, checkpoint_ns: str, checkpoint: dict) -> Tuple[str, bytes]:
+        """
+        重新编码成全量(保留策略删除了父检查点时用)
+        """
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": None}}
+        return self.dumps_checkpoint(config, checkpoint)
+
+    # ======================= 解码 =======================
+    def _decode(self, type_: str, blob: bytes):
+        _, compression, inner_type = type_.split("/", 2)
+        checkpoint = self.inner.loads_typed((inner_type, self._decompress(compression, blob)))
+        thread_id, checkpoint_ns = checkpoint.pop(_OWNER)
+        values = checkpoint["channel_values"]
+        entry = {}
+        for channel, value in list(values.items()):
+            if isinstance(value, dict) and _BASE in value:
+                base = self._messages(thread_id, checkpoint_ns, value[_BASE], channel)
+                if len(base) < value["len"]:
+                    raise ValueError(f"检查点 {checkpoint['id']} 的基准 {value[_BASE]} 只有 {len(base)} 条消息")
+                messages = list(base[:value["len"]]) + value["append"]
+                values[channel] = messages
+                entry[channel] = (tuple(messages), value["depth"])
+            elif channel in self.channels and isinstance(value, list):
+                entry[channel] = (tuple(value), 0)
+        self._remember((thread_id, checkpoint_ns, checkpoint["id"]), entry)
+        return checkpoint
+
+    def _messages(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str, channel: str) -> tuple:
+        cached = self._cached((thread_id, checkpoint_ns, checkpoint_id), channel)
+        if cached is not None:
+            return cached[0]
+        if self._fetch is None:
+            raise RuntimeError("DeltaSerde没有绑定读取父检查点的函数，请通过支持它的saver使用")
+        row = self._fetch(thread_id, checkpoint_ns, checkpoint_id)
+        self.stats["fetches"] += 1
+        if row is None:
+            raise KeyError(f"增量检查点的基准 {thread_id}/{checkpoint_id} 不存在")
+        checkpoint = self.loads_typed(row)
+        cached = self._cached((thread_id, checkpoint_ns, checkpoint_id), channel)
+        return cached[0] if cached is not None else tuple(checkpoint["channel_values"].get(channel, ()))
+
+    # ======================= 缓存 =======================
+    def _cached(self, key: tuple, channel: str):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            self._cache.move_to_end(key)
+            return entry.get(channel)
+
+    def _remember(self, key: tuple, entry: dict):
+        if not entry:
+            return
+        with self._lock:
+            self._cache[key] = entry
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    # ======================= 压缩 =======================
+    def _compress(self, raw: bytes) -> bytes:
+        if self.compression == "zstd":
+            compressor = getattr(self._local, "compressor", None)
+            if compressor is None:
+                compressor = self._local.compressor = zstandard.ZstdCompressor(level=self.level or 3)
+            return compressor.compress(raw)
+        if self.compression == "zlib":
+            return zlib.compress(raw, self.level or 6)
+        return raw
+
+    def _decompress(self, compression: str, blob: bytes) -> bytes:
+        if compression == "zstd":
+            if zstandard is None:
+                raise ImportError("该检查点使用zstd压缩，需要安装zstandard")
+            decompressor = getattr(self._local, "decompressor", None)
+            if decompressor is None:
+                decompressor = self._local.decompressor = zstandard.ZstdDecompressor()
+            return decompressor.decompress(blob)
+        if compression == "zlib":
+            return zlib.decompress(blob)
+        return blob
+
+
+if __name__ == '__main__':
+    print("delta_serde...")
+    from langchain_core.messages import AIMessage, HumanMessage
+
+    serde = DeltaSerde(full_every=4)
+    stored = {}
+    serde.bind(lambda thread_id, checkpoint_ns, checkpoint_id: stored.get(checkpoint_id))
+    messages, parent = [], None
+    for i in range(10):
+        messages = messages + [HumanMessage(f"问题{i}", id=f"h{i}"), AIMessage(f"回答{i}", id=f"a{i}")]
+        checkpoint = {"v": 4, "id": f"{i:04d}", "ts": "", "channel_values": {"messages": messages},
+                      "channel_versions": {}, "versions_seen": {}}
+        config = {"configurable": {"thread_id": "1", "checkpoint_ns": "", "checkpoint_id": parent}}
+        stored[checkpoint["id"]] = serde.dumps_checkpoint(config, checkpoint)
+        parent = checkpoint["id"]
+    serde.clear_cache()  # 模拟重启：从存储中沿父链解码
+    restored = serde.loads_typed(stored[parent])["channel_values"]["messages"]
+    print(restored == messages, serde.stats, [len(blob) for _, blob in stored.values()])
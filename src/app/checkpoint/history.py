@@ -0,0 +1,400 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : history.py
+@time    : 2026/10/18 21:50
+@desc    : 分页、延迟反序列化的状态历史：只读检查点的id/父id/metadata，按checkpoint_id倒序分页，
+           支持before游标和步数范围过滤，快照的values在第一次访问时才通过graph.get_state加载
+           get_state_history会把每个快照都完整反序列化(包括全部消息和待执行任务)，长会话只看最近几步时代价很高
+-----------------------------------------------------------------------
+"""
+import json
+from dataclasses import dataclass, field
+from typing import Iterator, List, Optional, Union
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from src.app.checkpoint.retention import checkpoint_time
+from src.app.checkpoint.sqlite_saver import STEP_EXPR, STEP_INDEX_SQL
+from src.app.checkpoint.tiered_saver import TieredSqliteSaver
+
+
+class HistoryEntry:
+    """
+    一个历史快照：checkpoint_id、父检查点、metadata(步数、来源、写入)立即可用，
+    snapshot/values在第一次访问时才加载
+    """
+
+    __slots__ = ("graph", "config", "parent_config", "metadata", "_snapshot")
+
+    def __init__(self, graph, config: dict, parent_config: Optional[dict], metadata: dict):
+        self.graph = graph
+        self.config = config
+        self.parent_config = parent_config
+        self.metadata = metadata
+        self._snapshot = None
+
+    @property
+    def checkpoint_id(self) -> str:
+        return self.config["configurable"]["checkpoint_id"]
+
+    @property
+    def step(self) -> Optional[int]:
+        return self.metadata.get("step")
+
+    @property
+    def created_at(self) -> float:
+        return checkpoint_time(self.checkpoint_id)
+
+    @property
+    def snapshot(self):
+        if self._snapshot is None:
+            self._snapshot = self.graph.get_state(self.config)
+        return self._snapshot
+
+    async def aload(self):
+        if self._snapshot is None:
+            self._snapshot = await self.graph.aget_state(self.config)
+        return self._snapshot
+
+    @property
+    def values(self) -> dict:
+        return self.snapshot.values
+
+    @property
+    def next(self) -> tuple:
+        return self.snapshot.next
+
+    def __repr__(self):
+        return f"HistoryEntry(checkpoint_id={self.checkpoint_id!r}, step={self.step}, source={self.metadata.get('source')!r})"
+
+
+@dataclass
+class HistoryPage:
+    """
+    cursor: 下一页的before参数，None表示没有更多了
+    """
+    entries: List[HistoryEntry] = field(default_factory=list)
+    cursor: Optional[str] = None
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _before_id(before: Union[str, dict, None]) -> Optional[str]:
+    if isinstance(before, dict):
+        return before["configurable"]["checkpoint_id"]
+    return before
+
+
+def _in_range(step, min_step, max_step) -> bool:
+    if min_step is None and max_step is None:
+        return True
+    if step is None:
+        return False
+    return (min_step is None or step >= min_step) and (max_step is None or step <= max_step)
+
+
+def _where(thread_id, checkpoint_ns, before, min_step, max_step):
+    """
+    只按主键(thread_id, checkpoint_ns, checkpoint_id)或步数索引查询，不读checkpoint列
+    """
+    clauses, params = ["thread_id = ?", "checkpoint_ns = ?"], [thread_id, checkpoint_ns]
+    if before is not None:
+        clauses.append("checkpoint_id < ?")
+        params.append(before)
+    if min_step is not None:
+        clauses.append(f"{STEP_EXPR} >= ?")
+        params.append(min_step)
+    if max_step is not None:
+        clauses.append(f"{STEP_EXPR} <= ?")
+        params.append(max_step)
+    return " AND ".join(clauses), params
+
+
+class _SqliteBackend:
+    def __init__(self, saver: SqliteSaver):
+        self.saver = saver
+        with saver.cursor() as cur:  # 普通SqliteSaver的库没有步数索引，这里补建
+            cur.execute(STEP_INDEX_SQL)
+
+    def rows(self, thread_id, checkpoint_ns, limit, before, min_step, max_step):
+        where, params = _where(thread_id, checkpoint_ns, before, min_step, max_step)
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute(f"SELECT checkpoint_id, parent_checkpoint_id, metadata FROM checkpoints WHERE {where} "
+                        f"ORDER BY checkpoint_id DESC LIMIT ?", (*params, limit))
+            return [(cid, parent, json.loads(metadata) if metadata else {}) for cid, parent, metadata in cur]
+
+    def count(self, thread_id, checkpoint_ns, min_step, max_step) -> int:
+        where, params = _where(thread_id, checkpoint_ns, None, min_step, max_step)
+        with self.saver.cursor(transaction=False) as cur:
+            return cur.execute(f"SELECT COUNT(*) FROM checkpoints WHERE {where}", params).fetchone()[0]
+
+
+class _AsyncSqliteBackend:
+    def __init__(self, saver: AsyncSqliteSaver):
+        self.saver = saver
+        self._indexed = False
+
+    async def _ready(self):
+        await self.saver.setup()
+        if not self._indexed:
+            async with self.saver.lock:
+                await self.saver.conn.execute(STEP_INDEX_SQL)
+                await self.saver.conn.commit()
+            self._indexed = True
+
+    async def rows(self, thread_id, checkpoint_ns, limit, before, min_step, max_step):
+        await self._ready()
+        where, params = _where(thread_id, checkpoint_ns, before, min_step, max_step)
+        async with self.saver.lock, self.saver.conn.execute(
+                f"SELECT checkpoint_id, parent_checkpoint_id, metadata FROM checkpoints WHERE {where} "
+                f"ORDER BY checkpoint_id DESC LIMIT ?", (*params, limit)) as cur:
+            return [(cid, parent, json.loads(metadata) if metadata else {}) for cid, parent, metadata
+                    in await cur.fetchall()]
+
+    async def count(self, thread_id, checkpoint_ns, min_step, max_step) -> int:
+        await self._ready()
+        where, params = _where(thread_id, checkpoint_ns, None, min_step, max_step)
+        async with self.saver.lock, self.saver.conn.execute(
+                f"SELECT COUNT(*) FROM checkpoints WHERE {where}", params) as cur:
+            return (await cur.fetchone())[0]
+
+
+class _MemoryBackend:
+    """
+    InMemorySaver：检查点id排序后倒序扫描，只反序列化扫描到的metadata
+    """
+
+    def __init__(self, saver: InMemorySaver):
+        self.saver = saver
+
+    def _scan(self, thread_id, checkpoint_ns, before, min_step, max_step) -> Iterator[tuple]:
+        checkpoints = self.saver.storage.get(thread_id, {}).get(checkpoint_ns, {})
+        for checkpoint_id in sorted(list(checkpoints), reverse=True):
+            if before is not None and checkpoint_id >= before:
+                continue
+            saved = checkpoints.get(checkpoint_id)
+            if saved is None:
+                continue
+            metadata = self.saver.serde.loads_typed(saved[1])
+            if _in_range(metadata.get("step"), min_step, max_step):
+                yield checkpoint_id, saved[2], metadata
+
+    def rows(self, thread_id, checkpoint_ns, limit, before, min_step, max_step):
+        rows = []
+        for row in self._scan(thread_id, checkpoint_ns, before, min_step, max_step):
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def count(self, thread_id, checkpoint_ns, min_step, max_step) -> int:
+        if min_step is None and max_step is None:
+            return len(self.saver.storage.get(thread_id, {}).get(checkpoint_ns, {}))
+        return sum(1 for _ in self._scan(thread_id, checkpoint_ns, None, min_step, max_step))
+
+
+class _TieredBackend:
+    """
+    TieredSqliteSaver：会话在内存中时读内存中的行(metadata是原始JSON)，否则查磁盘上的checkpoints表，
+    两种情况都不反序列化checkpoint
+    """
+
+    def __init__(self, saver: TieredSqliteSaver):
+        self.saver = saver
+        self.disk = _SqliteBackend(saver.disk)
+
+    def _scan(self, rows, before, min_step, max_step) -> Iterator[tuple]:
+        for row in sorted(rows, key=lambda row: row[2], reverse=True):
+            checkpoint_id, parent, metadata = row[2], row[3], row[6]
+            if before is not None and checkpoint_id >= before:
+                continue
+            metadata = json.loads(metadata) if metadata else {}
+            if _in_range(metadata.get("step"), min_step, max_step):
+                yield checkpoint_id, parent, metadata
+
+    def rows(self, thread_id, checkpoint_ns, limit, before, min_step, max_step):
+        hot = self.saver.hot_checkpoints(thread_id, checkpoint_ns)
+        if hot is None:
+            return self.disk.rows(thread_id, checkpoint_ns, limit, before, min_step, max_step)
+        rows = []
+        for row in self._scan(hot, before, min_step, max_step):
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def count(self, thread_id, checkpoint_ns, min_step, max_step) -> int:
+        hot = self.saver.hot_checkpoints(thread_id, checkpoint_ns)
+        if hot is None:
+            return self.disk.count(thread_id, checkpoint_ns, min_step, max_step)
+        if min_step is None and max_step is None:
+            return len(hot)
+        return sum(1 for _ in self._scan(hot, None, min_step, max_step))
+
+
+class _ListBackend:
+    """
+    其他检查点：退化为saver.list，checkpoint会被反序列化，但仍然只取需要的条数
+    """
+
+    def __init__(self, saver):
+        self.saver = saver
+
+    def _scan(self, thread_id, checkpoint_ns, before, min_step, max_step, limit=None):
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns}}
+        before = {"configurable": {"checkpoint_id": before}} if before else None
+        unfiltered = min_step is None and max_step is None
+        for item in self.saver.list(config, before=before, limit=limit if unfiltered else None):
+            if _in_range(item.metadata.get("step"), min_step, max_step):
+                parent = item.parent_config["configurable"]["checkpoint_id"] if item.parent_config else None
+                yield item.config["configurable"]["checkpoint_id"], parent, item.metadata
+
+    def rows(self, thread_id, checkpoint_ns, limit, before, min_step, max_step):
+        rows = []
+        for row in self._scan(thread_id, checkpoint_ns, before, min_step, max_step, limit):
+            rows.append(row)
+            if len(rows) >= limit:
+                break
+        return rows
+
+    def count(self, thread_id, checkpoint_ns, min_step, max_step) -> int:
+        return sum(1 for _ in self._scan(thread_id, checkpoint_ns, None, min_step, max_step))
+
+
+class StateHistory:
+    """
+    history = StateHistory(graph)
+    page = history.page(config, limit=3)                           # 最近3个快照
+    page = history.page(config, limit=3, before=page.cursor)       # 下一页
+    for entry in history.iter(config, min_step=10, max_step=20):   # 按步数范围逐页拉取
+        print(entry.step, entry.values["messages"][-1])            # 访问values时才加载快照
+
+    BatchedSqliteSaver/BatchedAsyncSqliteSaver建表时会建(thread_id, checkpoint_ns, step)索引，
+    取最新几页只走主键索引，耗时与会话长度无关；TieredSqliteSaver的热会话直接读内存中的行
+    """
+
+    def __init__(self, graph, checkpointer=None):
+        self.graph = graph
+        saver = checkpointer or graph.checkpointer
+        if isinstance(saver, TieredSqliteSaver):
+            self._backend = _TieredBackend(saver)
+        elif isinstance(saver, SqliteSaver):
+            self._backend = _SqliteBackend(saver)
+        elif isinstance(saver, AsyncSqliteSaver):
+            self._backend = _AsyncSqliteBackend(saver)
+        elif isinstance(saver, InMemorySaver):
+            self._backend = _MemoryBackend(saver)
+        elif saver is not None and not isinstance(saver, bool):
+            self._backend = _ListBackend(saver)
+        else:
+            raise ValueError("图没有配置检查点，无法查看历史")
+
+    @staticmethod
+    def _thread(config: dict):
+        configurable = config["configurable"]
+        return str(configurable["thread_id"]), configurable.get("checkpoint_ns", "")
+
+    def _page(self, config, rows, limit) -> HistoryPage:
+        thread_id, checkpoint_ns = self._thread(config)
+        entries = [
+            HistoryEntry(
+                self.graph,
+                {"configurable": {**config["configurable"], "checkpoint_ns": checkpoint_ns, "checkpoint_id": cid}},
+                {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns, "checkpoint_id": parent}}
+                if parent else None,
+                metadata,
+            )
+            for cid, parent, metadata in rows
+        ]
+        return HistoryPage(entries, entries[-1].checkpoint_id if len(entries) == limit else None)
+
+    # ======================= 同步 =======================
+    def page(self, config: dict, limit: int = 10, before: Union[str, dict] = None,
+             min_step: int = None, max_step: int = None) -> HistoryPage:
+        """
+        :param config: 包含thread_id(可选checkpoint_ns)
+        :param limit: 每页条数
+        :param before: 只返回比它更早的快照，上一页的cursor或带checkpoint_id的config
+        :param min_step: 步数下限(含)
+        :param max_step: 步数上限(含)
+        :return: 按checkpoint_id倒序(从新到旧)
+        """
+        if isinstance(self._backend, _AsyncSqliteBackend):
+            raise TypeError("异步检查点请使用apage/aiter")
+        thread_id, checkpoint_ns = self._thread(config)
+        rows = self._backend.rows(thread_id, checkpoint_ns, limit, _before_id(before), min_step, max_step)
+        return self._page(config, rows, limit)
+
+    def iter(self, config: dict, page_size: int = 50, before: Union[str, dict] = None,
+             min_step: int = None, max_step: int = None) -> Iterator[HistoryEntry]:
+        cursor = _before_id(before)
+        while True:
+            page = self.page(config, page_size, cursor, min_step, max_step)
+            yield from page.entries
+            if page.cursor is None:
+                return
+            cursor = page.cursor
+
+    def count(self, config: dict, min_step: int = None, max_step: int = None) -> int:
+        if isinstance(self._backend, _AsyncSqliteBackend):
+            raise TypeError("异步检查点请使用acount")
+        return self._backend.count(*self._thread(config), min_step, max_step)
+
+    # ======================= 异步 =======================
+    async def apage(self, config: dict, limit: int = 10, before: Union[str, dict] = None,
+                    min_step: int = None, max_step: int = None) -> HistoryPage:
+        if not isinstance(self._backend, _AsyncSqliteBackend):
+            return self.page(config, limit, before, min_step, max_step)
+        thread_id, checkpoint_ns = self._thread(config)
+        rows = await self._backend.rows(thread_id, checkpoint_ns, limit, _before_id(before), min_step, max_step)
+        return self._page(config, rows, limit)
+
+    async def aiter(self, config: dict, page_size: int = 50, before: Union[str, dict] = None,
+                    min_step: int = None, max_step: int = None):
+        cursor = _before_id(before)
+        while True:
+            page = await self.apage(config, page_size, cursor, min_step, max_step)
+            for entry in page.entries:
+                yield entry
+            if page.cursor is None:
+                return
+            cursor = page.cursor
+
+    async def acount(self, config: dict, min_step: int = None, max_step: int = None) -> int:
+        if not isinstance(self._backend, _AsyncSqliteBackend):
+            return self.count(config, min_step, max_step)
+        return await self._backend.count(*self._thread(config), min_step, max_step)
+
+
+if __name__ == '__main__':
+    print("history...")
+    from langgraph.graph import StateGraph, START, END
+    from typing import TypedDict
+
+    class Counter(TypedDict):
+        count: int
+
+    builder = StateGraph(Counter)
+    builder.add_node("inc", lambda state: {"count": state["count"] + 1})
+    builder.add_edge(START, "inc")
+    builder.add_conditional_edges("inc", lambda state: END if state["count"] >= 20 else "inc")
+    graph = builder.compile(checkpointer=InMemorySaver())
+    config = {"configurable": {"thread_id": "1"}}
+    graph.invoke({"count": 0}, config)
+
+    history = StateHistory(graph)
+    print(f"共 {history.count(config)} 个快照")
+    page = history.page(config, limit=3)
+    print(page.entries, page.cursor)
+    print([entry.values for entry in history.page(config, limit=3, before=page.cursor)])
+    print([entry.step for entry in history.iter(config, page_size=4, min_step=5, max_step=9)])
@@ -0,0 +1,397 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : retention.py
+@time    : 2026/10/18 12:10
+@desc    : 检查点保留策略、后台压缩(分批删除 + 增量VACUUM)和存储统计
+-----------------------------------------------------------------------
+"""
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Optional
+
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from src.app.checkpoint.delta_serde import DeltaSerde
+from src.app.checkpoint.sqlite_saver import checkpoint_fetcher, connect
+
+logger = logging.getLogger(__name__)
+
+# UUIDv6时间戳起点(1582-10-15)到Unix纪元的100纳秒数
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+
+
+def checkpoint_time(checkpoint_id: str) -> float:
+    """
+    从检查点ID(uuid6)中解析写入时间，返回Unix时间戳(秒)，无需反序列化检查点
+    :param checkpoint_id:
+    :return:
+    """
+    hex_id = checkpoint_id.replace("-", "")
+    timestamp = (int(hex_id[0:12], 16) << 12) | int(hex_id[13:16], 16)
+    return (timestamp - _UUID_EPOCH_OFFSET) / 1e7
+
+
+@dataclass
+class RetentionPolicy:
+    """
+    检查点保留策略(每个thread_id + checkpoint_ns独立计算，最新的检查点始终保留)
+
+    keep_last: 保留最近K个检查点
+    keep_every: 超出K个之后，每N步保留一个(step % N == 0)，0表示不保留
+    ttl: 超过ttl秒的检查点删除(不受keep_every保护)，None表示不按时间清理
+    """
+    keep_last: int = 20
+    keep_every: int = 0
+    ttl: Optional[float] = None
+
+    def __post_init__(self):
+        if self.keep_last < 1:
+            raise ValueError("keep_last至少为1，最新的检查点不能删除")
+
+    def select_expired(self, entries, now: float = None) -> list:
+        """
+        计算需要删除的检查点
+        :param entries: [(checkpoint_id, step)]，同一线程的检查点
+        :param now:
+        :return: 需要删除的checkpoint_id列表
+        """
+        now = time.time() if now is None else now
+        ordered = sorted(entries, key=lambda e: e[0], reverse=True)  # uuid6按时间有序
+        expired = []
+        for index, (checkpoint_id, step) in enumerate(ordered):
+            if index == 0:
+                continue
+            if self.ttl is not None and now - checkpoint_time(checkpoint_id) > self.ttl:
+                expired.append(checkpoint_id)
+            elif index < self.keep_last:
+                continue
+            elif self.keep_every and step is not None and step % self.keep_every == 0:
+                continue
+            else:
+                expired.append(checkpoint_id)
+        return expired
+
+
+class _MemoryBackend:
+    """
+    InMemorySaver：直接操作其storage/writes/blobs字典
+    InMemorySaver没有可以共享的锁，只能在使用该saver的线程中、两次图调用之间执行，不支持后台线程
+    """
+
+    def __init__(self, saver: InMemorySaver):
+        self.saver = saver
+
+    def groups(self):
+        for thread_id, namespaces in list(self.saver.storage.items()):
+            for checkpoint_ns in list(namespaces.keys()):
+                yield thread_id, checkpoint_ns
+
+    def entries(self, thread_id, checkpoint_ns):
+        saved = dict(self.saver.storage[thread_id][checkpoint_ns])
+        return [
+            (checkpoint_id, self.saver.serde.loads_typed(metadata).get("step"))
+            for checkpoint_id, (_, metadata, _) in saved.items()
+        ]
+
+    def delete(self, thread_id, checkpoint_ns, checkpoint_ids, batch_size):
+        serde = self.saver.serde
+        checkpoints = self.saver.storage[thread_id][checkpoint_ns]
+        doomed = set(checkpoint_ids)
+        parents = {cid: saved[2] for cid, saved in list(checkpoints.items())}
+
+        candidates = set()  # 被删除检查点引用的(通道, 版本)
+        for checkpoint_id in doomed:
+            saved = checkpoints.pop(checkpoint_id, None)
+            self.saver.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+            if saved is not None:
+                candidates.update(serde.loads_typed(saved[0])["channel_versions"].items())
+
+        # 父节点被删除的检查点，改为指向最近的保留祖先，保持历史链完整
+        for checkpoint_id, saved in list(checkpoints.items()):
+            parent = saved[2]
+            if parent in doomed:
+                while parent in doomed:
+                    parent = parents.get(parent)
+                checkpoints[checkpoint_id] = (saved[0], saved[1], parent)
+
+        # 删除不再被任何保留检查点引用的通道数据
+        referenced = set()
+        for saved in list(checkpoints.values()):
+            for channel, version in serde.loads_typed(saved[0])["channel_versions"].items():
+                referenced.add((channel, version))
+        for channel, version in candidates - referenced:
+            self.saver.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+        return len(doomed)
+
+    def vacuum(self, pages):
+        return 0
+
+    def stats(self) -> dict:
+        per_thread = {}
+        rows = nbytes = 0
+        for thread_id, namespaces in list(self.saver.storage.items()):
+            count = 0
+            for checkpoints in list(namespaces.values()):
+                for checkpoint, metadata, _ in list(checkpoints.values()):
+                    count += 1
+                    nbytes += len(checkpoint[1]) + len(metadata[1])
+            per_thread[thread_id] = count
+            rows += count
+        writes = 0
+        for stored in list(self.saver.writes.values()):
+            for _, _, value, _ in list(stored.values()):
+                writes += 1
+                nbytes += len(value[1])
+        for value in list(self.saver.blobs.values()):
+            nbytes += len(value[1])
+        return {
+            "backend": "memory",
+            "threads": len(per_thread),
+            "checkpoints": rows,
+            "writes": writes,
+            "blobs": len(self.saver.blobs),
+            "bytes": nbytes,
+            "per_thread": per_thread,
+        }
+
+
+class _SqliteBackend:
+    """
+    SqliteSaver(及其子类)或SQLite文件路径，每批删除单独提交，批次之间释放锁，不阻塞在线写入
+    """
+
+    def __init__(self, saver_or_path):
+        if isinstance(saver_or_path, SqliteSaver):
+            self.saver = saver_or_path
+        else:
+            # 只有文件路径时(例如AsyncSqliteSaver的库)，单独开一个连接，WAL下与在线写入互不阻塞
+            # DeltaSerde兼容普通格式，库里有增量检查点时也能解码
+            conn = connect(saver_or_path)
+            serde = DeltaSerde()
+            serde.bind(checkpoint_fetcher(conn))
+            self.saver = SqliteSaver(conn, serde=serde)
+
+    def groups(self):
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute("SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints")
+            return cur.fetchall()
+
+    def entries(self, thread_id, checkpoint_ns):
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute(
+                "SELECT checkpoint_id, json_extract(CAST(metadata AS TEXT), '$.step') FROM checkpoints "
+                "WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            )
+            return cur.fetchall()
+
+    def delete(self, thread_id, checkpoint_ns, checkpoint_ids, batch_size):
+        doomed = set(checkpoint_ids)
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute(
+                "SELECT checkpoint_id, parent_checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?",
+                (thread_id, checkpoint_ns),
+            )
+            parents = dict(cur.fetchall())
+
+        # 先把保留检查点的父指针改到最近的保留祖先
+        relink = []
+        for checkpoint_id, parent in parents.items():
+            if checkpoint_id not in doomed and parent in doomed:
+                while parent in doomed:
+                    parent = parents.get(parent)
+                relink.append((parent, thread_id, checkpoint_ns, checkpoint_id))
+        with self.saver.cursor() as cur:
+            self._materialize(cur, thread_id, checkpoint_ns, [row[-1] for row in relink])
+            cur.executemany(
+                "UPDATE checkpoints SET parent_checkpoint_id = ? "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                relink,
+            )
+
+        ordered = sorted(doomed)
+        for start in range(0, len(ordered), batch_size):
+            rows = [(thread_id, checkpoint_ns, cid) for cid in ordered[start:start + batch_size]]
+            with self.saver.cursor() as cur:
+                cur.executemany(
+                    "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", rows
+                )
+                cur.executemany(
+                    "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", rows
+                )
+        return len(ordered)
+
+    def _materialize(self, cur, thread_id, checkpoint_ns, checkpoint_ids):
+        """
+        父检查点要被删除的增量检查点，先改写成全量，否则删除后无法解码
+        """
+        serde = self.saver.serde
+        if not isinstance(serde, DeltaSerde):
+            return
+        for checkpoint_id in checkpoint_ids:
+            row = checkpoint_fetcher(self.saver.conn)(thread_id, checkpoint_ns, checkpoint_id)
+            if row is None or not serde.is_delta(row[0]):
+                continue
+            type_, blob = serde.dumps_full(thread_id, checkpoint_ns, serde.loads_typed(row))
+            cur.execute(
+                "UPDATE checkpoints SET type = ?, checkpoint = ? "
+                "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+                (type_, blob, thread_id, checkpoint_ns, checkpoint_id),
+            )
+
+    def vacuum(self, pages):
+        """
+        增量回收空闲页(需要库以auto_vacuum=INCREMENTAL创建)，并截断WAL
+        """
+        with self.saver.cursor(transaction=False) as cur:
+            auto_vacuum = cur.execute("PRAGMA auto_vacuum").fetchone()[0]
+            before = cur.execute("PRAGMA freelist_count").fetchone()[0]
+            if auto_vacuum == 2 and before:
+                # execute只会step一次(每次回收一页)，executescript才会执行完整个pragma
+                self.saver.conn.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+            cur.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+            after = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        return before - after
+
+    def stats(self) -> dict:
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute("SELECT thread_id, COUNT(*) FROM checkpoints GROUP BY thread_id")
+            per_thread = dict(cur.fetchall())
+            writes = cur.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+            payload = cur.execute(
+                "SELECT COALESCE(SUM(LENGTH(checkpoint) + LENGTH(metadata)), 0) FROM checkpoints"
+            ).fetchone()[0]
+            payload += cur.execute("SELECT COALESCE(SUM(LENGTH(value)), 0) FROM writes").fetchone()[0]
+            page_size = cur.execute("PRAGMA page_size").fetchone()[0]
+            page_count = cur.execute("PRAGMA page_count").fetchone()[0]
+            freelist = cur.execute("PRAGMA freelist_count").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "threads": len(per_thread),
+            "checkpoints": sum(per_thread.values()),
+            "writes": writes,
+            "bytes": payload,
+            "file_bytes": page_size * page_count,
+            "free_bytes": page_size * freelist,
+            "per_thread": per_thread,
+        }
+
+    def close(self):
+        self.saver.conn.close()
+
+
+def _backend(saver):
+    if isinstance(saver, InMemorySaver):
+        return _MemoryBackend(saver)
+    if isinstance(saver, (SqliteSaver, str)):
+        return _SqliteBackend(saver)
+    raise TypeError(f"不支持的检查点类型：{type(saver).__name__}")
+
+
+def checkpoint_stats(saver) -> dict:
+    """
+    检查点存储统计：行数、字节数、每个线程的检查点数
+    :param saver: InMemorySaver / SqliteSaver / SQLite文件路径
+    :return:
+    """
+    backend = _backend(saver)
+    if isinstance(saver, str):
+        with closing(backend.saver.conn):
+            return backend.stats()
+    return backend.stats()
+
+
+class CheckpointCompactor:
+    """
+    后台压缩器：按保留策略定期清理检查点，SQLite下分批删除并增量VACUUM
+
+    compactor = CheckpointCompactor(sqlite_saver, RetentionPolicy(keep_last=20, keep_every=10))
+    compactor.start()
+
+    InMemorySaver不能start()，由调用方在两次图调用之间执行compactor.run_once()
+    后台线程中的失败记录到日志，并计入stats()的failures
+    """
+
+    def __init__(self, saver, policy: RetentionPolicy, interval: float = 60.0,
+                 batch_size: int = 500, vacuum_pages: int = 1000):
+        self.backend = _backend(saver)
+        self.policy = policy
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.runs = 0
+        self.deleted = 0
+        self.failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def run_once(self) -> dict:
+        """
+        执行一轮压缩
+        :return: 本轮删除的检查点数、回收的页数
+        """
+        now = time.time()
+        deleted = 0
+        per_thread = defaultdict(int)
+        for thread_id, checkpoint_ns in self.backend.groups():
+            expired = self.policy.select_expired(self.backend.entries(thread_id, checkpoint_ns), now)
+            if expired:
+                count = self.backend.delete(thread_id, checkpoint_ns, expired, self.batch_size)
+                per_thread[thread_id] += count
+                deleted += count
+            if self._stop.is_set():
+                break
+        reclaimed = self.backend.vacuum(self.vacuum_pages)
+        self.runs += 1
+        self.deleted += deleted
+        return {"deleted": deleted, "reclaimed_pages": reclaimed, "per_thread": dict(per_thread)}
+
+    def stats(self) -> dict:
+        return {**self.backend.stats(),
+                "compactor": {"runs": self.runs, "deleted": self.deleted, "failures": self.failures}}
+
+    def start(self):
+        if isinstance(self.backend, _MemoryBackend):
+            raise ValueError("InMemorySaver不能在后台线程中压缩，请在调用方线程中执行run_once()")
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="checkpoint-compactor", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception:
+                self.failures += 1
+                logger.exception("检查点压缩失败")
+
+
+if __name__ == '__main__':
+    print("retention...")
+    from langgraph.checkpoint.base import empty_checkpoint
+
+    memory = InMemorySaver()
+    config = {"configurable": {"thread_id": "1", "checkpoint_ns": ""}}
+    for step in range(50):
+        config = memory.put(config, empty_checkpoint(), {"step": step}, {})
+    compactor = CheckpointCompactor(memory, RetentionPolicy(keep_last=10, keep_every=10))
+    print(compactor.run_once())
+    print(json.dumps(compactor.stats(), ensure_ascii=False))
@@ -0,0 +1,431 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : sqlite_saver.py
+@time    : 2026/10/18 11:05
+@desc    : 高吞吐SQLite检查点：WAL及pragma调优、多线程写入组提交、异步版本、按步数的历史索引
+-----------------------------------------------------------------------
+"""
+import asyncio
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import asynccontextmanager, closing, contextmanager
+
+import aiosqlite
+from langgraph.checkpoint.base import WRITES_IDX_MAP, get_checkpoint_metadata
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+from src.app.checkpoint.delta_serde import DeltaSerde
+
+# 默认pragma：WAL允许读写并发，synchronous=NORMAL在WAL下只在checkpoint时fsync
+SQLITE_PRAGMAS = {
+    "auto_vacuum": "INCREMENTAL",  # 只对新建的库生效，配合retention中的增量VACUUM回收空间
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -64000,  # 负数表示KB，约64MB页缓存
+    "temp_store": "MEMORY",
+    "mmap_size": 268435456,  # 256MB
+    "busy_timeout": 5000,  # 毫秒
+}
+
+_CHECKPOINT_SQL = (
+    "INSERT OR REPLACE INTO checkpoints (thread_id, checkpoint_ns, checkpoint_id, "
+    "parent_checkpoint_id, type, checkpoint, metadata) VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+_WRITES_REPLACE_SQL = (
+    "INSERT OR REPLACE INTO writes (thread_id, checkpoint_ns, checkpoint_id, task_id, "
+    "task_path, idx, channel, type, value) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+_WRITES_IGNORE_SQL = _WRITES_REPLACE_SQL.replace("INSERT OR REPLACE", "INSERT OR IGNORE")
+
+# 检查点的步数(metadata中的step)，查询条件必须与索引表达式完全一致才能走索引
+STEP_EXPR = "json_extract(CAST(metadata AS TEXT), '$.step')"
+STEP_INDEX_SQL = (
+    f"CREATE INDEX IF NOT EXISTS checkpoints_thread_step ON checkpoints (thread_id, checkpoint_ns, {STEP_EXPR})"
+)
+
+
+def _pragma_statements(pragmas: dict = None):
+    merged = {**SQLITE_PRAGMAS, **(pragmas or {})}
+    return [f"PRAGMA {name}={value}" for name, value in merged.items() if value is not None]
+
+
+def apply_pragmas(conn: sqlite3.Connection, pragmas: dict = None):
+    """
+    给连接设置pragma，pragmas中的值会覆盖默认值，值为None表示不设置
+    :param conn:
+    :param pragmas:
+    :return:
+    """
+    for statement in _pragma_statements(pragmas):
+        conn.execute(statement)
+
+
+async def aapply_pragmas(conn: aiosqlite.Connection, pragmas: dict = None):
+    for statement in _pragma_statements(pragmas):
+        await conn.execute(statement)
+
+
+def connect(conn_string: str, pragmas: dict = None) -> sqlite3.Connection:
+    """
+    打开调优后的SQLite连接(可跨线程使用，由saver内部加锁)
+    :param conn_string:
+    :param pragmas:
+    :return:
+    """
+    conn = sqlite3.connect(conn_string, check_same_thread=False)
+    apply_pragmas(conn, pragmas)
+    return conn
+
+
+def checkpoint_op(saver, config, checkpoint, metadata):
+    """
+    序列化检查点，返回(sql, 参数列表)，序列化在调用方线程完成，不占用写锁
+    DeltaSerde需要父检查点id，走dumps_checkpoint
+    """
+    if isinstance(saver.serde, DeltaSerde):
+        type_, serialized_checkpoint = saver.serde.dumps_checkpoint(config, checkpoint)
+    else:
+        type_, serialized_checkpoint = saver.serde.dumps_typed(checkpoint)
+    serialized_metadata = json.dumps(
+        get_checkpoint_metadata(config, metadata), ensure_ascii=False
+    ).encode("utf-8", "ignore")
+    row = (
+        str(config["configurable"]["thread_id"]),
+        config["configurable"]["checkpoint_ns"],
+        checkpoint["id"],
+        config["configurable"].get("checkpoint_id"),
+        type_,
+        serialized_checkpoint,
+        serialized_metadata,
+    )
+    return _CHECKPOINT_SQL, [row]
+
+
+def writes_op(saver, config, writes, task_id, task_path):
+    """
+    序列化中间写入，返回(sql, 参数列表)
+    """
+    query = _WRITES_REPLACE_SQL if all(w[0] in WRITES_IDX_MAP for w in writes) else _WRITES_IGNORE_SQL
+    rows = [
+        (
+            str(config["configurable"]["thread_id"]),
+            str(config["configurable"]["checkpoint_ns"]),
+            str(config["configurable"]["checkpoint_id"]),
+            task_id,
+            task_path,
+            WRITES_IDX_MAP.get(channel, idx),
+            channel,
+            *saver.serde.dumps_typed(value),
+        )
+        for idx, (channel, value) in enumerate(writes)
+    ]
+    return query, rows
+
+
+def checkpoint_fetcher(conn: sqlite3.Connection):
+    """
+    DeltaSerde解码增量时读取父检查点用，在saver持有锁的读取过程中调用，直接使用连接
+    """
+    def fetch(thread_id, checkpoint_ns, checkpoint_id):
+        return conn.execute(
+            "SELECT type, checkpoint FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?",
+            (thread_id, checkpoint_ns, checkpoint_id),
+        ).fetchone()
+    return fetch
+
+
+def _saved_config(config, checkpoint):
+    return {
+        "configurable": {
+            "thread_id": config["configurable"]["thread_id"],
+            "checkpoint_ns": config["configurable"]["checkpoint_ns"],
+            "checkpoint_id": checkpoint["id"],
+        }
+    }
+
+
+class _WriteRequest:
+    __slots__ = ("ops", "done", "error")
+
+    def __init__(self, ops):
+        self.ops = ops
+        self.done = threading.Event()
+        self.error = None
+
+
+class BatchedSqliteSaver(SqliteSaver):
+    """
+    组提交版SqliteSaver
+
+    put/put_writes在调用线程里完成序列化后进入写队列，由后台写线程把队列中已有的请求
+    合并到一个事务里提交，调用方在提交完成后才返回(持久化语义不变)
+    """
+
+    def __init__(self, conn: sqlite3.Connection, *, serde=None, max_batch: int = 512):
+        super().__init__(conn, serde=serde)
+        if isinstance(self.serde, DeltaSerde):
+            self.serde.bind(checkpoint_fetcher(conn))
+        self.max_batch = max_batch
+        self.batches = 0  # 已提交事务数
+        self.batched_writes = 0  # 已提交写请求数
+        self._queue = queue.SimpleQueue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    @classmethod
+    @contextmanager
+    def from_conn_string(cls, conn_string: str, pragmas: dict = None, **kwargs):
+        """
+        with BatchedSqliteSaver.from_conn_string("weather_agent.sqlite") as memory:
+            ...
+        """
+        with closing(connect(conn_string, pragmas)) as conn:
+            saver = cls(conn, **kwargs)
+            try:
+                yield saver
+            finally:
+                saver.close()
+
+    def setup(self):
+        """
+        建表之后再建(thread_id, checkpoint_ns, step)索引，已有的库第一次打开时补建
+        """
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(STEP_INDEX_SQL)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        self._submit([checkpoint_op(self, config, checkpoint, metadata)])
+        return _saved_config(config, checkpoint)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        self._submit([writes_op(self, config, writes, task_id, task_path)])
+
+    def write_ops(self, ops):
+        """
+        写入checkpoint_op/writes_op生成的(sql, 参数列表)，所有操作在同一个事务里提交
+        """
+        self._submit(ops)
+
+    def close(self):
+        """
+        停止后台写线程(等待队列中的请求提交完成)
+        """
+        with self._writer_lock:
+            if self._writer is not None:
+                self._queue.put(None)
+                self._writer.join()
+                self._writer = None
+
+    def _submit(self, ops):
+        request = _WriteRequest(ops)
+        self._ensure_writer()
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+
+    def _ensure_writer(self):
+        if self._writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = threading.Thread(
+                        target=self._writer_loop, name="sqlite-group-commit", daemon=True
+                    )
+                    self._writer.start()
+
+    def _writer_loop(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            stop = False
+            # 取走队列中已经在等待的请求，不额外等待
+            while len(batch) < self.max_batch:
+                try:
+                    request = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    stop = True
+                    break
+                batch.append(request)
+            self._commit(batch)
+            if stop:
+                return
+
+    def _commit(self, batch):
+        with self.lock:
+            try:
+                self.setup()
+                self._execute(batch)
+                self.conn.commit()
+                self.batches += 1
+                self.batched_writes += len(batch)
+            except Exception:
+                self.conn.rollback()
+                # 整批失败时逐个重试，只让出错的请求收到异常
+                for request in batch:
+                    try:
+                        self._execute([request])
+                        self.conn.commit()
+                        self.batches += 1
+                        self.batched_writes += 1
+                    except Exception as e:
+                        self.conn.rollback()
+                        request.error = e
+        for request in batch:
+            request.done.set()
+
+    def _execute(self, batch):
+        cur = self.conn.cursor()
+        try:
+            for request in batch:
+                for sql, rows in request.ops:
+                    cur.executemany(sql, rows)
+        finally:
+            cur.close()
+
+
+def _resolve(future: asyncio.Future, error: BaseException = None):
+    """
+    调用方已经被取消(例如SSE客户端断开)时future已完成，跳过，不能再设置结果
+    """
+    if future.done():
+        return
+    if error is None:
+        future.set_result(None)
+    else:
+        future.set_exception(error)
+
+
+class BatchedAsyncSqliteSaver(AsyncSqliteSaver):
+    """
+    组提交版AsyncSqliteSaver，同一事件循环中并发的aput/aput_writes合并到一个事务里提交
+    使用DeltaSerde时，解码增量需要同步读取父检查点，from_conn_string会另开一个只读的同步连接(read_conn)
+    """
+
+    def __init__(self, conn: aiosqlite.Connection, *, serde=None, max_batch: int = 512,
+                 read_conn: sqlite3.Connection = None):
+        super().__init__(conn, serde=serde)
+        if isinstance(self.serde, DeltaSerde):
+            if read_conn is None:
+                raise ValueError("异步检查点使用DeltaSerde时需要同步的read_conn")
+            self.serde.bind(checkpoint_fetcher(read_conn))
+        self.max_batch = max_batch
+        self.batches = 0
+        self.batched_writes = 0
+        self._pending = []  # [(ops, future)]
+        self._writer = None
+
+    @classmethod
+    @asynccontextmanager
+    async def from_conn_string(cls, conn_string: str, pragmas: dict = None, **kwargs):
+        """
+        async with BatchedAsyncSqliteSaver.from_conn_string("weather_agent.sqlite") as memory:
+            ...
+        """
+        delta = isinstance(kwargs.get("serde"), DeltaSerde)
+        if delta and conn_string == ":memory:":
+            raise ValueError("DeltaSerde需要文件数据库，读取父检查点的同步连接看不到另一个连接的内存库")
+        async with aiosqlite.connect(conn_string) as conn:
+            await aapply_pragmas(conn, pragmas)
+            read_conn = connect(conn_string, pragmas) if delta else None
+            saver = cls(conn, read_conn=read_conn, **kwargs)
+            try:
+                yield saver
+            finally:
+                await saver.aclose()
+                if read_conn is not None:
+                    read_conn.close()
+
+    async def setup(self):
+        if self.is_setup:
+            return
+        await super().setup()
+        async with self.lock:
+            await self.conn.execute(STEP_INDEX_SQL)
+            await self.conn.commit()
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        await self._asubmit([checkpoint_op(self, config, checkpoint, metadata)])
+        return _saved_config(config, checkpoint)
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        await self._asubmit([writes_op(self, config, writes, task_id, task_path)])
+
+    async def aclose(self):
+        if self._writer is not None:
+            await self._writer
+
+    async def _asubmit(self, ops):
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((ops, future))
+        if self._writer is None or self._writer.done():
+            self._writer = asyncio.create_task(self._writer_loop())
+        await future
+
+    async def _writer_loop(self):
+        batch = []
+        try:
+            await self.setup()
+            while self._pending:
+                batch = self._pending[:self.max_batch]
+                del self._pending[:self.max_batch]
+                async with self.lock:
+                    await self._commit(batch)
+                batch = []
+        except BaseException as e:
+            # 写入协程本身出错或被取消：当前批次和排队中的调用都收到异常，不会有调用方一直等待
+            pending, self._pending = batch + self._pending, []
+            for _, future in pending:
+                _resolve(future, e)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+
+    async def _commit(self, batch):
+        """
+        整批一个事务；失败时回滚，再逐个提交找出出错的调用
+        """
+        try:
+            await self._execute(batch)
+            await self.conn.commit()
+        except Exception:
+            await self.conn.rollback()
+        else:
+            self.batches += 1
+            self.batched_writes += len(batch)
+            for _, future in batch:
+                _resolve(future)
+            return
+        for ops, future in batch:
+            try:
+                await self._execute([(ops, future)])
+                await self.conn.commit()
+            except Exception as e:
+                await self.conn.rollback()
+                _resolve(future, e)
+            else:
+                self.batches += 1
+                self.batched_writes += 1
+                _resolve(future)
+
+    async def _execute(self, batch):
+        for ops, _ in batch:
+            for sql, rows in ops:
+                await self.conn.executemany(sql, rows)
+
+
+if __name__ == '__main__':
+    print("sqlite_saver...")
+    with BatchedSqliteSaver.from_conn_string(":memory:") as saver:
+        print(saver.conn.execute("PRAGMA synchronous").fetchone())
@@ -0,0 +1,471 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : tiered_saver.py
+@time    : 2026/10/18 23:10
+@desc    : 内存/磁盘两级检查点：活跃会话的检查点放在有上限(会话数、字节数)的内存LRU里，
+           超出预算时把最久未访问的会话写到SQLite(BatchedSqliteSaver)并移出内存，再次访问时整体加载回来
+           MemorySaver的会话永远留在内存里，SqliteSaver每次读取都要查库，大量空闲会话的场景两者都不合适
+           内存中保存的是与SQLite表结构相同的行(已序列化)，写入磁盘和加载回内存都不需要重新序列化
+-----------------------------------------------------------------------
+"""
+import asyncio
+import json
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+from langgraph.checkpoint.base import BaseCheckpointSaver, CheckpointTuple, get_checkpoint_id
+from langgraph.checkpoint.sqlite.utils import load_pending_writes
+
+from src.app.checkpoint.delta_serde import DeltaSerde
+from src.app.checkpoint.sqlite_saver import BatchedSqliteSaver, checkpoint_fetcher, checkpoint_op, writes_op
+from src.app.profiling.metrics import MetricsRegistry
+
+_ROW_OVERHEAD = 200  # 每行在内存中除序列化数据以外的大致开销(元组、字典项、字符串)
+
+_LOAD_CHECKPOINTS_SQL = (
+    "SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata "
+    "FROM checkpoints WHERE thread_id = ?"
+)
+_LOAD_WRITES_SQL = (
+    "SELECT thread_id, checkpoint_ns, checkpoint_id, task_id, task_path, idx, channel, type, value "
+    "FROM writes WHERE thread_id = ?"
+)
+
+
+def _row_bytes(*blobs) -> int:
+    return _ROW_OVERHEAD + sum(len(blob) for blob in blobs if blob is not None)
+
+
+class _Thread:
+    """
+    一个会话在内存中的全部检查点和中间写入
+    checkpoints: checkpoint_ns -> {checkpoint_id: 行}，行与checkpoints表的列顺序相同
+    writes: (checkpoint_ns, checkpoint_id) -> {(task_id, idx): 行}，行与writes表的列顺序相同
+    dirty: 还没写到磁盘的(sql, 行列表)，按写入顺序
+    """
+
+    __slots__ = ("checkpoints", "latest", "writes", "dirty", "bytes")
+
+    def __init__(self):
+        self.checkpoints = {}
+        self.latest = {}  # checkpoint_ns -> 最新的checkpoint_id
+        self.writes = {}
+        self.dirty = []
+        self.bytes = 0
+
+    def add_checkpoint(self, row) -> int:
+        _, checkpoint_ns, checkpoint_id = row[:3]
+        rows = self.checkpoints.setdefault(checkpoint_ns, {})
+        old = rows.get(checkpoint_id)
+        rows[checkpoint_id] = row
+        if checkpoint_id > self.latest.get(checkpoint_ns, ""):
+            self.latest[checkpoint_ns] = checkpoint_id
+        delta = _row_bytes(row[5], row[6]) - (_row_bytes(old[5], old[6]) if old else 0)
+        self.bytes += delta
+        return delta
+
+    def add_writes(self, rows, replace: bool) -> int:
+        delta = 0
+        for row in rows:
+            writes = self.writes.setdefault((row[1], row[2]), {})
+            key = (row[3], row[5])
+            old = writes.get(key)
+            if old is not None and not replace:
+                continue
+            writes[key] = row
+            delta += _row_bytes(row[8]) - (_row_bytes(old[8]) if old else 0)
+        self.bytes += delta
+        return delta
+
+
+class TieredSqliteSaver(BaseCheckpointSaver):
+    """
+    用法：
+        with TieredSqliteSaver.from_conn_string("checkpoints.sqlite", max_threads=10000) as checkpointer:
+            graph = builder.compile(checkpointer=checkpointer)
+
+    - 内存预算：max_threads(会话数)和max_bytes(序列化后的字节数)，任一超出就按LRU淘汰到low_watermark，
+      刚访问的会话不会被淘汰
+    - 默认写回：写入只进内存，会话被淘汰、flush()或close()时才写盘(进程崩溃会丢失未写盘的部分)；
+      write_through=True时每次写入同时提交到磁盘，淘汰时直接丢弃
+    - 淘汰中的会话被再次访问时直接放回内存，不会读到写盘前的旧数据；delete_thread等待进行中的写盘结束再删除
+    - list(None)或不带thread_id的查询先flush()再交给磁盘
+    - 指标：stats()中的命中/加载/淘汰/写盘次数，metrics中的加载、写盘耗时直方图
+    """
+
+    def __init__(self, disk: BatchedSqliteSaver, *, max_threads: int = 10000, max_bytes: int = 256 * 1024 * 1024,
+                 write_through: bool = False, name: str = "tiered", metrics: MetricsRegistry = None,
+                 low_watermark: float = 0.9, load_stripes: int = 64):
+        super().__init__(serde=disk.serde)
+        self.disk = disk
+        self.max_threads = max_threads
+        self.max_bytes = max_bytes
+        self.write_through = write_through
+        self.low_watermark = low_watermark
+        self.name = name
+        self.metrics = metrics or MetricsRegistry()
+        self.hot_bytes = 0
+        self._hot = OrderedDict()  # thread_id -> _Thread
+        self._spilling = {}  # 正在写盘的会话 thread_id -> [_Thread, 进行中的写盘次数]
+        self._lock = threading.Lock()
+        self._spilled = threading.Condition(self._lock)  # 某个会话的写盘全部结束时通知，delete_thread等待它
+        self._load_locks = [threading.Lock() for _ in range(load_stripes)]  # 同一会话只加载一次，不同会话并行加载
+        self._stats = {"hits": 0, "loads": 0, "created": 0, "evictions": 0, "spills": 0, "spilled_ops": 0}
+        if isinstance(self.serde, DeltaSerde):  # 父检查点可能只在内存里
+            self._disk_fetch = checkpoint_fetcher(disk.conn)
+            self.serde.bind(self._fetch)
+
+    @classmethod
+    @contextmanager
+    def from_conn_string(cls, conn_string: str, pragmas: dict = None, *, serde=None, **kwargs):
+        with BatchedSqliteSaver.from_conn_string(conn_string, pragmas, serde=serde) as disk:
+            saver = cls(disk, **kwargs)
+            try:
+                yield saver
+            finally:
+                saver.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["loads"] + self._stats["created"]
+            return {**self._stats, "hot_threads": len(self._hot), "hot_bytes": self.hot_bytes,
+                    "spilling": len(self._spilling),
+                    "hit_rate": round(self._stats["hits"] / lookups, 4) if lookups else 0.0}
+
+    def get_next_version(self, current, channel):
+        return self.disk.get_next_version(current, channel)
+
+    # ======================= 内存层 =======================
+    def _attach(self, thread_id: str) -> Optional[_Thread]:
+        """
+        持有self._lock时调用：会话在内存(或正在写盘)时移到LRU末尾并返回
+        """
+        thread = self._hot.get(thread_id)
+        if thread is not None:
+            self._hot.move_to_end(thread_id)
+            return thread
+        spilling = self._spilling.get(thread_id)
+        if spilling is not None:
+            thread = spilling[0]
+            self._hot[thread_id] = thread
+            self.hot_bytes += thread.bytes
+            return thread
+        return None
+
+    def _hit(self, thread_id: str) -> Optional[_Thread]:
+        with self._lock:
+            thread = self._attach(thread_id)
+            if thread is not None:
+                self._stats["hits"] += 1
+            return thread
+
+    def _load(self, thread_id: str) -> _Thread:
+        """
+        从磁盘整体加载一个会话，磁盘上没有时创建空会话
+        """
+        with self._load_locks[hash(thread_id) % len(self._load_locks)]:
+            with self._lock:
+                thread = self._attach(thread_id)
+                if thread is not None:
+                    return thread
+            t0 = time.perf_counter()
+            thread = _Thread()
+            with self.disk.cursor(transaction=False) as cur:
+                checkpoints = cur.execute(_LOAD_CHECKPOINTS_SQL, (thread_id,)).fetchall()
+                writes = cur.execute(_LOAD_WRITES_SQL, (thread_id,)).fetchall()
+            for row in checkpoints:
+                thread.add_checkpoint(row)
+            thread.add_writes(writes, replace=True)
+            with self._lock:
+                self._hot[thread_id] = thread
+                self.hot_bytes += thread.bytes
+                self._stats["loads" if checkpoints else "created"] += 1
+        self.metrics.histogram("tiered_load_seconds", {"saver": self.name},
+                               help="冷会话从磁盘加载回内存的耗时").observe(time.perf_counter() - t0)
+        return thread
+
+    def _thread(self, thread_id: str) -> _Thread:
+        return self._hit(thread_id) or self._load(thread_id)
+
+    def _store(self, thread_id: str, thread: _Thread, op, checkpoint: bool) -> bool:
+        """
+        把一次写入加到会话上；会话在取到之后已经被淘汰并写完盘时返回False，由调用方重新取
+        """
+        sql, rows = op
+        with self._lock:
+            if self._attach(thread_id) is not thread:
+                return False
+            if checkpoint:
+                delta = thread.add_checkpoint(rows[0])
+            else:
+                delta = thread.add_writes(rows, replace=not sql.startswith("INSERT OR IGNORE"))
+            self.hot_bytes += delta
+            if not self.write_through:
+                thread.dirty.append(op)
+            return True
+
+    def _over_budget(self, ratio: float = 1.0) -> bool:
+        return len(self._hot) > 1 and (len(self._hot) > self.max_threads * ratio or
+                                       self.hot_bytes > self.max_bytes * ratio)
+
+    def _evict(self):
+        """
+        超出预算后一直淘汰到预算的low_watermark以下，脏数据合并成一个事务写盘(在锁外进行)，
+        不会每来一个新会话就单独写一次盘
+        """
+        victims = []
+        with self._lock:
+            while self._over_budget(self.low_watermark):
+                thread_id, thread = self._hot.popitem(last=False)
+                self.hot_bytes -= thread.bytes
+                self._stats["evictions"] += 1
+                if thread.dirty:
+                    spilling = self._spilling.setdefault(thread_id, [thread, 0])
+                    spilling[1] += 1
+                    victims.append((thread_id, thread, thread.dirty))
+                    thread.dirty = []
+        if victims:
+            self._spill(victims)
+
+    def _spill(self, victims):
+        t0 = time.perf_counter()
+        ops = [op for _, _, dirty in victims for op in dirty]
+        try:
+            self.disk.write_ops(ops)
+        except Exception:
+            with self._lock:  # 写盘失败：放回内存，数据不丢
+                for thread_id, thread, dirty in victims:
+                    thread.dirty = dirty + thread.dirty
+                    self._attach(thread_id)
+            raise
+        finally:
+            with self._lock:
+                for thread_id, thread, _ in victims:
+                    spilling = self._spilling.get(thread_id)
+                    if spilling is not None and spilling[0] is thread:
+                        spilling[1] -= 1
+                        if spilling[1] == 0:
+                            del self._spilling[thread_id]
+                            self._spilled.notify_all()
+        with self._lock:
+            self._stats["spills"] += 1
+            self._stats["spilled_ops"] += len(ops)
+        self.metrics.histogram("tiered_spill_seconds", {"saver": self.name},
+                               help="淘汰的会话写盘的耗时").observe(time.perf_counter() - t0)
+
+    def flush(self):
+        """
+        把内存中所有会话的脏数据写盘，会话仍留在内存
+        """
+        victims = []
+        with self._lock:
+            for thread_id, thread in self._hot.items():
+                if thread.dirty:
+                    spilling = self._spilling.setdefault(thread_id, [thread, 0])
+                    spilling[1] += 1
+                    victims.append((thread_id, thread, thread.dirty))
+                    thread.dirty = []
+        if victims:
+            self._spill(victims)
+
+    def close(self):
+        self.flush()
+
+    def hot_checkpoints(self, thread_id: str, checkpoint_ns: str) -> Optional[list]:
+        """
+        内存中该会话的检查点行(已序列化，不改变LRU顺序，也不从磁盘加载)，供StateHistory只读id/父id/metadata
+        :return: 会话不在内存中时返回None，此时磁盘上的数据是完整的
+        """
+        with self._lock:
+            thread = self._hot.get(thread_id)
+            if thread is None:
+                spilling = self._spilling.get(thread_id)
+                thread = spilling[0] if spilling else None
+            if thread is None:
+                return None
+            return list(thread.checkpoints.get(checkpoint_ns, {}).values())
+
+    def _fetch(self, thread_id, checkpoint_ns, checkpoint_id):
+        """
+        DeltaSerde读取父检查点：先查内存，再查磁盘
+        """
+        with self._lock:
+            thread = self._hot.get(thread_id)
+            if thread is None:
+                spilling = self._spilling.get(thread_id)
+                thread = spilling[0] if spilling else None
+            row = thread.checkpoints.get(checkpoint_ns, {}).get(checkpoint_id) if thread is not None else None
+        if row is not None:
+            return row[4], row[5]
+        return self._disk_fetch(thread_id, checkpoint_ns, checkpoint_id)
+
+    # ======================= 读取 =======================
+    def _select(self, thread: _Thread, config) -> Optional[tuple]:
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+        with self._lock:
+            rows = thread.checkpoints.get(checkpoint_ns)
+            if not rows:
+                return None
+            row = rows.get(checkpoint_id or thread.latest[checkpoint_ns])
+            if row is None:
+                return None
+            return row, list(thread.writes.get((checkpoint_ns, row[2]), {}).values())
+
+    def _tuple(self, row, writes, config=None) -> CheckpointTuple:
+        thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type_, checkpoint, metadata = row
+        if config is None:
+            config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                                       "checkpoint_id": checkpoint_id}}
+        return CheckpointTuple(
+            config,
+            self.serde.loads_typed((type_, checkpoint)),
+            json.loads(metadata) if metadata is not None else {},
+            {"configurable": {"thread_id": thread_id, "checkpoint_ns": checkpoint_ns,
+                              "checkpoint_id": parent_checkpoint_id}} if parent_checkpoint_id else None,
+            load_pending_writes([(w[3], w[6], w[7], w[8], w[4], w[5]) for w in writes], self.serde),
+        )
+
+    def get_tuple(self, config) -> Optional[CheckpointTuple]:
+        thread = self._thread(str(config["configurable"]["thread_id"]))
+        if self._over_budget():
+            self._evict()
+        selected = self._select(thread, config)
+        if selected is None:
+            return None
+        return self._tuple(*selected, config if get_checkpoint_id(config) else None)
+
+    def list(self, config, *, filter=None, before=None, limit=None) -> Iterator[CheckpointTuple]:
+        configurable = (config or {}).get("configurable", {})
+        if "thread_id" not in configurable:
+            self.flush()
+            yield from self.disk.list(config, filter=filter, before=before, limit=limit)
+            return
+        thread = self._thread(str(configurable["thread_id"]))
+        before_id = get_checkpoint_id(before) if before else None
+        with self._lock:
+            candidates = []
+            for checkpoint_ns, rows in thread.checkpoints.items():
+                if "checkpoint_ns" in configurable and checkpoint_ns != configurable["checkpoint_ns"]:
+                    continue
+                for checkpoint_id, row in rows.items():
+                    if configurable.get("checkpoint_id") and checkpoint_id != configurable["checkpoint_id"]:
+                        continue
+                    if before_id is not None and checkpoint_id >= before_id:
+                        continue
+                    candidates.append((row, list(thread.writes.get((checkpoint_ns, checkpoint_id), {}).values())))
+        candidates.sort(key=lambda item: item[0][2], reverse=True)
+        count = 0
+        for row, writes in candidates:
+            if limit is not None and count >= limit:
+                return
+            if filter:
+                metadata = json.loads(row[6]) if row[6] is not None else {}
+                if not all(metadata.get(k) == v for k, v in filter.items()):
+                    continue
+            count += 1
+            yield self._tuple(row, writes)
+
+    # ======================= 写入 =======================
+    def put(self, config, checkpoint, metadata, new_versions):
+        op = checkpoint_op(self, config, checkpoint, metadata)
+        self._write(str(config["configurable"]["thread_id"]), op, checkpoint=True)
+        return {"configurable": {"thread_id": config["configurable"]["thread_id"],
+                                 "checkpoint_ns": config["configurable"]["checkpoint_ns"],
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        op = writes_op(self, config, writes, task_id, task_path)
+        self._write(str(config["configurable"]["thread_id"]), op, checkpoint=False)
+
+    def _write(self, thread_id: str, op, checkpoint: bool):
+        while not self._store(thread_id, self._thread(thread_id), op, checkpoint):
+            pass
+        if self.write_through:
+            self.disk.write_ops([op])
+        if self._over_budget():
+            self._evict()
+
+    def delete_thread(self, thread_id: str):
+        """
+        先等该会话正在进行的写盘结束(否则写盘会在删除之后把行写回磁盘)，再从内存和磁盘删除
+        写盘失败时会话会放回内存，所以等待之后才从内存移除
+        """
+        thread_id = str(thread_id)
+        with self._lock:
+            self._spilled.wait_for(lambda: thread_id not in self._spilling)
+            thread = self._hot.pop(thread_id, None)
+            if thread is not None:
+                self.hot_bytes -= thread.bytes
+        self.disk.delete_thread(thread_id)
+
+    # ======================= 异步 =======================
+    # 内存命中时直接在事件循环里处理，需要读写磁盘时放到线程池
+    async def _athread(self, thread_id: str) -> _Thread:
+        return self._hit(thread_id) or await asyncio.to_thread(self._load, thread_id)
+
+    async def aget_tuple(self, config) -> Optional[CheckpointTuple]:
+        thread = await self._athread(str(config["configurable"]["thread_id"]))
+        if self._over_budget():
+            await asyncio.to_thread(self._evict)
+        selected = self._select(thread, config)
+        if selected is None:
+            return None
+        return self._tuple(*selected, config if get_checkpoint_id(config) else None)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        for item in await asyncio.to_thread(lambda: list(self.list(config, filter=filter, before=before,
+                                                                   limit=limit))):
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        op = checkpoint_op(self, config, checkpoint, metadata)
+        await self._awrite(str(config["configurable"]["thread_id"]), op, checkpoint=True)
+        return {"configurable": {"thread_id": config["configurable"]["thread_id"],
+                                 "checkpoint_ns": config["configurable"]["checkpoint_ns"],
+                                 "checkpoint_id": checkpoint["id"]}}
+
+    async def aput_writes(self, config, writes, task_id, task_path=""):
+        op = writes_op(self, config, writes, task_id, task_path)
+        await self._awrite(str(config["configurable"]["thread_id"]), op, checkpoint=False)
+
+    async def _awrite(self, thread_id: str, op, checkpoint: bool):
+        while not self._store(thread_id, await self._athread(thread_id), op, checkpoint):
+            pass
+        if self.write_through:
+            await asyncio.to_thread(self.disk.write_ops, [op])
+        if self._over_budget():
+            await asyncio.to_thread(self._evict)
+
+    async def adelete_thread(self, thread_id: str):
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+
+if __name__ == '__main__':
+    print("tiered_saver...")
+    import os
+    import tempfile
+
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langgraph.graph import StateGraph, START, END, MessagesState
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("reply", lambda state: {"messages": [AIMessage(f"收到：{state['messages'][-1].content}")]})
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    path = os.path.join(tempfile.mkdtemp(), "tiered.sqlite")
+    with TieredSqliteSaver.from_conn_string(path, max_threads=3) as checkpointer:
+        graph = builder.compile(checkpointer=checkpointer)
+        for round_ in range(2):
+            for user in range(10):
+                graph.invoke({"messages": [HumanMessage(f"第{round_}轮")]}, {"configurable": {"thread_id": f"u{user}"}})
+        counts = [len(graph.get_state({"configurable": {"thread_id": f"u{user}"}}).values["messages"])
+                  for user in range(10)]
+        print(counts, checkpointer.stats())
@@ -0,0 +1,155 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : registry.py
+@time    : 2026/10/18 18:30
+@desc    : 编译图注册表：按(图名, 构建参数)缓存编译好的图，同一配置只编译一次，
+           编译好的图不可变，可以在多个线程和协程之间共享
+-----------------------------------------------------------------------
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+
+def freeze(value) -> Any:
+    """
+    把构建参数转换成可以做字典键的形式：
+    dict/list/tuple/set递归转换，可哈希的对象按自身比较(检查点、模型等按对象身份)，
+    不可哈希的对象按id，注册表会一直持有参数的引用，id不会被复用
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return ("id", type(value).__name__, id(value))
+
+
+class GraphRegistry:
+    """
+    用法：
+        registry.register("chatbot_demo3", build_graph)          # build_graph(**options) -> 编译好的图
+        graph = registry.get("chatbot_demo3", checkpointer=saver)  # 第一次编译，之后直接返回同一个对象
+        registry.warmup([("chatbot_demo3", {"checkpointer": saver})])
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[..., Any]] = {}
+        self._graphs: Dict[Tuple, Tuple[dict, Any]] = {}  # key -> (options, graph)，持有options保证id不被复用
+        self._building: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.compiles = 0
+        self.compile_seconds = 0.0
+
+    def register(self, name: str, factory: Callable[..., Any], replace: bool = False):
+        """
+        注册图的构建函数，replace=True时替换已有的构建函数并丢弃它编译过的图
+        """
+        with self._lock:
+            if name in self._factories and not replace:
+                if self._factories[name] is factory:
+                    return factory
+                raise ValueError(f"图 {name} 已经注册过")
+            self._factories[name] = factory
+            if replace:
+                self._drop(name)
+        return factory
+
+    def names(self) -> list:
+        return sorted(self._factories)
+
+    def get(self, name: str, **options):
+        """
+        返回编译好的图，同一配置并发调用时只有一个线程编译，其余等待结果
+        """
+        key = (name, freeze(options))
+        entry = self._graphs.get(key)
+        if entry is not None:
+            self.hits += 1
+            return entry[1]
+        with self._lock:
+            if name not in self._factories:
+                raise KeyError(f"未注册的图：{name}，可选：{', '.join(self.names())}")
+            factory = self._factories[name]
+            building = self._building.setdefault(key, threading.Lock())
+        with building:
+            entry = self._graphs.get(key)
+            if entry is None:
+                start = time.perf_counter()
+                graph = factory(**options)
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._graphs[key] = entry = (dict(options), graph)
+                    self._building.pop(key, None)
+                    self.compiles += 1
+                    self.compile_seconds += elapsed
+            else:
+                self.hits += 1
+        return entry[1]
+
+    def warmup(self, specs: Iterable) -> dict:
+        """
+        进程启动后、接收请求之前预先编译，specs的元素是图名或(图名, 构建参数)
+        :return: 每个图的编译耗时(毫秒)，已经编译过的为0
+        """
+        timings = {}
+        for spec in specs:
+            name, options = (spec, {}) if isinstance(spec, str) else spec
+            start = time.perf_counter()
+            self.get(name, **options)
+            timings[name] = round((time.perf_counter() - start) * 1000, 3)
+        return timings
+
+    def clear(self, name: str = None):
+        with self._lock:
+            if name is None:
+                self._graphs.clear()
+            else:
+                self._drop(name)
+
+    def _drop(self, name: str):
+        for key in [k for k in self._graphs if k[0] == name]:
+            del self._graphs[key]
+
+    def stats(self) -> dict:
+        return {
+            "graphs": len(self._graphs),
+            "hits": self.hits,
+            "compiles": self.compiles,
+            "compile_ms": round(self.compile_seconds * 1000, 3),
+        }
+
+
+# 进程内共享的默认注册表，各demo在导入时注册自己的构建函数
+registry = GraphRegistry()
+
+
+if __name__ == '__main__':
+    print("registry...")
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.graph import StateGraph, START, END, MessagesState
+
+    def build(checkpointer=None, reply: str = "你好"):
+        builder = StateGraph(MessagesState)
+        builder.add_node("chatbot", lambda state: {"messages": [("ai", reply)]})
+        builder.add_edge(START, "chatbot")
+        builder.add_edge("chatbot", END)
+        return builder.compile(checkpointer=checkpointer)
+
+    demo = GraphRegistry()
+    demo.register("echo", build)
+    saver = MemorySaver()
+    print(demo.warmup([("echo", {"checkpointer": saver})]))
+    assert demo.get("echo", checkpointer=saver) is demo.get("echo", checkpointer=saver)
+    assert demo.get("echo", checkpointer=saver, reply="hi") is not demo.get("echo", checkpointer=saver)
+    print(demo.stats())
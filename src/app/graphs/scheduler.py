@@ -0,0 +1,325 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : scheduler.py
+@time    : 2026/10/18 21:10
+@desc    : 按thread_id调度图的执行：同一会话的请求排队串行执行(先到先执行)，不同会话完全并行，
+           避免两个并发请求读到同一个父检查点、各自写入后把会话历史分叉
+           可选：合并排队中的请求(coalesce，多条用户消息合成一轮执行)、限制每个会话的排队长度
+-----------------------------------------------------------------------
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, nullcontext
+from typing import Callable, Dict, List, Optional
+
+from src.app.graphs.registry import freeze
+from src.app.profiling.metrics import MetricsRegistry
+
+
+class ThreadQueueFullError(RuntimeError):
+    pass
+
+
+def merge_messages(inputs: List[dict]) -> Optional[dict]:
+    """
+    合并只包含messages的输入，其他形式(带别的状态字段、Command等)返回None表示不能合并
+    """
+    merged = []
+    for item in inputs:
+        if not isinstance(item, dict) or set(item) != {"messages"}:
+            return None
+        messages = item["messages"]
+        merged.extend(messages if isinstance(messages, list) else [messages])
+    return {"messages": merged}
+
+
+class _Request:
+    __slots__ = ("graph", "inputs", "config", "enqueued", "wake", "granted", "finished", "result", "error")
+
+    def __init__(self, graph, inputs, config, wake: Callable[[], None]):
+        self.graph = graph
+        self.inputs = inputs
+        self.config = config
+        self.enqueued = time.perf_counter()
+        self.wake = wake  # 轮到执行或已经被合并执行完时调用，线程和协程都可以安全调用
+        self.granted = False  # 执行权已经交给了这个请求
+        self.finished = False
+        self.result = None
+        self.error = None
+
+
+class _ThreadQueue:
+    __slots__ = ("waiting", "running")
+
+    def __init__(self):
+        self.waiting = deque()  # 排队中、还没开始执行的请求
+        self.running = False
+
+
+class ThreadScheduler:
+    """
+    用法：
+        scheduler = ThreadScheduler(name="chatbot2_demo1", coalesce=True, max_queue=8)
+        result = scheduler.invoke(graph, inputs, config)           # 多线程
+        result = await scheduler.ainvoke(graph, inputs, config)    # 协程
+        async with scheduler.turn(thread_id):                      # 流式输出等自己驱动图的场景，只排队不合并
+            async for ... in graph.astream(...): ...
+
+    - 同一个scheduler可以同时被线程和协程使用，排队顺序统一
+    - coalesce=True：执行期间同一会话排队的请求，如果图和config相同、输入都只有messages，
+      下一轮合并成一次执行(最多max_batch个)，每个请求都拿到这次执行的结果；
+      异步路径中发起这次执行的请求被取消时，执行继续完成，其余请求照常拿到结果
+    - max_queue：每个会话最多排队的请求数(不含正在执行的)，超过抛ThreadQueueFullError，HTTP层可返回429
+    - locks：传入ThreadLocks时，异步路径执行期间还会持有跨进程的文件锁(多worker部署)
+    - 指标：scheduler_queue_wait_seconds{scheduler} 从提交到开始执行的时间(包括等待文件锁)，
+            scheduler_batch_size{scheduler} 每次执行合并的请求数
+    """
+
+    def __init__(self, name: str = "default", coalesce: bool = False, max_batch: int = 8,
+                 max_queue: Optional[int] = None, merge: Callable[[List[dict]], Optional[dict]] = merge_messages,
+                 locks=None, metrics: MetricsRegistry = None):
+        self.name = name
+        self.coalesce = coalesce
+        self.max_batch = max_batch
+        self.max_queue = max_queue
+        self.merge = merge
+        self.locks = locks
+        self.metrics = metrics or MetricsRegistry()
+        self._queues: Dict[str, _ThreadQueue] = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "runs": 0, "coalesced": 0, "rejected": 0}
+
+    # ======================= 排队 =======================
+    @staticmethod
+    def thread_key(config: dict) -> str:
+        configurable = (config or {}).get("configurable") or {}
+        if "thread_id" not in configurable:
+            raise ValueError("config['configurable']中缺少thread_id")
+        return str(configurable["thread_id"])
+
+    def _enqueue(self, key: str, request: _Request) -> bool:
+        """
+        :return: 是否可以立即执行(队列空闲)
+        """
+        with self._lock:
+            queue = self._queues.setdefault(key, _ThreadQueue())
+            if self.max_queue is not None and queue.running and len(queue.waiting) >= self.max_queue:
+                self._stats["rejected"] += 1
+                raise ThreadQueueFullError(f"会话 {key} 排队的请求已达上限 {self.max_queue}")
+            self._stats["requests"] += 1
+            if not queue.running:
+                queue.running = True
+                return True
+            queue.waiting.append(request)
+            return False
+
+    def _batch(self, key: str, head: _Request) -> List[_Request]:
+        """
+        轮到head执行时，把后面可以合并的请求一起取出
+        """
+        batch = [head]
+        with self._lock:
+            queue = self._queues[key]
+            if self.coalesce and head.graph is not None:
+                config = freeze(head.config)
+                while (queue.waiting and len(batch) < self.max_batch and queue.waiting[0].graph is head.graph
+                       and freeze(queue.waiting[0].config) == config):
+                    batch.append(queue.waiting.popleft())
+            self._stats["runs"] += 1
+            self._stats["coalesced"] += len(batch) - 1
+        return batch
+
+    def _release(self, key: str):
+        """
+        执行结束：把执行权交给下一个排队的请求，队列空了就删除
+        """
+        with self._lock:
+            queue = self._queues[key]
+            if queue.waiting:
+                request = queue.waiting.popleft()
+                request.granted = True
+                request.wake()
+            else:
+                del self._queues[key]
+
+    def _inputs(self, key: str, batch: List[_Request]):
+        if len(batch) == 1:
+            return batch[0].inputs, batch
+        merged = self.merge([request.inputs for request in batch])
+        if merged is None:  # 不能合并：只执行第一个，其余放回队首
+            with self._lock:
+                self._queues[key].waiting.extendleft(reversed(batch[1:]))
+                self._stats["coalesced"] -= len(batch) - 1
+            return batch[0].inputs, batch[:1]
+        return merged, batch
+
+    def _started(self, batch: List[_Request]):
+        now = time.perf_counter()
+        wait = self.metrics.histogram("scheduler_queue_wait_seconds", {"scheduler": self.name},
+                                      help="请求从提交到开始执行的排队时间")
+        for request in batch:
+            wait.observe(now - request.enqueued)
+        self.metrics.histogram("scheduler_batch_size", {"scheduler": self.name}, buckets=(1, 2, 4, 8, 16, 32),
+                               help="每次执行合并的请求数").observe(len(batch))
+
+    @staticmethod
+    def _finish(batch: List[_Request], head: _Request, result, error):
+        for request in batch:
+            request.result, request.error, request.finished = result, error, True
+            if request is not head:
+                request.wake()
+
+    # ======================= 同步 =======================
+    def invoke(self, graph, inputs, config: dict = None, **kwargs):
+        key = self.thread_key(config)
+        event = threading.Event()
+        request = _Request(graph, inputs, config, event.set)
+        if not self._enqueue(key, request):
+            event.wait()
+            if request.finished:  # 已经被合并到前一次执行里
+                return self._outcome(request)
+        try:
+            inputs, batch = self._inputs(key, self._batch(key, request))
+            self._started(batch)
+            try:
+                result, error = graph.invoke(inputs, config, **kwargs), None
+            except Exception as e:
+                result, error = None, e
+            except BaseException:
+                self._finish(batch, request, None, RuntimeError("合并执行被中断"))
+                raise
+            self._finish(batch, request, result, error)
+        finally:
+            self._release(key)
+        return self._outcome(request)
+
+    # ======================= 异步 =======================
+    async def ainvoke(self, graph, inputs, config: dict = None, **kwargs):
+        key = self.thread_key(config)
+        async with self._turn(key, _Request(graph, inputs, config, None)) as (request, inputs, batch):
+            if request.finished:
+                return self._outcome(request)
+            task = asyncio.ensure_future(graph.ainvoke(inputs, config, **kwargs))
+            try:
+                result, error = await asyncio.shield(task), None
+            except asyncio.CancelledError:
+                if len(batch) == 1:
+                    task.cancel()
+                    raise
+                # 发起者被取消(例如客户端断开)：合并进来的其他请求还在等，继续持有执行权直到这次执行结束
+                await self._complete(task, batch, request)
+                raise
+            except Exception as e:
+                result, error = None, e
+            self._finish(batch, request, result, error)
+        return self._outcome(request)
+
+    async def _complete(self, task, batch: List[_Request], head: _Request):
+        try:
+            result, error = await asyncio.shield(task), None
+        except asyncio.CancelledError:  # 再次被取消(例如服务关闭)，合并进来的请求也结束等待
+            task.cancel()
+            self._finish(batch, head, None, RuntimeError("合并执行被取消"))
+            raise
+        except Exception as e:
+            result, error = None, e
+        self._finish(batch, head, result, error)
+
+    @asynccontextmanager
+    async def turn(self, thread_id: str):
+        """
+        等到这个会话轮到自己后进入，退出时把执行权交给下一个请求
+        :return: 排队等待的秒数
+        """
+        async with self._turn(str(thread_id), _Request(None, None, {"configurable": {"thread_id": thread_id}},
+                                                       None)) as (request, _, _):
+            yield time.perf_counter() - request.enqueued
+
+    @asynccontextmanager
+    async def _turn(self, key: str, request: _Request):
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        request.wake = lambda: loop.call_soon_threadsafe(event.set)
+        if not self._enqueue(key, request):
+            await self._wait(key, request, event)
+            if request.finished:
+                yield request, None, [request]
+                return
+        try:
+            inputs, batch = self._inputs(key, self._batch(key, request))
+            # ThreadLocks定义了__len__，空闲时为假，必须和None比较
+            async with self.locks.hold(f"{self.name}:{key}") if self.locks is not None else nullcontext():
+                self._started(batch)
+                yield request, inputs, batch
+        finally:
+            self._release(key)
+
+    async def _wait(self, key: str, request: _Request, event: asyncio.Event):
+        try:
+            await event.wait()
+        except asyncio.CancelledError:
+            # 取消时：还在排队就出队；执行权已经交过来了就继续交给下一个；已被合并的由执行者负责
+            with self._lock:
+                queue = self._queues.get(key)
+                if queue is not None and request in queue.waiting:
+                    queue.waiting.remove(request)
+            if request.granted:
+                self._release(key)
+            raise
+
+    # ======================= 公共 =======================
+    @staticmethod
+    def _outcome(request: _Request):
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def depth(self, thread_id: str) -> int:
+        """
+        会话当前的排队数(不含正在执行的)
+        """
+        with self._lock:
+            queue = self._queues.get(str(thread_id))
+            return len(queue.waiting) if queue else 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "active_threads": len(self._queues),
+                    "queued": sum(len(q.waiting) for q in self._queues.values())}
+
+
+if __name__ == '__main__':
+    print("scheduler...")
+    from concurrent.futures import ThreadPoolExecutor
+
+    from langchain_core.messages import AIMessage
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.graph import StateGraph, START, END, MessagesState
+
+    def slow_echo(state: MessagesState):
+        time.sleep(0.05)
+        return {"messages": [AIMessage(f"收到{len(state['messages'])}条消息")]}
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("echo", slow_echo)
+    builder.add_edge(START, "echo")
+    builder.add_edge("echo", END)
+    graph = builder.compile(checkpointer=MemorySaver())
+
+    for coalesce in (False, True):
+        scheduler = ThreadScheduler(coalesce=coalesce)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda i: scheduler.invoke(graph, {"messages": [("user", f"消息{i}")]},
+                                                     {"configurable": {"thread_id": f"coalesce={coalesce}"}}),
+                          range(8)))
+        state = graph.get_state({"configurable": {"thread_id": f"coalesce={coalesce}"}})
+        history = len(list(graph.get_state_history({"configurable": {"thread_id": f"coalesce={coalesce}"}})))
+        print(f"coalesce={coalesce} 耗时 {time.perf_counter() - start:.2f}s，消息数 {len(state.values['messages'])}，"
+              f"检查点数 {history}，{scheduler.stats()}")
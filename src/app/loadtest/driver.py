@@ -0,0 +1,206 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : driver.py
+@time    : 2026/10/18 15:00
+@desc    : 压测驱动：N个会话 x T轮，按并发C运行目标图，输出吞吐、延迟分位数和各节点耗时(JSON)
+           运行：python -m src.app.loadtest.driver --target chatbot_demo3 --concurrency 32 --conversations 200
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, ExitStack, redirect_stdout
+from typing import Any, Dict, List
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langgraph.checkpoint.memory import MemorySaver
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.checkpoint.sqlite_saver import BatchedAsyncSqliteSaver, BatchedSqliteSaver
+from src.app.loadtest.targets import TARGETS, build_target
+from src.app.store.sqlite_store import IndexedSqliteStore
+
+
+class NodeTimer(BaseCallbackHandler):
+    """
+    通过回调统计每个图节点的耗时：节点对应的chain运行满足 name == metadata["langgraph_node"]
+    """
+
+    run_inline = True  # 异步模式下直接在事件循环中回调，不进线程池
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._starts: Dict[Any, tuple] = {}
+        self.durations: Dict[str, List[float]] = {}
+        self.errors = 0
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        node = (metadata or {}).get("langgraph_node")
+        if not node or kwargs.get("name") != node:
+            return
+        parent = self._starts.get(parent_run_id)
+        if parent and parent[0] == node:
+            return  # RunnableLambda等包装在节点内部的同名运行，只统计最外层
+        self._starts[run_id] = (node, time.perf_counter())
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        started = self._starts.pop(run_id, None)
+        if started:
+            node, t0 = started
+            with self._lock:
+                self.durations.setdefault(node, []).append(time.perf_counter() - t0)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        if self._starts.pop(run_id, None):
+            with self._lock:
+                self.errors += 1
+
+    def report(self) -> dict:
+        report = {}
+        for node, values in sorted(self.durations.items()):
+            report[node] = {**summarize(values), "total_ms": round(sum(values) * 1000, 3)}
+        return report
+
+
+def _checkpointer_path(directory: str) -> str:
+    return os.path.join(directory, "loadtest.sqlite")
+
+
+def _store_path(directory: str) -> str:
+    return os.path.join(directory, "loadtest_store.sqlite")
+
+
+def run_threads(target, concurrency: int, conversations: int, turns: int, timer: NodeTimer) -> dict:
+    latencies, errors = [], []
+
+    def conversation(i):
+        config = {**target.make_config(i), "callbacks": [timer]}
+        for turn in range(turns):
+            t0 = time.perf_counter()
+            try:
+                target.graph.invoke(target.make_input(i, turn), config)
+                latencies.append(time.perf_counter() - t0)
+            except Exception as e:
+                errors.append(repr(e))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(conversation, range(conversations)))
+    return {"elapsed": time.perf_counter() - start, "latencies": latencies, "errors": errors}
+
+
+async def run_async(target, concurrency: int, conversations: int, turns: int, timer: NodeTimer) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], []
+
+    async def conversation(i):
+        async with semaphore:
+            config = {**target.make_config(i), "callbacks": [timer]}
+            for turn in range(turns):
+                t0 = time.perf_counter()
+                try:
+                    await target.graph.ainvoke(target.make_input(i, turn), config)
+                    latencies.append(time.perf_counter() - t0)
+                except Exception as e:
+                    errors.append(repr(e))
+
+    start = time.perf_counter()
+    await asyncio.gather(*[conversation(i) for i in range(conversations)])
+    return {"elapsed": time.perf_counter() - start, "latencies": latencies, "errors": errors}
+
+
+async def _run_async_with_checkpointer(args, timer: NodeTimer, directory: str, store) -> dict:
+    async with AsyncExitStack() as stack:
+        if args.checkpointer == "sqlite":
+            checkpointer = await stack.enter_async_context(
+                BatchedAsyncSqliteSaver.from_conn_string(_checkpointer_path(directory)))
+        else:
+            checkpointer = MemorySaver()
+        target = build_target(args.target, checkpointer, latency=args.latency, tool_latency=args.tool_latency,
+                              token_latency=args.token_latency, seed=args.seed, store=store, users=args.users)
+        try:
+            return await run_async(target, args.concurrency, args.conversations, args.turns, timer)
+        finally:
+            target.close()
+
+
+def run(args) -> dict:
+    timer = NodeTimer()
+    with tempfile.TemporaryDirectory() as directory, ExitStack() as stack:
+        if args.quiet:
+            stack.enter_context(redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        # 长期记忆和检查点一样放在临时目录，各次压测互不影响
+        store = stack.enter_context(
+            IndexedSqliteStore.from_conn_string(_store_path(directory), indexed_fields=("session_id",)))
+        if args.mode == "async":
+            result = asyncio.run(_run_async_with_checkpointer(args, timer, directory, store))
+        else:
+            if args.checkpointer == "sqlite":
+                checkpointer = stack.enter_context(BatchedSqliteSaver.from_conn_string(_checkpointer_path(directory)))
+            else:
+                checkpointer = MemorySaver()
+            target = build_target(args.target, checkpointer, latency=args.latency, tool_latency=args.tool_latency,
+                                  token_latency=args.token_latency, seed=args.seed, store=store, users=args.users)
+            try:
+                result = run_threads(target, args.concurrency, args.conversations, args.turns, timer)
+            finally:
+                target.close()
+
+    requests = len(result["latencies"])
+    return {
+        "target": args.target,
+        "mode": args.mode,
+        "checkpointer": args.checkpointer,
+        "concurrency": args.concurrency,
+        "conversations": args.conversations,
+        "turns": args.turns,
+        "latency": args.latency,
+        "tool_latency": args.tool_latency,
+        "seed": args.seed,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "requests": requests,
+        "errors": len(result["errors"]),
+        "error_samples": result["errors"][:5],
+        "elapsed_s": round(result["elapsed"], 3),
+        "throughput_rps": round(requests / result["elapsed"], 2) if result["elapsed"] else 0.0,
+        "latency_ms": summarize(result["latencies"]),
+        "nodes_ms": timer.report(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="src/app图的压测驱动(假大模型，不需要API Key)")
+    parser.add_argument("--target", default="chatbot_demo3", choices=sorted(TARGETS))
+    parser.add_argument("--mode", default="async", choices=["async", "thread"])
+    parser.add_argument("--checkpointer", default="memory", choices=["memory", "sqlite"])
+    parser.add_argument("--concurrency", type=int, default=32, help="同时进行的会话数")
+    parser.add_argument("--conversations", type=int, default=100, help="会话(thread)总数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的轮数")
+    parser.add_argument("--users", type=int, default=100, help="chatbot2目标的用户数")
+    parser.add_argument("--latency", default="lognormal:0.05:0.3", help="大模型首token延迟分布，如fixed:0.05")
+    parser.add_argument("--token-latency", default="fixed:0.0", help="流式输出的token间隔分布")
+    parser.add_argument("--tool-latency", default="fixed:0.02", help="工具替身的延迟分布")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果JSON写入的文件，默认输出到stdout")
+    parser.add_argument("--verbose", dest="quiet", action="store_false", help="保留节点内的print输出")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = json.dumps(run(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        sys.stdout.write(report + "\n")
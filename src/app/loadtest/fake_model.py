@@ -0,0 +1,187 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : fake_model.py
+@time    : 2026/10/18 15:00
+@desc    : 可复现的脚本化假大模型：延迟分布、逐token流式输出、脚本化工具调用
+-----------------------------------------------------------------------
+"""
+import asyncio
+import hashlib
+import json
+import random
+import time
+from typing import Any, List, Optional
+
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class Latency:
+    """
+    延迟分布，单位秒，支持的写法：
+        fixed:0.05
+        uniform:0.02:0.08
+        normal:0.05:0.01      均值、标准差(小于0截断为0)
+        lognormal:0.05:0.5    中位数、sigma(长尾)
+    """
+
+    def __init__(self, kind: str = "fixed", a: float = 0.0, b: float = 0.0):
+        if kind not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"不支持的延迟分布：{kind}")
+        self.kind = kind
+        self.a = a
+        self.b = b
+
+    @classmethod
+    def parse(cls, spec) -> "Latency":
+        if isinstance(spec, Latency):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec))
+        kind, *args = str(spec).split(":")
+        args = [float(x) for x in args] + [0.0, 0.0]
+        return cls(kind, args[0], args[1])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            return self.a
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "normal":
+            return max(0.0, rng.gauss(self.a, self.b))
+        return self.a * rng.lognormvariate(0.0, self.b)
+
+    def __repr__(self):
+        return f"{self.kind}:{self.a}:{self.b}"
+
+
+class ScriptedChatModel(BaseChatModel):
+    """
+    按脚本回复的假大模型
+
+    script是一轮用户提问内的回复步骤，当前步骤 = 最后一条用户消息之后已有的AI消息数，
+    超出脚本长度时重复最后一步。每一步可以是字符串，或者：
+        {"content": "...", "tool_calls": [{"name": "get_weather", "args": {"location": "Beijing"}}]}
+    所有随机性都由seed和输入消息决定，同样的输入在任意并发下得到同样的输出和延迟
+    """
+
+    script: List[Any] = ["这是一个模拟回复"]
+    latency: Any = "fixed:0.05"  # 首token延迟
+    token_latency: Any = "fixed:0.0"  # token间隔
+    chunk_chars: int = 2  # 流式输出时每个chunk的字符数
+    seed: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-chat-model"
+
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+    def _rng(self, messages: List[BaseMessage]) -> random.Random:
+        last = messages[-1].content if messages else ""
+        key = f"{self.seed}|{len(messages)}|{last}".encode("utf-8")
+        return random.Random(int.from_bytes(hashlib.sha1(key).digest()[:8], "big"))
+
+    def _step(self, messages: List[BaseMessage]):
+        index = 0
+        for message in reversed(messages):
+            if isinstance(message, HumanMessage):
+                break
+            if isinstance(message, AIMessage):
+                index += 1
+        step = self.script[min(index, len(self.script) - 1)]
+        if isinstance(step, str):
+            step = {"content": step}
+        return index, step
+
+    def _plan(self, messages: List[BaseMessage]):
+        """
+        计算本次回复：(内容, 工具调用, 首token延迟, 每个chunk的间隔列表, 用量)
+        """
+        rng = self._rng(messages)
+        index, step = self._step(messages)
+        content = step.get("content", "")
+        tool_calls = [
+            {"name": call["name"], "args": call.get("args", {}), "id": f"call_{index}_{i}_{rng.getrandbits(32):08x}"}
+            for i, call in enumerate(step.get("tool_calls", []))
+        ]
+        chunks = [content[i:i + self.chunk_chars] for i in range(0, len(content), self.chunk_chars)]
+        first = Latency.parse(self.latency).sample(rng)
+        token = Latency.parse(self.token_latency)
+        gaps = [token.sample(rng) for _ in chunks[1:]]
+        input_tokens = count_tokens_approximately(messages)
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": max(len(chunks), 1),
+            "total_tokens": input_tokens + max(len(chunks), 1),
+        }
+        return content, tool_calls, chunks, first, gaps, usage
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        content, tool_calls, _, first, gaps, usage = self._plan(messages)
+        time.sleep(first + sum(gaps))
+        message = AIMessage(content=content, tool_calls=tool_calls, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs) -> ChatResult:
+        content, tool_calls, _, first, gaps, usage = self._plan(messages)
+        await asyncio.sleep(first + sum(gaps))
+        message = AIMessage(content=content, tool_calls=tool_calls, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, chunks, tool_calls, usage):
+        for piece in chunks:
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        tool_call_chunks = [
+            {"name": c["name"], "args": json.dumps(c["args"], ensure_ascii=False), "id": c["id"], "index": i}
+            for i, c in enumerate(tool_calls)
+        ]
+        yield ChatGenerationChunk(message=AIMessageChunk(
+            content="", tool_call_chunks=tool_call_chunks, usage_metadata=usage, chunk_position="last"
+        ))
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs):
+        _, tool_calls, chunks, first, gaps, usage = self._plan(messages)
+        time.sleep(first)
+        for i, chunk in enumerate(self._chunks(chunks, tool_calls, usage)):
+            if 0 < i <= len(gaps):
+                time.sleep(gaps[i - 1])
+            if run_manager and chunk.message.content:
+                run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs):
+        _, tool_calls, chunks, first, gaps, usage = self._plan(messages)
+        await asyncio.sleep(first)
+        for i, chunk in enumerate(self._chunks(chunks, tool_calls, usage)):
+            if 0 < i <= len(gaps):
+                await asyncio.sleep(gaps[i - 1])
+            if run_manager and chunk.message.content:
+                await run_manager.on_llm_new_token(chunk.message.content, chunk=chunk)
+            yield chunk
+
+
+if __name__ == '__main__':
+    print("fake_model...")
+    model = ScriptedChatModel(
+        script=[{"content": "", "tool_calls": [{"name": "get_weather", "args": {"location": "Beijing"}}]},
+                "北京今天晴，20度"],
+        latency="lognormal:0.01:0.5", token_latency="fixed:0.001", seed=42,
+    )
+    first = model.invoke([HumanMessage("北京天气")])
+    print(first.tool_calls)
+    history = [HumanMessage("北京天气"), first, ToolMessage("晴", tool_call_id=first.tool_calls[0]["id"])]
+    for chunk in model.stream(history):
+        print(repr(chunk.content), end=" ")
+    print()
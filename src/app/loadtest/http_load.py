@@ -0,0 +1,159 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : http_load.py
+@time    : 2026/10/18 20:30
+@desc    : HTTP服务压测：N个会话 x T轮，按并发C请求 /graphs/{name}/invoke 或 /stream，输出RPS、延迟分位数、
+           首token延迟(stream)和服务端的排队等待指标
+           运行：python -m src.app.server.app --workers 4 --fake-latency fixed:0.05      (另一个终端)
+                 python -m src.app.loadtest.http_load --url http://127.0.0.1:8000 --concurrency 64
+           不启动服务(进程内ASGI，单进程，stream模式下响应体被缓冲，首token延迟不准)：
+                 python -m src.app.loadtest.http_load --inprocess --fake-latency fixed:0.05
+-----------------------------------------------------------------------
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import AsyncExitStack, redirect_stdout
+
+import httpx
+
+from src.app.benchmark.bench_utils import summarize
+from src.app.loadtest.targets import CITIES, CS_INPUTS, TOPICS
+
+MESSAGES = {"chatbot_demo3": TOPICS, "chatbot_demo4": CITIES, "chatbot2_demo2": CS_INPUTS}
+SERVER_METRICS = ("scheduler_queue_wait_seconds_sum", "scheduler_queue_wait_seconds_count",
+                  "scheduler_batch_size_sum", "scheduler_batch_size_count")
+
+
+def make_body(graph: str, conversation: int, turn: int, users: int) -> dict:
+    topics = MESSAGES.get(graph, TOPICS)
+    return {"thread_id": f"http_{conversation}", "user_id": f"user_{conversation % users}",
+            "message": f"第{turn}个问题：{topics[(conversation + turn) % len(topics)]}"}
+
+
+async def invoke(client: httpx.AsyncClient, graph: str, body: dict) -> dict:
+    response = await client.post(f"/graphs/{graph}/invoke", json=body)
+    response.raise_for_status()
+    return {}
+
+
+async def stream(client: httpx.AsyncClient, graph: str, body: dict) -> dict:
+    """
+    解析SSE：记录第一个token事件到达的时间，收到error事件视为失败
+    """
+    start, first_token, event = time.perf_counter(), None, None
+    async with client.stream("POST", f"/graphs/{graph}/stream", json=body) as response:
+        response.raise_for_status()
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+                if event == "token" and first_token is None:
+                    first_token = time.perf_counter() - start
+            elif line.startswith("data: ") and event == "error":
+                raise RuntimeError(json.loads(line[6:])["error"])
+    return {"first_token": first_token}
+
+
+async def run(client: httpx.AsyncClient, args) -> dict:
+    call = stream if args.endpoint == "stream" else invoke
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, first_tokens, errors = [], [], []
+
+    async def request(i, turn):
+        t0 = time.perf_counter()
+        try:
+            result = await call(client, args.graph, make_body(args.graph, i, turn, args.users))
+            latencies.append(time.perf_counter() - t0)
+            if result.get("first_token") is not None:
+                first_tokens.append(result["first_token"])
+        except Exception as e:
+            errors.append(repr(e))
+
+    async def conversation(i):
+        # 同一会话的各轮默认依次发送，burst时同时发送(服务端排队/合并)；不同会话之间按并发数并行
+        async with semaphore:
+            if args.burst:
+                await asyncio.gather(*[request(i, turn) for turn in range(args.turns)])
+            else:
+                for turn in range(args.turns):
+                    await request(i, turn)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[conversation(i) for i in range(args.conversations)])
+    elapsed = time.perf_counter() - start
+    metrics = (await client.get("/metrics")).text
+    return {
+        "graph": args.graph,
+        "endpoint": args.endpoint,
+        "concurrency": args.concurrency,
+        "conversations": args.conversations,
+        "turns": args.turns,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": summarize(latencies),
+        "first_token_ms": summarize(first_tokens),
+        "server_metrics": [line for line in metrics.splitlines() if line.startswith(SERVER_METRICS)],
+    }
+
+
+async def main(args) -> dict:
+    timeout = httpx.Timeout(args.timeout)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    if not args.inprocess:
+        async with httpx.AsyncClient(base_url=args.url, timeout=timeout, limits=limits) as client:
+            return await run(client, args)
+
+    from src.app.server.app import ChatApp, ChatService  # 进程内模式才需要加载图
+
+    async with AsyncExitStack() as stack:
+        directory = stack.enter_context(tempfile.TemporaryDirectory())
+        stack.enter_context(redirect_stdout(stack.enter_context(open(os.devnull, "w"))))
+        app = ChatApp(ChatService([args.graph], directory, args.fake_latency, args.fake_token_latency,
+                                  args.coalesce, args.max_queue))
+        await app.startup()
+        stack.push_async_callback(app.service.shutdown)
+        transport = httpx.ASGITransport(app=app)
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(transport=transport, base_url="http://inprocess", timeout=timeout, limits=limits))
+        return await run(client, args)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="聊天图HTTP服务的压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--graph", default="chatbot_demo3", choices=sorted(MESSAGES))
+    parser.add_argument("--endpoint", default="invoke", choices=["invoke", "stream"])
+    parser.add_argument("--concurrency", type=int, default=32, help="同时进行的会话数")
+    parser.add_argument("--conversations", type=int, default=100, help="会话(thread)总数")
+    parser.add_argument("--turns", type=int, default=3, help="每个会话的轮数")
+    parser.add_argument("--users", type=int, default=100, help="chatbot2_demo2的用户数")
+    parser.add_argument("--burst", action="store_true", help="同一会话的各轮同时发送")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单个请求的超时(秒)")
+    parser.add_argument("--inprocess", action="store_true", help="不启动服务，直接在进程内调用ASGI应用")
+    parser.add_argument("--fake-latency", default="fixed:0.05", help="进程内模式下假大模型的延迟分布")
+    parser.add_argument("--fake-token-latency", default="fixed:0.0", help="进程内模式下假模型的token间隔分布")
+    parser.add_argument("--coalesce", action="store_true", help="进程内模式下合并同一会话排队中的请求")
+    parser.add_argument("--max-queue", type=int, help="进程内模式下每个会话最多排队的请求数")
+    parser.add_argument("--output", help="结果JSON写入的文件，默认输出到stdout")
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    report = json.dumps(asyncio.run(main(args)), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(report)
+    else:
+        sys.stdout.write(report + "\n")
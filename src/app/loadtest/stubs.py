@@ -0,0 +1,100 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : stubs.py
+@time    : 2026/10/18 15:00
+@desc    : 天气、搜索工具的本地替身：与真实工具同名同参数，按延迟分布返回固定结果
+-----------------------------------------------------------------------
+"""
+import asyncio
+import hashlib
+import random
+import time
+
+from langchain_core.tools import StructuredTool
+from pydantic import BaseModel, Field
+
+from src.app.loadtest.fake_model import Latency
+from src.app.tools.CommonTools import WeatherInput
+
+
+class SearchInput(BaseModel):
+    query: str = Field(description="搜索关键词")
+
+
+def _rng(seed: int, *parts) -> random.Random:
+    key = "|".join([str(seed), *map(str, parts)]).encode("utf-8")
+    return random.Random(int.from_bytes(hashlib.sha1(key).digest()[:8], "big"))
+
+
+def weather_stub(latency="fixed:0.02", seed: int = 0) -> StructuredTool:
+    """
+    get_weather的替身，同一城市的结果和延迟固定
+    """
+    latency = Latency.parse(latency)
+
+    def result(location: str):
+        rng = _rng(seed, "weather", location)
+        text = f"城市：{location}\n天气：晴\n温度：{rng.randint(-5, 35)}°C\n湿度：{rng.randint(20, 90)}%"
+        return text, latency.sample(rng)
+
+    def get_weather(location: str) -> str:
+        text, delay = result(location)
+        time.sleep(delay)
+        return text
+
+    async def aget_weather(location: str) -> str:
+        text, delay = result(location)
+        await asyncio.sleep(delay)
+        return text
+
+    return StructuredTool.from_function(
+        func=get_weather,
+        coroutine=aget_weather,
+        name="get_weather",
+        description="查询指定城市的当前天气",
+        args_schema=WeatherInput,
+    )
+
+
+def search_stub(latency="fixed:0.05", seed: int = 0, results: int = 2) -> StructuredTool:
+    """
+    tavily_search的替身，返回结构与TavilySearch一致的字典
+    """
+    latency = Latency.parse(latency)
+
+    def result(query: str):
+        rng = _rng(seed, "search", query)
+        items = [
+            {"title": f"{query} - 结果{i + 1}", "url": f"https://example.com/{i + 1}",
+             "content": f"关于“{query}”的模拟搜索结果{i + 1}。", "score": round(rng.random(), 4)}
+            for i in range(results)
+        ]
+        return {"query": query, "results": items}, latency.sample(rng)
+
+    def tavily_search(query: str) -> dict:
+        data, delay = result(query)
+        time.sleep(delay)
+        return data
+
+    async def atavily_search(query: str) -> dict:
+        data, delay = result(query)
+        await asyncio.sleep(delay)
+        return data
+
+    return StructuredTool.from_function(
+        func=tavily_search,
+        coroutine=atavily_search,
+        name="tavily_search",
+        description="搜索引擎，返回与查询相关的网页摘要",
+        args_schema=SearchInput,
+    )
+
+
+if __name__ == '__main__':
+    print("stubs...")
+    print(weather_stub().invoke({"location": "Beijing"}))
+    print(asyncio.run(search_stub().ainvoke({"query": "LangGraph"})))
@@ -0,0 +1,146 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : targets.py
+@time    : 2026/10/18 15:00
+@desc    : 压测目标：把各demo的大模型和工具替换为假模型/本地替身后编译图，并生成每轮的输入和配置
+-----------------------------------------------------------------------
+"""
+import importlib
+import os
+from dataclasses import dataclass
+from typing import Any, Callable
+
+from langchain_core.messages import HumanMessage
+from langgraph.store.memory import InMemoryStore
+
+from src.app.loadtest.fake_model import ScriptedChatModel
+from src.app.loadtest.stubs import search_stub, weather_stub
+from src.app.store.log_writer import BatchedLogWriter
+
+os.environ.setdefault("TAVILY_API_KEY", "loadtest")  # 构造TavilySearch需要，压测中会被替身替换
+
+CITIES = ["Beijing", "Shanghai", "Guangzhou", "Shenzhen", "Hangzhou", "Chengdu"]
+TOPICS = ["LangGraph", "检查点", "提示词缓存", "向量检索", "异步执行"]
+CS_INPUTS = ["我想查订单 ORD-001", "我要申请订单 ORD-002 的退款", "退货政策是什么", "我喜欢苹果产品，帮我看看快递"]
+
+
+@dataclass
+class Target:
+    """
+    graph: 已编译的图
+    make_input(conversation, turn): 第turn轮的输入
+    make_config(conversation): 会话配置(同一会话的各轮共用thread_id)
+    close(): 压测结束后调用，在关闭store之前写完后台日志
+    """
+    name: str
+    graph: Any
+    make_input: Callable[[int, int], dict]
+    make_config: Callable[[int], dict]
+    close: Callable[[], None] = lambda: None
+
+
+def _thread_config(conversation: int) -> dict:
+    return {"configurable": {"thread_id": f"loadtest_{conversation}"}}
+
+
+def _user_config(users: int):
+    def make_config(conversation: int) -> dict:
+        return {"configurable": {"thread_id": f"loadtest_{conversation}", "user_id": f"user_{conversation % users}"}}
+    return make_config
+
+
+def _patch_chatbot(module, model, tools):
+    """
+    替换chatbot_demo模块的懒加载函数，节点函数在运行时才调用它们，真实模型和工具不会被创建
+    """
+    summarizer = ScriptedChatModel(script=["摘要：用户在咨询问题，助手已给出建议。"], latency=model.latency,
+                                   seed=model.seed)
+    module.get_llm = lambda: summarizer  # 只有摘要会直接用到get_llm()
+    module.get_llm_with_tools = lambda: model
+    module.get_tools = lambda: tools
+    if hasattr(module, "get_window"):
+        module.get_window.cache_clear()
+
+
+def _patch_store(module, store):
+    """
+    长期记忆换成压测驱动传入的store(未传时用内存store)，保留demo的缓存/语义检索层，
+    不写demo共用的chatbot2_store.sqlite，每次压测都从空的store开始
+    """
+    store = module.new_store(store if store is not None else InMemoryStore())
+    module.get_store = lambda: store
+    return store
+
+
+def _search_script():
+    return [{"content": "", "tool_calls": [{"name": "tavily_search", "args": {"query": "LangGraph"}}]},
+            "根据搜索结果，LangGraph是一个用于构建有状态多智能体应用的框架。"]
+
+
+def chatbot_demo(name: str, checkpointer, latency, tool_latency, seed: int = 0, **kwargs) -> Target:
+    module = importlib.import_module(f"src.app.chatbot.{name}")
+    if name == "chatbot_demo4":
+        script = [{"content": "", "tool_calls": [{"name": "get_weather", "args": {"location": "Beijing"}}]},
+                  "北京今天晴，气温适宜，适合出行。"]
+        tools = [weather_stub(tool_latency, seed)]
+        topics = CITIES
+    else:
+        script = _search_script()
+        tools = [search_stub(tool_latency, seed)]
+        topics = TOPICS
+    model = ScriptedChatModel(script=script, latency=latency, token_latency=kwargs.get("token_latency", "fixed:0.0"),
+                              seed=seed)
+    _patch_chatbot(module, model, tools)
+
+    def make_input(conversation: int, turn: int) -> dict:
+        topic = topics[(conversation + turn) % len(topics)]
+        return {"messages": [{"role": "user", "content": f"第{turn}个问题：{topic}怎么样？"}]}
+
+    return Target(name, module.get_graph(checkpointer=checkpointer), make_input, _thread_config)
+
+
+def chatbot2_demo1(checkpointer, store=None, users: int = 100, **kwargs) -> Target:
+    module = importlib.import_module("src.app.chatbot2.chatbot2_demo1")
+    store = _patch_store(module, store)
+    log_writer = BatchedLogWriter(store)
+    module.get_log_writer = lambda: log_writer
+    graph = module.get_graph(checkpointer=checkpointer, store=store)
+
+    def make_input(conversation: int, turn: int) -> dict:
+        return {"messages": [HumanMessage(f"第{turn}句话，你好")]}
+
+    return Target("chatbot2_demo1", graph, make_input, _user_config(users), log_writer.close)
+
+
+def chatbot2_demo2(checkpointer, store=None, users: int = 100, **kwargs) -> Target:
+    module = importlib.import_module("src.app.chatbot2.chatbot2_demo2")
+    graph = module.get_graph(checkpointer=checkpointer, store=_patch_store(module, store))
+
+    def make_input(conversation: int, turn: int) -> dict:
+        return {"messages": [HumanMessage(CS_INPUTS[(conversation + turn) % len(CS_INPUTS)])]}
+
+    return Target("chatbot2_demo2", graph, make_input, _user_config(users))
+
+
+TARGETS = {
+    "chatbot_demo2": lambda **kw: chatbot_demo("chatbot_demo2", **kw),
+    "chatbot_demo3": lambda **kw: chatbot_demo("chatbot_demo3", **kw),
+    "chatbot_demo4": lambda **kw: chatbot_demo("chatbot_demo4", **kw),
+    "chatbot2_demo1": chatbot2_demo1,
+    "chatbot2_demo2": chatbot2_demo2,
+}
+
+
+def build_target(name: str, checkpointer, latency="fixed:0.05", tool_latency="fixed:0.02", seed: int = 0,
+                 store=None, **kwargs) -> Target:
+    """
+    :param store: chatbot2目标的长期记忆后端，和checkpointer一样由调用方创建，None时用内存store
+    """
+    if name not in TARGETS:
+        raise ValueError(f"未知的压测目标：{name}，可选：{', '.join(TARGETS)}")
+    return TARGETS[name](checkpointer=checkpointer, latency=latency, tool_latency=tool_latency, seed=seed,
+                         store=store, **kwargs)
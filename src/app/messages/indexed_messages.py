@@ -0,0 +1,224 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : indexed_messages.py
+@time    : 2026/10/18 22:50
+@desc    : 带id索引的消息通道，替换State里的Annotated[list, add_messages]：
+           messages: Annotated[list, IndexedMessages()]
+           add_messages每次合并都要复制整个列表、转换全部旧消息并重建id->位置的字典，单次合并O(n)，整段会话O(n²)
+           这里通道自己持有消息列表和id->槽位索引，追加、按id替换、删除都只处理本次的新消息(删除是均摊O(1))
+           合并语义与add_messages一致(缺id时生成uuid、同id替换、RemoveMessage删除、REMOVE_ALL_MESSAGES清空)
+-----------------------------------------------------------------------
+"""
+import uuid
+from bisect import bisect_left, insort
+from typing import Any, Optional, Sequence
+
+from langchain_core.messages import RemoveMessage, convert_to_messages, message_chunk_to_message
+from langgraph.channels.base import BaseChannel
+from langgraph.errors import InvalidUpdateError
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
+from langgraph.types import Overwrite
+
+
+def _to_messages(value) -> list:
+    if not isinstance(value, list):
+        value = [value]
+    return [message_chunk_to_message(m) for m in convert_to_messages(value)]
+
+
+class _Index:
+    """
+    id -> 槽位号：追加时分配递增的槽位号，删除不重新编号，只把槽位号记进有序的removed，
+    当前位置 = 槽位号 - removed中比它小的个数；removed超过消息数时整体重新编号一次(均摊O(1))
+    version在每次原地修改时加一，通道副本据此判断共享的索引是否已经被改过
+    """
+
+    __slots__ = ("slots", "removed", "next_slot", "version")
+
+    def __init__(self, messages: list):
+        for m in messages:
+            if m.id is None:
+                m.id = str(uuid.uuid4())
+        self.slots = {m.id: i for i, m in enumerate(messages)}
+        self.removed = []
+        self.next_slot = len(messages)
+        self.version = 0
+
+    def copy(self) -> "_Index":
+        index = _Index.__new__(_Index)
+        index.slots, index.removed = dict(self.slots), list(self.removed)
+        index.next_slot, index.version = self.next_slot, 0
+        return index
+
+    def position(self, slot: int) -> int:
+        return slot - bisect_left(self.removed, slot) if self.removed else slot
+
+
+class IndexedMessages(BaseChannel[list, Any, list]):
+    """
+    - 列表写时复制：get/checkpoint交出去的列表(节点读到的状态、异步写入中的检查点)之后不会再被原地修改，
+      下一次合并前先复制一份(C层面的指针复制，不转换消息、不调用Python代码)
+    - 索引只在通道内部使用：copy()出来的副本(条件边读取本任务写入后的状态时用)共享索引，
+      副本要修改时再复制，原通道在此期间修改过则副本从自己的列表重建
+    - 索引在第一次合并时才建立：从检查点恢复的通道不需要时不建
+    - 与add_messages的差别：不支持format="langchain-openai"
+    """
+
+    __slots__ = ("value", "index", "_list_owned", "_index_version")
+
+    def __init__(self, typ: Any = list):
+        super().__init__(typ)
+        self.value: list = []
+        self.index: Optional[_Index] = None
+        self._list_owned = True
+        self._index_version = None  # 共享的索引的版本，None表示索引归本通道所有
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, IndexedMessages)
+
+    @property
+    def ValueType(self) -> Any:
+        return self.typ
+
+    @property
+    def UpdateType(self) -> Any:
+        return self.typ
+
+    def copy(self):
+        empty = self.__class__(self.typ)
+        empty.key = self.key
+        empty.value, empty.index = self.value, self.index
+        empty._list_owned = self._list_owned = False
+        if self.index is not None:
+            empty._index_version = self.index.version
+        return empty
+
+    def from_checkpoint(self, checkpoint):
+        empty = self.__class__(self.typ)
+        empty.key = self.key
+        if isinstance(checkpoint, list):
+            empty.value = checkpoint
+            empty._list_owned = False
+        return empty
+
+    def get(self) -> list:
+        self._list_owned = False
+        return self.value
+
+    def is_available(self) -> bool:
+        return True
+
+    def checkpoint(self) -> list:
+        self._list_owned = False
+        return self.value
+
+    # ======================= 合并 =======================
+    def update(self, values: Sequence[Any]) -> bool:
+        if not values:
+            return False
+        overwritten = False
+        for value in values:
+            if isinstance(value, Overwrite):
+                if overwritten:
+                    raise InvalidUpdateError("每个超级步只能有一个Overwrite")
+                self._reset(_to_messages(value.value))
+                overwritten = True
+            elif not overwritten:
+                self._merge(_to_messages(value))
+        return True
+
+    def _reset(self, messages: list):
+        self.value, self.index = [], None
+        self._list_owned, self._index_version = True, None
+        self._merge(messages)
+
+    def _own(self) -> _Index:
+        if not self._list_owned:
+            self.value = list(self.value)
+            self._list_owned = True
+        if self._index_version is not None:
+            if self.index.version == self._index_version:
+                self.index = self.index.copy()
+            else:
+                self.index = None
+            self._index_version = None
+        if self.index is None:
+            self.index = _Index(self.value)
+        self.index.version += 1
+        return self.index
+
+    def _merge(self, right: list):
+        remove_all = None
+        for i, m in enumerate(right):
+            if m.id is None:
+                m.id = str(uuid.uuid4())
+            if isinstance(m, RemoveMessage) and m.id == REMOVE_ALL_MESSAGES:
+                remove_all = i
+        if remove_all is not None:
+            # 与add_messages一致：丢弃已有消息，最后一个REMOVE_ALL_MESSAGES之后的消息原样作为新列表，索引下次合并时重建
+            self.value, self.index = right[remove_all + 1:], None
+            self._list_owned, self._index_version = True, None
+            return
+        index = self._own()
+        value, slots = self.value, index.slots
+        pending = {}  # 本次合并中删除的 id -> 槽位号，先占位，合并结束后再真正删除
+        for m in right:
+            slot = slots.get(m.id)
+            if slot is None:
+                if isinstance(m, RemoveMessage):
+                    raise ValueError(f"Attempting to delete a message with an ID that doesn't exist ('{m.id}')")
+                slots[m.id] = index.next_slot
+                index.next_slot += 1
+                value.append(m)
+            elif isinstance(m, RemoveMessage):
+                pending[m.id] = slot
+            else:
+                pending.pop(m.id, None)  # 同一次合并中先删除后又写回，保留原位置
+                value[index.position(slot)] = m
+        if pending:
+            self._remove(index, pending)
+
+    def _remove(self, index: _Index, pending: dict):
+        for message_id, slot in sorted(pending.items(), key=lambda item: item[1], reverse=True):
+            del self.value[index.position(slot)]  # 从后往前删，前面的位置不受影响
+            del index.slots[message_id]
+        for slot in pending.values():
+            insort(index.removed, slot)
+        if len(index.removed) > len(self.value):
+            self.index = _Index(self.value)
+
+
+if __name__ == '__main__':
+    print("indexed_messages...")
+    from typing import Annotated
+
+    from langchain_core.messages import AIMessage, HumanMessage
+    from langgraph.checkpoint.memory import MemorySaver
+    from langgraph.graph import StateGraph, START, END, add_messages
+    from typing_extensions import TypedDict
+
+    class State(TypedDict):
+        messages: Annotated[list, IndexedMessages()]
+
+    def reply(state: State):
+        last = state["messages"][-1]
+        return {"messages": [AIMessage(f"收到：{last.content}", id=f"ai-{last.id}")]}
+
+    builder = StateGraph(State)
+    builder.add_node("reply", reply)
+    builder.add_edge(START, "reply")
+    builder.add_edge("reply", END)
+    graph = builder.compile(checkpointer=MemorySaver())
+    config = {"configurable": {"thread_id": "1"}}
+    for i in range(3):
+        graph.invoke({"messages": [HumanMessage(f"问题{i}", id=f"h{i}")]}, config)
+    graph.update_state(config, {"messages": [RemoveMessage(id="h0"), AIMessage("改写的回答", id="ai-h1")]})
+    merged = graph.get_state(config).values["messages"]
+    history = [m for i in range(3)
+               for m in (HumanMessage(f"问题{i}", id=f"h{i}"), AIMessage(f"收到：问题{i}", id=f"ai-h{i}"))]
+    expected = add_messages(history, [RemoveMessage(id="h0"), AIMessage("改写的回答", id="ai-h1")])
+    print(merged == expected, [(m.id, m.content) for m in merged])
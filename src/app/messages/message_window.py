@@ -0,0 +1,237 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : message_window.py
+@time    : 2026/10/18 13:20
+@desc    : 按token预算裁剪发送给大模型的消息，被裁掉的轮次增量合并进摘要
+-----------------------------------------------------------------------
+"""
+import asyncio
+
+from langchain_core.messages import HumanMessage, SystemMessage, ToolMessage, AIMessage
+from langchain_core.messages.utils import count_tokens_approximately
+
+SUMMARY_PROMPT = (
+    "你是对话摘要助手。请把【新增对话】合并进【已有摘要】，输出更新后的摘要，"
+    "保留用户身份、偏好、已确认的事实和未完成的事项，不超过300字。\n\n"
+    "【已有摘要】\n{summary}\n\n【新增对话】\n{dialogue}"
+)
+
+
+def _role(message) -> str:
+    if isinstance(message, HumanMessage):
+        return "用户"
+    if isinstance(message, ToolMessage):
+        return "工具"
+    if isinstance(message, SystemMessage):
+        return "系统"
+    return "助手"
+
+
+def format_dialogue(messages) -> str:
+    lines = []
+    for message in messages:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        if isinstance(message, AIMessage) and message.tool_calls:
+            calls = ", ".join(f"{c['name']}({c['args']})" for c in message.tool_calls)
+            content = f"{content} [调用工具: {calls}]".strip()
+        lines.append(f"{_role(message)}: {content}")
+    return "\n".join(lines)
+
+
+# 摘要是内部调用，不出现在stream_mode="messages"的逐token输出中
+NOSTREAM = {"tags": ["nostream"]}
+
+
+class LLMSummarizer:
+    """
+    用大模型增量更新摘要：每次只把新被裁掉的消息和已有摘要发给模型，不重新总结全部历史
+    """
+
+    def __init__(self, llm, prompt: str = SUMMARY_PROMPT):
+        self.llm = llm
+        self.prompt = prompt
+        self.calls = 0
+
+    def __call__(self, summary: str, messages) -> str:
+        self.calls += 1
+        text = self.prompt.format(summary=summary or "无", dialogue=format_dialogue(messages))
+        return self.llm.invoke([HumanMessage(text)], config=NOSTREAM).content
+
+    async def asummarize(self, summary: str, messages) -> str:
+        self.calls += 1
+        text = self.prompt.format(summary=summary or "无", dialogue=format_dialogue(messages))
+        return (await self.llm.ainvoke([HumanMessage(text)], config=NOSTREAM)).content
+
+
+class TruncatingSummarizer:
+    """
+    不调用大模型的摘要：把被裁掉的消息截断后追加到摘要末尾，超长时丢弃最早的部分
+    """
+
+    def __init__(self, max_chars: int = 2000, per_message_chars: int = 80):
+        self.max_chars = max_chars
+        self.per_message_chars = per_message_chars
+        self.calls = 0
+
+    def __call__(self, summary: str, messages) -> str:
+        self.calls += 1
+        lines = [line[:self.per_message_chars] for line in format_dialogue(messages).split("\n")]
+        merged = "\n".join(filter(None, [summary] + lines))
+        return merged[-self.max_chars:]
+
+
+class MessageWindow:
+    """
+    模型调用前的消息窗口
+
+    - 从最新消息往前累加token，超出预算的更早消息不再发送给模型
+    - 窗口总是从用户消息开始，不会把AI工具调用和对应的工具结果拆开
+    - 被裁掉的消息通过summarizer增量合并进state["summary"]，
+      state["summarized_count"]记录已经合并进摘要的消息数
+    - 尚未合并进摘要的消息全部发送给模型：累计不足min_summarize条时先不合并，本轮可能略超预算，
+      每条消息总在摘要或窗口中的一处
+    - 超出预算时一次合并到低水位：合并后窗口只剩max_tokens * low_water左右，之后多轮对话都不用再合并，
+      摘要和提示词前缀保持不变，提示词缓存(prompt_cache)能持续命中；low_water=1时每次只合并刚好超出的部分
+
+    State需要增加两个字段：
+        summary: str
+        summarized_count: int
+    """
+
+    def __init__(self, max_tokens: int = 4000, summarizer=None, token_counter=count_tokens_approximately,
+                 keep_system: bool = True, min_summarize: int = 2, low_water: float = 0.5):
+        if not 0 < low_water <= 1:
+            raise ValueError(f"low_water必须在(0, 1]之间：{low_water}")
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer or TruncatingSummarizer()
+        self.token_counter = token_counter
+        self.keep_system = keep_system
+        self.min_summarize = min_summarize  # 累计被裁掉至少这么多条消息才更新一次摘要
+        self.low_water = low_water  # 合并摘要后窗口占预算的比例
+
+    def _count(self, message) -> int:
+        return self.token_counter([message])
+
+    def select(self, messages, summary: str = "", ratio: float = 1.0):
+        """
+        计算窗口起点
+        :param messages:
+        :param summary:
+        :param ratio: 只使用预算的这个比例，合并摘要时按low_water计算
+        :return: (头部保留的系统消息数, 窗口起始下标)
+        """
+        head = 1 if self.keep_system and messages and isinstance(messages[0], SystemMessage) else 0
+        budget = int(self.max_tokens * ratio)
+        if summary:
+            budget -= self.token_counter([SystemMessage(summary)])
+        if head:
+            budget -= self._count(messages[0])
+
+        start = len(messages)
+        last_fit = None  # 预算内最靠前的用户消息
+        last_human = None  # 最新的用户消息
+        used = 0
+        for index in range(len(messages) - 1, head - 1, -1):
+            used += self._count(messages[index])
+            if used > budget:
+                break
+            start = index
+            if isinstance(messages[index], HumanMessage):
+                last_fit = index
+        if last_fit is None:
+            # 最新一轮本身就超出预算：仍然完整发送最新一轮，保证对话可用
+            for index in range(len(messages) - 1, head - 1, -1):
+                if isinstance(messages[index], HumanMessage):
+                    last_human = index
+                    break
+            return head, last_human if last_human is not None else start
+        return head, last_fit
+
+    @staticmethod
+    def _summarized(state, head: int, start: int) -> int:
+        messages = state["messages"]
+        summarized = max(state.get("summarized_count", 0) or 0, head)
+        return start if summarized > len(messages) else summarized  # 消息列表被整体替换过
+
+    def _pending(self, start: int, summarized: int) -> bool:
+        return start > summarized and start - summarized >= self.min_summarize
+
+    def _target(self, messages, summary: str, start: int) -> int:
+        """
+        合并的终点：窗口缩到低水位，至少合并到超出预算的起点
+        """
+        return max(self.select(messages, summary, self.low_water)[1], start)
+
+    def _build(self, messages, head, start, summary):
+        prompt = list(messages[:head])
+        if summary:
+            prompt.append(SystemMessage(f"以下是更早对话的摘要：\n{summary}"))
+        prompt.extend(messages[start:])
+        return prompt
+
+    def prepare(self, state):
+        """
+        生成本轮发送给模型的消息
+        :param state:
+        :return: (prompt消息列表, 需要写回state的字段)
+        """
+        messages = state["messages"]
+        summary = state.get("summary", "") or ""
+        head, start = self.select(messages, summary)
+        summarized = self._summarized(state, head, start)
+        updates = {}
+        # 摘要变长后预算变少，窗口起点可能继续后移，重复合并直到起点不再越过已合并的位置
+        while self._pending(start, summarized):
+            target = self._target(messages, summary, start)
+            summary = self.summarizer(summary, messages[summarized:target])
+            summarized = target
+            updates = {"summary": summary, "summarized_count": summarized}
+            head, start = self.select(messages, summary)
+        return self._build(messages, head, summarized, summary), updates
+
+    async def aprepare(self, state):
+        """
+        prepare的异步版本
+        :param state:
+        :return:
+        """
+        messages = state["messages"]
+        summary = state.get("summary", "") or ""
+        head, start = self.select(messages, summary)
+        summarized = self._summarized(state, head, start)
+        updates = {}
+        while self._pending(start, summarized):
+            target = self._target(messages, summary, start)
+            evicted = messages[summarized:target]
+            if hasattr(self.summarizer, "asummarize"):
+                summary = await self.summarizer.asummarize(summary, evicted)
+            else:
+                summary = await asyncio.to_thread(self.summarizer, summary, evicted)
+            summarized = target
+            updates = {"summary": summary, "summarized_count": summarized}
+            head, start = self.select(messages, summary)
+        return self._build(messages, head, summarized, summary), updates
+
+
+if __name__ == '__main__':
+    print("message_window...")
+    history = []
+    for i in range(20):
+        history += [HumanMessage(f"第{i}个问题" * 20), AIMessage(f"第{i}个回答" * 20)]
+    window = MessageWindow(max_tokens=300)
+    prompt, updates = window.prepare({"messages": history})
+    print(len(prompt), updates.get("summarized_count"))
+
+    # 逐轮增长的会话：统计摘要次数和提示词前缀(系统消息+摘要)变化的次数
+    for low_water in (1.0, 0.5):
+        window, state, prefixes = MessageWindow(max_tokens=2000, low_water=low_water), {"messages": []}, set()
+        for i in range(300):
+            state["messages"] = state["messages"] + [HumanMessage(f"第{i}个问题" * 5), AIMessage(f"第{i}个回答" * 5)]
+            prompt, updates = window.prepare(state)
+            state.update(updates)
+            prefixes.add(state.get("summary", ""))
+        print(f"low_water={low_water}: 摘要{window.summarizer.calls}次，前缀{len(prefixes)}种")
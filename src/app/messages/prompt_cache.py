@@ -0,0 +1,172 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : prompt_cache.py
+@time    : 2026/10/18 14:05
+@desc    : Anthropic提示词前缀缓存：自动在工具定义和稳定的对话前缀上打缓存断点，统计缓存命中
+-----------------------------------------------------------------------
+"""
+import threading
+from collections import deque
+
+from langchain_core.messages import HumanMessage
+
+EPHEMERAL = {"type": "ephemeral"}
+
+
+def cache_tools(tools, cache_control: dict = EPHEMERAL) -> list:
+    """
+    把工具转换成Anthropic格式，并在最后一个工具上打断点(缓存全部工具定义)
+    :param tools:
+    :param cache_control:
+    :return:
+    """
+    from langchain_anthropic import convert_to_anthropic_tool  # 导入anthropic SDK较慢，用到时才导入
+
+    formatted = [dict(convert_to_anthropic_tool(t)) for t in tools]
+    if formatted:
+        formatted[-1]["cache_control"] = dict(cache_control)
+    return formatted
+
+
+def _with_breakpoint(message, cache_control):
+    """
+    返回在最后一个内容块上带cache_control的消息副本，无法打断点时返回None
+    """
+    content = message.content
+    if isinstance(content, str):
+        if not content:
+            return None  # 空文本块会被API拒绝(例如只有tool_calls的AI消息)
+        blocks = [{"type": "text", "text": content, "cache_control": dict(cache_control)}]
+    elif isinstance(content, list) and content:
+        blocks = list(content)
+        last = blocks[-1]
+        if isinstance(last, str):
+            last = {"type": "text", "text": last}
+        if not isinstance(last, dict):
+            return None
+        blocks[-1] = {**last, "cache_control": dict(cache_control)}
+    else:
+        return None
+    return message.model_copy(update={"content": blocks})
+
+
+def mark_cache_breakpoints(messages, cache_control: dict = EPHEMERAL, max_breakpoints: int = 2) -> list:
+    """
+    在对话上打缓存断点(不修改原消息)：
+    1. 最后一条可打断点的消息：本轮写入缓存，下一轮作为前缀命中
+    2. 最新一条用户消息之前的最后一条消息：即上一轮结束时的稳定前缀，本轮读取缓存
+    Anthropic每次请求最多4个断点，工具定义占1个，这里默认最多再用2个
+    :param messages:
+    :param cache_control:
+    :param max_breakpoints:
+    :return:
+    """
+    messages = list(messages)
+    targets = []
+
+    def mark_from(index):
+        for i in range(index, -1, -1):
+            if i in targets:
+                return
+            copied = _with_breakpoint(messages[i], cache_control)
+            if copied is not None:
+                messages[i] = copied
+                targets.append(i)
+                return
+
+    if max_breakpoints >= 1 and messages:
+        mark_from(len(messages) - 1)
+    if max_breakpoints >= 2:
+        for i in range(len(messages) - 1, -1, -1):
+            if isinstance(messages[i], HumanMessage):
+                if i > 0:
+                    mark_from(i - 1)
+                break
+    return messages
+
+
+def cache_usage(message) -> dict:
+    """
+    从AI消息的usage_metadata中取出缓存命中情况
+    :param message:
+    :return: cache_read 命中缓存的token / cache_creation 写入缓存的token / uncached 未缓存的输入token
+    """
+    usage = getattr(message, "usage_metadata", None) or {}
+    details = usage.get("input_token_details", {}) or {}
+    cache_read = details.get("cache_read", 0) or 0
+    cache_creation = details.get("cache_creation", 0) or 0
+    input_tokens = usage.get("input_tokens", 0) or 0
+    return {
+        "input_tokens": input_tokens,
+        "cache_read": cache_read,
+        "cache_creation": cache_creation,
+        "uncached": max(input_tokens - cache_read - cache_creation, 0),
+        "output_tokens": usage.get("output_tokens", 0) or 0,
+    }
+
+
+class PromptCache:
+    """
+    聊天节点使用的提示词缓存：
+
+    llm_with_tools = prompt_cache.bind_tools(llm, tools)
+    response = llm_with_tools.invoke(prompt_cache.prepare(messages))
+    prompt_cache.record(response)  # 节点中只记录，不打印(服务端和--stream输出不被打断)
+    for usage in prompt_cache.drain():  # 交互循环每轮结束后打印本轮的用量
+        print(format_usage(usage))
+    """
+
+    def __init__(self, cache_control: dict = EPHEMERAL, max_breakpoints: int = 2, history: int = 1000):
+        self.cache_control = cache_control
+        self.max_breakpoints = max_breakpoints
+        self.turns = deque(maxlen=history)  # 最近若干轮的cache_usage
+        self._totals = {"turns": 0, "input_tokens": 0, "cache_read": 0, "cache_creation": 0, "uncached": 0}
+        self._drained = 0  # drain()已经返回过的轮数
+        self._lock = threading.Lock()
+
+    def bind_tools(self, llm, tools, **kwargs):
+        return llm.bind_tools(cache_tools(tools, self.cache_control), **kwargs)
+
+    def prepare(self, messages) -> list:
+        return mark_cache_breakpoints(messages, self.cache_control, self.max_breakpoints)
+
+    def record(self, message) -> dict:
+        usage = cache_usage(message)
+        with self._lock:
+            self.turns.append(usage)
+            self._totals["turns"] += 1
+            for key in ("input_tokens", "cache_read", "cache_creation", "uncached"):
+                self._totals[key] += usage[key]
+        return usage
+
+    def drain(self) -> list:
+        """
+        返回上次drain()之后新记录的用量(最多history轮)
+        """
+        with self._lock:
+            count = min(self._totals["turns"] - self._drained, len(self.turns))
+            self._drained = self._totals["turns"]
+            return list(self.turns)[len(self.turns) - count:]
+
+    def totals(self) -> dict:
+        with self._lock:
+            totals = dict(self._totals)
+        totals["hit_rate"] = round(totals["cache_read"] / totals["input_tokens"], 4) if totals["input_tokens"] else 0.0
+        return totals
+
+
+def format_usage(usage: dict) -> str:
+    return (f"[缓存] 命中 {usage['cache_read']} / 写入 {usage['cache_creation']} / "
+            f"未缓存 {usage['uncached']} 输入token")
+
+
+if __name__ == '__main__':
+    print("prompt_cache...")
+    from langchain_core.messages import AIMessage
+    history = [HumanMessage("你好"), AIMessage("你好，有什么可以帮你？"), HumanMessage("北京天气怎么样")]
+    for m in mark_cache_breakpoints(history):
+        print(type(m).__name__, m.content)
@@ -0,0 +1,190 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : token_stream.py
+@time    : 2026/10/18 19:10
+@desc    : 逐token流式输出：把graph.stream(stream_mode="messages")转换成文本片段，统计首token延迟(TTFT)
+-----------------------------------------------------------------------
+"""
+import time
+from typing import AsyncIterator, Callable, Iterator, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+
+from src.app.profiling.metrics import MetricsRegistry
+
+# 节点里的模型调用用invoke即可：messages模式下langgraph会注册流式回调，模型自动改为逐chunk生成
+# 不想推给用户的模型调用(例如生成摘要)在config的tags中加"nostream"
+
+
+class StreamStats:
+    """
+    一次流式输出的统计，时间单位秒
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token: Optional[float] = None  # 首token延迟
+        self.total: Optional[float] = None  # 整轮耗时
+        self.chunks = 0  # 收到的文本片段数
+        self.chars = 0
+
+    def on_text(self, text: str, token: bool = True):
+        """
+        :param token: 是否为大模型生成的片段，工具结果不计入首token延迟
+        """
+        if token and self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+        self.chunks += 1
+        self.chars += len(text)
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+
+    def to_dict(self) -> dict:
+        return {"ttft_ms": _ms(self.first_token), "total_ms": _ms(self.total), "chunks": self.chunks,
+                "chars": self.chars}
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class TokenStreamer:
+    """
+    用法：
+        streamer = TokenStreamer(graph_name="chatbot_demo3")
+        for node, text in streamer.stream(graph, inputs, config):
+            print(text, end="", flush=True)
+        print(streamer.metrics.snapshot())
+
+    产出(节点名, 文本)：大模型节点逐片段输出，工具节点输出完整的工具结果
+    """
+
+    def __init__(self, graph_name: str = "chatbot", llm_nodes=("chatbot",), tool_nodes=("tools",),
+                 metrics: MetricsRegistry = None):
+        self.graph_name = graph_name
+        self.llm_nodes = set(llm_nodes)
+        self.tool_nodes = set(tool_nodes)
+        self.metrics = metrics or MetricsRegistry()
+
+    def _text(self, message, metadata) -> Optional[str]:
+        node = metadata.get("langgraph_node")
+        if node in self.llm_nodes and isinstance(message, AIMessage):  # 没有调用大模型的节点直接产出完整消息
+            return message.text or None
+        if node in self.tool_nodes and isinstance(message, ToolMessage):
+            return message.text
+        return None
+
+    def _record(self, stats: StreamStats):
+        stats.finish()
+        labels = {"graph": self.graph_name}
+        if stats.first_token is not None:
+            self.metrics.histogram("llm_time_to_first_token_seconds", labels,
+                                   help="从提交输入到收到第一个token的时间").observe(stats.first_token)
+        self.metrics.histogram("llm_stream_seconds", labels, help="一轮流式输出的总耗时").observe(stats.total)
+
+    def _end_of_message(self, message, metadata) -> bool:
+        """
+        模型一次回复的最后一个chunk(langchain_core保证流式输出以chunk_position="last"的空chunk结尾)
+        """
+        return (metadata.get("langgraph_node") in self.llm_nodes and isinstance(message, AIMessageChunk)
+                and message.chunk_position == "last")
+
+    def stream(self, graph, inputs, config=None, stats: StreamStats = None,
+               on_message_end: Callable[[str], None] = None) -> Iterator[Tuple[str, str]]:
+        """
+        :param stats: 传入时填充本轮的统计
+        :param on_message_end: 模型的一次回复输出完时回调，参数是节点名
+        """
+        stats = stats or StreamStats()
+        try:
+            for message, metadata in graph.stream(inputs, config, stream_mode="messages"):
+                text = self._text(message, metadata)
+                if text:
+                    node = metadata["langgraph_node"]
+                    stats.on_text(text, node in self.llm_nodes)
+                    yield node, text
+                if on_message_end and self._end_of_message(message, metadata):
+                    on_message_end(metadata["langgraph_node"])
+        finally:
+            self._record(stats)
+
+    async def astream(self, graph, inputs, config=None, stats: StreamStats = None,
+                      on_message_end: Callable[[str], None] = None) -> AsyncIterator[Tuple[str, str]]:
+        stats = stats or StreamStats()
+        try:
+            async for message, metadata in graph.astream(inputs, config, stream_mode="messages"):
+                text = self._text(message, metadata)
+                if text:
+                    node = metadata["langgraph_node"]
+                    stats.on_text(text, node in self.llm_nodes)
+                    yield node, text
+                if on_message_end and self._end_of_message(message, metadata):
+                    on_message_end(metadata["langgraph_node"])
+        finally:
+            self._record(stats)
+
+    def print(self, graph, inputs, config=None) -> StreamStats:
+        """
+        交互式命令行：边生成边打印，结束后打印首token延迟
+        """
+        stats = StreamStats()
+        printer = _Printer()
+        for node, text in self.stream(graph, inputs, config, stats, printer.end_message):
+            printer.write(node, text)
+        printer.end(stats)
+        return stats
+
+    async def aprint(self, graph, inputs, config=None) -> StreamStats:
+        stats = StreamStats()
+        printer = _Printer()
+        async for node, text in self.astream(graph, inputs, config, stats, printer.end_message):
+            printer.write(node, text)
+        printer.end(stats)
+        return stats
+
+
+class _Printer:
+    """
+    每条消息开头打印节点名，结束时换行(节点里打印的用量信息不会接在回复后面)
+    """
+
+    def __init__(self):
+        self.node = None
+
+    def end_message(self, node: str = None):
+        if self.node is not None:
+            print()
+            self.node = None
+
+    def write(self, node: str, text: str):
+        if node != self.node:
+            self.end_message()
+            print("Assistant: " if node == "chatbot" else f"{node.upper()}: ", end="")
+            self.node = node
+        print(text, end="", flush=True)
+
+    def end(self, stats: StreamStats):
+        self.end_message()
+        info = stats.to_dict()
+        print(f"[首token {info['ttft_ms']} ms，总耗时 {info['total_ms']} ms，{info['chunks']} 个片段]")
+
+
+if __name__ == '__main__':
+    print("token_stream...")
+    from langgraph.graph import StateGraph, START, END, MessagesState
+    from src.app.loadtest.fake_model import ScriptedChatModel
+
+    model = ScriptedChatModel(script=["你好，我是一个逐token输出的助手。"], latency="fixed:0.2",
+                              token_latency="fixed:0.05")
+    builder = StateGraph(MessagesState)
+    builder.add_node("chatbot", lambda state: {"messages": [model.invoke(state["messages"])]})
+    builder.add_edge(START, "chatbot")
+    builder.add_edge("chatbot", END)
+    streamer = TokenStreamer(graph_name="demo")
+    streamer.print(builder.compile(), {"messages": [("user", "你好")]})
+    print(streamer.metrics.snapshot())
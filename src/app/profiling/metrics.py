@@ -0,0 +1,149 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : metrics.py
+@time    : 2026/10/18 16:10
+@desc    : 进程内直方图注册表：固定分桶、线程安全、可导出为Prometheus文本格式
+-----------------------------------------------------------------------
+"""
+import bisect
+import math
+import threading
+
+# 秒：0.1ms ~ 60s
+TIME_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 字节：1KB ~ 64MB
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(9))
+
+
+class Histogram:
+    """
+    固定分桶直方图，observe是O(log 桶数)，只保存计数，内存占用与样本数无关
+    """
+
+    def __init__(self, buckets=TIME_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个是+Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q: float) -> float:
+        """
+        按分桶线性插值估算分位数，0 <= q <= 1
+        """
+        with self._lock:
+            counts, count, peak = list(self.counts), self.count, self.max
+        if not count:
+            return 0.0
+        rank = q * count
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else peak
+                return min(lower + (upper - lower) * (rank - seen) / c, peak)
+            seen += c
+        return peak
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """
+    按(指标名, 标签)管理直方图
+
+    registry.histogram("node_wall_seconds", {"node": "tools"}).observe(0.01)
+    print(registry.to_prometheus())
+    """
+
+    def __init__(self):
+        self._metrics = {}  # name -> {"help", "buckets", "series": {labels_tuple: Histogram}}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, labels: dict = None, buckets=TIME_BUCKETS, help: str = "") -> Histogram:
+        key = tuple(sorted((labels or {}).items()))
+        metric = self._metrics.get(name)
+        if metric is not None:
+            series = metric["series"].get(key)
+            if series is not None:
+                return series
+        with self._lock:
+            metric = self._metrics.setdefault(name, {"help": help, "buckets": buckets, "series": {}})
+            return metric["series"].setdefault(key, Histogram(metric["buckets"]))
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+    def snapshot(self) -> dict:
+        """
+        {指标名: {"node=tools": {...统计...}}}
+        """
+        result = {}
+        for name, metric in list(self._metrics.items()):
+            result[name] = {
+                ",".join(f"{k}={v}" for k, v in labels): histogram.snapshot()
+                for labels, histogram in list(metric["series"].items())
+            }
+        return result
+
+    def to_prometheus(self) -> str:
+        """
+        导出为Prometheus文本格式(0.0.4)
+        """
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            if metric["help"]:
+                lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} histogram")
+            for labels, histogram in sorted(metric["series"].items()):
+                with histogram._lock:
+                    counts, count, total = list(histogram.counts), histogram.count, histogram.sum
+                cumulative = 0
+                for bound, c in zip(histogram.buckets + (math.inf,), counts):
+                    cumulative += c
+                    le = "+Inf" if bound == math.inf else repr(float(bound))
+                    lines.append(f"{name}_bucket{_labels(labels, le=le)} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {total}")
+                lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels, **extra) -> str:
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+if __name__ == '__main__':
+    print("metrics...")
+    registry = MetricsRegistry()
+    for ms in (1, 2, 3, 20, 200):
+        registry.histogram("node_wall_seconds", {"node": "tools"}).observe(ms / 1000)
+    print(registry.snapshot())
+    print(registry.to_prometheus())
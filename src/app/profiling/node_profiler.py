@@ -0,0 +1,255 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : node_profiler.py
+@time    : 2026/10/18 16:10
+@desc    : StateGraph节点级性能埋点：墙钟时间、CPU时间、内存分配(tracemalloc)、状态大小，
+           写入进程内直方图，可选导出到OpenTelemetry / Prometheus文本格式
+-----------------------------------------------------------------------
+"""
+import functools
+import inspect
+import itertools
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from langchain_core.messages import BaseMessage
+
+from src.app.profiling.metrics import SIZE_BUCKETS, TIME_BUCKETS, MetricsRegistry
+
+try:
+    from opentelemetry import metrics as otel_metrics, trace as otel_trace
+except ImportError:  # 未安装opentelemetry时只写进程内注册表
+    otel_metrics = otel_trace = None
+
+REGISTRY = MetricsRegistry()  # 默认的全局注册表
+
+WALL = "langgraph_node_wall_seconds"
+CPU = "langgraph_node_cpu_seconds"
+ALLOC = "langgraph_node_alloc_peak_bytes"
+STATE = "langgraph_node_state_bytes"
+UPDATE = "langgraph_node_update_bytes"
+
+# 正在采样内存的调用数：第一个开启tracemalloc，最后一个关闭，未采样的调用不受tracemalloc拖累
+_tracing_lock = threading.Lock()
+_tracing_users = 0
+_tracing_owned = False  # tracemalloc是否由这里开启；外部已开启时不去关闭它
+
+
+def _start_tracing() -> int:
+    global _tracing_users, _tracing_owned
+    with _tracing_lock:
+        if _tracing_users == 0:
+            _tracing_owned = not tracemalloc.is_tracing()
+            if _tracing_owned:
+                tracemalloc.start(1)
+        _tracing_users += 1
+        # 并发采样时峰值会包含其他节点的分配，只作参考
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracing(start: int) -> int:
+    """
+    :return: 开始采样以来的分配峰值(字节)
+    """
+    global _tracing_users
+    with _tracing_lock:
+        peak = tracemalloc.get_traced_memory()[1]
+        _tracing_users -= 1
+        if _tracing_users == 0 and _tracing_owned:
+            tracemalloc.stop()
+        return max(peak - start, 0)
+
+
+def approx_size(value, _depth: int = 0) -> int:
+    """
+    估算状态的大小(字节)：字符串按UTF-8长度，消息按内容和工具调用计算，容器递归求和，
+    比序列化整个状态便宜得多
+    """
+    if isinstance(value, str):
+        return len(value.encode("utf-8", "ignore"))
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if _depth > 20:
+        return sys.getsizeof(value)
+    if isinstance(value, BaseMessage):
+        return approx_size(value.content, _depth + 1) + approx_size(getattr(value, "tool_calls", None) or [], _depth + 1)
+    if isinstance(value, dict):
+        return sum(approx_size(k, _depth + 1) + approx_size(v, _depth + 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set)):
+        return sum(approx_size(v, _depth + 1) for v in value)
+    return sys.getsizeof(value)
+
+
+class NodeProfiler:
+    """
+    包装节点函数，不改变节点的签名(config/store等参数照常注入)：
+
+    profiler = NodeProfiler()
+    builder.add_node("tools", profiler.wrap(call_tools))
+    print(profiler.report())
+
+    每次调用都记录墙钟时间和CPU时间(两次计时器调用，开销在微秒级)；
+    状态大小每state_every次采样一次，内存分配每memory_every次采样一次(0为关闭)。
+    tracemalloc只在被采样的调用期间开启，这次调用会慢好几倍，其余调用不受影响。
+    异步节点会在await期间让出CPU，CPU时间没有意义，只记录墙钟时间。
+    """
+
+    def __init__(self, registry: MetricsRegistry = None, enabled: bool = True, state_every: int = 10,
+                 memory_every: int = 0, otel: bool = False):
+        self.registry = registry or REGISTRY
+        self.enabled = enabled
+        self.state_every = state_every
+        self.memory_every = memory_every
+        self._tracer = self._meter = None
+        self._otel = {}
+        if enabled and otel and otel_trace is not None:
+            self._tracer = otel_trace.get_tracer(__name__)
+            self._meter = otel_metrics.get_meter(__name__)
+            self._otel = {
+                WALL: self._meter.create_histogram("langgraph.node.duration", unit="s", description="节点墙钟时间"),
+                CPU: self._meter.create_histogram("langgraph.node.cpu_time", unit="s", description="节点CPU时间"),
+            }
+
+    @classmethod
+    def from_env(cls, registry: MetricsRegistry = None) -> "NodeProfiler":
+        """
+        NODE_PROFILING=1 开启；NODE_PROFILING_MEMORY_EVERY=N 每N次采样内存分配；
+        NODE_PROFILING_OTEL=1 同时写OpenTelemetry
+        """
+        return cls(
+            registry=registry,
+            enabled=os.getenv("NODE_PROFILING", "0").lower() in ("1", "true", "yes"),
+            state_every=int(os.getenv("NODE_PROFILING_STATE_EVERY", "10")),
+            memory_every=int(os.getenv("NODE_PROFILING_MEMORY_EVERY", "0")),
+            otel=os.getenv("NODE_PROFILING_OTEL", "0").lower() in ("1", "true", "yes"),
+        )
+
+    def wrap(self, func, name: str = None):
+        """
+        返回带埋点的节点函数；未开启时原样返回，没有任何开销
+        """
+        if not self.enabled:
+            return func
+        name = name or getattr(func, "__name__", "node")
+        calls = itertools.count(1)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                n = next(calls)
+                span, memory = self._before(name, n, args)
+                start = time.perf_counter()
+                status, result = "error", None
+                try:
+                    result = await func(*args, **kwargs)
+                    status = "ok"
+                    return result
+                finally:
+                    self._after(name, n, status, time.perf_counter() - start, None, memory, span, result)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            n = next(calls)
+            span, memory = self._before(name, n, args)
+            start, cpu_start = time.perf_counter(), time.thread_time()
+            status, result = "error", None
+            try:
+                result = func(*args, **kwargs)
+                status = "ok"
+                return result
+            finally:
+                self._after(name, n, status, time.perf_counter() - start, time.thread_time() - cpu_start,
+                            memory, span, result)
+        return wrapper
+
+    def _before(self, name, n, args):
+        span = None
+        if self._tracer is not None:
+            span = self._tracer.start_span(f"node:{name}", attributes={"langgraph.node": name})
+        if self.state_every and n % self.state_every == 0 and args:
+            self.registry.histogram(STATE, {"node": name}, SIZE_BUCKETS, "节点输入状态大小(采样)").observe(
+                approx_size(args[0]))
+        memory = None
+        if self.memory_every and n % self.memory_every == 0:
+            memory = _start_tracing()
+        return span, memory
+
+    def _after(self, name, n, status, wall, cpu, memory, span, result):
+        labels = {"node": name, "status": status}
+        self.registry.histogram(WALL, labels, TIME_BUCKETS, "节点墙钟时间(秒)").observe(wall)
+        if cpu is not None:
+            self.registry.histogram(CPU, {"node": name}, TIME_BUCKETS, "节点CPU时间(秒)").observe(cpu)
+        if memory is not None:
+            self.registry.histogram(ALLOC, {"node": name}, SIZE_BUCKETS, "节点内存分配峰值(字节，采样)").observe(
+                _stop_tracing(memory))
+        if self.state_every and n % self.state_every == 0 and result is not None:
+            self.registry.histogram(UPDATE, {"node": name}, SIZE_BUCKETS, "节点返回的状态更新大小(采样)").observe(
+                approx_size(result))
+        if self._otel:
+            self._otel[WALL].record(wall, {"langgraph.node": name, "status": status})
+            if cpu is not None:
+                self._otel[CPU].record(cpu, {"langgraph.node": name})
+        if span is not None:
+            span.set_attribute("langgraph.node.status", status)
+            span.end()
+
+    def report(self) -> dict:
+        """
+        按节点汇总：调用次数、错误数、墙钟/CPU时间分位数(毫秒)、采样的内存和状态大小(KB)
+        """
+        snapshot = self.registry.snapshot()
+        nodes = {}
+        for labels, stats in snapshot.get(WALL, {}).items():
+            parts = dict(p.split("=", 1) for p in labels.split(","))
+            node = nodes.setdefault(parts["node"], {"calls": 0, "errors": 0})
+            node["calls"] += stats["count"]
+            if parts.get("status") == "error":
+                node["errors"] += stats["count"]
+            else:
+                node["wall_ms"] = _scaled(stats, 1000)
+        for metric, key, unit in ((CPU, "cpu_ms", 1000), (ALLOC, "alloc_peak_kb", 1 / 1024),
+                                  (STATE, "state_kb", 1 / 1024), (UPDATE, "update_kb", 1 / 1024)):
+            for labels, stats in snapshot.get(metric, {}).items():
+                node = labels.split("=", 1)[1]
+                nodes.setdefault(node, {"calls": 0, "errors": 0})[key] = _scaled(stats, unit)
+        return nodes
+
+    def to_prometheus(self) -> str:
+        return self.registry.to_prometheus()
+
+
+def _scaled(stats: dict, unit: float) -> dict:
+    return {k: round(stats[k] * unit, 3) for k in ("mean", "p50", "p99", "max")}
+
+
+def format_report(report: dict) -> str:
+    lines = [f"{'节点':<18}{'次数':>8}{'错误':>6}{'p50(ms)':>10}{'p99(ms)':>10}{'CPU p50':>10}{'状态KB':>10}"]
+    for node, stats in report.items():
+        wall = stats.get("wall_ms", {})
+        lines.append(f"{node:<20}{stats['calls']:>8}{stats['errors']:>6}{wall.get('p50', 0):>10}"
+                     f"{wall.get('p99', 0):>10}{stats.get('cpu_ms', {}).get('p50', 0):>10}"
+                     f"{stats.get('state_kb', {}).get('mean', 0):>10}")
+    return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    print("node_profiler...")
+    profiler = NodeProfiler(MetricsRegistry(), state_every=1, memory_every=1)
+
+    @profiler.wrap
+    def build(state):
+        return {"messages": ["x" * 1000 for _ in range(100)]}
+
+    for _ in range(20):
+        build({"messages": ["hello"]})
+    print(format_report(profiler.report()))
+    print("alloc_peak_kb:", profiler.report()["build"]["alloc_peak_kb"], "tracing after calls:", tracemalloc.is_tracing())
@@ -0,0 +1,307 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : app.py
+@time    : 2026/10/18 20:30
+@desc    : 聊天图的HTTP服务(纯ASGI，不依赖web框架)：chatbot_demo3 / chatbot_demo4 / chatbot2_demo2
+           POST /graphs/{name}/invoke   {"thread_id": "...", "user_id": "...", "message": "..."} -> JSON
+           POST /graphs/{name}/stream   同上 -> text/event-stream，逐token推送
+           GET  /healthz                GET /metrics (Prometheus文本格式)
+           多worker：每个worker进程各自打开同一个SQLite检查点库(WAL)，同一会话的请求由ThreadScheduler排队，
+           并用文件锁跨进程串行化
+           运行：python -m src.app.server.app --workers 4 --port 8000          (需要安装uvicorn)
+                 python -m src.app.server.app --fake-latency fixed:0.05      (假大模型，压测用，不需要API Key)
+-----------------------------------------------------------------------
+"""
+import argparse
+import importlib
+import json
+import os
+import time
+from contextlib import AsyncExitStack
+from urllib.parse import unquote
+
+from langchain_core.messages import HumanMessage
+
+from src.app.checkpoint.delta_serde import DeltaSerde
+from src.app.checkpoint.sqlite_saver import BatchedAsyncSqliteSaver
+from src.app.graphs.scheduler import ThreadQueueFullError, ThreadScheduler
+from src.app.messages.token_stream import StreamStats, TokenStreamer
+from src.app.profiling.metrics import MetricsRegistry
+from src.app.server.thread_lock import ThreadLocks
+
+# 图名 -> (模块, 流式输出时推送哪些节点的消息)
+GRAPHS = {
+    "chatbot_demo3": ("src.app.chatbot.chatbot_demo3", {"llm_nodes": ("chatbot",), "tool_nodes": ("tools",)}),
+    "chatbot_demo4": ("src.app.chatbot.chatbot_demo4", {"llm_nodes": ("chatbot",), "tool_nodes": ("tools",)}),
+    "chatbot2_demo2": ("src.app.chatbot2.chatbot2_demo2", {
+        "llm_nodes": ("analyze_intent", "tools", "human_approval", "handle_approval"), "tool_nodes": (),
+    }),
+}
+
+# 多worker进程之间通过环境变量传递配置
+ENV_GRAPHS = "CHAT_SERVER_GRAPHS"  # 逗号分隔，默认全部
+ENV_DATA_DIR = "CHAT_SERVER_DATA_DIR"  # 检查点库和锁文件所在目录
+ENV_FAKE_LATENCY = "CHAT_SERVER_FAKE_LATENCY"  # 设置后大模型和工具换成假模型/替身
+ENV_FAKE_TOKEN_LATENCY = "CHAT_SERVER_FAKE_TOKEN_LATENCY"  # 假模型流式输出的token间隔
+ENV_COALESCE = "CHAT_SERVER_COALESCE"  # 1：同一会话排队中的invoke请求合并执行
+ENV_MAX_QUEUE = "CHAT_SERVER_MAX_QUEUE"  # 每个会话最多排队的请求数，超过返回429
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class ChatService:
+    """
+    管理各图的检查点、编译好的图和会话锁，与HTTP协议无关
+    """
+
+    def __init__(self, graphs=None, data_dir: str = "chat_server_data", fake_latency: str = None,
+                 fake_token_latency: str = "fixed:0.0", coalesce: bool = False, max_queue: int = None):
+        self.names = list(graphs or GRAPHS)
+        unknown = [name for name in self.names if name not in GRAPHS]
+        if unknown:
+            raise ValueError(f"未知的图：{', '.join(unknown)}，可选：{', '.join(GRAPHS)}")
+        self.data_dir = data_dir
+        self.fake_latency = fake_latency
+        self.fake_token_latency = fake_token_latency
+        self.metrics = MetricsRegistry()
+        self.graphs = {}
+        self.streamers = {}
+        self.schedulers = {}
+        self.coalesce = coalesce
+        self.max_queue = max_queue
+        self.locks = ThreadLocks(os.path.join(data_dir, "locks") if _multiprocess_locks() else None)
+        self._stack = AsyncExitStack()
+
+    @classmethod
+    def from_env(cls) -> "ChatService":
+        graphs = [g for g in os.getenv(ENV_GRAPHS, "").split(",") if g] or None
+        max_queue = os.getenv(ENV_MAX_QUEUE)
+        return cls(graphs, os.getenv(ENV_DATA_DIR, "chat_server_data"), os.getenv(ENV_FAKE_LATENCY) or None,
+                   os.getenv(ENV_FAKE_TOKEN_LATENCY, "fixed:0.0"), os.getenv(ENV_COALESCE) == "1",
+                   int(max_queue) if max_queue else None)
+
+    async def startup(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        for name in self.names:
+            # 每个图一个检查点库，不同图的thread_id互不干扰
+            saver = await self._stack.enter_async_context(
+                BatchedAsyncSqliteSaver.from_conn_string(os.path.join(self.data_dir, f"{name}.sqlite"),
+                                                         serde=DeltaSerde()))
+            self.graphs[name] = self._compile(name, saver)
+            self.streamers[name] = TokenStreamer(graph_name=name, metrics=self.metrics, **GRAPHS[name][1])
+            self.schedulers[name] = ThreadScheduler(name=name, coalesce=self.coalesce, max_queue=self.max_queue,
+                                                    locks=self.locks, metrics=self.metrics)
+
+    async def shutdown(self):
+        await self._stack.aclose()
+
+    def _compile(self, name: str, checkpointer):
+        if self.fake_latency:
+            from src.app.loadtest.targets import build_target  # 只有压测模式才需要假模型
+            return build_target(name, checkpointer, latency=self.fake_latency,
+                                token_latency=self.fake_token_latency).graph
+        module = importlib.import_module(GRAPHS[name][0])
+        return module.get_graph(checkpointer=checkpointer)
+
+    def _prepare(self, name: str, body: dict):
+        if name not in self.graphs:
+            raise HTTPError(404, f"未知的图：{name}")
+        thread_id, message = body.get("thread_id"), body.get("message")
+        if not thread_id or not isinstance(message, str) or not message:
+            raise HTTPError(400, "thread_id和message不能为空")
+        configurable = {"thread_id": str(thread_id)}
+        if body.get("user_id"):
+            configurable["user_id"] = str(body["user_id"])
+        return self.graphs[name], {"messages": [HumanMessage(message)]}, {"configurable": configurable}
+
+    async def invoke(self, name: str, body: dict) -> dict:
+        graph, inputs, config = self._prepare(name, body)
+        result = await self.schedulers[name].ainvoke(graph, inputs, config)
+        reply = result["messages"][-1]
+        return {"thread_id": config["configurable"]["thread_id"], "reply": reply.text,
+                "messages": len(result["messages"])}
+
+    async def stream(self, name: str, body: dict):
+        """
+        产出(事件名, 数据)：token {"node", "text"}，最后一个是end {"ttft_ms", ...}
+        """
+        graph, inputs, config = self._prepare(name, body)
+        async with self.schedulers[name].turn(config["configurable"]["thread_id"]):
+            stats = StreamStats()
+            async for node, text in self.streamers[name].astream(graph, inputs, config, stats):
+                yield "token", {"node": node, "text": text}
+        yield "end", {"thread_id": config["configurable"]["thread_id"], **stats.to_dict()}
+
+
+def _multiprocess_locks() -> bool:
+    try:
+        import fcntl  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+class ChatApp:
+    """
+    ASGI应用：路由、JSON编解码、SSE，业务都交给ChatService
+    """
+
+    def __init__(self, service: ChatService = None):
+        self.service = service
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def startup(self):
+        if self.service is None:
+            self.service = ChatService.from_env()
+        await self.service.startup()
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await self.startup()
+                except Exception as e:
+                    await send({"type": "lifespan.startup.failed", "message": repr(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.service.shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        method, parts = scope["method"], [unquote(p) for p in scope["path"].strip("/").split("/")]
+        start = time.perf_counter()
+        endpoint = "other"
+        try:
+            if method == "GET" and parts == ["healthz"]:
+                endpoint = "healthz"
+                await _json(send, 200, {"status": "ok", "pid": os.getpid(), "graphs": self.service.names})
+            elif method == "GET" and parts == ["metrics"]:
+                endpoint = "metrics"
+                await _send(send, 200, b"text/plain; version=0.0.4", self.service.metrics.to_prometheus().encode())
+            elif method == "POST" and len(parts) == 3 and parts[0] == "graphs" and parts[2] in ("invoke", "stream"):
+                endpoint = parts[2]
+                body = await _read_json(receive)
+                if endpoint == "invoke":
+                    await _json(send, 200, await self.service.invoke(parts[1], body))
+                else:
+                    await self._sse(send, self.service.stream(parts[1], body))
+            else:
+                raise HTTPError(404, "not found")
+        except HTTPError as e:
+            await _json(send, e.status, {"error": e.message})
+        except ThreadQueueFullError as e:
+            await _json(send, 429, {"error": str(e)})
+        except Exception as e:
+            await _json(send, 500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            self.service.metrics.histogram("http_request_seconds", {"endpoint": endpoint},
+                                           help="HTTP请求处理时间").observe(time.perf_counter() - start)
+
+    @staticmethod
+    async def _sse(send, events):
+        """
+        第一个事件产出之前的错误(参数错误、未知的图、排队已满)按普通HTTP错误返回，之后的错误作为error事件推送
+        """
+        events = events.__aiter__()
+        first = await events.__anext__()
+        await send({"type": "http.response.start", "status": 200, "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache"),
+            (b"x-accel-buffering", b"no"),
+        ]})
+        try:
+            event = first
+            while True:
+                await send({"type": "http.response.body", "body": _sse_event(*event), "more_body": True})
+                try:
+                    event = await events.__anext__()
+                except StopAsyncIteration:
+                    break
+        except Exception as e:
+            await send({"type": "http.response.body", "more_body": True,
+                        "body": _sse_event("error", {"error": f"{type(e).__name__}: {e}"})})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def _sse_event(event: str, data: dict) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+async def _read_json(receive) -> dict:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            break
+    try:
+        body = json.loads(b"".join(chunks) or b"{}")
+    except ValueError:
+        raise HTTPError(400, "请求体不是合法的JSON")
+    if not isinstance(body, dict):
+        raise HTTPError(400, "请求体必须是JSON对象")
+    return body
+
+
+async def _send(send, status: int, content_type: bytes, body: bytes):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _json(send, status: int, data: dict):
+    await _send(send, status, b"application/json; charset=utf-8", json.dumps(data, ensure_ascii=False).encode())
+
+
+# uvicorn按 "src.app.server.app:app" 在每个worker进程中导入，配置从环境变量读取
+app = ChatApp()
+
+
+if __name__ == '__main__':
+    print("app...")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--graphs", default=",".join(GRAPHS), help="逗号分隔的图名")
+    parser.add_argument("--data-dir", default="chat_server_data", help="检查点库和锁文件目录，所有worker共享")
+    parser.add_argument("--coalesce", action="store_true", help="同一会话排队中的invoke请求合并执行")
+    parser.add_argument("--max-queue", type=int, help="每个会话最多排队的请求数，超过返回429")
+    parser.add_argument("--fake-latency", help="使用假大模型和工具替身，值为延迟分布，如fixed:0.05")
+    parser.add_argument("--fake-token-latency", default="fixed:0.0", help="假模型流式输出的token间隔分布")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        raise SystemExit("需要安装uvicorn：pip install uvicorn")
+    if args.workers > 1 and not _multiprocess_locks():
+        raise SystemExit("当前平台不支持跨进程文件锁，请使用 --workers 1")
+
+    os.environ[ENV_GRAPHS] = args.graphs
+    os.environ[ENV_DATA_DIR] = os.path.abspath(args.data_dir)
+    if args.coalesce:
+        os.environ[ENV_COALESCE] = "1"
+    if args.max_queue:
+        os.environ[ENV_MAX_QUEUE] = str(args.max_queue)
+    if args.fake_latency:
+        os.environ[ENV_FAKE_LATENCY] = args.fake_latency
+        os.environ[ENV_FAKE_TOKEN_LATENCY] = args.fake_token_latency
+    uvicorn.run("src.app.server.app:app", host=args.host, port=args.port, workers=args.workers,
+                lifespan="on", log_level="warning")
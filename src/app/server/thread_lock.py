@@ -0,0 +1,112 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : thread_lock.py
+@time    : 2026/10/18 20:30
+@desc    : 按thread_id串行化请求：进程内用asyncio.Lock，多个worker进程之间用文件锁(fcntl.flock，按哈希分桶)，
+           同一会话的两个请求不会同时读到同一个父检查点而把历史分叉
+-----------------------------------------------------------------------
+"""
+import asyncio
+import hashlib
+import os
+import time
+from contextlib import asynccontextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows没有flock，只能单worker运行
+    fcntl = None
+
+
+class ThreadLocks:
+    """
+    async with locks.hold("thread_1"):
+        await graph.ainvoke(...)
+
+    lock_dir为None时只在进程内串行化；多worker部署时所有worker指向同一个目录
+    文件锁按哈希分成stripes个桶，不同会话落在同一个桶时也会互相等待，桶数要远大于并发数
+    """
+
+    def __init__(self, lock_dir: str = None, stripes: int = 1024, poll: float = 0.002, max_poll: float = 0.05):
+        if lock_dir and fcntl is None:
+            raise RuntimeError("当前平台不支持fcntl.flock，无法跨进程串行化，请只启动一个worker")
+        self.lock_dir = lock_dir
+        self.stripes = stripes
+        self.poll = poll
+        self.max_poll = max_poll
+        self._locks = {}  # key -> [asyncio.Lock, 引用数]
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        """
+        :return: 等待锁的秒数
+        """
+        start = time.perf_counter()
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                fd = await self._acquire_file(key) if self.lock_dir else None
+                try:
+                    yield time.perf_counter() - start
+                finally:
+                    if fd is not None:
+                        fcntl.flock(fd, fcntl.LOCK_UN)
+                        os.close(fd)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                self._locks.pop(key, None)
+
+    def _path(self, key: str) -> str:
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        return os.path.join(self.lock_dir, f"{int.from_bytes(digest, 'big') % self.stripes:04d}.lock")
+
+    async def _acquire_file(self, key: str) -> int:
+        """
+        非阻塞flock + 退避轮询，不占用事件循环；每次获取都重新打开文件，
+        flock按打开的文件描述区分持有者，同一进程内落在同一个桶的不同会话也能正确互斥
+        """
+        fd = os.open(self._path(key), os.O_RDWR | os.O_CREAT, 0o644)
+        delay = self.poll
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll)
+            except BaseException:
+                os.close(fd)
+                raise
+
+    def __len__(self):
+        return len(self._locks)
+
+
+if __name__ == '__main__':
+    print("thread_lock...")
+    import tempfile
+
+    async def main(lock_dir):
+        locks = ThreadLocks(lock_dir)
+        order = []
+
+        async def request(key, i):
+            async with locks.hold(key) as waited:
+                order.append((key, i, round(waited, 3)))
+                await asyncio.sleep(0.05)
+
+        start = time.perf_counter()
+        await asyncio.gather(*[request(f"thread_{i % 2}", i) for i in range(6)])
+        print(f"耗时 {time.perf_counter() - start:.2f}s(同一会话串行，两个会话并行，约0.15s)")
+        print(order)
+
+    with tempfile.TemporaryDirectory() as directory:
+        asyncio.run(main(directory if fcntl else None))
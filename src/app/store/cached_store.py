@@ -0,0 +1,152 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : cached_store.py
+@time    : 2026/10/18 18:40
+@desc    : 长期记忆读缓存：包装任意BaseStore，get走LRU/TTL缓存，put写穿透并失效缓存，缓存不存在的key
+-----------------------------------------------------------------------
+"""
+import threading
+from typing import Callable, Iterable, Optional
+
+from langgraph.store.base import BaseStore, GetOp, PutOp
+
+from src.app.store.sqlite_store import put_many
+from src.app.tools.CacheTools import TTLCache
+
+_MISSING = object()
+_NOT_FOUND = object()  # 负缓存：store中不存在该key
+
+
+def profile_only(namespace: tuple) -> bool:
+    """
+    只缓存用户档案这类很少变化的命名空间，例如 ("user_001", "profile")
+    """
+    return bool(namespace) and namespace[-1] == "profile"
+
+
+class CachedStore(BaseStore):
+    """
+    读穿透缓存：
+
+    store = CachedStore(IndexedSqliteStore(...), cacheable=profile_only)
+    store.get(("user_001", "profile"), "basic_info")  # 第一次读store，之后命中缓存
+
+    - get：先查缓存，未命中的合并成一次batch发给底层store，结果(包括不存在)写入缓存
+    - put/delete/put_many：先写底层store，再删除对应缓存(写穿透失效)
+    - search/list_namespaces：直接转发
+    只对本进程内的写入失效缓存，其他进程写入的数据最多延迟ttl秒可见；
+    命中缓存的get不会刷新底层store的TTL
+    """
+
+    def __init__(self, store: BaseStore, maxsize: int = 10000, ttl: float = 300.0, negative_ttl: float = 30.0,
+                 cacheable: Optional[Callable[[tuple], bool]] = None):
+        self.store = store
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.negative_ttl = negative_ttl
+        self.cacheable = cacheable or (lambda namespace: True)
+        self.hits = 0
+        self.negative_hits = 0  # 命中负缓存的次数(包含在hits中)
+        self.misses = 0
+        self.invalidations = 0
+        self._generation = 0  # 写入计数：加载期间有写入时不回填缓存，避免把旧值写回
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # setup/search_page/explain等底层store的只读扩展方法直接转发，写入方法必须在本类中覆盖
+        if name == "store":
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    def put_many(self, items, chunk_size: int = 2000) -> int:
+        """
+        批量写入经过本类的batch，同样失效缓存
+        """
+        return put_many(self, items, chunk_size)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.cache),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def batch(self, ops: Iterable):
+        ops = list(ops)
+        results, pending, generation = self._lookup(ops)
+        if pending:
+            for index, result in zip(pending, self.store.batch([ops[i] for i in pending])):
+                results[index] = result
+            self._after(ops, pending, results, generation)
+        return results
+
+    async def abatch(self, ops: Iterable):
+        ops = list(ops)
+        results, pending, generation = self._lookup(ops)
+        if pending:
+            for index, result in zip(pending, await self.store.abatch([ops[i] for i in pending])):
+                results[index] = result
+            self._after(ops, pending, results, generation)
+        return results
+
+    def _lookup(self, ops):
+        """
+        用缓存回答能回答的get，返回(结果列表, 需要发给底层store的op下标, 当前写入计数)
+        batch中包含写入时整批转发，保证同一批内先写后读的顺序语义
+        """
+        results = [None] * len(ops)
+        if any(isinstance(op, PutOp) for op in ops):
+            return results, list(range(len(ops))), self._generation
+        pending = []
+        for i, op in enumerate(ops):
+            if isinstance(op, GetOp) and self.cacheable(op.namespace):
+                value = self.cache.get((op.namespace, op.key), _MISSING)
+                if value is not _MISSING:
+                    with self._lock:
+                        self.hits += 1
+                        if value is _NOT_FOUND:
+                            self.negative_hits += 1
+                    results[i] = None if value is _NOT_FOUND else value
+                    continue
+                with self._lock:
+                    self.misses += 1
+            pending.append(i)
+        return results, pending, self._generation
+
+    def _after(self, ops, pending, results, generation):
+        writes = [ops[i] for i in pending if isinstance(ops[i], PutOp)]
+        with self._lock:  # 失效和回填互斥，回填时检查的写入计数不会在写缓存之前变化
+            if writes:
+                self._generation += 1
+                self.invalidations += len(writes)
+                for op in writes:
+                    self.cache.delete((op.namespace, op.key))
+                return
+            if generation != self._generation:
+                return  # 加载期间有写入，本次结果可能已过期，不回填
+            for i in pending:
+                op = ops[i]
+                if isinstance(op, GetOp) and self.cacheable(op.namespace):
+                    if results[i] is None:
+                        self.cache.set((op.namespace, op.key), _NOT_FOUND, ttl=self.negative_ttl)
+                    else:
+                        self.cache.set((op.namespace, op.key), results[i])
+
+
+if __name__ == '__main__':
+    print("cached_store...")
+    from langgraph.store.memory import InMemoryStore
+    store = CachedStore(InMemoryStore(), cacheable=profile_only)
+    for _ in range(3):
+        store.get(("user_001", "profile"), "basic_info")
+    store.put(("user_001", "profile"), "basic_info", {"name": "张三"})
+    print(store.get(("user_001", "profile"), "basic_info").value)
+    print(store.get(("user_001", "profile"), "basic_info").value)
+    print(store.stats())
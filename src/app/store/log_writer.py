@@ -0,0 +1,182 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : log_writer.py
+@time    : 2026/10/18 19:20
+@desc    : 只追加的会话日志：append立即返回，后台线程按条数/时间分批写入store，队列满时反压
+-----------------------------------------------------------------------
+"""
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from langgraph.store.base import PutOp
+
+
+class BatchedLogWriter:
+    """
+    log_writer = BatchedLogWriter(store)
+    seq = log_writer.append((user_id, "logs"), session_id, {"message_count": 3})
+    log_writer.flush()  # 需要立即读到日志时
+
+    - 每条日志一个key：log_{session_id}_{seq:08d}，不再覆盖上一条，完整保留历史
+    - seq为会话内递增序号；进程内第一次写某个会话时，从store中已有的日志恢复序号
+    - 后台线程攒够max_batch条或距第一条等待超过flush_interval秒时，用一次store.batch写入
+    - 队列上限max_pending：写入跟不上时append最多阻塞block_timeout秒，仍然满则丢弃并计数，
+      日志不会拖垮对话本身
+    """
+
+    def __init__(self, store, max_batch: int = 500, flush_interval: float = 0.2, max_pending: int = 10000,
+                 block_timeout: float = 1.0, recover_page: int = 1000):
+        self.store = store
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.block_timeout = block_timeout
+        self.recover_page = recover_page
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._seq = {}  # (namespace, session_id) -> 下一个序号
+        self._seq_lock = threading.Lock()
+        self._enqueued = 0
+        self._done = 0  # 已写入或写入失败的条数
+        self._cond = threading.Condition()  # 同时保护written/dropped/failed/batches等计数
+        self._stopped = False
+        self._writer = threading.Thread(target=self._writer_loop, name="log-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, namespace: tuple, session_id: str, entry: dict) -> int:
+        """
+        追加一条日志，返回会话内序号(丢弃时为-1)
+        """
+        if self._stopped:
+            raise RuntimeError("log writer已关闭")
+        seq = self._next_seq(tuple(namespace), session_id)
+        value = {
+            **entry,
+            "session_id": session_id,
+            "seq": seq,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        }
+        op = PutOp(tuple(namespace), f"log_{session_id}_{seq:08d}", value, index=False)
+        try:
+            self._queue.put(op, timeout=self.block_timeout)
+        except queue.Full:
+            with self._cond:
+                self.dropped += 1
+            return -1
+        with self._cond:
+            self._enqueued += 1
+        return seq
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        等待已append的日志全部写入
+        :return: 超时返回False
+        """
+        with self._cond:
+            target = self._enqueued
+            return self._cond.wait_for(lambda: self._done >= target, timeout)
+
+    def close(self, timeout: float = None):
+        """
+        写完队列中剩余的日志后停止后台线程
+        """
+        if self._stopped:
+            return
+        self.flush(timeout)
+        self._stopped = True
+        self._queue.put(None)
+        self._writer.join(timeout)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"pending": self._queue.qsize(), "written": self.written, "dropped": self.dropped,
+                    "failed": self.failed, "batches": self.batches}
+
+    def _next_seq(self, namespace: tuple, session_id: str) -> int:
+        key = (namespace, session_id)
+        with self._seq_lock:
+            seq = self._seq.get(key)
+            if seq is not None:
+                self._seq[key] = seq + 1
+                return seq
+        recovered = self._recover_seq(namespace, session_id)  # 不持锁查询，避免阻塞其他会话
+        with self._seq_lock:
+            seq = self._seq.setdefault(key, recovered)
+            self._seq[key] = seq + 1
+        return seq
+
+    def _recover_seq(self, namespace: tuple, session_id: str) -> int:
+        """
+        store中该会话最新一条日志的seq + 1，没有时从0开始
+        没有search_page的store按recover_page分页读完该会话的全部日志，search的结果顺序不保证按seq
+        """
+        filter = {"session_id": session_id}
+        if hasattr(self.store, "search_page"):
+            items, _ = self.store.search_page(namespace, filter=filter, limit=1)
+            return items[0].value.get("seq", -1) + 1 if items else 0
+        last, offset = -1, 0
+        while True:
+            items = self.store.search(namespace, filter=filter, limit=self.recover_page, offset=offset)
+            last = max([last] + [item.value.get("seq", -1) for item in items])
+            if len(items) < self.recover_page:
+                return last + 1
+            offset += len(items)
+
+    def _writer_loop(self):
+        while True:
+            op = self._queue.get()
+            if op is None:
+                return
+            batch = [op]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    op = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if op is None:
+                    stop = True
+                    break
+                batch.append(op)
+            self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        try:
+            self.store.batch(batch)
+            ok = True
+        except Exception as e:
+            ok = False
+            print(f"[日志] 批量写入失败，丢弃{len(batch)}条：{e!r}")
+        with self._cond:
+            if ok:
+                self.written += len(batch)
+                self.batches += 1
+            else:
+                self.failed += len(batch)
+            self._done += len(batch)
+            self._cond.notify_all()
+
+
+if __name__ == '__main__':
+    print("log_writer...")
+    from langgraph.store.memory import InMemoryStore
+    store = InMemoryStore()
+    writer = BatchedLogWriter(store, flush_interval=0.05)
+    for i in range(5):
+        writer.append(("user_001", "logs"), "conv_1", {"message_count": i * 2})
+    writer.flush()
+    print([(item.key, item.value["seq"]) for item in store.search(("user_001", "logs"))])
+    writer.close()
+    print(BatchedLogWriter(store).append(("user_001", "logs"), "conv_1", {}), writer.stats())
@@ -0,0 +1,620 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : semantic_store.py
+@time    : 2026/10/18 23:30
+@desc    : 长期记忆语义检索：包装任意BaseStore，按命名空间维护向量索引，search(query=...)返回按余弦相似度排序的记忆
+           - 嵌入函数可插拔，默认HashingEmbedder：中文按字n-gram、英文按单词做特征哈希，纯本地、无需模型
+           - 打分用NumPy一次矩阵乘完成整个命名空间；没有安装numpy时退化为纯Python逐条打分(不支持IVF)
+           - 大命名空间自动切换为IVF倒排索引：k-means聚类中心 + 只对最近的nprobe个簇打分
+           - put时增量更新索引，不需要重建
+-----------------------------------------------------------------------
+"""
+import asyncio
+import heapq
+import math
+import re
+import threading
+import zlib
+from operator import itemgetter, mul
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langgraph.store.base import BaseStore, GetOp, PutOp, SearchItem, SearchOp, _ensure_refresh, \
+    _validate_namespace_labels
+from langgraph.store.memory import _compare_values
+
+from src.app.store.sqlite_store import put_many
+
+try:
+    import numpy as np
+except ImportError:  # 没有安装numpy时用纯Python打分
+    np = None
+
+_TOKEN = re.compile(r"[a-z0-9]+|[^\W_]")  # 英文单词/数字串作为一个词，其他文字(中文)逐字
+
+
+def _normalize(vector):
+    """
+    L2归一化，之后点积即余弦相似度；零向量原样返回
+    """
+    if np is not None:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm > 0 else list(vector)
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class HashingEmbedder:
+    """
+    特征哈希向量：把文本切成字/词的n-gram，每个n-gram用crc32哈希到dims维中的一维(符号也由哈希决定)，
+    只能衡量字面上的相近程度，但完全本地、没有模型加载开销，适合作为默认实现或测试
+
+    embedder = HashingEmbedder(dims=256)
+    vectors = embedder(["退货政策", "运费规则"])  # numpy矩阵 (2, 256)，没有numpy时为列表
+    需要真正的语义向量时，换成任意 texts -> vectors 的函数(例如本地sentence-transformers模型的encode)
+    """
+
+    def __init__(self, dims: int = 256, ngrams: Sequence[int] = (1, 2)):
+        self.dims = dims
+        self.ngrams = tuple(ngrams)
+
+    def features(self, text: str) -> Dict[int, float]:
+        tokens = _TOKEN.findall(text.lower())
+        features = {}
+        for n in self.ngrams:
+            weight = float(n)  # 越长的n-gram越能区分内容
+            for i in range(len(tokens) - n + 1):
+                h = zlib.crc32("\x1f".join(tokens[i:i + n]).encode("utf-8"))
+                index = h % self.dims
+                features[index] = features.get(index, 0.0) + (weight if h & 0x80000000 else -weight)
+        return features
+
+    def __call__(self, texts: Sequence[str]):
+        if np is None:
+            vectors = []
+            for text in texts:
+                vector = [0.0] * self.dims
+                for index, value in self.features(text).items():
+                    vector[index] = value
+                vectors.append(vector)
+            return vectors
+        vectors = np.zeros((len(texts), self.dims), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self.features(text)
+            if features:
+                vectors[row, list(features)] = list(features.values())
+        return vectors
+
+
+class _Bucket:
+    """
+    一组向量及其key：numpy下是按倍数扩容的矩阵，删除时用最后一行填补空位(O(dims))
+    """
+
+    __slots__ = ("keys", "vectors")
+
+    def __init__(self, dims: int):
+        self.keys = []
+        self.vectors = np.empty((16, dims), dtype=np.float32) if np is not None else []
+
+    def _reserve(self, size: int):
+        if size > len(self.vectors):
+            grown = np.empty((max(size, len(self.vectors) * 2), self.vectors.shape[1]), dtype=np.float32)
+            grown[:len(self.keys)] = self.vectors[:len(self.keys)]
+            self.vectors = grown
+
+    def append(self, key, vector) -> int:
+        position = len(self.keys)
+        if np is None:
+            self.vectors.append(vector)
+        else:
+            self._reserve(position + 1)
+            self.vectors[position] = vector
+        self.keys.append(key)
+        return position
+
+    def extend(self, keys: list, matrix) -> int:
+        start = len(self.keys)
+        self._reserve(start + len(keys))
+        self.vectors[start:start + len(keys)] = matrix
+        self.keys.extend(keys)
+        return start
+
+    def pop(self, position: int):
+        """
+        删除position处的向量，返回被挪到position的key(没有挪动时为None)
+        """
+        last = len(self.keys) - 1
+        moved = None
+        if position != last:
+            moved = self.keys[position] = self.keys[last]
+            self.vectors[position] = self.vectors[last]
+        self.keys.pop()
+        if np is None:
+            self.vectors.pop()
+        return moved
+
+    def top(self, query, k: int) -> List[Tuple[float, str]]:
+        n = len(self.keys)
+        if not n:
+            return []
+        if np is None:
+            scores = [sum(map(mul, vector, query)) for vector in self.vectors]
+            return heapq.nlargest(k, zip(scores, self.keys), key=itemgetter(0))
+        scores = self.vectors[:n] @ query  # 整个桶一次矩阵乘
+        if n > k:
+            picked = np.argpartition(scores, n - k)[n - k:]
+        else:
+            picked = range(n)
+        keys = self.keys
+        return [(float(scores[i]), keys[i]) for i in picked]
+
+
+def _nearest(matrix, centroids, chunk: int = 65536):
+    """
+    每一行最近的聚类中心(向量已归一化，点积最大即最近)，分块计算控制临时矩阵的大小
+    """
+    assign = np.empty(len(matrix), dtype=np.int64)
+    for start in range(0, len(matrix), chunk):
+        assign[start:start + chunk] = np.argmax(matrix[start:start + chunk] @ centroids.T, axis=1)
+    return assign
+
+
+def _kmeans(matrix, nlist: int, rng, iterations: int = 10, sample_per_list: int = 64):
+    """
+    球面k-means：在抽样的至多nlist*sample_per_list行上训练nlist个聚类中心，空簇用随机样本重新初始化
+    """
+    if len(matrix) > nlist * sample_per_list:
+        matrix = matrix[np.sort(rng.choice(len(matrix), nlist * sample_per_list, replace=False))]
+    centroids = matrix[rng.choice(len(matrix), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(matrix, centroids)
+        order = np.argsort(assign, kind="stable")
+        lists, starts = np.unique(assign[order], return_index=True)
+        sums = np.add.reduceat(matrix[order], starts, axis=0)
+        centroids[lists] = _normalize_rows(sums)
+        empty = np.setdiff1d(np.arange(nlist), lists)
+        if len(empty):
+            centroids[empty] = matrix[rng.choice(len(matrix), len(empty), replace=False)]
+    return centroids
+
+
+class VectorIndex:
+    """
+    单个命名空间的向量索引：
+    - 少于ivf_threshold条时只有一个桶，查询对全部向量做一次矩阵乘(精确结果)
+    - 达到ivf_threshold后用k-means训练约sqrt(n)个聚类中心，每个簇一个桶；查询先给中心打分，
+      只对最近的nprobe个簇打分(近似结果，召回率随nprobe提高)
+    - add/remove都是增量的：新向量直接放进最近的簇；条数比上次训练时增长到4倍时重新训练
+    - 没有numpy时不做IVF
+    """
+
+    def __init__(self, dims: int, *, ivf_threshold: Optional[int] = 50000, nprobe: int = 8, seed: int = 0):
+        self.dims = dims
+        self.ivf_threshold = ivf_threshold if np is not None else None
+        self.nprobe = nprobe
+        self.buckets = [_Bucket(dims)]
+        self.centroids = None
+        self.locations = {}  # key -> (桶号, 桶内位置)
+        self.trained_size = 0
+        self.rng = np.random.default_rng(seed) if np is not None else None
+
+    def __len__(self) -> int:
+        return len(self.locations)
+
+    def __contains__(self, key) -> bool:
+        return key in self.locations
+
+    @property
+    def ivf(self) -> bool:
+        return self.centroids is not None
+
+    def add(self, key: str, vector):
+        vector = _normalize(vector)
+        self.remove(key)
+        bucket = 0 if self.centroids is None else int(np.argmax(self.centroids @ vector))
+        self.locations[key] = (bucket, self.buckets[bucket].append(key, vector))
+        self._maybe_train()
+
+    def add_many(self, keys: Sequence[str], vectors):
+        """
+        批量添加(加载命名空间时用)，同一批中重复的key以最后一个为准
+        """
+        if np is None:
+            for key, vector in zip(keys, vectors):
+                self.add(key, vector)
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        latest = {key: i for i, key in enumerate(keys)}
+        for key in latest:
+            self.remove(key)
+        if len(latest) < len(keys):
+            vectors = vectors[np.fromiter(latest.values(), dtype=np.int64, count=len(latest))]
+        self._place(list(latest), _normalize_rows(vectors))
+        self._maybe_train()
+
+    def _place(self, keys: list, matrix):
+        """
+        把已归一化、key不重复的向量按最近的聚类中心分到各个桶
+        """
+        if self.centroids is None:
+            first = self.buckets[0].extend(keys, matrix)
+            self.locations.update((key, (0, first + i)) for i, key in enumerate(keys))
+            return
+        assign = _nearest(matrix, self.centroids)
+        order = np.argsort(assign, kind="stable")
+        lists, starts = np.unique(assign[order], return_index=True)
+        ends = starts[1:].tolist() + [len(order)]
+        for bucket, start, end in zip(lists.tolist(), starts.tolist(), ends):
+            picked = order[start:end]
+            bucket_keys = [keys[i] for i in picked]
+            first = self.buckets[bucket].extend(bucket_keys, matrix[picked])
+            self.locations.update((key, (bucket, first + i)) for i, key in enumerate(bucket_keys))
+
+    def remove(self, key: str) -> bool:
+        location = self.locations.pop(key, None)
+        if location is None:
+            return False
+        bucket, position = location
+        moved = self.buckets[bucket].pop(position)
+        if moved is not None:
+            self.locations[moved] = (bucket, position)
+        return True
+
+    def _maybe_train(self):
+        size = len(self.locations)
+        if self.ivf_threshold and size >= self.ivf_threshold and size >= self.trained_size * 4:
+            self.rebuild()
+
+    def rebuild(self, nlist: Optional[int] = None):
+        """
+        按当前全部向量重新训练聚类中心并重新分桶；条数低于ivf_threshold(且没有指定nlist)时恢复为单桶
+        """
+        if np is None:
+            return
+        keys, parts = [], []
+        for bucket in self.buckets:
+            keys.extend(bucket.keys)
+            parts.append(bucket.vectors[:len(bucket.keys)])
+        matrix = np.concatenate(parts) if parts else np.empty((0, self.dims), dtype=np.float32)
+        del parts
+        if nlist is None and (not self.ivf_threshold or len(keys) < self.ivf_threshold):
+            nlist = 1
+        nlist = min(nlist or max(16, int(math.sqrt(len(keys)))), max(len(keys), 1))
+        self.buckets, self.locations = [], {}  # 先释放旧的桶，重建期间内存中只多一份向量
+        self.centroids = _kmeans(matrix, nlist, self.rng) if nlist > 1 else None
+        self.buckets = [_Bucket(self.dims) for _ in range(nlist)]
+        self.trained_size = len(keys) if nlist > 1 else 0
+        if keys:
+            self._place(keys, matrix)
+
+    def search(self, query, k: int = 10, nprobe: Optional[int] = None) -> List[Tuple[float, str]]:
+        """
+        :return: [(余弦相似度, key), ...]，按相似度从高到低
+        """
+        query = _normalize(query)
+        if self.centroids is None:
+            buckets = self.buckets
+        else:
+            probes = min(nprobe or self.nprobe, len(self.buckets))
+            scores = self.centroids @ query
+            buckets = [self.buckets[i] for i in np.argpartition(scores, len(scores) - probes)[-probes:]]
+        candidates = []
+        for bucket in buckets:
+            candidates.extend(bucket.top(query, k))
+        return heapq.nlargest(k, candidates, key=itemgetter(0))
+
+
+def _collect_text(value, parts: list):
+    if isinstance(value, str):
+        parts.append(value)
+    elif isinstance(value, dict):
+        for item in value.values():
+            _collect_text(item, parts)
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            _collect_text(item, parts)
+
+
+class SemanticStore(BaseStore):
+    """
+    语义检索：
+
+    store = SemanticStore(IndexedSqliteStore(...))
+    store.put(("user_001", "memories"), "m1", {"text": "喜欢用顺丰快递"})
+    store.search(("user_001",), query="发什么快递", limit=3)  # item.score为余弦相似度
+    store.search(("user_001",), query="发什么快递", limit=3, min_score=0.2)  # 不相关的记忆不返回
+
+    - put：先写底层store，再增量更新该命名空间的向量索引(value为None时删除)；
+      put(..., index=False)不进索引，index=["text"]只对这些字段编码，默认对fields编码("$"表示整个value中的全部字符串)
+    - search(query=...)：在前缀下所有命名空间的索引中取相似度最高的，再从底层store读出记录；
+      filter在召回之后过滤，不够时扩大召回数量重试；相似度低于min_score的不返回(构造参数为默认值，search可单独指定)，
+      limit只是上限，没有足够相关的记忆时返回的条数更少
+    - 索引在第一次查询某个前缀时从底层store加载，之后只靠本进程的put增量维护：
+      其他进程的写入、TTL过期不会反映到索引中(读出记录时发现已不存在会顺便从索引删除)；
+      多worker部署时(见server/app.py)每个worker的索引只包含加载时已有的记录和本worker之后put的记录，
+      其他worker新写入的记忆在本worker重启之前搜不到；
+      加载时无法知道当初put的index参数，按fields编码
+    - 其他op(get、不带query的search、list_namespaces)直接转发
+    """
+
+    def __init__(self, store: BaseStore, embed: Optional[Callable[[Sequence[str]], Sequence]] = None, *,
+                 fields: Sequence[str] = ("$",), indexed: Optional[Callable[[tuple], bool]] = None,
+                 ivf_threshold: Optional[int] = 50000, nprobe: int = 8, load_page: int = 1000,
+                 min_score: Optional[float] = None):
+        self.store = store
+        self.min_score = min_score
+        self.embed = embed or HashingEmbedder()
+        self.fields = tuple(fields)
+        self.indexed = indexed or (lambda namespace: True)
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+        self.load_page = load_page
+        self.indexes: Dict[tuple, VectorIndex] = {}
+        self._children: Dict[tuple, set] = {}  # 前缀 -> 该前缀下已建索引的命名空间
+        self._loaded = set()  # 已从底层store加载过的前缀
+        self.loads = 0
+        self.queries = 0
+        self.updates = 0
+        self._lock = threading.RLock()
+
+    def __getattr__(self, name):
+        # setup/search_page/explain等底层store的只读扩展方法直接转发，写入方法必须在本类中覆盖
+        if name == "store":
+            raise AttributeError(name)
+        return getattr(self.store, name)
+
+    def put_many(self, items, chunk_size: int = 2000) -> int:
+        """
+        批量写入经过本类的batch，同样更新已加载的索引
+        """
+        return put_many(self, items, chunk_size)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "namespaces": len(self.indexes),
+                "vectors": sum(len(index) for index in self.indexes.values()),
+                "ivf_namespaces": sum(index.ivf for index in self.indexes.values()),
+                "loaded_prefixes": len(self._loaded),
+                "loads": self.loads,
+                "queries": self.queries,
+                "updates": self.updates,
+            }
+
+    # ======================= 编码 =======================
+    def text_of(self, value: dict, fields: Optional[Sequence[str]] = None) -> str:
+        parts = []
+        for field in fields or self.fields:
+            if field == "$":
+                _collect_text(value, parts)
+                continue
+            current = value
+            for name in field.split("."):
+                current = current.get(name) if isinstance(current, dict) else None
+            _collect_text(current, parts)
+        return " ".join(parts)
+
+    def _embed(self, texts: List[str]):
+        if hasattr(self.embed, "embed_documents"):  # 也接受langchain的Embeddings对象
+            return self.embed.embed_documents(texts)
+        return self.embed(texts)
+
+    def _create(self, namespace: tuple, dims: int) -> VectorIndex:
+        index = self.indexes.get(namespace)
+        if index is None:
+            index = self.indexes[namespace] = VectorIndex(dims, ivf_threshold=self.ivf_threshold, nprobe=self.nprobe)
+            for i in range(len(namespace) + 1):
+                self._children.setdefault(namespace[:i], set()).add(namespace)
+        return index
+
+    # ======================= 增量更新 =======================
+    def _apply(self, puts: List[PutOp]):
+        """
+        底层store写入成功后更新索引：先在锁外编码，再在锁内一次性更新
+        """
+        removes, adds, texts = [], [], []
+        for op in puts:
+            if not self.indexed(op.namespace):
+                continue
+            text = self.text_of(op.value, op.index or None) if op.value is not None and op.index is not False else ""
+            if text:
+                adds.append(op)
+                texts.append(text)
+            else:
+                removes.append(op)
+        vectors = self._embed(texts) if texts else []
+        with self._lock:
+            for op in removes:
+                index = self.indexes.get(op.namespace)
+                if index is not None:
+                    index.remove(op.key)
+            for op, vector in zip(adds, vectors):
+                self._create(op.namespace, len(vector)).add(op.key, vector)
+            self.updates += len(removes) + len(adds)
+
+    # ======================= 加载 =======================
+    def _covered(self, prefix: tuple) -> bool:
+        return any(prefix[:i] in self._loaded for i in range(len(prefix) + 1))
+
+    def _ensure(self, prefix: tuple):
+        with self._lock:
+            if self._covered(prefix):
+                return
+            offset = 0
+            while True:
+                namespaces = self.store.list_namespaces(prefix=prefix, limit=self.load_page, offset=offset)
+                for namespace in namespaces:
+                    if self.indexed(namespace) and not self._covered(namespace):
+                        self._load(namespace)
+                if len(namespaces) < self.load_page:
+                    break
+                offset += self.load_page
+            self._loaded.add(prefix)
+            self.loads += 1
+
+    def _scan(self, namespace: tuple) -> Iterable:
+        if hasattr(self.store, "search_page"):  # IndexedSqliteStore：键集分页
+            cursor = None
+            while True:
+                items, cursor = self.store.search_page(namespace, limit=self.load_page, cursor=cursor)
+                yield from items
+                if cursor is None:
+                    return
+        offset = 0
+        while True:
+            items = self.store.search(namespace, limit=self.load_page, offset=offset)
+            yield from (item for item in items if item.namespace == namespace)
+            if len(items) < self.load_page:
+                return
+            offset += self.load_page
+
+    def _load(self, namespace: tuple):
+        keys, texts = [], []
+        for item in self._scan(namespace):
+            text = self.text_of(item.value)
+            if text:
+                keys.append(item.key)
+                texts.append(text)
+        if keys:
+            vectors = self._embed(texts)
+            self._create(namespace, len(vectors[0])).add_many(keys, vectors)
+
+    # ======================= 查询 =======================
+    def _rank(self, op: SearchOp, query, k: int) -> Tuple[list, bool]:
+        """
+        :return: ([(相似度, 命名空间, key), ...], 是否已经取完全部候选)
+        """
+        self._ensure(op.namespace_prefix)
+        with self._lock:
+            self.queries += 1
+            candidates, total = [], 0
+            for namespace in self._children.get(op.namespace_prefix, ()):
+                index = self.indexes[namespace]
+                total += len(index)
+                candidates.extend((score, namespace, key) for score, key in index.search(query, k))
+        ranked = heapq.nlargest(k, candidates, key=itemgetter(0))
+        return ranked, k >= total
+
+    def _gets(self, op: SearchOp, ranked: list) -> List[GetOp]:
+        return [GetOp(namespace, key, refresh_ttl=op.refresh_ttl) for _, namespace, key in ranked]
+
+    def _items(self, op: SearchOp, ranked: list, results: list) -> List[SearchItem]:
+        items, missing = [], []
+        for (score, namespace, key), item in zip(ranked, results):
+            if item is None:
+                missing.append((namespace, key))
+                continue
+            if op.filter and not all(_compare_values(item.value.get(field), expected)
+                                     for field, expected in op.filter.items()):
+                continue
+            items.append(SearchItem(item.namespace, item.key, item.value, item.created_at, item.updated_at,
+                                    score=score))
+        if missing:  # 其他进程删除或TTL过期的记录
+            with self._lock:
+                for namespace, key in missing:
+                    self.indexes[namespace].remove(key)
+        return items
+
+    @staticmethod
+    def _relevant(ranked: list, exhausted: bool, min_score: Optional[float]) -> Tuple[list, bool]:
+        """
+        去掉相似度低于min_score的候选；ranked已按相似度降序，一旦有候选被去掉，更大的召回数量也不会再有新的
+        """
+        if min_score is None:
+            return ranked, exhausted
+        relevant = [entry for entry in ranked if entry[0] >= min_score]
+        return relevant, exhausted or len(relevant) < len(ranked)
+
+    def search(self, namespace_prefix: tuple, /, *, query: Optional[str] = None, filter: Optional[dict] = None,
+               limit: int = 10, offset: int = 0, refresh_ttl: Optional[bool] = None,
+               min_score: Optional[float] = None) -> List[SearchItem]:
+        """
+        :param min_score: 相似度下限，None时用构造参数min_score
+        """
+        _validate_namespace_labels(namespace_prefix)
+        op = SearchOp(namespace_prefix, filter, limit, offset, query, _ensure_refresh(self.ttl_config, refresh_ttl))
+        return self.batch([op], min_score=min_score)[0]
+
+    async def asearch(self, namespace_prefix: tuple, /, *, query: Optional[str] = None,
+                      filter: Optional[dict] = None, limit: int = 10, offset: int = 0,
+                      refresh_ttl: Optional[bool] = None, min_score: Optional[float] = None) -> List[SearchItem]:
+        _validate_namespace_labels(namespace_prefix)
+        op = SearchOp(namespace_prefix, filter, limit, offset, query, _ensure_refresh(self.ttl_config, refresh_ttl))
+        return (await self.abatch([op], min_score=min_score))[0]
+
+    def _prepare(self, ops: list) -> Tuple[List[int], List[int]]:
+        queries = [i for i, op in enumerate(ops) if isinstance(op, SearchOp) and op.query]
+        forwarded = [i for i, op in enumerate(ops) if not (isinstance(op, SearchOp) and op.query)]
+        return queries, forwarded
+
+    def batch(self, ops: Iterable, min_score: Optional[float] = None):
+        ops = list(ops)
+        min_score = self.min_score if min_score is None else min_score
+        results = [None] * len(ops)
+        queries, forwarded = self._prepare(ops)
+        if forwarded:
+            for i, result in zip(forwarded, self.store.batch([ops[i] for i in forwarded])):
+                results[i] = result
+            self._apply([ops[i] for i in forwarded if isinstance(ops[i], PutOp)])
+        for i in queries:
+            op = ops[i]
+            query, want = self._embed([op.query])[0], op.offset + op.limit
+            k = want
+            while True:
+                ranked, exhausted = self._relevant(*self._rank(op, query, k), min_score)
+                items = self._items(op, ranked, self.store.batch(self._gets(op, ranked)))
+                if len(items) >= want or exhausted:
+                    break
+                k *= 4
+            results[i] = items[op.offset:want]
+        return results
+
+    async def abatch(self, ops: Iterable, min_score: Optional[float] = None):
+        ops = list(ops)
+        min_score = self.min_score if min_score is None else min_score
+        results = [None] * len(ops)
+        queries, forwarded = self._prepare(ops)
+        if forwarded:
+            for i, result in zip(forwarded, await self.store.abatch([ops[i] for i in forwarded])):
+                results[i] = result
+            self._apply([ops[i] for i in forwarded if isinstance(ops[i], PutOp)])
+        loop = asyncio.get_running_loop()
+        for i in queries:
+            op = ops[i]
+            query, want = self._embed([op.query])[0], op.offset + op.limit
+            k = want
+            while True:
+                # 第一次查询某个前缀时要同步读底层store加载索引，放到线程池里做
+                ranked, exhausted = self._relevant(*await loop.run_in_executor(None, self._rank, op, query, k),
+                                                   min_score)
+                items = self._items(op, ranked, await self.store.abatch(self._gets(op, ranked)))
+                if len(items) >= want or exhausted:
+                    break
+                k *= 4
+            results[i] = items[op.offset:want]
+        return results
+
+
+if __name__ == '__main__':
+    print("semantic_store...")
+    from langgraph.store.memory import InMemoryStore
+    store = SemanticStore(InMemoryStore())
+    store.put(("user_001", "memories"), "m1", {"text": "喜欢用顺丰快递，周末不方便收货"})
+    store.put(("user_001", "memories"), "m2", {"text": "上次退货时对运费有意见"})
+    store.put(("user_001", "profile"), "basic_info", {"name": "张三", "level": "VIP"})
+    for item in store.search(("user_001",), query="退货运费怎么算", limit=3):
+        print(round(item.score, 3), item.namespace, item.key, item.value)
+    print("min_score=0.1:", [item.key for item in store.search(("user_001",), query="退货运费怎么算", limit=3,
+                                                                min_score=0.1)])
+    print(store.stats())
@@ -0,0 +1,150 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : sqlite_store.py
+@time    : 2026/10/18 18:00
+@desc    : 持久化长期记忆：带命名空间+更新时间索引、value字段二级索引、键集分页和分批写入的SqliteStore
+-----------------------------------------------------------------------
+"""
+import re
+from contextlib import closing, contextmanager
+from typing import Iterable, List, Optional, Tuple
+
+from langgraph.store.base import Item, PutOp
+from langgraph.store.sqlite import SqliteStore
+from langgraph.store.sqlite.base import _namespace_to_text, _row_to_item
+
+from src.app.checkpoint.sqlite_saver import connect
+
+_FIELD_PATTERN = re.compile(r"^[A-Za-z0-9_]+$")
+_COLUMNS = ("prefix", "key", "value", "created_at", "updated_at", "expires_at", "ttl_minutes")
+
+
+def put_many(store, items: Iterable[Tuple[tuple, str, dict]], chunk_size: int = 2000) -> int:
+    """
+    按chunk_size分块调用store.batch写入[(namespace, key, value), ...]，包装store(缓存、语义索引)也用它，
+    写入经过包装层自己的batch
+    :return: 写入条数
+    """
+    ops, total = [], 0
+    for namespace, key, value in items:
+        ops.append(PutOp(tuple(namespace), key, value))
+        if len(ops) >= chunk_size:
+            store.batch(ops)
+            total += len(ops)
+            ops = []
+    if ops:
+        store.batch(ops)
+        total += len(ops)
+    return total
+
+
+class IndexedSqliteStore(SqliteStore):
+    """
+    在SqliteStore上增加：
+    1. (prefix, updated_at, key)索引：精确命名空间内按更新时间倒序的分页只读取一页的行
+    2. indexed_fields中每个value字段的表达式索引：filter={"session_id": ...}不再逐行解析JSON
+       (索引表达式与SqliteStore生成的 json_extract(value, '$.字段') 一致，search自动使用)
+    3. search_page：键集分页，翻到第N页的开销与N无关(offset分页需要跳过前面所有行)
+    4. put_many：大批量写入按SQLite参数上限分块，每块一个事务
+    """
+
+    def __init__(self, conn, *, indexed_fields: Iterable[str] = (), **kwargs):
+        super().__init__(conn, **kwargs)
+        self.indexed_fields = tuple(indexed_fields)
+        for field in self.indexed_fields:
+            if not _FIELD_PATTERN.match(field):
+                raise ValueError(f"不支持的索引字段名：{field}")
+
+    @classmethod
+    @contextmanager
+    def from_conn_string(cls, conn_string: str, pragmas: dict = None, **kwargs):
+        """
+        with IndexedSqliteStore.from_conn_string("store.sqlite", indexed_fields=("session_id",)) as store:
+            ...
+        """
+        with closing(connect(conn_string, pragmas)) as conn:
+            conn.isolation_level = None  # SqliteStore自己管理BEGIN/COMMIT
+            yield cls(conn, **kwargs)
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        with self.lock:
+            statements = ["CREATE INDEX IF NOT EXISTS store_prefix_updated_idx ON store (prefix, updated_at, key)"]
+            for field in self.indexed_fields:
+                statements.append(
+                    f"CREATE INDEX IF NOT EXISTS store_value_{field}_idx "
+                    f"ON store (json_extract(value, '$.{field}'), prefix)"
+                )
+            for statement in statements:
+                self.conn.execute(statement)
+            self.conn.execute("ANALYZE store")
+
+    def put_many(self, items: Iterable[Tuple[tuple, str, dict]], chunk_size: int = 2000) -> int:
+        """
+        批量写入[(namespace, key, value), ...]，value为None表示删除
+        SqliteStore把一批写入拼成一条多行INSERT，每行7个参数，按chunk_size分块避免超出参数上限
+        :return: 写入条数
+        """
+        return put_many(self, items, chunk_size)
+
+    def search_page(self, namespace: tuple, *, filter: dict = None, limit: int = 10,
+                    cursor: Optional[str] = None) -> Tuple[List[Item], Optional[str]]:
+        """
+        精确命名空间内按更新时间倒序分页：
+            items, cursor = store.search_page(("user_001", "logs"), filter={"session_id": "s1"})
+            items, cursor = store.search_page(("user_001", "logs"), cursor=cursor)  # 下一页
+        :return: (本页数据, 下一页游标；没有下一页时为None)
+        """
+        conditions, params = ["prefix = ?"], [_namespace_to_text(namespace)]
+        for key, value in (filter or {}).items():
+            operations = value.items() if isinstance(value, dict) else [("$eq", value)]
+            for op, operand in operations:
+                condition, condition_params = self._get_filter_condition(key, op, operand)
+                conditions.append(condition)
+                params.extend(condition_params)
+        if cursor:
+            updated_at, key = cursor.split("|", 1)
+            conditions.append("(updated_at, key) < (?, ?)")  # 行值比较，可以直接在索引上定位
+            params.extend([updated_at, key])
+        query = (f"SELECT {', '.join(_COLUMNS)} FROM store WHERE {' AND '.join(conditions)} "
+                 f"ORDER BY updated_at DESC, key DESC LIMIT ?")
+        params.append(limit + 1)
+
+        with self._cursor(transaction=False) as cur:
+            cur.execute(query, params)
+            rows = [dict(zip(_COLUMNS, row)) for row in cur.fetchall()]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = f"{rows[-1]['updated_at']}|{rows[-1]['key']}"
+        return [_row_to_item(tuple(namespace), row, loader=self._deserializer) for row in rows], next_cursor
+
+    def explain(self, query: str, params=()) -> List[str]:
+        """
+        查看查询计划，确认是否用上了索引
+        """
+        with self._cursor(transaction=False) as cur:
+            cur.execute(f"EXPLAIN QUERY PLAN {query}", params)
+            return [row[-1] for row in cur.fetchall()]
+
+
+if __name__ == '__main__':
+    print("sqlite_store...")
+    with IndexedSqliteStore.from_conn_string(":memory:", indexed_fields=("session_id",)) as store:
+        store.put_many((("user_001", "logs"), f"log_{i}", {"session_id": f"s{i % 3}", "n": i}) for i in range(25))
+        items, cursor = store.search_page(("user_001", "logs"), filter={"session_id": "s1"}, limit=3)
+        while True:
+            print([item.key for item in items])
+            if not cursor:
+                break
+            items, cursor = store.search_page(("user_001", "logs"), filter={"session_id": "s1"}, limit=3,
+                                              cursor=cursor)
+        print([item.key for item in store.search(("user_001",), filter={"session_id": "s2"}, limit=3)])
+        print(store.explain("SELECT key FROM store WHERE json_extract(value, '$.session_id') = ? "
+                            "AND (prefix = ? OR prefix GLOB ?)", ("s1", "user_001.logs", "user_001.logs.*")))
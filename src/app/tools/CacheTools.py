@@ -0,0 +1,173 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : CacheTools.py
+@time    : 2026/10/18 09:30
+@desc    : 缓存工具(TTL + LRU + 请求合并)
+-----------------------------------------------------------------------
+"""
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class _Flight:
+    """
+    进行中的同步加载：完成后event置位，等待方读取value或error
+    """
+
+    __slots__ = ("event", "value", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    带过期时间、容量上限(LRU淘汰)的线程安全缓存
+
+    get_or_load / aget_or_load 支持请求合并：同一个key并发未命中时只会调用一次loader，
+    其余调用方等待同一个结果(loader抛出的异常、不可缓存的结果也一并返回给本轮的等待方)
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._timer = timer
+        self._data = OrderedDict()  # key -> (expire_at, value)
+        self._lock = threading.Lock()
+        self._inflight = {}  # 同步请求合并：key -> _Flight
+        self._ainflight = {}  # 异步请求合并：(事件循环, key) -> 加载task
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._get_locked(key)
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._set_locked(key, value, ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
+
+    def get_or_load(self, key, loader, cacheable=lambda value: True):
+        """
+        读取缓存，未命中时调用loader加载(同一key的并发调用只加载一次)
+        :param key:
+        :param loader: 无参可调用对象
+        :param cacheable: 判断结果是否写入缓存(比如失败结果不缓存)
+        :return:
+        """
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                self.misses += 1
+                flight = self._inflight[key] = _Flight()
+
+        if not owner:
+            # 已有线程在加载：等待并直接使用它的结果(包括异常和不可缓存的结果)，与异步路径一致
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            value = loader()
+            if cacheable(value):
+                self.set(key, value)
+            flight.value = value
+            return value
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+
+    async def aget_or_load(self, key, loader, cacheable=lambda value: True):
+        """
+        get_or_load的异步版本，loader为无参协程函数
+        每个事件循环各自合并(future不能跨循环等待)；加载在单独的task中执行，
+        任何一个调用方(包括发起加载的)被取消都不影响其他等待方
+        :param key:
+        :param loader:
+        :param cacheable:
+        :return:
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            value = self._get_locked(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            task = self._ainflight.get((loop, key))
+            if task is None:
+                self.misses += 1
+                task = self._ainflight[(loop, key)] = loop.create_task(self._aload(loop, key, loader, cacheable))
+                task.add_done_callback(lambda t: t.cancelled() or t.exception())  # 无人等待时不告警
+        return await asyncio.shield(task)
+
+    async def _aload(self, loop, key, loader, cacheable):
+        try:
+            value = await loader()
+            if cacheable(value):
+                self.set(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._ainflight.pop((loop, key), None)
+
+    def _get_locked(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return _MISSING
+        expire_at, value = item
+        if expire_at <= self._timer():
+            del self._data[key]
+            return _MISSING
+        self._data.move_to_end(key)
+        return value
+
+    def _set_locked(self, key, value, ttl: float = None):
+        expire_at = self._timer() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expire_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+if __name__ == '__main__':
+    print("CacheTools...")
+    cache = TTLCache(maxsize=2, ttl=1)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 3)
+    print(cache.get("a"), cache.get("b"), cache.get("c"))
@@ -9,10 +9,18 @@
 @desc    : 通用工具
 -----------------------------------------------------------------------
 """
+import asyncio
 import os
+import threading
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 from pydantic import BaseModel, Field
-from langchain_core.tools import tool
+from langchain_core.tools import StructuredTool
+
+from src.app.tools.CacheTools import TTLCache
+
+WEATHER_API_URL = "https://api.openweathermap.org/data/2.5/weather"
 
 class WeatherInput(BaseModel):
     """
@@ -20,31 +28,157 @@ class WeatherInput(BaseModel):
     """
     location:str= Field(description="城市名称，如Beijing、Shanghai、ChangSha")
 
-@tool(args_schema=WeatherInput)
-def get_weather(location:str) :
+class WeatherClient:
+    """
+    天气查询客户端：复用连接池(同步requests / 异步httpx)，并按城市做TTL缓存和请求合并
+    """
+
+    def __init__(self, url: str = WEATHER_API_URL, timeout: tuple = (3.05, 10),
+                 pool_maxsize: int = 32, cache_ttl: float = 600, cache_maxsize: int = 1024):
+        self.url = url
+        self.timeout = timeout  # (连接超时, 读取超时)，避免请求无限挂起
+        self.pool_maxsize = pool_maxsize
+        self.cache = TTLCache(maxsize=cache_maxsize, ttl=cache_ttl)
+
+        # 同步连接池，keep-alive复用TCP/TLS连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        # 异步连接池绑定事件循环，每个事件循环首次使用时创建一个(多个线程可以各自运行事件循环)
+        self._aclients = {}  # 事件循环 -> httpx.AsyncClient
+        self._aclients_lock = threading.Lock()
+
+    def _params(self, location: str) -> dict:
+        return {
+            "q": location,
+            "appid": os.getenv("OPENWEATHERMAP_API_KEY"),  # 需要去openweathermap.org注册
+            "units": "metric",
+            "lang": "zh_cn"
+        }
+
+    @staticmethod
+    def _cache_key(location: str) -> str:
+        return location.strip().lower()
+
+    @staticmethod
+    def _format(location: str, status_code: int, data: dict):
+        """
+        格式化接口返回
+        :return: (是否成功, 文本结果)
+        """
+        if status_code == 200:
+            weather = data["weather"][0]["description"]
+            temp = data["main"]["temp"]
+            return True, f"{location}当前天气：{weather}，温度：{temp}°C"
+        return False, f"查询失败：{data.get('message', '未知错误')}"
+
+    def _request(self, location: str):
+        try:
+            response = self.session.get(self.url, params=self._params(location), timeout=self.timeout)
+            return self._format(location, response.status_code, response.json())
+        except Exception as e:
+            return False, f"查询出错：{str(e)}"
+
+    async def _arequest(self, location: str):
+        try:
+            response = await self._get_aclient().get(self.url, params=self._params(location))
+            return self._format(location, response.status_code, response.json())
+        except Exception as e:
+            return False, f"查询出错：{str(e)}"
+
+    def _get_aclient(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        with self._aclients_lock:
+            client = self._aclients.get(loop)
+            if client is not None:
+                return client
+            stale = [old for old in self._aclients if not old.is_running()]
+            for old in stale:
+                self._close_stale(self._aclients.pop(old))
+            connect, read = self.timeout
+            client = self._aclients[loop] = httpx.AsyncClient(
+                timeout=httpx.Timeout(read, connect=connect),
+                limits=httpx.Limits(max_connections=self.pool_maxsize,
+                                    max_keepalive_connections=self.pool_maxsize),
+            )
+            return client
+
+    @staticmethod
+    def _close_stale(client: httpx.AsyncClient):
+        """
+        事件循环已经结束(例如上一次asyncio.run)的客户端，在当前循环中关闭，释放其连接池中的socket；
+        仍在其他线程运行的循环继续使用自己的客户端
+        """
+        task = asyncio.get_running_loop().create_task(client.aclose())
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())  # 旧连接已不可用，关闭失败不影响新请求
+
+    def get_weather(self, location: str) -> str:
+        """
+        查询天气(同步)，只缓存成功结果
+        :param location:
+        :return:
+        """
+        _, text = self.cache.get_or_load(
+            self._cache_key(location),
+            lambda: self._request(location),
+            cacheable=lambda result: result[0],
+        )
+        return text
+
+    async def aget_weather(self, location: str) -> str:
+        """
+        查询天气(异步)，只缓存成功结果
+        :param location:
+        :return:
+        """
+        _, text = await self.cache.aget_or_load(
+            self._cache_key(location),
+            lambda: self._arequest(location),
+            cacheable=lambda result: result[0],
+        )
+        return text
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        """
+        关闭当前事件循环的异步客户端
+        """
+        with self._aclients_lock:
+            client = self._aclients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+# 进程内共享的天气客户端
+weather_client = WeatherClient()
+
+def _get_weather(location:str) :
     """
     查询指定城市的当前天气
     :param location:
     :return:
     """
-    url = "https://api.openweathermap.org/data/2.5/weather"
-    params = {
-        "q": location,
-        "appid": os.getenv("OPENWEATHERMAP_API_KEY"),  # 需要去openweathermap.org注册
-        "units": "metric",
-        "lang": "zh_cn"
-    }
+    return weather_client.get_weather(location)
 
-    try:
-        response = requests.get(url, params=params)
-        data = response.json()
+async def _aget_weather(location:str) :
+    """
+    查询指定城市的当前天气(异步)
+    :param location:
+    :return:
+    """
+    return await weather_client.aget_weather(location)
 
-        if response.status_code == 200:
-            weather = data["weather"][0]["description"]
-            temp = data["main"]["temp"]
-            return f"{location}当前天气：{weather}，温度：{temp}°C"
-        else:
-            return f"查询失败：{data.get('message', '未知错误')}"
-    except Exception as e:
-        return f"查询出错：{str(e)}"
+get_weather = StructuredTool.from_function(
+    func=_get_weather,
+    coroutine=_aget_weather,
+    name="get_weather",
+    description="查询指定城市的当前天气",
+    args_schema=WeatherInput,
+)
 
+if __name__ == '__main__':
+    print("CommonTools...")
+    print(get_weather.invoke({"location": "Beijing"}))
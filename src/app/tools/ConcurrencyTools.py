@@ -0,0 +1,217 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : ConcurrencyTools.py
+@time    : 2026/10/18 19:50
+@desc    : 工具调用保护：按工具限制并发、单次调用超时、失败重试(指数退避+抖动)，
+           通过ToolNode的wrap_tool_call/awrap_tool_call接入，同一轮的多个工具调用由ToolNode并行执行
+-----------------------------------------------------------------------
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from contextlib import nullcontext
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from langchain_core.messages import ToolMessage
+
+
+class ToolTimeoutError(TimeoutError):
+    pass
+
+
+@dataclass(frozen=True)
+class ToolPolicy:
+    max_concurrency: Optional[int] = None  # 同一个工具同时执行的调用数上限，None不限制
+    timeout: Optional[float] = None  # 单次调用超时(秒)，None不限制
+    retries: int = 0  # 失败后的重试次数，有副作用的工具保持0
+    backoff: float = 0.2  # 第n次重试前等待 backoff * 2**(n-1) 秒(乘以0.5~1的随机抖动)
+    max_backoff: float = 5.0
+    retry_on: tuple = (Exception,)  # 哪些异常需要重试，其他异常直接抛给ToolNode处理
+
+
+class ToolGuard:
+    """
+    用法：
+        guard = ToolGuard({"get_weather": ToolPolicy(max_concurrency=8, timeout=10, retries=2)})
+        ToolNode(tools, wrap_tool_call=guard.wrap, awrap_tool_call=guard.awrap)
+
+    - 同步路径：超时通过把调用放到线程池执行实现，超时后调用方立即返回，
+      底层调用仍占着并发名额直到真正结束，挂起的工具不会无限占用新线程
+    - 异步路径：asyncio.wait_for，超时会取消调用
+    - 等待并发名额的时间也计入timeout：名额被挂起的调用占满时，后来的调用按超时失败，不会一直排队
+    - 重试用完仍然失败时返回status="error"的ToolMessage，大模型可以据此回复用户，整轮对话不会失败
+    """
+
+    def __init__(self, policies: Dict[str, ToolPolicy] = None, default: ToolPolicy = ToolPolicy(),
+                 max_workers: int = 32):
+        self.policies = dict(policies or {})
+        self.default = default
+        self.max_workers = max_workers  # 同步路径下带超时的调用所用线程池的大小
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._asemaphores = weakref.WeakKeyDictionary()  # 事件循环 -> {工具名: asyncio.Semaphore}
+        self._pool = None
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def policy(self, name: str) -> ToolPolicy:
+        return self.policies.get(name, self.default)
+
+    # ======================= 同步 =======================
+    def wrap(self, request, execute):
+        name = request.tool_call["name"]
+        policy = self.policy(name)
+        error = None
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                self._count(name, "retries")
+                time.sleep(self._delay(policy, attempt))
+            try:
+                self._count(name, "calls")
+                return self._call(name, policy, request, execute)
+            except policy.retry_on as e:
+                error = e
+        return self._failed(request, name, error)
+
+    def _call(self, name: str, policy: ToolPolicy, request, execute):
+        semaphore = self._semaphore(name, policy)
+        if policy.timeout is None:
+            with semaphore or nullcontext():
+                return execute(request)
+
+        deadline = time.monotonic() + policy.timeout
+        if semaphore and not semaphore.acquire(timeout=policy.timeout):
+            self._count(name, "timeouts")
+            raise ToolTimeoutError(f"工具 {name} 等待并发名额超过 {policy.timeout} 秒")
+        try:
+            future = self._executor().submit(contextvars.copy_context().run, execute, request)
+        except BaseException:
+            if semaphore:
+                semaphore.release()
+            raise
+        if semaphore:
+            future.add_done_callback(lambda _: semaphore.release())
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeoutError:
+            self._count(name, "timeouts")
+            raise ToolTimeoutError(f"工具 {name} 超过 {policy.timeout} 秒未返回")
+
+    def _semaphore(self, name: str, policy: ToolPolicy):
+        if not policy.max_concurrency:
+            return None
+        semaphore = self._semaphores.get(name)
+        if semaphore is None:
+            with self._lock:
+                semaphore = self._semaphores.setdefault(name, threading.BoundedSemaphore(policy.max_concurrency))
+        return semaphore
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="tool-guard")
+        return self._pool
+
+    # ======================= 异步 =======================
+    async def awrap(self, request, execute):
+        name = request.tool_call["name"]
+        policy = self.policy(name)
+        error = None
+        for attempt in range(policy.retries + 1):
+            if attempt:
+                self._count(name, "retries")
+                await asyncio.sleep(self._delay(policy, attempt))
+            try:
+                self._count(name, "calls")
+                return await self._acall(name, policy, request, execute)
+            except policy.retry_on as e:
+                error = e
+        return self._failed(request, name, error)
+
+    async def _acall(self, name: str, policy: ToolPolicy, request, execute):
+        if policy.timeout is None:
+            return await self._arun(name, policy, request, execute)
+        try:
+            # 等待并发名额和执行共用一个超时
+            return await asyncio.wait_for(self._arun(name, policy, request, execute), policy.timeout)
+        except asyncio.TimeoutError:
+            self._count(name, "timeouts")
+            raise ToolTimeoutError(f"工具 {name} 超过 {policy.timeout} 秒未返回")
+
+    async def _arun(self, name: str, policy: ToolPolicy, request, execute):
+        async with self._asemaphore(name, policy) or nullcontext():
+            return await execute(request)
+
+    def _asemaphore(self, name: str, policy: ToolPolicy):
+        """
+        asyncio.Semaphore绑定在创建它的事件循环上，每个事件循环各用一组
+        """
+        if not policy.max_concurrency:
+            return None
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphores = self._asemaphores.setdefault(loop, {})
+            return semaphores.setdefault(name, asyncio.Semaphore(policy.max_concurrency))
+
+    # ======================= 公共 =======================
+    @staticmethod
+    def _delay(policy: ToolPolicy, attempt: int) -> float:
+        return min(policy.max_backoff, policy.backoff * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+
+    def _failed(self, request, name: str, error: Exception) -> ToolMessage:
+        self._count(name, "failures")
+        return ToolMessage(
+            content=f"工具 {name} 调用失败：{type(error).__name__}: {error}",
+            name=name,
+            tool_call_id=request.tool_call["id"],
+            status="error",
+        )
+
+    def _count(self, name: str, key: str):
+        with self._lock:
+            stats = self._stats.setdefault(name, {"calls": 0, "retries": 0, "timeouts": 0, "failures": 0})
+            stats[key] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+if __name__ == '__main__':
+    print("ConcurrencyTools...")
+    from langchain_core.messages import AIMessage
+    from langchain_core.tools import tool
+    from langgraph.graph import StateGraph, START, END, MessagesState
+    from langgraph.prebuilt import ToolNode
+
+    @tool
+    def slow_echo(text: str) -> str:
+        """慢速回显"""
+        time.sleep(2.0 if text == "hang" else 0.1)
+        return text
+
+    guard = ToolGuard({"slow_echo": ToolPolicy(max_concurrency=2, timeout=0.5, retries=1, backoff=0.05)})
+    builder = StateGraph(MessagesState)
+    builder.add_node("tools", ToolNode([slow_echo], wrap_tool_call=guard.wrap, awrap_tool_call=guard.awrap))
+    builder.add_edge(START, "tools")
+    builder.add_edge("tools", END)
+    calls = [{"name": "slow_echo", "args": {"text": t}, "id": f"call_{i}"} for i, t in enumerate(["a", "b", "c", "hang"])]
+    start = time.perf_counter()
+    result = builder.compile().invoke({"messages": [AIMessage("", tool_calls=calls)]})
+    print(f"耗时 {time.perf_counter() - start:.2f}s")
+    for message in result["messages"][1:]:
+        print(f"  {message.status}: {message.content}")
+    print(guard.stats())
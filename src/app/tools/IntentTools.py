@@ -0,0 +1,149 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : IntentTools.py
+@time    : 2026/10/18 16:50
+@desc    : 意图识别工具(字典树多关键词匹配 + 加权打分)
+-----------------------------------------------------------------------
+"""
+import re
+from typing import Dict, Iterable, List
+
+_END = ""  # 字典树中标记关键词结束的键
+
+
+class KeywordMatcher:
+    """
+    多关键词匹配器(Aho-Corasick风格)：一次扫描文本找出所有命中的关键词，包括相互重叠、互为前缀的关键词
+
+    关键词先建成字典树，再把字典树编译成一个正则，例如 订单|订单号|快递 -> (?=(订单(?:号)?|快递))，
+    由正则引擎(C实现)在每个位置沿字典树走一次，得到从该位置开始的最长关键词，
+    从同一位置开始的较短关键词都是它的前缀，预先算好即可，不用在Python里逐字符循环
+    """
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = list(patterns)
+        trie = {}
+        for pattern in self.patterns:
+            if not pattern:
+                raise ValueError("关键词不能为空")
+            node = trie
+            for ch in pattern:
+                node = node.setdefault(ch, {})
+            node[_END] = True
+        index = {pattern: i for i, pattern in enumerate(self.patterns)}
+        # 最长匹配 -> 从同一位置开始命中的全部关键词下标
+        self._prefixes = {
+            pattern: tuple(index[pattern[:n]] for n in range(1, len(pattern) + 1) if pattern[:n] in index)
+            for pattern in index
+        }
+        self._regex = re.compile(f"(?=({_trie_pattern(trie)}))") if self.patterns else None
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def matches(self, text: str) -> set:
+        """
+        返回文本中命中的关键词下标集合
+        """
+        hits = set()
+        if self._regex is None:
+            return hits
+        prefixes = self._prefixes
+        for found in self._regex.findall(text):
+            hits.update(prefixes[found])
+        return hits
+
+
+def _trie_pattern(node: dict) -> str:
+    branches = [re.escape(ch) + _trie_pattern(child) for ch, child in sorted(node.items()) if ch != _END]
+    if not branches:
+        return ""
+    body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    return f"(?:{body})?" if _END in node else body
+
+
+class IntentClassifier:
+    """
+    加权关键词意图分类器，在构建图时创建一次：
+
+    classifier = IntentClassifier({"订单查询": {"订单": 1.0, "快递": 1.0}, "退款申请": {"退款": 1.0}})
+    classifier.classify("我想查订单")  # -> "订单查询"
+
+    每个命中的关键词(重复出现只算一次)给对应意图加上权重，取得分最高的意图；
+    同分时按rules中意图的先后顺序，没有命中返回default
+    """
+
+    def __init__(self, rules: Dict[str, Dict[str, float]], default: str = "一般咨询", ignore_case: bool = True):
+        self.default = default
+        self.ignore_case = ignore_case
+        self.intents = list(rules)
+        keywords, self._targets = [], []  # 关键词下标 -> [(意图下标, 权重)]
+        seen = {}
+        for intent_index, intent in enumerate(self.intents):
+            for keyword, weight in rules[intent].items():
+                key = keyword.lower() if ignore_case else keyword
+                if key not in seen:
+                    seen[key] = len(keywords)
+                    keywords.append(key)
+                    self._targets.append([])
+                self._targets[seen[key]].append((intent_index, weight))
+        self.matcher = KeywordMatcher(keywords)
+        # 只命中一个关键词是最常见的情况，预先算好结果
+        self._single = [self._best_of(self._score((k,))) for k in range(len(keywords))]
+
+    def scores(self, text: str) -> Dict[str, float]:
+        totals = self._score(self.matcher.matches(text.lower() if self.ignore_case else text))
+        return {self.intents[i]: score for i, score in totals.items()}
+
+    def _score(self, hits) -> dict:
+        totals = {}
+        for keyword in hits:
+            for intent_index, weight in self._targets[keyword]:
+                totals[intent_index] = totals.get(intent_index, 0.0) + weight
+        return totals
+
+    def _best_of(self, totals: dict) -> str:
+        if not totals:
+            return self.default
+        best = max(totals, key=lambda i: (totals[i], -i))
+        return self.intents[best] if totals[best] > 0 else self.default
+
+    def _best(self, hits) -> str:
+        if not hits:
+            return self.default
+        if len(hits) == 1:
+            return self._single[next(iter(hits))]
+        return self._best_of(self._score(hits))
+
+    def classify(self, text: str) -> str:
+        return self._best(self.matcher.matches(text.lower() if self.ignore_case else text))
+
+    def classify_batch(self, texts: Iterable[str]) -> List[str]:
+        """
+        逐条调用classify的便捷方法，相同文本只算一次；不是向量化接口，文本各不相同时每条耗时与classify相同，
+        只有离线回放/批量标注这类重复文本多的场景才更快
+        """
+        matches, best, ignore_case = self.matcher.matches, self._best, self.ignore_case
+        cache = {}
+        results = []
+        for text in texts:
+            intent = cache.get(text)
+            if intent is None:
+                intent = cache[text] = best(matches(text.lower() if ignore_case else text))
+            results.append(intent)
+        return results
+
+
+if __name__ == '__main__':
+    print("IntentTools...")
+    classifier = IntentClassifier({
+        "订单查询": {"订单": 1.0, "快递": 1.0},
+        "退款申请": {"退款": 1.0, "退货": 1.0},
+    })
+    for text in ["我想查订单 ORD-001", "我要退货退款", "你好"]:
+        print(text, classifier.classify(text), classifier.scores(text))
+    print(classifier.classify_batch(["快递到哪了", "退款", "快递到哪了"]))
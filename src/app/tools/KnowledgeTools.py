@@ -0,0 +1,303 @@
+# -*- coding:utf-8 -*-
+
+"""
+***********************************************************************
+
+@author  : yangguangyuan
+@file    : KnowledgeTools.py
+@time    : 2026/10/18 23:50
+@desc    : 知识库检索工具：BM25倒排索引，中文按字n-gram切词，离线构建成一个文件，各worker用mmap直接打开
+-----------------------------------------------------------------------
+"""
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # 没有安装numpy时用纯Python累加得分
+    np = None
+
+_RUN = re.compile(r"[a-z0-9]+|[^\W\d_a-z]+")  # 英文单词/数字串，或连续的中文等其他文字
+_MAGIC = b"KBBM25\x00\x01"
+# magic, 文档数, 词项数, 哈希表大小, n-gram掩码, 字节序(1小端/2大端), 保留, k1, b, 平均文档长度, 8个区段的(偏移, 字节数)
+_HEADER = struct.Struct("<8s6I3d16Q")
+_SECTIONS = ("slots", "term_offsets", "terms", "posting_offsets", "posting_docs", "posting_weights",
+             "doc_offsets", "docs")
+
+
+def tokenize(text: str, ngrams: Sequence[int] = (1, 2)) -> List[str]:
+    """
+    英文单词、数字串整体作为一个词；连续的中文切成字n-gram，默认单字+二元组，例如 "退货政策" ->
+    退 货 政 策 退货 货政 政策；n-gram不跨越标点、空格和英文
+    """
+    tokens = []
+    for run in _RUN.findall(text.lower()):
+        if run[0] < "\x80":  # 英文、数字
+            tokens.append(run)
+            continue
+        for n in ngrams:
+            tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
+    return tokens
+
+
+def _hash(term: bytes) -> int:
+    return zlib.crc32(term)
+
+
+def _align(size: int) -> int:
+    return (size + 7) & ~7
+
+
+class BM25Index:
+    """
+    BM25Index.build(docs, "kb.bm25")  # 离线构建一次，docs为dict的序列，例如 {"title": ..., "content": ...}
+    index = BM25Index("kb.bm25")       # worker启动时打开：只读取文件头，数据按需由操作系统分页加载，多进程共享页缓存
+    index.search("退货运费怎么算", k=3)  # [(得分, 文档dict), ...]
+
+    文件格式(小端，各区段8字节对齐)：
+    - slots：开放寻址哈希表(crc32，线性探测)，值为词项号+1，0表示空
+    - term_offsets/terms：词项的utf-8字节
+    - posting_offsets/posting_docs/posting_weights：每个词项的倒排表(文档号 + 预先算好的BM25得分贡献)
+    - doc_offsets/docs：文档的JSON
+    BM25的k1、b和文档长度在构建时已经计入posting_weights，查询时只需把各词项的贡献按文档累加
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _HEADER.unpack_from(self._mmap, 0)
+        if header[0] != _MAGIC:
+            self._mmap.close()
+            raise ValueError(f"不是BM25索引文件：{path}")
+        (self.n_docs, self.n_terms, self.table_size, mask, order, _), header = header[1:7], header[7:]
+        if order != (1 if sys.byteorder == "little" else 2):
+            self._mmap.close()
+            raise ValueError("索引文件的字节序与本机不同，需要在本机重新构建")
+        self.ngrams = tuple(n for n in range(1, 33) if mask & (1 << (n - 1)))
+        self.k1, self.b, self.avgdl = header[:3]
+        sections = dict(zip(_SECTIONS, zip(header[3::2], header[4::2])))
+        self._buffer = memoryview(self._mmap)
+        self._views = {}
+        for name, fmt in (("slots", "I"), ("term_offsets", "Q"), ("posting_offsets", "Q"), ("posting_docs", "I"),
+                          ("posting_weights", "f"), ("doc_offsets", "Q")):
+            offset, size = sections[name]
+            self._views[name] = self._buffer[offset:offset + size].cast(fmt)
+        self._terms_at = sections["terms"][0]
+        self._docs_at = sections["docs"][0]
+        self._arrays = None
+        if np is not None:
+            self._arrays = tuple(np.frombuffer(self._mmap, dtype=dtype, count=sections[name][1] // 4,
+                                               offset=sections[name][0])
+                                 for name, dtype in (("posting_docs", np.uint32), ("posting_weights", np.float32)))
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """
+        释放所有指向mmap的视图后再关闭
+        """
+        if self._mmap.closed:
+            return
+        self._arrays = None
+        for view in self._views.values():
+            view.release()
+        self._buffer.release()
+        self._mmap.close()
+
+    def stats(self) -> dict:
+        return {
+            "docs": self.n_docs,
+            "terms": self.n_terms,
+            "postings": self._views["posting_offsets"][self.n_terms],
+            "bytes": len(self._mmap),
+            "avgdl": round(self.avgdl, 1),
+        }
+
+    # ======================= 构建 =======================
+    @classmethod
+    def build(cls, docs: Iterable[dict], path: str, *, fields: Sequence[str] = ("title", "content"),
+              k1: float = 1.2, b: float = 0.75, ngrams: Sequence[int] = (1, 2)) -> "BM25Index":
+        """
+        构建索引并写入path：先写临时文件再原子替换，正在使用旧文件的worker不受影响，重新打开即可读到新索引
+        :param docs: 文档dict的序列，fields中的字段拼接后建索引，整个dict原样保存用于返回
+        :return: 打开的新索引
+        """
+        terms: Dict[str, int] = {}
+        posting_docs, posting_tfs = [], []
+        lengths, doc_offsets, blobs, position = array("I"), array("Q", [0]), [], 0
+        for doc_id, doc in enumerate(docs):
+            text = " ".join(str(doc.get(field) or "") for field in fields)
+            counts = Counter(tokenize(text, ngrams))
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                term_id = terms.get(term)
+                if term_id is None:
+                    term_id = terms[term] = len(posting_docs)
+                    posting_docs.append(array("I"))
+                    posting_tfs.append(array("I"))
+                posting_docs[term_id].append(doc_id)
+                posting_tfs[term_id].append(tf)
+            blob = json.dumps(doc, ensure_ascii=False).encode("utf-8")
+            blobs.append(blob)
+            position += len(blob)
+            doc_offsets.append(position)
+
+        n_docs = len(lengths)
+        avgdl = sum(lengths) / n_docs if n_docs else 0.0
+        posting_offsets, total = array("Q", [0]), 0
+        for docs_of_term in posting_docs:
+            total += len(docs_of_term)
+            posting_offsets.append(total)
+        all_docs = array("I")
+        for docs_of_term in posting_docs:
+            all_docs.extend(docs_of_term)
+        weights = cls._weights(posting_docs, posting_tfs, all_docs, lengths, n_docs, avgdl, k1, b)
+        del posting_tfs
+
+        term_bytes = [term.encode("utf-8") for term in terms]
+        term_offsets, position = array("Q", [0]), 0
+        for term in term_bytes:
+            position += len(term)
+            term_offsets.append(position)
+        table_size = 1 << max(4, (2 * len(term_bytes)).bit_length())  # 装载因子不超过1/2
+        slots = array("I", bytes(4 * table_size))
+        for term_id, term in enumerate(term_bytes):
+            slot = _hash(term) & (table_size - 1)
+            while slots[slot]:
+                slot = (slot + 1) & (table_size - 1)
+            slots[slot] = term_id + 1
+
+        mask = sum(1 << (n - 1) for n in set(ngrams))
+        order = 1 if sys.byteorder == "little" else 2
+        sections = [slots.tobytes(), term_offsets.tobytes(), b"".join(term_bytes), posting_offsets.tobytes(),
+                    all_docs.tobytes(), weights, doc_offsets.tobytes(), b"".join(blobs)]
+        layout, offset = [], _align(_HEADER.size)
+        for section in sections:
+            layout.extend((offset, len(section)))
+            offset = _align(offset + len(section))
+        header = _HEADER.pack(_MAGIC, n_docs, len(term_bytes), table_size, mask, order, 0, k1, b, avgdl, *layout)
+
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(header)
+            for section, section_offset in zip(sections, layout[::2]):
+                f.write(bytes(section_offset - f.tell()))
+                f.write(section)
+        os.replace(tmp, path)
+        return cls(path)
+
+    @staticmethod
+    def _weights(posting_docs, posting_tfs, all_docs, lengths, n_docs, avgdl, k1, b) -> bytes:
+        """
+        每条倒排记录的得分贡献：idf * tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl))，idf取Lucene的非负形式
+        """
+        dfs = [len(docs_of_term) for docs_of_term in posting_docs]
+        idfs = [math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) for df in dfs]
+        if np is not None and all_docs:
+            tf = np.concatenate([np.frombuffer(tfs, dtype=np.uint32) for tfs in posting_tfs]).astype(np.float64)
+            dl = np.frombuffer(lengths, dtype=np.uint32)[np.frombuffer(all_docs, dtype=np.uint32)]
+            idf = np.repeat(np.asarray(idfs), dfs)
+            weights = idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))
+            return weights.astype(np.float32).tobytes()
+        weights = array("f")
+        for idf, docs_of_term, tfs in zip(idfs, posting_docs, posting_tfs):
+            weights.extend(idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * lengths[doc] / avgdl))
+                           for doc, tf in zip(docs_of_term, tfs))
+        return weights.tobytes()
+
+    # ======================= 查询 =======================
+    def term_id(self, term: str) -> Optional[int]:
+        encoded = term.encode("utf-8")
+        slots, offsets, buffer = self._views["slots"], self._views["term_offsets"], self._buffer
+        mask = self.table_size - 1
+        slot = _hash(encoded) & mask
+        while True:
+            value = slots[slot]
+            if not value:
+                return None
+            start, end = offsets[value - 1], offsets[value]
+            if end - start == len(encoded) and buffer[self._terms_at + start:self._terms_at + end] == encoded:
+                return value - 1
+            slot = (slot + 1) & mask
+
+    def doc(self, doc_id: int) -> dict:
+        offsets = self._views["doc_offsets"]
+        start, end = self._docs_at + offsets[doc_id], self._docs_at + offsets[doc_id + 1]
+        return json.loads(bytes(self._buffer[start:end]))
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[float, dict]]:
+        """
+        :return: 得分最高的k篇文档 [(BM25得分, 文档dict), ...]，没有任何词项命中时为空
+        """
+        return [(score, self.doc(doc_id)) for score, doc_id in self.search_ids(query, k)]
+
+    def search_ids(self, query: str, k: int = 10) -> List[Tuple[float, int]]:
+        offsets = self._views["posting_offsets"]
+        ranges = []
+        for term in set(tokenize(query, self.ngrams)):
+            term_id = self.term_id(term)
+            if term_id is not None:
+                ranges.append((offsets[term_id], offsets[term_id + 1]))
+        if not ranges:
+            return []
+        if self._arrays is None:
+            return self._search_python(ranges, k)
+        docs, weights = self._arrays
+        ids = np.concatenate([docs[start:end] for start, end in ranges])
+        contributions = np.concatenate([weights[start:end] for start, end in ranges])
+        if len(ids) * 16 < self.n_docs:  # 命中的文档很少：只对命中的文档累加，不分配n_docs大小的数组
+            ids, inverse = np.unique(ids, return_inverse=True)
+            scores = np.bincount(inverse, weights=contributions)
+        else:
+            scores = np.bincount(ids, weights=contributions, minlength=self.n_docs)
+            ids = None
+        if len(scores) > k:
+            picked = np.argpartition(scores, len(scores) - k)[len(scores) - k:]
+        else:
+            picked = np.arange(len(scores))
+        ranked = sorted(((float(scores[i]), int(i if ids is None else ids[i])) for i in picked),
+                        key=lambda item: (-item[0], item[1]))
+        return [item for item in ranked if item[0] > 0]
+
+    def _search_python(self, ranges, k: int) -> List[Tuple[float, int]]:
+        docs, weights, scores = self._views["posting_docs"], self._views["posting_weights"], {}
+        for start, end in ranges:
+            for doc_id, weight in zip(docs[start:end], weights[start:end]):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+        return [(score, doc_id) for doc_id, score in
+                heapq.nsmallest(k, scores.items(), key=lambda item: (-item[1], item[0]))]
+
+
+if __name__ == '__main__':
+    print("KnowledgeTools...")
+    import tempfile
+    kb = [
+        {"title": "退货政策", "content": "支持7天无理由退货，15天质量问题换货"},
+        {"title": "运费规则", "content": "满99元免运费，VIP用户全年包邮"},
+        {"title": "发票说明", "content": "订单完成后可在个人中心申请电子发票"},
+    ]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "kb.bm25")
+        BM25Index.build(kb, path).close()
+        with BM25Index(path) as index:
+            print(index.stats())
+            for question in ("退货政策", "买了东西不想要了能退货吗", "VIP运费", "电子发票怎么开"):
+                print(question, [(round(score, 3), doc["title"]) for score, doc in index.search(question, k=2)])